@@ -0,0 +1,278 @@
+import csv
+import sqlite3
+import time
+from datetime import datetime
+
+import database
+
+# Carga de ventas históricas exportadas por otro sistema (un CSV con una fila por línea de venta).
+# No pasa por registrar_venta: no descuenta stock, no asigna turnos de caja ni aplica promociones.
+# Todo va en una sola transacción (si algo falla, la BD queda como estaba): los índices y triggers
+# de las tablas de ventas se quitan al empezar y se vuelven a crear al final, así cada inserción no
+# tiene que mantenerlos; las filas se leen del archivo y se insertan de a lotes con executemany.
+#
+# Columnas (la primera fila es el encabezado; el orden no importa):
+#   fecha            obligatoria: 'AAAA-MM-DD[ HH:MM[:SS]]' o 'DD/MM/AAAA[ HH:MM[:SS]]'
+#   codigo_barras    o 'producto' (nombre); si no existe se crea el producto, sin stock
+#   cantidad, precio_unitario   obligatorias
+#   comprobante      número de venta del sistema anterior: las filas seguidas con el mismo número
+#                    forman una venta. Sin esta columna cada fila es una venta.
+#   forma_pago, cliente (DNI o nombre; si no existe se crea), descuento (%), observaciones
+#   costo_unitario   opcional; sin ella cada línea se valúa al último costo conocido del producto,
+#                    igual que registrar_venta con lo que sale sin lote
+
+TAMANO_LOTE_CARGA = 10000
+MAXIMO_RECHAZOS_INFORMADOS = 100
+TABLAS_VENTAS = ('ventas', 'detalle_venta', 'movimientos_cuenta_cliente')
+_FORMATOS_FECHA = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y')
+
+
+def _normalizar_fecha(texto: str) -> str:
+    if len(texto) == 19 and texto[4] == '-' and texto[10] == ' ':
+        return texto  # ya viene como la guarda la BD
+    for formato in _FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            pass
+    raise ValueError(f"fecha inválida '{texto}'")
+
+
+class _Resolutor:
+    # Traduce códigos, nombres y DNIs del archivo a ids; lo que no existe se crea en la misma transacción.
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.productos_por_codigo = {}
+        self.productos_por_nombre = {}
+        for id_producto, nombre, codigo in cursor.execute("SELECT id_producto, nombre, codigo_barras FROM productos"):
+            if codigo:
+                self.productos_por_codigo[codigo] = id_producto
+            self.productos_por_nombre.setdefault(database._normalizar_texto(nombre), id_producto)
+        self.clientes_por_dni = {}
+        self.clientes_por_nombre = {}
+        for id_cliente, nombre, dni in cursor.execute("SELECT id_cliente, nombre, dni FROM cliente"):
+            if dni:
+                self.clientes_por_dni[dni] = id_cliente
+            self.clientes_por_nombre.setdefault(database._normalizar_texto(nombre), id_cliente)
+        self.productos_creados = []
+        self.clientes_creados = 0
+        self.costos = {}
+
+    def producto(self, codigo, nombre, precio, fecha):
+        if codigo and codigo in self.productos_por_codigo:
+            return self.productos_por_codigo[codigo]
+        clave = database._normalizar_texto(nombre) if nombre else None
+        if clave and clave in self.productos_por_nombre:
+            return self.productos_por_nombre[clave]
+        if not codigo and not nombre:
+            raise ValueError("la fila no tiene producto ni código de barras")
+        self.cursor.execute(
+            "INSERT INTO productos (nombre, precio_venta, codigo_barras) VALUES (?, ?, ?)",
+            (nombre or f"Producto {codigo}", precio, codigo or None)
+        )
+        id_producto = self.cursor.lastrowid
+        # El precio de la primera venta cargada abre el historial: los reportes por fecha lo necesitan.
+        database._registrar_cambio_precio(self.cursor, id_producto, precio, fecha)
+        self.productos_creados.append(id_producto)
+        if codigo:
+            self.productos_por_codigo[codigo] = id_producto
+        if clave:
+            self.productos_por_nombre[clave] = id_producto
+        return id_producto
+
+    def costo(self, id_producto):
+        if id_producto not in self.costos:
+            self.costos[id_producto] = database._ultimo_costo_conocido(self.cursor, id_producto)
+        return self.costos[id_producto]
+
+    def cliente(self, texto):
+        if not texto:
+            return None
+        if texto in self.clientes_por_dni:
+            return self.clientes_por_dni[texto]
+        clave = database._normalizar_texto(texto)
+        if clave in self.clientes_por_nombre:
+            return self.clientes_por_nombre[clave]
+        es_dni = texto.replace('.', '').isdigit()
+        self.cursor.execute(
+            "INSERT INTO cliente (nombre, dni) VALUES (?, ?)",
+            (f"Cliente {texto}" if es_dni else texto, texto if es_dni else None)
+        )
+        id_cliente = self.cursor.lastrowid
+        self.clientes_creados += 1
+        if es_dni:
+            self.clientes_por_dni[texto] = id_cliente
+        else:
+            self.clientes_por_nombre[clave] = id_cliente
+        return id_cliente
+
+
+def _quitar_indices_y_triggers(cursor):
+    objetos = cursor.execute(
+        f"""SELECT type, name, sql FROM sqlite_master
+            WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+              AND tbl_name IN ({', '.join('?' for _ in TABLAS_VENTAS)})""",
+        TABLAS_VENTAS
+    ).fetchall()
+    for tipo, nombre, _ in objetos:
+        cursor.execute(f'DROP {tipo.upper()} "{nombre}"')
+    return [sql for _, _, sql in objetos]
+
+
+def _columnas(encabezado):
+    indices = {columna.strip().lower(): i for i, columna in enumerate(encabezado)}
+    faltantes = [columna for columna in ('fecha', 'cantidad', 'precio_unitario') if columna not in indices]
+    if 'codigo_barras' not in indices and 'producto' not in indices:
+        faltantes.append('codigo_barras o producto')
+    if faltantes:
+        raise ValueError(f"faltan las columnas: {', '.join(faltantes)}")
+    return indices
+
+
+def cargar_ventas_historicas(ruta_csv, delimitador=None, codificacion='utf-8-sig', progreso=None, tamano_lote=TAMANO_LOTE_CARGA):
+    # Devuelve un informe con lo cargado, lo rechazado (fila y motivo) y la velocidad, o None si falló.
+    # Sin 'delimitador' se deduce del encabezado. progreso(lineas_cargadas) se llama después de cada lote.
+    inicio = time.perf_counter()
+    conn = database._get_db_connection()
+    cursor = conn.cursor()
+    informe = {'lineas': 0, 'ventas': 0, 'rechazadas': [], 'cantidad_rechazadas': 0}
+    try:
+        archivo = open(ruta_csv, newline='', encoding=codificacion)
+    except OSError as e:
+        print(f"Error al abrir el archivo de ventas históricas: {e}")
+        return None
+
+    with archivo:
+        try:
+            if delimitador is None:
+                # Las exportaciones en castellano suelen venir separadas por ';'.
+                encabezado = archivo.readline()
+                delimitador = ';' if encabezado.count(';') > encabezado.count(',') else ','
+                archivo.seek(0)
+            lector = csv.reader(archivo, delimiter=delimitador)
+            separador_decimal = database._separador_decimal(delimitador)
+            columnas = _columnas(next(lector, []))
+        except (ValueError, csv.Error, UnicodeDecodeError) as e:
+            print(f"Error al leer el encabezado de ventas históricas: {e}")
+            return None
+
+        def columna(nombre):
+            # Las columnas opcionales que faltan leen siempre ''.
+            indice = columnas.get(nombre)
+            return (lambda fila: fila[indice].strip() if indice < len(fila) else '') if indice is not None else (lambda fila: '')
+
+        leer_fecha, leer_cantidad, leer_precio, leer_descuento = columna('fecha'), columna('cantidad'), columna('precio_unitario'), columna('descuento')
+        leer_comprobante, leer_cliente, leer_codigo, leer_producto = columna('comprobante'), columna('cliente'), columna('codigo_barras'), columna('producto')
+        leer_forma_pago, leer_observaciones, leer_costo = columna('forma_pago'), columna('observaciones'), columna('costo_unitario')
+
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            primer_id_venta = cursor.execute("SELECT IFNULL(MAX(id_venta), 0) + 1 FROM ventas").fetchone()[0]
+            sql_diferido = _quitar_indices_y_triggers(cursor)
+            resolutor = _Resolutor(cursor)
+
+            id_venta = primer_id_venta - 1
+            comprobante_actual = None
+            venta = None  # [id_venta, fecha, total, forma_pago, observaciones, id_cliente] de la venta en curso
+            ventas, detalles = [], []
+
+            def volcar():
+                cursor.executemany(
+                    "INSERT INTO ventas (id_venta, fecha_venta, total, forma_pago, observaciones, id_cliente) VALUES (?, ?, ?, ?, ?, ?)",
+                    ventas
+                )
+                cursor.executemany(
+                    "INSERT INTO detalle_venta (id_venta, id_producto, cantidad, precio_unitario, descuento, subtotal, costo_total) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    detalles
+                )
+                ventas.clear()
+                detalles.clear()
+                if progreso:
+                    progreso(informe['lineas'])
+
+            for numero_fila, fila in enumerate(lector, start=2):
+                if not fila:
+                    continue
+                comprobante = leer_comprobante(fila)
+                venta_nueva = not comprobante or comprobante != comprobante_actual
+                try:
+                    cantidad = database._numero(leer_cantidad(fila), separador_decimal=separador_decimal)
+                    precio = database._numero(leer_precio(fila), separador_decimal=separador_decimal)
+                    descuento = database._numero(leer_descuento(fila), 0.0, separador_decimal)
+                    if venta_nueva:
+                        fecha = _normalizar_fecha(leer_fecha(fila))
+                        id_cliente = resolutor.cliente(leer_cliente(fila))
+                    id_producto = resolutor.producto(leer_codigo(fila), leer_producto(fila), precio, fecha)
+                    texto_costo = leer_costo(fila)
+                    costo = database._numero(texto_costo, separador_decimal=separador_decimal) if texto_costo else resolutor.costo(id_producto)
+                except ValueError as e:
+                    informe['cantidad_rechazadas'] += 1
+                    if len(informe['rechazadas']) < MAXIMO_RECHAZOS_INFORMADOS:
+                        informe['rechazadas'].append((numero_fila, str(e)))
+                    continue
+
+                if venta_nueva:
+                    if venta:
+                        ventas.append(venta)
+                    id_venta += 1
+                    comprobante_actual = comprobante
+                    venta = [id_venta, fecha, 0.0, leer_forma_pago(fila) or 'Efectivo', leer_observaciones(fila) or None, id_cliente]
+                subtotal = cantidad * precio * (1 - descuento / 100)
+                venta[2] += subtotal
+                detalles.append((id_venta, id_producto, cantidad, precio, descuento, subtotal, cantidad * costo))
+                informe['lineas'] += 1
+                if len(detalles) >= tamano_lote:
+                    volcar()
+            if venta:
+                ventas.append(venta)
+            volcar()
+
+            for sql in sql_diferido:
+                cursor.execute(sql)
+            _completar_ventas_cargadas(cursor, primer_id_venta, id_venta)
+            conn.commit()
+        except (sqlite3.Error, csv.Error, UnicodeDecodeError) as e:
+            print(f"Error al cargar las ventas históricas: {e}")
+            conn.rollback()
+            return None
+
+    if resolutor.productos_creados:
+        database._notificar_cambio_productos(resolutor.productos_creados)
+    database.descartar_snapshot_reportes()
+
+    informe['ventas'] = id_venta - primer_id_venta + 1
+    informe['productos_creados'] = len(resolutor.productos_creados)
+    informe['clientes_creados'] = resolutor.clientes_creados
+    informe['segundos'] = time.perf_counter() - inicio
+    informe['filas_por_segundo'] = informe['lineas'] / informe['segundos'] if informe['segundos'] else 0.0
+    return informe
+
+
+def _completar_ventas_cargadas(cursor, primer_id_venta, ultimo_id_venta):
+    # Lo que registrar_venta hace venta por venta, en una pasada sobre las ventas cargadas: deudas de
+    # libreta, resumen de márgenes y el índice de texto de las observaciones.
+    rango = (primer_id_venta, ultimo_id_venta)
+    cursor.execute(
+        """INSERT INTO movimientos_cuenta_cliente (id_cliente, id_venta, fecha, tipo_movimiento, monto)
+           SELECT id_cliente, id_venta, fecha_venta, 'DEUDA', total FROM ventas
+           WHERE id_venta BETWEEN ? AND ? AND forma_pago = 'Libreta' AND id_cliente IS NOT NULL""",
+        rango
+    )
+    cursor.execute(
+        """INSERT INTO resumen_margen_diario (fecha, id_producto, unidades, ingresos, costo)
+           SELECT date(v.fecha_venta), dv.id_producto, SUM(dv.cantidad), SUM(dv.subtotal), SUM(dv.costo_total)
+           FROM ventas v
+           JOIN detalle_venta dv ON dv.id_venta = v.id_venta
+           WHERE v.id_venta BETWEEN ? AND ?
+           GROUP BY date(v.fecha_venta), dv.id_producto
+           ON CONFLICT (fecha, id_producto) DO UPDATE SET
+               unidades = unidades + excluded.unidades,
+               ingresos = ingresos + excluded.ingresos,
+               costo = costo + excluded.costo""",
+        rango
+    )
+    cursor.execute(
+        """INSERT INTO ventas_fts (rowid, observaciones)
+           SELECT id_venta, observaciones FROM ventas WHERE id_venta BETWEEN ? AND ? AND observaciones IS NOT NULL""",
+        rango
+    )
@@ -3,7 +3,15 @@ import hashlib
 import configparser
 import sys
 import os
-from models import Producto, Venta, Cliente, DetalleVenta
+import gzip
+import shutil
+import tempfile
+import threading
+import copy
+import json
+import re
+from collections import OrderedDict
+from models import Producto, Venta, Cliente, DetalleVenta, Promocion
 from datetime import datetime, timedelta
 import unicodedata
 
@@ -23,6 +31,7 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 DB_FILE = get_persistent_path('easyst.db')
+TAMANO_LOTE_LECTURA = 500
 SQL_SCRIPT = """
 CREATE TABLE IF NOT EXISTS productos (
     id_producto INTEGER PRIMARY KEY NOT NULL, 
@@ -40,6 +49,7 @@ CREATE TABLE IF NOT EXISTS stock (
     cantidad INTEGER NOT NULL,
     fecha_vencimiento TEXT,
     codigo_barras TEXT,
+    costo_unitario REAL,
     FOREIGN KEY (id_producto) REFERENCES productos(id_producto) ON DELETE CASCADE
 );
 
@@ -47,7 +57,8 @@ CREATE TABLE IF NOT EXISTS cliente (
     id_cliente INTEGER PRIMARY KEY, 
     nombre TEXT NOT NULL,
     dni TEXT UNIQUE,    
-    fecha_limite_pago TEXT
+    fecha_limite_pago TEXT,
+    id_lista_precios INTEGER REFERENCES listas_precios(id_lista)
 );
 
 CREATE TABLE IF NOT EXISTS ventas (
@@ -58,6 +69,7 @@ CREATE TABLE IF NOT EXISTS ventas (
     observaciones TEXT,
     ruta_pdf_ticket TEXT,
     id_cliente INTEGER,
+    id_turno INTEGER REFERENCES turnos_caja(id_turno),
     FOREIGN KEY (id_cliente) REFERENCES cliente(id_cliente)
 );
 
@@ -70,6 +82,9 @@ CREATE TABLE IF NOT EXISTS detalle_venta (
     descuento REAL NOT NULL DEFAULT 0,
     estado TEXT NOT NULL DEFAULT 'Completada',
     subtotal REAL NOT NULL,
+    cantidad_pendiente INTEGER NOT NULL DEFAULT 0,
+    costo_total REAL NOT NULL DEFAULT 0,
+    descuento_promocion REAL NOT NULL DEFAULT 0,
     FOREIGN KEY (id_venta) REFERENCES ventas(id_venta),
     FOREIGN KEY (id_producto) REFERENCES productos(id_producto)
 );
@@ -90,18 +105,313 @@ CREATE TABLE IF NOT EXISTS movimientos_cuenta_cliente (
     monto REAL NOT NULL,
     FOREIGN KEY (id_cliente) REFERENCES cliente(id_cliente) ON DELETE CASCADE
 );
+
+CREATE TABLE IF NOT EXISTS historial_precios (
+    id_historial INTEGER PRIMARY KEY AUTOINCREMENT,
+    id_producto INTEGER NOT NULL,
+    precio REAL NOT NULL,
+    fecha_desde TEXT NOT NULL,
+    FOREIGN KEY (id_producto) REFERENCES productos(id_producto) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS resumen_margen_diario (
+    fecha TEXT NOT NULL,
+    id_producto INTEGER NOT NULL,
+    unidades INTEGER NOT NULL DEFAULT 0,
+    ingresos REAL NOT NULL DEFAULT 0,
+    costo REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, id_producto)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS promociones (
+    id_promocion INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    cantidad INTEGER NOT NULL DEFAULT 1,
+    valor REAL NOT NULL DEFAULT 0,
+    prioridad INTEGER NOT NULL DEFAULT 0,
+    fecha_desde TEXT,
+    fecha_hasta TEXT,
+    dias_semana TEXT,
+    hora_desde TEXT,
+    hora_hasta TEXT,
+    activa INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS promocion_productos (
+    id_promocion INTEGER NOT NULL,
+    id_producto INTEGER NOT NULL,
+    cantidad INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (id_promocion, id_producto),
+    FOREIGN KEY (id_promocion) REFERENCES promociones(id_promocion) ON DELETE CASCADE,
+    FOREIGN KEY (id_producto) REFERENCES productos(id_producto) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS detalle_venta_promociones (
+    id_detalle INTEGER NOT NULL,
+    id_promocion INTEGER NOT NULL,
+    monto REAL NOT NULL,
+    PRIMARY KEY (id_detalle, id_promocion),
+    FOREIGN KEY (id_detalle) REFERENCES detalle_venta(id_detalle) ON DELETE CASCADE,
+    FOREIGN KEY (id_promocion) REFERENCES promociones(id_promocion)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS listas_precios (
+    id_lista INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE,
+    ajuste_porcentaje REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS precios_lista (
+    id_lista INTEGER NOT NULL,
+    id_producto INTEGER NOT NULL,
+    cantidad_minima INTEGER NOT NULL DEFAULT 1,
+    precio REAL NOT NULL,
+    PRIMARY KEY (id_lista, id_producto, cantidad_minima),
+    FOREIGN KEY (id_lista) REFERENCES listas_precios(id_lista) ON DELETE CASCADE,
+    FOREIGN KEY (id_producto) REFERENCES productos(id_producto) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS turnos_caja (
+    id_turno INTEGER PRIMARY KEY,
+    usuario TEXT NOT NULL,
+    apertura TEXT NOT NULL,
+    cierre TEXT,
+    monto_inicial REAL NOT NULL DEFAULT 0,
+    monto_contado REAL,
+    observaciones TEXT
+);
+
+CREATE TABLE IF NOT EXISTS totales_turno (
+    id_turno INTEGER NOT NULL,
+    forma_pago TEXT NOT NULL,
+    cantidad_ventas INTEGER NOT NULL DEFAULT 0,
+    total_ventas REAL NOT NULL DEFAULT 0,
+    cantidad_cobros INTEGER NOT NULL DEFAULT 0,
+    total_cobros REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_turno, forma_pago),
+    FOREIGN KEY (id_turno) REFERENCES turnos_caja(id_turno) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- Conteos físicos de inventario. Las lecturas se acumulan en conteo_items mientras el conteo está
+-- abierto; al aplicarlo, cada diferencia queda en ajustes_stock.
+CREATE TABLE IF NOT EXISTS conteos_inventario (
+    id_conteo INTEGER PRIMARY KEY,
+    usuario TEXT,
+    inicio TEXT NOT NULL,
+    cierre TEXT,
+    estado TEXT NOT NULL DEFAULT 'Abierto',
+    observaciones TEXT
+);
+
+CREATE TABLE IF NOT EXISTS conteo_items (
+    id_conteo INTEGER NOT NULL,
+    id_producto INTEGER NOT NULL,
+    cantidad INTEGER NOT NULL DEFAULT 0,
+    cantidad_sistema INTEGER NOT NULL,
+    ultima_lectura TEXT NOT NULL,
+    PRIMARY KEY (id_conteo, id_producto),
+    FOREIGN KEY (id_conteo) REFERENCES conteos_inventario(id_conteo) ON DELETE CASCADE,
+    FOREIGN KEY (id_producto) REFERENCES productos(id_producto) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS ajustes_stock (
+    id_ajuste INTEGER PRIMARY KEY,
+    id_conteo INTEGER,
+    id_producto INTEGER NOT NULL,
+    fecha TEXT NOT NULL,
+    cantidad_sistema INTEGER NOT NULL,
+    cantidad_contada INTEGER NOT NULL,
+    diferencia INTEGER NOT NULL,
+    FOREIGN KEY (id_conteo) REFERENCES conteos_inventario(id_conteo),
+    FOREIGN KEY (id_producto) REFERENCES productos(id_producto) ON DELETE CASCADE
+);
+
+-- Órdenes de compra a proveedores. cantidad_recibida se acumula con cada recepción (recibir_mercaderia);
+-- la orden pasa a 'Parcial' o 'Recibida' según lo que falte.
+CREATE TABLE IF NOT EXISTS ordenes_compra (
+    id_orden INTEGER PRIMARY KEY,
+    proveedor TEXT,
+    fecha TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'Pendiente',
+    ultima_recepcion TEXT,
+    observaciones TEXT
+);
+
+CREATE TABLE IF NOT EXISTS orden_compra_items (
+    id_orden INTEGER NOT NULL,
+    id_producto INTEGER NOT NULL,
+    cantidad_pedida INTEGER NOT NULL,
+    cantidad_recibida INTEGER NOT NULL DEFAULT 0,
+    costo_unitario REAL,
+    PRIMARY KEY (id_orden, id_producto),
+    FOREIGN KEY (id_orden) REFERENCES ordenes_compra(id_orden) ON DELETE CASCADE,
+    FOREIGN KEY (id_producto) REFERENCES productos(id_producto) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- Última versión conocida de cada fila de las listas de precios de proveedores (ver sincronizacion_proveedores.py).
+-- 'clave' es el código de barras o, si la fila no tiene, 'nombre:' + el nombre normalizado.
+CREATE TABLE IF NOT EXISTS listas_proveedores (
+    proveedor TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    id_producto INTEGER,
+    hash_fila TEXT NOT NULL,
+    precio REAL NOT NULL,
+    fecha_sincronizacion TEXT NOT NULL,
+    fecha_baja TEXT,
+    PRIMARY KEY (proveedor, clave),
+    FOREIGN KEY (id_producto) REFERENCES productos(id_producto) ON DELETE SET NULL
+) WITHOUT ROWID;
+
+-- Cuándo se aplicó por última vez la lista de cada proveedor, haya cambiado algo o no.
+CREATE TABLE IF NOT EXISTS proveedores_sincronizados (
+    proveedor TEXT PRIMARY KEY,
+    ultima_sincronizacion TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS ventas_fts USING fts5(
+    observaciones,
+    content='ventas',
+    content_rowid='id_venta',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS ventas_fts_insert AFTER INSERT ON ventas WHEN new.observaciones IS NOT NULL BEGIN
+    INSERT INTO ventas_fts (rowid, observaciones) VALUES (new.id_venta, new.observaciones);
+END;
+
+CREATE TRIGGER IF NOT EXISTS ventas_fts_delete AFTER DELETE ON ventas WHEN old.observaciones IS NOT NULL BEGIN
+    INSERT INTO ventas_fts (ventas_fts, rowid, observaciones) VALUES ('delete', old.id_venta, old.observaciones);
+END;
+
+CREATE TRIGGER IF NOT EXISTS ventas_fts_update AFTER UPDATE OF observaciones ON ventas BEGIN
+    INSERT INTO ventas_fts (ventas_fts, rowid, observaciones) SELECT 'delete', old.id_venta, old.observaciones WHERE old.observaciones IS NOT NULL;
+    INSERT INTO ventas_fts (rowid, observaciones) SELECT new.id_venta, new.observaciones WHERE new.observaciones IS NOT NULL;
+END;
 CREATE INDEX IF NOT EXISTS idx_productos_nombre ON productos (nombre);
 
 CREATE INDEX IF NOT EXISTS idx_cliente_nombre ON cliente (nombre);
+CREATE INDEX IF NOT EXISTS idx_cliente_fecha_limite ON cliente (fecha_limite_pago) WHERE fecha_limite_pago IS NOT NULL;
 
 CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas (fecha_venta);
+CREATE INDEX IF NOT EXISTS idx_ventas_cliente_fecha ON ventas (id_cliente, fecha_venta) WHERE id_cliente IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_ventas_forma_pago_fecha ON ventas (forma_pago, fecha_venta);
+CREATE INDEX IF NOT EXISTS idx_ventas_total ON ventas (total);
+
+CREATE INDEX IF NOT EXISTS idx_stock_id_producto ON stock (id_producto, fecha_vencimiento);
+CREATE INDEX IF NOT EXISTS idx_stock_vencimiento ON stock (fecha_vencimiento) WHERE cantidad > 0 AND fecha_vencimiento IS NOT NULL;
 
 CREATE INDEX IF NOT EXISTS idx_detalle_venta_id_venta ON detalle_venta (id_venta);
-CREATE INDEX IF NOT EXISTS idx_detalle_venta_id_producto ON detalle_venta (id_producto);
+CREATE INDEX IF NOT EXISTS idx_detalle_venta_producto_venta ON detalle_venta (id_producto, id_venta);
 CREATE INDEX IF NOT EXISTS idx_movimientos_id_cliente ON movimientos_cuenta_cliente (id_cliente);
+CREATE INDEX IF NOT EXISTS idx_movimientos_cliente_tipo_fecha ON movimientos_cuenta_cliente (id_cliente, tipo_movimiento, fecha);
+CREATE INDEX IF NOT EXISTS idx_historial_precios_producto_fecha ON historial_precios (id_producto, fecha_desde);
+CREATE INDEX IF NOT EXISTS idx_detalle_venta_promociones_promocion ON detalle_venta_promociones (id_promocion);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_turnos_caja_abierto ON turnos_caja ((cierre IS NULL)) WHERE cierre IS NULL;
+CREATE INDEX IF NOT EXISTS idx_turnos_caja_apertura ON turnos_caja (apertura);
+CREATE INDEX IF NOT EXISTS idx_turnos_caja_usuario_apertura ON turnos_caja (usuario, apertura);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_conteos_inventario_abierto ON conteos_inventario ((estado = 'Abierto')) WHERE estado = 'Abierto';
+CREATE INDEX IF NOT EXISTS idx_ajustes_stock_producto_fecha ON ajustes_stock (id_producto, fecha);
+CREATE INDEX IF NOT EXISTS idx_ajustes_stock_conteo ON ajustes_stock (id_conteo);
+CREATE INDEX IF NOT EXISTS idx_ordenes_compra_estado ON ordenes_compra (estado);
+CREATE INDEX IF NOT EXISTS idx_listas_proveedores_producto ON listas_proveedores (id_producto) WHERE id_producto IS NOT NULL;
 """
 
-LATEST_SCHEMA_VERSION = 5
+# Índices sobre columnas agregadas por migraciones: se crean después de migrar para que una BD vieja
+# no falle al ejecutar SQL_SCRIPT antes de tener esas columnas.
+SQL_INDICES_POST_MIGRACION = """
+CREATE INDEX IF NOT EXISTS idx_detalle_venta_pendientes ON detalle_venta (id_producto, id_venta) WHERE estado = 'Pendiente de Stock';
+CREATE INDEX IF NOT EXISTS idx_stock_codigo_barras ON stock (codigo_barras) WHERE codigo_barras IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_ventas_turno ON ventas (id_turno) WHERE id_turno IS NOT NULL;
+"""
+
+LATEST_SCHEMA_VERSION = 12
+
+# Precio vigente de un producto en una fecha: el último cambio con fecha_desde <= ?. Usa el índice
+# (id_producto, fecha_desde), así que se puede usar como subconsulta por cada fila de un listado.
+_SQL_PRECIO_A_FECHA = """(SELECT h.precio FROM historial_precios h
+    WHERE h.id_producto = {alias}.id_producto AND h.fecha_desde <= ?
+    ORDER BY h.fecha_desde DESC, h.id_historial DESC LIMIT 1)"""
+
+# Precio al que se revalúa la deuda de libreta: las deudas se cobran al precio actual del producto,
+# según la lista de precios del cliente. Con lista, vale el precio cargado para la mayor cantidad mínima
+# que alcanza la línea; si el producto no figura en la lista, el precio de venta con el ajuste general.
+# Todas las consultas de saldos usan esta expresión (alias 'm' = movimientos, 'dv' = detalle_venta,
+# 'p' = productos); las subconsultas van por clave primaria.
+def _sql_precio_deuda(precio_base="p.precio_venta"):
+    return f"""COALESCE(
+        (SELECT pl.precio FROM cliente cl
+         JOIN precios_lista pl ON pl.id_lista = cl.id_lista_precios
+         WHERE cl.id_cliente = m.id_cliente AND pl.id_producto = dv.id_producto AND pl.cantidad_minima <= dv.cantidad
+         ORDER BY pl.cantidad_minima DESC LIMIT 1),
+        ROUND({precio_base} * (1 + IFNULL((SELECT l.ajuste_porcentaje FROM cliente cl
+                                           JOIN listas_precios l ON l.id_lista = cl.id_lista_precios
+                                           WHERE cl.id_cliente = m.id_cliente), 0) / 100.0), 2))"""
+
+_SQL_PRECIO_DEUDA = _sql_precio_deuda()
+
+# resumen_margen_diario acumula por día y producto lo vendido y su costo. registrar_venta lo mantiene
+# al día; esta consulta lo rearma desde el detalle (migración, cargas masivas).
+_SQL_RECONSTRUIR_RESUMEN_MARGEN = """
+    INSERT INTO resumen_margen_diario (fecha, id_producto, unidades, ingresos, costo)
+    SELECT date(v.fecha_venta), dv.id_producto, SUM(dv.cantidad), SUM(dv.subtotal), SUM(dv.costo_total)
+    FROM detalle_venta dv
+    JOIN ventas v ON dv.id_venta = v.id_venta
+    GROUP BY date(v.fecha_venta), dv.id_producto
+"""
+
+def _agregar_columna_si_falta(cursor: sqlite3.Cursor, tabla: str, definicion_columna: str):
+    # Las tablas que no existían antes de migrar ya las crea SQL_SCRIPT con todas sus columnas.
+    columna = definicion_columna.split()[0]
+    columnas_existentes = [fila[1] for fila in cursor.execute(f"PRAGMA table_info({tabla})").fetchall()]
+    if columna not in columnas_existentes:
+        cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {definicion_columna}")
+
+def _migracion_6(cursor: sqlite3.Cursor):
+    _agregar_columna_si_falta(cursor, 'detalle_venta', 'cantidad_pendiente INTEGER NOT NULL DEFAULT 0')
+    cursor.execute("UPDATE detalle_venta SET cantidad_pendiente = cantidad WHERE estado = 'Pendiente de Stock'")
+
+def _migracion_7(cursor: sqlite3.Cursor):
+    # Reconstruye el historial a partir de los precios cobrados en cada venta y cierra con el precio actual.
+    cursor.execute("""
+        INSERT INTO historial_precios (id_producto, precio, fecha_desde)
+        SELECT id_producto, precio_unitario, fecha_venta FROM (
+            SELECT dv.id_producto, dv.precio_unitario, v.fecha_venta,
+                   LAG(dv.precio_unitario) OVER (PARTITION BY dv.id_producto ORDER BY v.fecha_venta, dv.id_detalle) AS precio_anterior
+            FROM detalle_venta dv
+            JOIN ventas v ON dv.id_venta = v.id_venta
+            JOIN productos p ON dv.id_producto = p.id_producto
+        )
+        WHERE precio_anterior IS NULL OR precio_anterior != precio_unitario
+    """)
+    cursor.execute(f"""
+        INSERT INTO historial_precios (id_producto, precio, fecha_desde)
+        SELECT p.id_producto, p.precio_venta, ?
+        FROM productos p
+        WHERE {_SQL_PRECIO_A_FECHA.format(alias='p')} IS NOT p.precio_venta
+    """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), '9999-12-31'))
+
+def _migracion_8(cursor: sqlite3.Cursor):
+    # Las ventas anteriores quedan con costo 0: no hay forma de saber a qué costo entró cada lote.
+    _agregar_columna_si_falta(cursor, 'stock', 'costo_unitario REAL')
+    _agregar_columna_si_falta(cursor, 'detalle_venta', 'costo_total REAL NOT NULL DEFAULT 0')
+    cursor.execute("DELETE FROM resumen_margen_diario")
+    cursor.execute(_SQL_RECONSTRUIR_RESUMEN_MARGEN)
+
+def _migracion_9(cursor: sqlite3.Cursor):
+    _agregar_columna_si_falta(cursor, 'detalle_venta', 'descuento_promocion REAL NOT NULL DEFAULT 0')
+
+def _migracion_10(cursor: sqlite3.Cursor):
+    _agregar_columna_si_falta(cursor, 'cliente', 'id_lista_precios INTEGER REFERENCES listas_precios(id_lista)')
+
+def _migracion_11(cursor: sqlite3.Cursor):
+    # Las ventas anteriores a los turnos de caja quedan sin turno.
+    _agregar_columna_si_falta(cursor, 'ventas', 'id_turno INTEGER REFERENCES turnos_caja(id_turno)')
+
+def _migracion_12(cursor: sqlite3.Cursor):
+    # idx_detalle_venta_producto_venta (id_producto, id_venta) reemplaza al índice simple por producto.
+    cursor.execute("DROP INDEX IF EXISTS idx_detalle_venta_id_producto")
+    cursor.execute("INSERT INTO ventas_fts (ventas_fts) VALUES ('rebuild')")
 
 MIGRATIONS = {
     2: """
@@ -118,14 +428,23 @@ MIGRATIONS = {
     5: """
        ALTER TABLE stock ADD COLUMN codigo_barras TEXT;
     """,
+    6: _migracion_6,
+    7: _migracion_7,
+    8: _migracion_8,
+    9: _migracion_9,
+    10: _migracion_10,
+    11: _migracion_11,
+    12: _migracion_12,
 }
 
-def inicializar_bd(conexion: sqlite3.Connection | None = None):
+def inicializar_bd(conexion: sqlite3.Connection | None = None, reiniciar_estado=True):
     conn_provided = conexion is not None
     conn = conexion if conn_provided else _get_db_connection()
 
     try:
         cursor = conn.cursor()
+        # En modo WAL los lectores (reportes, backups, réplica) no bloquean a las ventas ni viceversa.
+        cursor.execute("PRAGMA journal_mode=WAL")
 
         cursor.executescript(SQL_SCRIPT)
         conn.commit()
@@ -142,11 +461,21 @@ def inicializar_bd(conexion: sqlite3.Connection | None = None):
             for version in range(current_version + 1, LATEST_SCHEMA_VERSION + 1):
                 if version in MIGRATIONS:
                     print(f"Aplicando migración para la versión {version}...")
-                    cursor.executescript(MIGRATIONS[version])
+                    migracion = MIGRATIONS[version]
+                    if callable(migracion):
+                        migracion(cursor)
+                    else:
+                        cursor.executescript(migracion)
                     print(f"Migración a la versión {version} completada.")
                     cursor.execute(f"PRAGMA user_version = {version}")
                     conn.commit()
 
+        cursor.executescript(SQL_INDICES_POST_MIGRACION)
+        conn.commit()
+        # Cachés y snapshots de una BD anterior no valen para esta (salvo al migrar una copia aparte).
+        if reiniciar_estado:
+            _reiniciar_estado_bd()
+
         _crear_usuario_admin_default(conn)
         print(f"Base de datos '{DB_FILE}' conectada y verificada con éxito. Versión del esquema: {LATEST_SCHEMA_VERSION}.")
     except sqlite3.Error as e:
@@ -175,15 +504,207 @@ def _crear_usuario_admin_default(conexion: sqlite3.Connection):
         print("Por favor, cámbiela en una futura sección de 'Usuarios'.")
         print("="*50)
 
-def _get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
+# Conexión fija del hilo actual (la usan los hilos de database_async). Sin ella, cada llamada
+# abre su propia conexión como siempre.
+_conexion_por_hilo = threading.local()
+
+def _nueva_conexion_bd(check_same_thread=True):
+    conn = sqlite3.connect(DB_FILE, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
     return conn
 
+def _get_db_connection():
+    conexion = getattr(_conexion_por_hilo, 'conexion', None)
+    return conexion if conexion is not None else _nueva_conexion_bd()
+
+# Funciones que descartan estado derivado de la BD (cachés, snapshots, etc.).
+# Se ejecutan cuando el contenido de la BD se reemplaza por completo, p. ej. al restaurar un backup.
+_CALLBACKS_REINICIO_BD = []
+
+def al_reiniciar_bd(funcion):
+    _CALLBACKS_REINICIO_BD.append(funcion)
+    return funcion
+
+def _reiniciar_estado_bd():
+    for funcion in _CALLBACKS_REINICIO_BD:
+        funcion()
+
+# Funciones que reciben los ids de productos cuyo dato o stock cambió (None = pueden ser todos).
+# Las escrituras las llaman después del commit.
+_CALLBACKS_CAMBIO_PRODUCTOS = []
+
+def al_cambiar_productos(funcion):
+    _CALLBACKS_CAMBIO_PRODUCTOS.append(funcion)
+    return funcion
+
+def _notificar_cambio_productos(ids_productos=None):
+    for funcion in _CALLBACKS_CAMBIO_PRODUCTOS:
+        funcion(ids_productos)
+
+# Funciones que se ejecutan cuando se agrega o modifica una promoción (p. ej. recompilar el motor).
+_CALLBACKS_CAMBIO_PROMOCIONES = []
+
+def al_cambiar_promociones(funcion):
+    _CALLBACKS_CAMBIO_PROMOCIONES.append(funcion)
+    return funcion
+
+def _notificar_cambio_promociones():
+    for funcion in _CALLBACKS_CAMBIO_PROMOCIONES:
+        funcion()
+
+# --- Snapshot en memoria para reportes ---
+# Los reportes pesados leen de una copia en memoria de la BD: no compiten con las ventas por
+# bloqueos ni por la caché de páginas. La copia se renueva a pedido o cuando supera su vigencia,
+# siempre en un hilo aparte: copiar una BD grande tarda y quien pide un reporte puede ser la interfaz.
+
+MINUTOS_VIGENCIA_SNAPSHOT_REPORTES = 5
+
+_snapshot_reportes = {'conexion': None, 'creado': None, 'refrescando': False, 'al_terminar': []}
+_bloqueo_snapshot_reportes = threading.Lock()
+
+def refrescar_snapshot_reportes():
+    destino = sqlite3.connect(":memory:", check_same_thread=False)
+    destino.row_factory = sqlite3.Row
+    _get_db_connection().backup(destino)
+    destino.execute("PRAGMA query_only = ON")
+    _registrar_funciones_sql(destino)
+    # La copia anterior no se cierra: otro hilo (un reporte en curso, la fachada async) puede estar
+    # leyendo de ella. Sus cursores la mantienen viva y se libera sola cuando termina el último.
+    with _bloqueo_snapshot_reportes:
+        _snapshot_reportes['conexion'] = destino
+        _snapshot_reportes['creado'] = datetime.now()
+    return _snapshot_reportes['creado']
+
+def refrescar_snapshot_reportes_en_segundo_plano(al_terminar=None):
+    # Renueva la copia en un hilo aparte. Si ya se está renovando no se empieza otra: 'al_terminar'
+    # se llama (sin argumentos, desde ese hilo) cuando termina la que está en curso.
+    with _bloqueo_snapshot_reportes:
+        if al_terminar:
+            _snapshot_reportes['al_terminar'].append(al_terminar)
+        if _snapshot_reportes['refrescando']:
+            return
+        _snapshot_reportes['refrescando'] = True
+
+    def tarea():
+        try:
+            refrescar_snapshot_reportes()
+        except sqlite3.Error as e:
+            print(f"Error al actualizar la copia de reportes: {e}")
+        finally:
+            with _bloqueo_snapshot_reportes:
+                _snapshot_reportes['refrescando'] = False
+                pendientes, _snapshot_reportes['al_terminar'] = _snapshot_reportes['al_terminar'], []
+            for funcion in pendientes:
+                funcion()
+
+    threading.Thread(target=tarea, daemon=True, name="snapshot-reportes").start()
+
+@al_reiniciar_bd
+def descartar_snapshot_reportes():
+    with _bloqueo_snapshot_reportes:
+        _snapshot_reportes['conexion'] = None
+        _snapshot_reportes['creado'] = None
+
+def obtener_antiguedad_snapshot_reportes():
+    creado = _snapshot_reportes['creado']
+    return (datetime.now() - creado) if creado else None
+
+def snapshot_reportes_vencido(minutos_vigencia=None):
+    vigencia = timedelta(minutes=minutos_vigencia if minutos_vigencia is not None else MINUTOS_VIGENCIA_SNAPSHOT_REPORTES)
+    antiguedad = obtener_antiguedad_snapshot_reportes()
+    return antiguedad is None or antiguedad > vigencia
+
+def _conexion_solo_lectura():
+    # Para leer antes de que exista la primera copia: la BD en uso abierta con mode=ro. Una BD en
+    # memoria no se puede abrir dos veces, así que se lee de la misma conexión.
+    conexion = _get_db_connection()
+    ruta = conexion.execute("PRAGMA database_list").fetchone()[2]
+    if not ruta:
+        return conexion
+    lectura = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+    lectura.row_factory = sqlite3.Row
+    _registrar_funciones_sql(lectura)
+    return lectura
+
+def _get_reporting_connection(minutos_vigencia=None):
+    # Nunca copia la BD en el hilo que pide: una copia vencida se sigue usando mientras se renueva.
+    if snapshot_reportes_vencido(minutos_vigencia):
+        refrescar_snapshot_reportes_en_segundo_plano()
+    conexion = _snapshot_reportes['conexion']
+    return conexion if conexion is not None else _conexion_solo_lectura()
+
+def _conexion_lectura(desde_snapshot=False):
+    return _get_reporting_connection() if desde_snapshot else _get_db_connection()
+
 def _normalizar_texto(texto: str) -> str:
     return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn').lower()
 
-def obtener_productos(nombre_like=None, solo_poco_stock=False, umbral_stock=5):
+# Miles agrupados de a tres: '2.500', '1.250.000' o '2,500'.
+_MILES_AGRUPADOS = {'.': re.compile(r'-?\d{1,3}(\.\d{3})+'), ',': re.compile(r'-?\d{1,3}(,\d{3})+')}
+
+def _separador_decimal(delimitador):
+    # Un CSV separado por ';' sale de una planilla en castellano (coma decimal); uno separado por ','
+    # no puede traer coma decimal sin comillas. Con otro delimitador se deduce de cada valor.
+    return {';': ',', ',': '.'}.get(delimitador)
+
+def _deducir_separador_decimal(texto: str) -> str:
+    coma, punto = texto.rfind(','), texto.rfind('.')
+    if coma >= 0 and punto >= 0:
+        return ',' if coma > punto else '.'
+    if punto >= 0:
+        # '2.500' son dos mil quinientos, no dos y medio.
+        return ',' if _MILES_AGRUPADOS['.'].fullmatch(texto) else '.'
+    if _MILES_AGRUPADOS[','].fullmatch(texto) and not texto.lstrip('-').startswith('0'):
+        raise ValueError(f"número ambiguo '{texto}': no se sabe si la coma separa miles o decimales")
+    return ','
+
+def _numero(texto: str, defecto=None, separador_decimal=None) -> float:
+    # Acepta '1250.5', '$ 1.250,50', '2.500' y '1250,5', como vienen de planillas y listas de proveedores.
+    # Con 'separador_decimal' (',' o '.') el otro signo solo puede agrupar miles de a tres; lo que no
+    # encaja se rechaza en vez de leerse con otra escala.
+    if not texto:
+        if defecto is None:
+            raise ValueError("falta un valor numérico")
+        return defecto
+    texto = texto.replace('$', '').strip()
+    if '.' not in texto and ',' not in texto:
+        return float(texto)
+    separador_decimal = separador_decimal or _deducir_separador_decimal(texto)
+    miles = '.' if separador_decimal == ',' else ','
+    entero, _, decimales = texto.partition(separador_decimal)
+    if miles in entero:
+        if not _MILES_AGRUPADOS[miles].fullmatch(entero):
+            raise ValueError(f"número ambiguo '{texto}'")
+        entero = entero.replace(miles, '')
+    if decimales and not decimales.isdigit():
+        raise ValueError(f"número inválido '{texto}'")
+    return float(f"{entero}.{decimales}" if decimales else entero)
+
+def _iterar_en_lotes(cursor: sqlite3.Cursor, tamano_lote: int):
+    while True:
+        filas = cursor.fetchmany(tamano_lote)
+        if not filas:
+            break
+        yield filas
+
+def _producto_desde_fila(fila) -> Producto:
+    prod_dict = dict(fila)
+    producto = Producto(
+        id_producto=prod_dict['id_producto'],
+        nombre=prod_dict['nombre'],
+        precio_venta=prod_dict['precio_venta'],
+        volumen=prod_dict['volumen'],
+        codigo_barras=prod_dict['codigo_barras'],
+        descripcion=prod_dict['descripcion'],
+        cantidad_stock=prod_dict.get('cantidad_stock', 0),
+        stock_sin_lote=prod_dict['stock_sin_lote']
+    )
+    producto.num_lotes = prod_dict.get('num_lotes', 0) or 0
+    producto.vencimiento_proximo = prod_dict.get('vencimiento_proximo')
+    producto.dias_para_vencer = prod_dict.get('dias_para_vencer')
+    return producto
+
+def iter_productos(nombre_like=None, solo_poco_stock=False, umbral_stock=5, tamano_lote=TAMANO_LOTE_LECTURA):
     conn = _get_db_connection()
     cursor = conn.cursor()
     try:
@@ -192,7 +713,8 @@ def obtener_productos(nombre_like=None, solo_poco_stock=False, umbral_stock=5):
                 p.*,
                 (IFNULL(s.total_lotes, 0) + p.stock_sin_lote) as cantidad_stock,
                 s.num_lotes,
-                s.vencimiento_proximo
+                s.vencimiento_proximo,
+                CAST(julianday(s.vencimiento_proximo) - julianday('now', 'localtime', 'start of day') AS INTEGER) as dias_para_vencer
             FROM
                 productos p
             LEFT JOIN 
@@ -206,35 +728,23 @@ def obtener_productos(nombre_like=None, solo_poco_stock=False, umbral_stock=5):
             ORDER BY p.nombre;
         """
         cursor.execute(query)
-        filas = cursor.fetchall()
-
-        productos = []
-        for fila in filas:
-            prod_dict = dict(fila)
-            producto = Producto(
-                id_producto=prod_dict['id_producto'],
-                nombre=prod_dict['nombre'],
-                precio_venta=prod_dict['precio_venta'],
-                volumen=prod_dict['volumen'],
-                codigo_barras=prod_dict['codigo_barras'],
-                descripcion=prod_dict['descripcion'],
-                cantidad_stock=prod_dict.get('cantidad_stock', 0),
-                stock_sin_lote=prod_dict['stock_sin_lote']
-            )
-            producto.num_lotes = prod_dict.get('num_lotes', 0) or 0
-            producto.vencimiento_proximo = prod_dict.get('vencimiento_proximo')
-            productos.append(producto)
-
-        if nombre_like:
-            productos = [p for p in productos if _normalizar_texto(nombre_like) in _normalizar_texto(p.nombre)]
-
-        if solo_poco_stock:
-            productos = [p for p in productos if p.cantidad_stock <= umbral_stock]
-
-        return productos
+        termino_busqueda = _normalizar_texto(nombre_like) if nombre_like else None
+
+        for filas in _iterar_en_lotes(cursor, tamano_lote):
+            for fila in filas:
+                producto = _producto_desde_fila(fila)
+                if termino_busqueda and termino_busqueda not in _normalizar_texto(producto.nombre):
+                    continue
+                if solo_poco_stock and producto.cantidad_stock > umbral_stock:
+                    continue
+                yield producto
     except sqlite3.Error as e:
         print(f"Error al obtener productos: {e}")
-        return []
+    finally:
+        cursor.close()
+
+def obtener_productos(nombre_like=None, solo_poco_stock=False, umbral_stock=5):
+    return list(iter_productos(nombre_like=nombre_like, solo_poco_stock=solo_poco_stock, umbral_stock=umbral_stock))
 
 def agregar_producto(producto: Producto):
     try:
@@ -245,26 +755,27 @@ def agregar_producto(producto: Producto):
                 (producto.nombre, producto.precio_venta, producto.volumen, producto.codigo_barras, producto.descripcion, 0)
             )
             id_producto_nuevo = cursor.lastrowid
-    
+            _registrar_cambio_precio(cursor, id_producto_nuevo, producto.precio_venta)
+
             cursor.execute(
-                "INSERT INTO stock (id_producto, cantidad, fecha_vencimiento) VALUES (?, ?, ?)",
-                (id_producto_nuevo, producto.cantidad_stock, producto.fecha_vencimiento if hasattr(producto, 'fecha_vencimiento') else None)
+                "INSERT INTO stock (id_producto, cantidad, fecha_vencimiento, costo_unitario) VALUES (?, ?, ?, ?)",
+                (id_producto_nuevo, producto.cantidad_stock, producto.fecha_vencimiento if hasattr(producto, 'fecha_vencimiento') else None, producto.costo_unitario)
             )
             return id_producto_nuevo
     except sqlite3.Error as e:
         print(f"Error al agregar producto: {e}")
         return None
 
-def obtener_clientes(nombre_o_dni=None, solo_con_deuda=False):
-    with _get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        query = """
+def iter_clientes(nombre_o_dni=None, solo_con_deuda=False, tamano_lote=TAMANO_LOTE_LECTURA):
+    conn = _get_db_connection()
+    cursor = conn.cursor()
+    try:
+        query = f"""
             SELECT 
                 c.*,
                 (
                     IFNULL((
-                        SELECT SUM(dv.cantidad * p.precio_venta)
+                        SELECT SUM(dv.cantidad * {_SQL_PRECIO_DEUDA})
                         FROM movimientos_cuenta_cliente m
                         JOIN detalle_venta dv ON m.id_venta = dv.id_venta
                         JOIN productos p ON dv.id_producto = p.id_producto
@@ -281,29 +792,30 @@ def obtener_clientes(nombre_o_dni=None, solo_con_deuda=False):
             ORDER BY c.nombre;
         """
         cursor.execute(query)
-        filas = cursor.fetchall()
-
-        clientes = []
-        for fila in filas:
-            c = Cliente(
-                id_cliente=fila['id_cliente'],
-                nombre=fila['nombre'],
-                dni=fila['dni'],
-                fecha_limite_pago=fila['fecha_limite_pago'],
-                saldo_deudor=fila['saldo_calculado']
-            )
-            clientes.append(c)
-
-        if nombre_o_dni:
-            termino_busqueda = _normalizar_texto(nombre_o_dni)
-            clientes = [c for c in clientes if 
-                        termino_busqueda in _normalizar_texto(c.nombre) or 
-                        (c.dni and termino_busqueda in c.dni)]
-
-        if solo_con_deuda:
-            clientes = [c for c in clientes if c.saldo_deudor > 0]
+        termino_busqueda = _normalizar_texto(nombre_o_dni) if nombre_o_dni else None
+
+        for filas in _iterar_en_lotes(cursor, tamano_lote):
+            for fila in filas:
+                c = Cliente(
+                    id_cliente=fila['id_cliente'],
+                    nombre=fila['nombre'],
+                    dni=fila['dni'],
+                    fecha_limite_pago=fila['fecha_limite_pago'],
+                    saldo_deudor=fila['saldo_calculado'],
+                    id_lista_precios=fila['id_lista_precios']
+                )
+                if termino_busqueda and not (termino_busqueda in _normalizar_texto(c.nombre) or (c.dni and termino_busqueda in c.dni)):
+                    continue
+                if solo_con_deuda and c.saldo_deudor <= 0:
+                    continue
+                yield c
+    except sqlite3.Error as e:
+        print(f"Error al obtener clientes: {e}")
+    finally:
+        cursor.close()
 
-        return clientes
+def obtener_clientes(nombre_o_dni=None, solo_con_deuda=False):
+    return list(iter_clientes(nombre_o_dni=nombre_o_dni, solo_con_deuda=solo_con_deuda))
 
 def obtener_cliente_por_id(id_cliente):
     with _get_db_connection() as conn:
@@ -321,8 +833,8 @@ def agregar_cliente(cliente: Cliente):
         with _get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "INSERT INTO cliente (nombre, dni, fecha_limite_pago) VALUES (?, ?, ?)",
-                (cliente.nombre, cliente.dni, cliente.fecha_limite_pago)
+                "INSERT INTO cliente (nombre, dni, fecha_limite_pago, id_lista_precios) VALUES (?, ?, ?, ?)",
+                (cliente.nombre, cliente.dni, cliente.fecha_limite_pago, cliente.id_lista_precios)
             )
             conn.commit()
             
@@ -337,8 +849,8 @@ def actualizar_cliente(cliente: Cliente):
         with conn:
             cursor = conn.cursor()
             cursor.execute(
-                "UPDATE cliente SET nombre = ?, dni = ?, fecha_limite_pago = ? WHERE id_cliente = ?",
-                (cliente.nombre, cliente.dni, cliente.fecha_limite_pago, cliente.id_cliente)
+                "UPDATE cliente SET nombre = ?, dni = ?, fecha_limite_pago = ?, id_lista_precios = ? WHERE id_cliente = ?",
+                (cliente.nombre, cliente.dni, cliente.fecha_limite_pago, cliente.id_lista_precios, cliente.id_cliente)
             )
         return True
     except sqlite3.Error as e:
@@ -346,56 +858,573 @@ def actualizar_cliente(cliente: Cliente):
         print(f"Error al actualizar cliente: {e}")
         return False
 
-def obtener_producto_por_codigo_barras(codigo_barras):
+# --- Listas de precios ---
+# Un cliente (o un grupo de clientes, p. ej. "Mayoristas") tiene una lista con precios por producto y,
+# opcionalmente, escalas por cantidad mínima. Lo que no figura en la lista se cobra al precio de venta
+# con el ajuste general de la lista. Las escalas se leen una vez por producto y lista y quedan en
+# memoria hasta que cambia la lista o el producto.
+
+_cache_listas_precios = {}  # (id_lista, id_producto) -> (precio_base, ((cantidad_minima, precio), ...) de mayor a menor)
+_generacion_cache_listas_precios = 0
+_bloqueo_cache_listas_precios = threading.Lock()
+
+def obtener_listas_precios():
     with _get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM productos WHERE codigo_barras = ?", (codigo_barras,))
-        fila = cursor.fetchone()
-        if fila:
-            producto = Producto(**dict(fila))
-            producto.cantidad_stock = obtener_stock_total_lotes(producto.id_producto) + producto.stock_sin_lote
-            return producto
+        cursor.execute(
+            """SELECT l.*, (SELECT COUNT(*) FROM cliente c WHERE c.id_lista_precios = l.id_lista) AS clientes
+               FROM listas_precios l ORDER BY l.nombre"""
+        )
+        return [dict(fila) for fila in cursor.fetchall()]
+
+def agregar_lista_precios(nombre, ajuste_porcentaje=0.0):
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO listas_precios (nombre, ajuste_porcentaje) VALUES (?, ?)", (nombre, ajuste_porcentaje))
+        return cursor.lastrowid
+    except sqlite3.Error as e:
+        print(f"Error al agregar la lista de precios: {e}")
         return None
 
-def obtener_producto_por_id(id_producto):
+def actualizar_lista_precios(id_lista, nombre, ajuste_porcentaje):
+    try:
+        with _get_db_connection() as conn:
+            conn.execute("UPDATE listas_precios SET nombre = ?, ajuste_porcentaje = ? WHERE id_lista = ?", (nombre, ajuste_porcentaje, id_lista))
+        invalidar_cache_listas_precios(id_lista=id_lista)
+        return True
+    except sqlite3.Error as e:
+        print(f"Error al actualizar la lista de precios: {e}")
+        return False
+
+def obtener_precios_lista(id_lista):
     with _get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM productos WHERE id_producto = ?", (id_producto,))
-        fila = cursor.fetchone()
-        if fila:
-            producto = Producto(**dict(fila))
-            producto.cantidad_stock = obtener_stock_total_lotes(producto.id_producto) + producto.stock_sin_lote
-            return producto
-        return None
+        cursor.execute(
+            """SELECT pl.id_producto, p.nombre, p.precio_venta, pl.cantidad_minima, pl.precio
+               FROM precios_lista pl
+               JOIN productos p ON p.id_producto = pl.id_producto
+               WHERE pl.id_lista = ?
+               ORDER BY p.nombre, pl.cantidad_minima""",
+            (id_lista,)
+        )
+        return [dict(fila) for fila in cursor.fetchall()]
+
+def guardar_precios_lista(id_lista, precios):
+    # 'precios' es una lista de (id_producto, cantidad_minima, precio); precio None quita esa escala.
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                """INSERT INTO precios_lista (id_lista, id_producto, cantidad_minima, precio) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (id_lista, id_producto, cantidad_minima) DO UPDATE SET precio = excluded.precio""",
+                [(id_lista, id_producto, cantidad_minima, precio) for id_producto, cantidad_minima, precio in precios if precio is not None]
+            )
+            cursor.executemany(
+                "DELETE FROM precios_lista WHERE id_lista = ? AND id_producto = ? AND cantidad_minima = ?",
+                [(id_lista, id_producto, cantidad_minima) for id_producto, cantidad_minima, precio in precios if precio is None]
+            )
+        invalidar_cache_listas_precios({id_producto for id_producto, _, _ in precios}, id_lista)
+        return True
+    except sqlite3.Error as e:
+        print(f"Error al guardar los precios de la lista: {e}")
+        return False
+
+@al_reiniciar_bd
+@al_cambiar_productos
+def invalidar_cache_listas_precios(ids_productos=None, id_lista=None):
+    global _generacion_cache_listas_precios
+    with _bloqueo_cache_listas_precios:
+        _generacion_cache_listas_precios += 1
+        if ids_productos is None and id_lista is None:
+            _cache_listas_precios.clear()
+            return
+        for clave in [c for c in _cache_listas_precios
+                      if (id_lista is None or c[0] == id_lista) and (ids_productos is None or c[1] in ids_productos)]:
+            del _cache_listas_precios[clave]
 
-def obtener_producto_por_nombre(nombre):
+def _cargar_escalas_precios(id_lista, ids_productos):
+    # Una sola consulta para todos los productos pedidos (p. ej. el carrito entero al asignar el cliente).
+    with _get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """SELECT p.id_producto, ROUND(p.precio_venta * (1 + l.ajuste_porcentaje / 100.0), 2) AS precio_base,
+                      pl.cantidad_minima, pl.precio
+               FROM json_each(?) j
+               JOIN productos p ON p.id_producto = j.value
+               JOIN listas_precios l ON l.id_lista = ?
+               LEFT JOIN precios_lista pl ON pl.id_lista = l.id_lista AND pl.id_producto = p.id_producto
+               ORDER BY p.id_producto, pl.cantidad_minima DESC""",
+            (json.dumps(list(ids_productos)), id_lista)
+        )
+        escalas = {}
+        for id_producto, precio_base, cantidad_minima, precio in cursor.fetchall():
+            base, lista = escalas.setdefault(id_producto, (precio_base, []))
+            if cantidad_minima is not None:
+                lista.append((cantidad_minima, precio))
+    return {id_producto: (base, tuple(lista)) for id_producto, (base, lista) in escalas.items()}
+
+def resolver_precios_lista(id_lista, cantidades: dict) -> dict:
+    # 'cantidades' es {id_producto: cantidad}; devuelve {id_producto: precio unitario según la lista}.
+    # Los productos inexistentes (o una lista inexistente) no aparecen en el resultado.
+    with _bloqueo_cache_listas_precios:
+        escalas = {p: _cache_listas_precios.get((id_lista, p)) for p in cantidades}
+        generacion = _generacion_cache_listas_precios
+    faltantes = [p for p, escala in escalas.items() if escala is None]
+    if faltantes:
+        try:
+            cargadas = _cargar_escalas_precios(id_lista, faltantes)
+        except sqlite3.Error as e:
+            print(f"Error al resolver precios de lista: {e}")
+            cargadas = {}
+        with _bloqueo_cache_listas_precios:
+            # Si algo se invalidó mientras se leía, lo leído sirve para esta vez pero no se guarda.
+            if generacion == _generacion_cache_listas_precios:
+                for id_producto, escala in cargadas.items():
+                    _cache_listas_precios[(id_lista, id_producto)] = escala
+        escalas.update(cargadas)
+
+    precios = {}
+    for id_producto, cantidad in cantidades.items():
+        escala = escalas.get(id_producto)
+        if escala is None:
+            continue
+        precio_base, escalones = escala
+        precios[id_producto] = next((precio for minima, precio in escalones if minima <= cantidad), precio_base)
+    return precios
+
+# --- Caché de productos ---
+# Las búsquedas puntuales de un producto se repiten mucho (una por línea del ticket, por fila del
+# detalle de venta, al editar el carrito). Se guardan en un LRU acotado por id, código de barras y
+# nombre, que invalidan las funciones que cambian el producto o su stock. Quien necesite el stock
+# al día aunque lo haya cambiado otro proceso pasa usar_cache=False.
+
+TAMANO_CACHE_PRODUCTOS = 512
+
+_cache_productos = OrderedDict()  # id_producto -> Producto
+_claves_cache_productos = {}  # ('codigo_barras' | 'nombre', valor) -> id_producto
+_metricas_cache_productos = {'aciertos': 0, 'fallos': 0, 'invalidaciones': 0}
+# Cada invalidación avanza la generación: una lectura que empezó antes no guarda su resultado.
+_generacion_cache_productos = 0
+_bloqueo_cache_productos = threading.Lock()
+
+def _quitar_de_cache_productos(id_producto):
+    producto = _cache_productos.pop(id_producto, None)
+    if producto is None:
+        return
+    for clave in (('codigo_barras', producto.codigo_barras), ('nombre', producto.nombre)):
+        if _claves_cache_productos.get(clave) == id_producto:
+            del _claves_cache_productos[clave]
+
+def _leer_cache_productos(campo, valor):
+    # Devuelve (copia del producto o None, generación vigente al momento de la lectura).
+    with _bloqueo_cache_productos:
+        id_producto = valor if campo == 'id_producto' else _claves_cache_productos.get((campo, valor))
+        producto = _cache_productos.get(id_producto)
+        if producto is None:
+            _metricas_cache_productos['fallos'] += 1
+            return None, _generacion_cache_productos
+        _cache_productos.move_to_end(id_producto)
+        _metricas_cache_productos['aciertos'] += 1
+        return copy.copy(producto), _generacion_cache_productos
+
+def _guardar_cache_productos(producto: Producto, generacion):
+    with _bloqueo_cache_productos:
+        if generacion != _generacion_cache_productos:
+            return
+        _quitar_de_cache_productos(producto.id_producto)
+        _cache_productos[producto.id_producto] = copy.copy(producto)
+        if producto.codigo_barras:
+            _claves_cache_productos[('codigo_barras', producto.codigo_barras)] = producto.id_producto
+        _claves_cache_productos[('nombre', producto.nombre)] = producto.id_producto
+        while len(_cache_productos) > TAMANO_CACHE_PRODUCTOS:
+            _quitar_de_cache_productos(next(iter(_cache_productos)))
+
+@al_reiniciar_bd
+@al_cambiar_productos
+def invalidar_cache_productos(ids_productos=None):
+    # Sin ids se vacía toda la caché (cambios masivos, restauración de un backup).
+    global _generacion_cache_productos
+    with _bloqueo_cache_productos:
+        _generacion_cache_productos += 1
+        _metricas_cache_productos['invalidaciones'] += 1
+        if ids_productos is None:
+            _cache_productos.clear()
+            _claves_cache_productos.clear()
+        else:
+            for id_producto in ids_productos:
+                _quitar_de_cache_productos(id_producto)
+
+def obtener_metricas_cache_productos():
+    with _bloqueo_cache_productos:
+        metricas = dict(_metricas_cache_productos)
+        metricas['tamano'] = len(_cache_productos)
+    consultas = metricas['aciertos'] + metricas['fallos']
+    metricas['tasa_aciertos'] = metricas['aciertos'] / consultas if consultas else 0.0
+    return metricas
+
+def _obtener_producto_por_campo(campo, valor, usar_cache=True):
+    # 'campo' es siempre uno de id_producto, codigo_barras o nombre (nunca viene del usuario).
+    if usar_cache:
+        producto, generacion = _leer_cache_productos(campo, valor)
+        if producto is not None:
+            return producto
     with _get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM productos WHERE nombre = ?", (nombre,))
+        cursor.execute(f"SELECT * FROM productos WHERE {campo} = ?", (valor,))
         fila = cursor.fetchone()
         if fila:
             producto = Producto(**dict(fila))
             producto.cantidad_stock = obtener_stock_total_lotes(producto.id_producto) + producto.stock_sin_lote
+            if usar_cache:
+                _guardar_cache_productos(producto, generacion)
             return producto
         return None
 
+def obtener_producto_por_codigo_barras(codigo_barras, usar_cache=True):
+    return _obtener_producto_por_campo('codigo_barras', codigo_barras, usar_cache)
+
+# Un código escaneado puede ser el del producto o el de uno de sus lotes. Manda el del producto
+# (p. ej. cuando el lote se cargó con el mismo EAN); entre lotes, el primero con stock por FEFO.
+_SQL_RESOLVER_CODIGO_BARRAS = """
+    SELECT id_producto, id_stock FROM (
+        SELECT id_producto, NULL AS id_stock, 0 AS prioridad, NULL AS vencimiento
+        FROM productos WHERE codigo_barras = :codigo
+        UNION ALL
+        SELECT id_producto, id_stock, CASE WHEN cantidad > 0 THEN 1 ELSE 2 END,
+               IFNULL(fecha_vencimiento, '9999-12-31')
+        FROM stock WHERE codigo_barras = :codigo
+    )
+    ORDER BY prioridad, vencimiento, id_stock
+    LIMIT 1
+"""
+
+def resolver_codigo_barras(codigo_barras):
+    # Devuelve (producto, id_stock) para cualquier código escaneado; id_stock es None si el
+    # código es el del producto. None si no corresponde a nada.
+    with _get_db_connection() as conn:
+        fila = conn.execute(_SQL_RESOLVER_CODIGO_BARRAS, {'codigo': codigo_barras}).fetchone()
+    if not fila:
+        return None
+    producto = obtener_producto_por_id(fila[0])
+    return (producto, fila[1]) if producto else None
+
+def obtener_producto_por_id(id_producto, usar_cache=True):
+    return _obtener_producto_por_campo('id_producto', id_producto, usar_cache)
+
+def obtener_producto_por_nombre(nombre, usar_cache=True):
+    return _obtener_producto_por_campo('nombre', nombre, usar_cache)
+
 def actualizar_producto(producto: Producto):
     conn = _get_db_connection()
     try:
         with conn:
             cursor = conn.cursor()
+            cursor.execute("SELECT precio_venta FROM productos WHERE id_producto = ?", (producto.id_producto,))
+            fila = cursor.fetchone()
             cursor.execute(
                 """UPDATE productos 
                    SET nombre = ?, precio_venta = ?, volumen = ?, codigo_barras = ?, descripcion = ?, stock_sin_lote = ?
                    WHERE id_producto = ?""",
                 (producto.nombre, producto.precio_venta, producto.volumen, producto.codigo_barras, producto.descripcion, producto.stock_sin_lote, producto.id_producto)
             )
-            return True
+            if fila and fila[0] != producto.precio_venta:
+                _registrar_cambio_precio(cursor, producto.id_producto, producto.precio_venta)
+        _notificar_cambio_productos([producto.id_producto])
+        return True
     except sqlite3.Error as e:
         print(f"Error al actualizar producto: {e}")
         conn.rollback()
         return False
 
+# --- Historial de precios ---
+
+def _normalizar_fecha_hasta(fecha: str) -> str:
+    # Una fecha sin hora ('2024-03-31') abarca todo ese día.
+    return fecha + " 23:59:59" if len(fecha) == 10 else fecha
+
+def _registrar_cambio_precio(cursor: sqlite3.Cursor, id_producto: int, precio: float, fecha: str = None):
+    cursor.execute(
+        "INSERT INTO historial_precios (id_producto, precio, fecha_desde) VALUES (?, ?, ?)",
+        (id_producto, precio, fecha or datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    )
+
+def obtener_historial_precios(id_producto):
+    with _get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT precio, fecha_desde FROM historial_precios WHERE id_producto = ? ORDER BY fecha_desde, id_historial",
+            (id_producto,)
+        )
+        return [dict(fila) for fila in cursor.fetchall()]
+
+def obtener_precio_a_fecha(id_producto, fecha: str):
+    with _get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT " + _SQL_PRECIO_A_FECHA.format(alias='p') + " FROM productos p WHERE p.id_producto = ?",
+            (_normalizar_fecha_hasta(fecha), id_producto)
+        )
+        fila = cursor.fetchone()
+        return fila[0] if fila else None
+
+def obtener_precios_a_fecha(fecha: str, product_ids: list = None) -> dict:
+    # {id_producto: precio vigente en 'fecha'} para todo el catálogo (o los ids indicados) en una consulta.
+    query = f"SELECT p.id_producto, {_SQL_PRECIO_A_FECHA.format(alias='p')} AS precio FROM productos p"
+    params = [_normalizar_fecha_hasta(fecha)]
+    if product_ids is not None:
+        if not product_ids:
+            return {}
+        query += f" WHERE p.id_producto IN ({','.join('?' for _ in product_ids)})"
+        params.extend(product_ids)
+    with _get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        return {id_producto: precio for id_producto, precio in cursor.fetchall() if precio is not None}
+
+_SQL_VARIACION_PRECIOS = f"""
+    SELECT id_producto, nombre, precio_inicio, precio_fin, unidades_vendidas,
+           (precio_fin - precio_inicio) * 100.0 / precio_inicio AS variacion_pct
+    FROM (
+        SELECT p.id_producto, p.nombre,
+               {_SQL_PRECIO_A_FECHA.format(alias='p')} AS precio_inicio,
+               {_SQL_PRECIO_A_FECHA.format(alias='p')} AS precio_fin,
+               IFNULL((SELECT SUM(dv.cantidad) FROM detalle_venta dv JOIN ventas v ON dv.id_venta = v.id_venta
+                       WHERE dv.id_producto = p.id_producto AND v.fecha_venta BETWEEN ? AND ?), 0) AS unidades_vendidas
+        FROM productos p
+        WHERE p.nombre LIKE ?
+    )
+    WHERE precio_inicio > 0 AND precio_fin IS NOT NULL
+    ORDER BY variacion_pct DESC
+"""
+
+def obtener_variacion_precios(fecha_inicio: str, fecha_fin: str, nombre_like: str = None):
+    desde = _normalizar_fecha_hasta(fecha_inicio)
+    hasta = _normalizar_fecha_hasta(fecha_fin)
+    patron = f"%{nombre_like}%" if nombre_like else "%"
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_VARIACION_PRECIOS, (desde, hasta, desde, hasta, patron))
+            return [dict(fila) for fila in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Error al calcular la variación de precios: {e}")
+        return []
+
+def obtener_reporte_inflacion(fecha_inicio: str, fecha_fin: str, nombre_like: str = None):
+    # Variación promedio simple y ponderada por unidades vendidas en el período (índice tipo Laspeyres).
+    variaciones = obtener_variacion_precios(fecha_inicio, fecha_fin, nombre_like)
+    reporte = {
+        'productos_comparados': len(variaciones),
+        'productos_con_aumento': sum(1 for v in variaciones if v['variacion_pct'] > 0),
+        'variacion_promedio_pct': None,
+        'variacion_ponderada_pct': None,
+        'detalle': variaciones,
+    }
+    if not variaciones:
+        return reporte
+    reporte['variacion_promedio_pct'] = sum(v['variacion_pct'] for v in variaciones) / len(variaciones)
+    base = sum(v['precio_inicio'] * v['unidades_vendidas'] for v in variaciones)
+    if base > 0:
+        actual = sum(v['precio_fin'] * v['unidades_vendidas'] for v in variaciones)
+        reporte['variacion_ponderada_pct'] = (actual - base) * 100.0 / base
+    return reporte
+
+# --- Promociones ---
+# Las reglas se guardan acá; promociones.py las compila en un índice por producto y las evalúa
+# sobre el carrito. registrar_venta guarda qué promoción aplicó cada línea y por cuánto.
+
+_COLUMNAS_PROMOCION = ('nombre', 'tipo', 'cantidad', 'valor', 'prioridad', 'fecha_desde', 'fecha_hasta', 'dias_semana', 'hora_desde', 'hora_hasta', 'activa')
+
+def _guardar_productos_promocion(cursor: sqlite3.Cursor, promocion: Promocion):
+    cursor.execute("DELETE FROM promocion_productos WHERE id_promocion = ?", (promocion.id_promocion,))
+    cursor.executemany(
+        "INSERT INTO promocion_productos (id_promocion, id_producto, cantidad) VALUES (?, ?, ?)",
+        [(promocion.id_promocion, id_producto, unidades) for id_producto, unidades in promocion.productos.items()]
+    )
+
+def agregar_promocion(promocion: Promocion):
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"INSERT INTO promociones ({', '.join(_COLUMNAS_PROMOCION)}) VALUES ({', '.join('?' for _ in _COLUMNAS_PROMOCION)})",
+                [getattr(promocion, columna) for columna in _COLUMNAS_PROMOCION]
+            )
+            promocion.id_promocion = cursor.lastrowid
+            _guardar_productos_promocion(cursor, promocion)
+        _notificar_cambio_promociones()
+        return promocion.id_promocion
+    except sqlite3.Error as e:
+        print(f"Error al agregar la promoción: {e}")
+        return None
+
+def actualizar_promocion(promocion: Promocion):
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"UPDATE promociones SET {', '.join(f'{columna} = ?' for columna in _COLUMNAS_PROMOCION)} WHERE id_promocion = ?",
+                [getattr(promocion, columna) for columna in _COLUMNAS_PROMOCION] + [promocion.id_promocion]
+            )
+            _guardar_productos_promocion(cursor, promocion)
+        _notificar_cambio_promociones()
+        return True
+    except sqlite3.Error as e:
+        print(f"Error al actualizar la promoción: {e}")
+        return False
+
+def obtener_promociones(solo_activas=False):
+    with _get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM promociones {'WHERE activa = 1' if solo_activas else ''} ORDER BY prioridad DESC, id_promocion")
+        promociones = {fila['id_promocion']: Promocion(**dict(fila)) for fila in cursor.fetchall()}
+        cursor.execute("SELECT id_promocion, id_producto, cantidad FROM promocion_productos")
+        for id_promocion, id_producto, unidades in cursor.fetchall():
+            if id_promocion in promociones:
+                promociones[id_promocion].productos[id_producto] = unidades
+        for promocion in promociones.values():
+            promocion.activa = bool(promocion.activa)
+        return list(promociones.values())
+
+def obtener_promociones_aplicadas(id_venta, desde_snapshot=False):
+    with _conexion_lectura(desde_snapshot) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """SELECT dvp.id_detalle, dv.id_producto, dvp.id_promocion, p.nombre, dvp.monto
+               FROM detalle_venta dv
+               JOIN detalle_venta_promociones dvp ON dvp.id_detalle = dv.id_detalle
+               JOIN promociones p ON p.id_promocion = dvp.id_promocion
+               WHERE dv.id_venta = ?
+               ORDER BY dvp.id_detalle, dvp.id_promocion""",
+            (id_venta,)
+        )
+        return [dict(fila) for fila in cursor.fetchall()]
+
+# --- Turnos de caja ---
+# Hay una sola caja: a lo sumo un turno abierto (lo garantiza idx_turnos_caja_abierto). Mientras está
+# abierto, registrar_venta y realizar_pago_cliente suman a totales_turno lo cobrado por cada forma de
+# pago, dentro de la misma transacción. El cierre (reporte Z) se arma con esas pocas filas, sin
+# recorrer las ventas del turno.
+
+def _id_turno_abierto(cursor: sqlite3.Cursor):
+    fila = cursor.execute("SELECT id_turno FROM turnos_caja WHERE cierre IS NULL").fetchone()
+    return fila[0] if fila else None
+
+def _sumar_a_turno(cursor: sqlite3.Cursor, id_turno, forma_pago, venta=None, cobro=None):
+    cursor.execute(
+        """INSERT INTO totales_turno (id_turno, forma_pago, cantidad_ventas, total_ventas, cantidad_cobros, total_cobros)
+           VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT (id_turno, forma_pago) DO UPDATE SET
+               cantidad_ventas = cantidad_ventas + excluded.cantidad_ventas,
+               total_ventas = total_ventas + excluded.total_ventas,
+               cantidad_cobros = cantidad_cobros + excluded.cantidad_cobros,
+               total_cobros = total_cobros + excluded.total_cobros""",
+        (id_turno, forma_pago or 'Sin especificar', int(venta is not None), venta or 0, int(cobro is not None), cobro or 0)
+    )
+
+def abrir_turno(usuario, monto_inicial=0.0, fecha_apertura=None):
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO turnos_caja (usuario, apertura, monto_inicial) VALUES (?, ?, ?)",
+                (usuario, fecha_apertura or datetime.now().strftime('%Y-%m-%d %H:%M:%S'), monto_inicial)
+            )
+            return cursor.lastrowid
+    except sqlite3.IntegrityError:
+        print("Error al abrir el turno: ya hay un turno de caja abierto.")
+        return None
+    except sqlite3.Error as e:
+        print(f"Error al abrir el turno: {e}")
+        return None
+
+def obtener_turno_abierto():
+    with _get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM turnos_caja WHERE cierre IS NULL")
+        fila = cursor.fetchone()
+        return dict(fila) if fila else None
+
+def cerrar_turno(id_turno, monto_contado, observaciones=None, fecha_cierre=None):
+    # Devuelve el reporte Z del turno, o None si no existe o ya estaba cerrado.
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE turnos_caja SET cierre = ?, monto_contado = ?, observaciones = ? WHERE id_turno = ? AND cierre IS NULL",
+                (fecha_cierre or datetime.now().strftime('%Y-%m-%d %H:%M:%S'), monto_contado, observaciones, id_turno)
+            )
+            if cursor.rowcount == 0:
+                print(f"Error al cerrar el turno: el turno {id_turno} no existe o ya está cerrado.")
+                return None
+    except sqlite3.Error as e:
+        print(f"Error al cerrar el turno: {e}")
+        return None
+    return obtener_reporte_turno(id_turno)
+
+def obtener_reporte_turno(id_turno, desde_snapshot=False):
+    # El efectivo esperado en la caja es el monto inicial más lo cobrado en efectivo (ventas y pagos de libreta).
+    with _conexion_lectura(desde_snapshot) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM turnos_caja WHERE id_turno = ?", (id_turno,))
+        fila = cursor.fetchone()
+        if not fila:
+            return None
+        reporte = dict(fila)
+        cursor.execute(
+            """SELECT forma_pago, cantidad_ventas, total_ventas, cantidad_cobros, total_cobros
+               FROM totales_turno WHERE id_turno = ? ORDER BY forma_pago""",
+            (id_turno,)
+        )
+        reporte['totales'] = [dict(fila) for fila in cursor.fetchall()]
+    reporte['cantidad_ventas'] = sum(t['cantidad_ventas'] for t in reporte['totales'])
+    reporte['total_ventas'] = sum(t['total_ventas'] for t in reporte['totales'])
+    reporte['total_cobros'] = sum(t['total_cobros'] for t in reporte['totales'])
+    efectivo = next((t for t in reporte['totales'] if t['forma_pago'] == 'Efectivo'), None)
+    reporte['efectivo_esperado'] = reporte['monto_inicial'] + (efectivo['total_ventas'] + efectivo['total_cobros'] if efectivo else 0)
+    reporte['diferencia'] = None if reporte['monto_contado'] is None else reporte['monto_contado'] - reporte['efectivo_esperado']
+    return reporte
+
+def obtener_turnos(usuario=None, fecha_desde=None, fecha_hasta=None, desde_snapshot=False):
+    # Historial de turnos, del más reciente al más viejo, con los totales de cada uno.
+    condiciones, params = [], []
+    if usuario:
+        condiciones.append("t.usuario = ?")
+        params.append(usuario)
+    if fecha_desde:
+        condiciones.append("t.apertura >= ?")
+        params.append(fecha_desde)
+    if fecha_hasta:
+        condiciones.append("t.apertura <= ?")
+        params.append(_normalizar_fecha_hasta(fecha_hasta))
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    with _conexion_lectura(desde_snapshot) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""SELECT t.id_turno, t.usuario, t.apertura, t.cierre, t.monto_inicial, t.monto_contado,
+                       IFNULL(SUM(tt.cantidad_ventas), 0) AS cantidad_ventas,
+                       IFNULL(SUM(tt.total_ventas), 0) AS total_ventas,
+                       IFNULL(SUM(tt.total_cobros), 0) AS total_cobros,
+                       t.monto_inicial + IFNULL(SUM(CASE WHEN tt.forma_pago = 'Efectivo' THEN tt.total_ventas + tt.total_cobros END), 0) AS efectivo_esperado
+                FROM turnos_caja t
+                LEFT JOIN totales_turno tt ON tt.id_turno = t.id_turno
+                {where}
+                GROUP BY t.id_turno
+                ORDER BY t.apertura DESC, t.id_turno DESC""",
+            params
+        )
+        turnos = [dict(fila) for fila in cursor.fetchall()]
+    for turno in turnos:
+        turno['diferencia'] = None if turno['monto_contado'] is None else turno['monto_contado'] - turno['efectivo_esperado']
+    return turnos
+
+def obtener_usuarios_turnos():
+    with _get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT usuario FROM turnos_caja ORDER BY usuario")
+        return [fila[0] for fila in cursor.fetchall()]
+
 def registrar_venta(venta: 'Venta'):
     conn = _get_db_connection()
     try:
@@ -405,11 +1434,14 @@ def registrar_venta(venta: 'Venta'):
             PERMITIR_STOCK_NEGATIVO = config.getboolean('Negocio', 'PermitirStockNegativo', fallback=False)
 
             cursor = conn.cursor()
+            id_turno = _id_turno_abierto(cursor)
             cursor.execute(
-                "INSERT INTO ventas (fecha_venta, total, forma_pago, observaciones, id_cliente) VALUES (?, ?, ?, ?, ?)",
-                (venta.fecha_venta, venta.total, venta.forma_pago, venta.observaciones, venta.id_cliente)
+                "INSERT INTO ventas (fecha_venta, total, forma_pago, observaciones, id_cliente, id_turno) VALUES (?, ?, ?, ?, ?, ?)",
+                (venta.fecha_venta, venta.total, venta.forma_pago, venta.observaciones, venta.id_cliente, id_turno)
             )
             id_venta_nueva = cursor.lastrowid
+            if id_turno is not None:
+                _sumar_a_turno(cursor, id_turno, venta.forma_pago, venta=venta.total)
 
             if venta.forma_pago == 'Libreta' and venta.id_cliente is not None:
                 cursor.execute(
@@ -420,12 +1452,6 @@ def registrar_venta(venta: 'Venta'):
                 )
 
             for detalle in venta.detalles:
-                detalle.estado = "Completada"
-                cursor.execute(
-                    "INSERT INTO detalle_venta (id_venta, id_producto, cantidad, precio_unitario, descuento, subtotal, estado) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    (id_venta_nueva, detalle.id_producto, detalle.cantidad, detalle.precio_unitario, detalle.descuento, detalle.subtotal, detalle.estado)
-                )
-
                 cursor.execute("SELECT stock_sin_lote FROM productos WHERE id_producto = ?", (detalle.id_producto,))
                 stock_sin_lote_actual = cursor.fetchone()[0]
 
@@ -437,10 +1463,21 @@ def registrar_venta(venta: 'Venta'):
                     raise sqlite3.IntegrityError(
                         f"Stock insuficiente para el producto ID {detalle.id_producto}. Se requieren {cantidad_a_vender} y hay {stock_total_disponible}."
                     )
-                
+
+                # Lo que no cubren los lotes ni el stock sin lote positivo queda pendiente hasta que entre
+                # mercadería. Se calcula contra lo que la línea descuenta de stock_sin_lote y no contra el
+                # stock total: así las líneas pendientes siempre suman -stock_sin_lote, que es lo que
+                # _procesar_ventas_pendientes_post_stock reparte al saldarlo, aunque haya lotes con
+                # unidades y stock_sin_lote negativo a la vez.
                 cantidad_a_reducir_de_lotes = min(cantidad_a_vender, stock_en_lotes)
+                detalle.cantidad_pendiente = max(0, cantidad_a_vender - max(cantidad_a_reducir_de_lotes, 0) - max(stock_sin_lote_actual, 0))
+                detalle.estado = "Pendiente de Stock" if detalle.cantidad_pendiente > 0 else "Completada"
+
+                # El costo de la línea es el de los lotes que consume; lo que sale sin lote se valúa
+                # al último costo conocido del producto.
+                detalle.costo_total = 0.0
                 if cantidad_a_reducir_de_lotes > 0:
-                    _reducir_stock_de_lotes(cursor, detalle.id_producto, cantidad_a_reducir_de_lotes)
+                    detalle.costo_total = _reducir_stock_de_lotes(cursor, detalle.id_producto, cantidad_a_reducir_de_lotes, detalle.id_stock)
 
                 diferencia = cantidad_a_vender - stock_en_lotes
                 if diferencia > 0:
@@ -448,8 +1485,30 @@ def registrar_venta(venta: 'Venta'):
                         "UPDATE productos SET stock_sin_lote = stock_sin_lote - ? WHERE id_producto = ?",
                         (diferencia, detalle.id_producto)
                     )
+                    unidades_sin_lote = cantidad_a_vender - max(cantidad_a_reducir_de_lotes, 0)
+                    detalle.costo_total += unidades_sin_lote * _ultimo_costo_conocido(cursor, detalle.id_producto)
+
+                cursor.execute(
+                    "INSERT INTO detalle_venta (id_venta, id_producto, cantidad, precio_unitario, descuento, subtotal, estado, cantidad_pendiente, costo_total, descuento_promocion) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (id_venta_nueva, detalle.id_producto, detalle.cantidad, detalle.precio_unitario, detalle.descuento, detalle.subtotal, detalle.estado, detalle.cantidad_pendiente, detalle.costo_total, detalle.descuento_promocion)
+                )
+                detalle.id_detalle = cursor.lastrowid
+                if detalle.promociones:
+                    cursor.executemany(
+                        "INSERT INTO detalle_venta_promociones (id_detalle, id_promocion, monto) VALUES (?, ?, ?)",
+                        [(detalle.id_detalle, id_promocion, monto) for id_promocion, monto in detalle.promociones]
+                    )
+                cursor.execute(
+                    """INSERT INTO resumen_margen_diario (fecha, id_producto, unidades, ingresos, costo) VALUES (date(?), ?, ?, ?, ?)
+                       ON CONFLICT (fecha, id_producto) DO UPDATE SET
+                           unidades = unidades + excluded.unidades,
+                           ingresos = ingresos + excluded.ingresos,
+                           costo = costo + excluded.costo""",
+                    (venta.fecha_venta, detalle.id_producto, detalle.cantidad, detalle.subtotal, detalle.costo_total)
+                )
 
-            return id_venta_nueva
+        _notificar_cambio_productos([detalle.id_producto for detalle in venta.detalles])
+        return id_venta_nueva
     except sqlite3.IntegrityError:
         raise
     except sqlite3.Error as e: 
@@ -457,11 +1516,14 @@ def registrar_venta(venta: 'Venta'):
         conn.rollback()
         return None
 
-def _reducir_stock_de_lotes(cursor, id_producto, cantidad_a_descontar):
+def _reducir_stock_de_lotes(cursor, id_producto, cantidad_a_descontar, id_stock_preferido=None):
+    # FEFO; si se escaneó un lote puntual, se descuenta primero de ese y el resto sigue por FEFO.
+    # Devuelve el costo de las unidades descontadas (los lotes sin costo cargado cuentan como 0).
+    costo_consumido = 0.0
     cursor.execute(
-        """SELECT id_stock, cantidad FROM stock WHERE id_producto = ? AND cantidad > 0
-           ORDER BY IFNULL(fecha_vencimiento, '9999-12-31') ASC, id_stock ASC""",
-        (id_producto,)
+        """SELECT id_stock, cantidad, costo_unitario FROM stock WHERE id_producto = ? AND cantidad > 0
+           ORDER BY (id_stock IS ?) DESC, IFNULL(fecha_vencimiento, '9999-12-31') ASC, id_stock ASC""",
+        (id_producto, id_stock_preferido)
     )
     lotes_disponibles = cursor.fetchall()
 
@@ -472,6 +1534,9 @@ def _reducir_stock_de_lotes(cursor, id_producto, cantidad_a_descontar):
         id_lote_actual = lote['id_stock']
         cantidad_en_lote = lote['cantidad']
 
+        unidades = min(cantidad_a_descontar, cantidad_en_lote)
+        costo_consumido += unidades * (lote['costo_unitario'] or 0)
+
         if cantidad_a_descontar >= cantidad_en_lote:
             cursor.execute("UPDATE stock SET cantidad = 0 WHERE id_stock = ?", (id_lote_actual,))
             cantidad_a_descontar -= cantidad_en_lote
@@ -482,12 +1547,21 @@ def _reducir_stock_de_lotes(cursor, id_producto, cantidad_a_descontar):
         
         if cantidad_a_descontar == 0:
             break
+    return costo_consumido
 
-def obtener_lotes_por_producto(id_producto):
+def _ultimo_costo_conocido(cursor, id_producto):
+    cursor.execute(
+        "SELECT costo_unitario FROM stock WHERE id_producto = ? AND costo_unitario IS NOT NULL ORDER BY id_stock DESC LIMIT 1",
+        (id_producto,)
+    )
+    fila = cursor.fetchone()
+    return fila[0] if fila else 0.0
+
+def obtener_lotes_por_producto(id_producto):
     with _get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT id_stock, cantidad, fecha_vencimiento, codigo_barras FROM stock WHERE id_producto = ? AND cantidad != 0 ORDER BY fecha_vencimiento ASC",
+            "SELECT id_stock, cantidad, fecha_vencimiento, codigo_barras, costo_unitario FROM stock WHERE id_producto = ? AND cantidad != 0 ORDER BY fecha_vencimiento ASC",
             (id_producto,)
         )
         filas = cursor.fetchall()
@@ -510,114 +1584,639 @@ def obtener_stock_total_lotes(id_producto):
         total = cursor.fetchone()[0]
         return total
 
+# --- Vencimientos ---
+# Lotes con stock que vencen hasta una fecha de corte. El índice parcial idx_stock_vencimiento
+# solo contiene lotes vivos con fecha, así que la consulta recorre nada más que la ventana pedida.
+
+_SQL_LOTES_POR_VENCER = """
+    SELECT s.id_stock, s.id_producto, p.nombre, s.codigo_barras, s.cantidad, s.fecha_vencimiento,
+           CAST(julianday(s.fecha_vencimiento) - julianday(:hoy) AS INTEGER) AS dias_para_vencer
+    FROM stock s
+    JOIN productos p ON s.id_producto = p.id_producto
+    WHERE s.cantidad > 0 AND s.fecha_vencimiento IS NOT NULL AND s.fecha_vencimiento <= :corte {filtro}
+    ORDER BY s.fecha_vencimiento, p.nombre, s.id_stock
+"""
+
+def _rango_vencimientos(dias, fecha_referencia=None):
+    hoy = datetime.strptime(fecha_referencia, '%Y-%m-%d') if fecha_referencia else datetime.now()
+    return {'hoy': hoy.strftime('%Y-%m-%d'), 'corte': (hoy + timedelta(days=dias)).strftime('%Y-%m-%d')}
+
+def obtener_lotes_por_vencer(dias=30, fecha_referencia=None, desde_snapshot=False):
+    # Incluye los ya vencidos que siguen con stock (dias_para_vencer negativo).
+    cursor = _conexion_lectura(desde_snapshot).cursor()
+    cursor.execute(_SQL_LOTES_POR_VENCER.format(filtro=""), _rango_vencimientos(dias, fecha_referencia))
+    return [dict(fila) for fila in cursor.fetchall()]
+
+# Resultado del escaneo en segundo plano. Entre escaneos completos (cambio de día o de ventana) solo
+# se vuelven a consultar los productos cuyos lotes cambiaron.
+_escaneo_vencimientos = {'lotes_por_producto': {}, 'dias': None, 'hoy': None, 'pendientes': set(), 'completo': False}
+_bloqueo_vencimientos = threading.Lock()
+
+@al_reiniciar_bd
+@al_cambiar_productos
+def _marcar_vencimientos_pendientes(ids_productos=None):
+    with _bloqueo_vencimientos:
+        if ids_productos is None:
+            _escaneo_vencimientos['completo'] = False
+        else:
+            _escaneo_vencimientos['pendientes'].update(ids_productos)
+
+def actualizar_vencimientos(dias=None, fecha_referencia=None):
+    # Sin 'dias' se mantiene la ventana del último escaneo (la que eligió el usuario en Reportes).
+    with _bloqueo_vencimientos:
+        dias = dias if dias is not None else (_escaneo_vencimientos['dias'] or 30)
+    rango = _rango_vencimientos(dias, fecha_referencia)
+    with _bloqueo_vencimientos:
+        escaneo_completo = not _escaneo_vencimientos['completo'] or _escaneo_vencimientos['dias'] != dias \
+            or _escaneo_vencimientos['hoy'] != rango['hoy']
+        pendientes = list(_escaneo_vencimientos['pendientes'])
+        _escaneo_vencimientos['pendientes'].clear()
+        if escaneo_completo:
+            _escaneo_vencimientos.update({'completo': True, 'dias': dias, 'hoy': rango['hoy']})
+    if not escaneo_completo and not pendientes:
+        return obtener_vencimientos_escaneados()
+
+    lotes_por_producto = {}
+    try:
+        cursor = _get_db_connection().cursor()
+        if escaneo_completo:
+            cursor.execute(_SQL_LOTES_POR_VENCER.format(filtro=""), rango)
+            filas = cursor.fetchall()
+        else:
+            filas = []
+            for inicio in range(0, len(pendientes), TAMANO_LOTE_LECTURA):
+                ids = pendientes[inicio:inicio + TAMANO_LOTE_LECTURA]
+                marcadores = ','.join(f':id{i}' for i in range(len(ids)))
+                parametros = dict(rango, **{f'id{i}': id_producto for i, id_producto in enumerate(ids)})
+                cursor.execute(_SQL_LOTES_POR_VENCER.format(filtro=f"AND s.id_producto IN ({marcadores})"), parametros)
+                filas.extend(cursor.fetchall())
+        for fila in filas:
+            lotes_por_producto.setdefault(fila['id_producto'], []).append(dict(fila))
+    except sqlite3.Error as e:
+        print(f"Error al escanear vencimientos: {e}")
+        _marcar_vencimientos_pendientes(None if escaneo_completo else pendientes)
+        return obtener_vencimientos_escaneados()
+
+    with _bloqueo_vencimientos:
+        if escaneo_completo:
+            _escaneo_vencimientos['lotes_por_producto'] = lotes_por_producto
+        else:
+            for id_producto in pendientes:
+                _escaneo_vencimientos['lotes_por_producto'].pop(id_producto, None)
+            _escaneo_vencimientos['lotes_por_producto'].update(lotes_por_producto)
+    return obtener_vencimientos_escaneados()
+
+def obtener_vencimientos_escaneados():
+    with _bloqueo_vencimientos:
+        lotes = [lote for lotes in _escaneo_vencimientos['lotes_por_producto'].values() for lote in lotes]
+    return sorted(lotes, key=lambda lote: (lote['fecha_vencimiento'], lote['nombre'], lote['id_stock']))
+
 def actualizar_lote(id_stock, cantidad, fecha_vencimiento, codigo_barras):
     try:
         with _get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "UPDATE stock SET cantidad = ?, fecha_vencimiento = ?, codigo_barras = ? WHERE id_stock = ?",
+                "UPDATE stock SET cantidad = ?, fecha_vencimiento = ?, codigo_barras = ? WHERE id_stock = ? RETURNING id_producto",
                 (cantidad, fecha_vencimiento, codigo_barras, id_stock)
             )
-            return True
+            ids_productos = [fila[0] for fila in cursor.fetchall()]
+        _notificar_cambio_productos(ids_productos)
+        return True
     except sqlite3.Error as e:
         print(f"Error al actualizar el lote: {e}")
         return False
 
-def agregar_lote(id_producto, cantidad, fecha_vencimiento, codigo_barras=None):
+def agregar_lote(id_producto, cantidad, fecha_vencimiento, codigo_barras=None, costo_unitario=None):
+    return agregar_lotes([(id_producto, cantidad, fecha_vencimiento, codigo_barras, costo_unitario)])
+
+def agregar_lotes(lotes):
+    # 'lotes' es una lista de (id_producto, cantidad, fecha_vencimiento, codigo_barras[, costo_unitario]).
+    # Toda la recepción se aplica en una sola transacción, incluida la entrega de ventas pendientes.
     try:
         with _get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT stock_sin_lote FROM productos WHERE id_producto = ?", (id_producto,))
-            stock_deuda = cursor.fetchone()[0]
-
-            cantidad_restante_lote = cantidad
-            if stock_deuda < 0:
-                a_saldar = abs(stock_deuda)
-                if cantidad_restante_lote >= a_saldar:
-                    cursor.execute("UPDATE productos SET stock_sin_lote = 0 WHERE id_producto = ?", (id_producto,))
-                    cantidad_restante_lote -= a_saldar
-                else:
-                    cursor.execute("UPDATE productos SET stock_sin_lote = stock_sin_lote + ? WHERE id_producto = ?", (cantidad_restante_lote, id_producto))
-                    cantidad_restante_lote = 0
-
-            if cantidad_restante_lote > 0:
-                query_buscar_lote = "SELECT id_stock, cantidad FROM stock WHERE id_producto = ?"
-                params_buscar_lote = [id_producto]
+            _agregar_lotes_con_cursor(conn.cursor(), lotes)
+        _notificar_cambio_productos({lote[0] for lote in lotes})
+        return True
+    except sqlite3.Error as e:
+        print(f"Error al agregar el lote: {e}")
+        return False
 
-                if fecha_vencimiento is not None:
-                    query_buscar_lote += " AND fecha_vencimiento = ?"
-                    params_buscar_lote.append(fecha_vencimiento)
-                else:
-                    query_buscar_lote += " AND fecha_vencimiento IS NULL"
-                
+def _agregar_lotes_con_cursor(cursor: sqlite3.Cursor, lotes):
+    # Devuelve (unidades que saldaron stock_sin_lote negativo, líneas de venta pendientes completadas).
+    # Las deudas de stock y los lotes con los que se consolida cada línea se leen con una consulta por
+    # tanda de productos, no con una por línea: una entrega entera cuesta pocas consultas más que un lote.
+    ids_productos = list({lote[0] for lote in lotes})
+    deuda_stock = {}
+    lotes_existentes = {}
+    for inicio in range(0, len(ids_productos), TAMANO_LOTE_LECTURA):
+        ids = ids_productos[inicio:inicio + TAMANO_LOTE_LECTURA]
+        placeholders = ','.join('?' for _ in ids)
+        cursor.execute(
+            f"SELECT id_producto, stock_sin_lote FROM productos WHERE id_producto IN ({placeholders}) AND stock_sin_lote < 0",
+            ids
+        )
+        deuda_stock.update({id_producto: -stock_sin_lote for id_producto, stock_sin_lote in cursor.fetchall()})
+        cursor.execute(
+            f"SELECT id_stock, id_producto, fecha_vencimiento FROM stock WHERE id_producto IN ({placeholders}) ORDER BY id_stock",
+            ids
+        )
+        for id_stock, id_producto, fecha_vencimiento in cursor.fetchall():
+            lotes_existentes.setdefault((id_producto, fecha_vencimiento), id_stock)
+
+    saldado_por_producto = {}
+    for id_producto, cantidad, fecha_vencimiento, codigo_barras, *resto in lotes:
+        costo_unitario = resto[0] if resto else None
+        cantidad_restante_lote = cantidad
+        a_saldar = min(cantidad_restante_lote, deuda_stock.get(id_producto, 0))
+        if a_saldar > 0:
+            deuda_stock[id_producto] -= a_saldar
+            saldado_por_producto[id_producto] = saldado_por_producto.get(id_producto, 0) + a_saldar
+            cantidad_restante_lote -= a_saldar
+
+        if cantidad_restante_lote > 0:
+            id_lote_existente = lotes_existentes.get((id_producto, fecha_vencimiento))
+            if id_lote_existente:
+                # Al consolidar en un lote existente el costo queda como promedio ponderado.
+                cursor.execute(
+                    """UPDATE stock SET
+                           costo_unitario = CASE
+                               WHEN :costo IS NULL THEN costo_unitario
+                               WHEN costo_unitario IS NULL OR cantidad <= 0 THEN :costo
+                               ELSE (costo_unitario * cantidad + :costo * :cantidad) / (cantidad + :cantidad)
+                           END,
+                           cantidad = cantidad + :cantidad
+                       WHERE id_stock = :id_stock""",
+                    {'costo': costo_unitario, 'cantidad': cantidad_restante_lote, 'id_stock': id_lote_existente}
+                )
+            else:
                 cursor.execute(
-                    query_buscar_lote,
-                    tuple(params_buscar_lote)
+                    "INSERT INTO stock (id_producto, cantidad, fecha_vencimiento, codigo_barras, costo_unitario) VALUES (?, ?, ?, ?, ?)",
+                    (id_producto, cantidad_restante_lote, fecha_vencimiento, codigo_barras, costo_unitario)
                 )
-                lote_existente = cursor.fetchone()
+                lotes_existentes[(id_producto, fecha_vencimiento)] = cursor.lastrowid
 
-                if lote_existente:
-                    nueva_cantidad = lote_existente['cantidad'] + cantidad_restante_lote
-                    cursor.execute("UPDATE stock SET cantidad = ? WHERE id_stock = ?", (nueva_cantidad, lote_existente['id_stock']))
-                else:
-                    cursor.execute(
-                        "INSERT INTO stock (id_producto, cantidad, fecha_vencimiento, codigo_barras) VALUES (?, ?, ?, ?)",
-                        (id_producto, cantidad_restante_lote, fecha_vencimiento, codigo_barras)
-                    )
-            conn.commit()
-            return True
+    cursor.executemany(
+        "UPDATE productos SET stock_sin_lote = stock_sin_lote + ? WHERE id_producto = ?",
+        [(saldado, id_producto) for id_producto, saldado in saldado_por_producto.items()]
+    )
+    completadas = _procesar_ventas_pendientes_post_stock(cursor, saldado_por_producto)
+    return sum(saldado_por_producto.values()), completadas
+
+def _procesar_ventas_pendientes_post_stock(cursor: sqlite3.Cursor, unidades_por_producto: dict) -> int:
+    # Las unidades que saldan stock_sin_lote negativo son las que se le debían a ventas ya cobradas:
+    # se asignan a las líneas pendientes de cada producto por orden de venta (FIFO).
+    disponibles = {id_producto: unidades for id_producto, unidades in unidades_por_producto.items() if unidades > 0}
+    if not disponibles:
+        return 0
+
+    completadas = []
+    parciales = []
+    ids_productos = list(disponibles)
+    for inicio in range(0, len(ids_productos), TAMANO_LOTE_LECTURA):
+        ids = ids_productos[inicio:inicio + TAMANO_LOTE_LECTURA]
+        placeholders = ','.join('?' for _ in ids)
+        cursor.execute(f"""
+            SELECT dv.id_detalle, dv.id_producto, dv.cantidad_pendiente
+            FROM detalle_venta dv
+            JOIN ventas v ON dv.id_venta = v.id_venta
+            WHERE dv.estado = 'Pendiente de Stock' AND dv.id_producto IN ({placeholders})
+            ORDER BY dv.id_producto, v.fecha_venta ASC, dv.id_detalle ASC
+        """, ids)
+        for id_detalle, id_producto, cantidad_pendiente in cursor.fetchall():
+            cantidad_a_surtir = min(disponibles[id_producto], cantidad_pendiente)
+            if cantidad_a_surtir <= 0:
+                continue
+            disponibles[id_producto] -= cantidad_a_surtir
+            if cantidad_a_surtir == cantidad_pendiente:
+                completadas.append((id_detalle,))
+            else:
+                parciales.append((cantidad_pendiente - cantidad_a_surtir, id_detalle))
+
+    cursor.executemany(
+        "UPDATE detalle_venta SET cantidad_pendiente = 0, estado = 'Completada' WHERE id_detalle = ?",
+        completadas
+    )
+    cursor.executemany("UPDATE detalle_venta SET cantidad_pendiente = ? WHERE id_detalle = ?", parciales)
+    return len(completadas)
+
+def obtener_detalles_venta_pendientes(id_producto, conn=None):
+    conn = conn or _get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT dv.id_detalle, dv.id_venta, dv.id_producto, dv.cantidad, dv.precio_unitario, dv.descuento,
+               dv.estado, dv.subtotal, dv.cantidad_pendiente
+        FROM detalle_venta dv
+        JOIN ventas v ON dv.id_venta = v.id_venta
+        WHERE dv.id_producto = ? AND dv.estado = 'Pendiente de Stock'
+        ORDER BY v.fecha_venta ASC, dv.id_detalle ASC
+    """, (id_producto,))
+    return [DetalleVenta(**dict(fila)) for fila in cursor.fetchall()]
+
+# --- Conteo de inventario ---
+# Un conteo físico acumula lecturas en conteo_items (una fila por producto, UPSERT por lectura) y
+# queda abierto hasta aplicarlo o cancelarlo, así que sobrevive a un reinicio. A lo sumo hay un conteo
+# abierto (idx_conteos_inventario_abierto).
+#
+# Se cuenta lo que hay en la góndola: los lotes con unidades más el stock sin lote positivo. Un
+# stock_sin_lote negativo son unidades que se les deben a ventas ya cobradas y el conteo no lo toca.
+# Con el local abierto el stock cambia mientras se cuenta; por eso cada producto guarda el stock del
+# sistema al leerlo por primera vez, y al aplicar se suma la diferencia contra ese valor al stock de
+# ese momento: las ventas hechas entre la lectura y la aplicación no se pierden.
+
+_SQL_STOCK_FISICO = """(IFNULL((SELECT SUM(s.cantidad) FROM stock s WHERE s.id_producto = {alias}.id_producto AND s.cantidad > 0), 0)
+    + MAX({alias}.stock_sin_lote, 0))"""
+
+def iniciar_conteo(usuario=None, observaciones=None):
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO conteos_inventario (usuario, inicio, observaciones) VALUES (?, ?, ?)",
+                (usuario, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), observaciones)
+            )
+            return cursor.lastrowid
+    except sqlite3.IntegrityError:
+        print("Error al iniciar el conteo: ya hay un conteo de inventario abierto.")
+        return None
     except sqlite3.Error as e:
-        print(f"Error al agregar el lote: {e}")
-        return False
+        print(f"Error al iniciar el conteo: {e}")
+        return None
+
+def obtener_conteo_abierto():
+    with _get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT c.*, COUNT(i.id_producto) AS productos_contados, IFNULL(SUM(i.cantidad), 0) AS unidades_contadas
+            FROM conteos_inventario c LEFT JOIN conteo_items i ON i.id_conteo = c.id_conteo
+            WHERE c.estado = 'Abierto'
+            GROUP BY c.id_conteo
+        """)
+        fila = cursor.fetchone()
+        return dict(fila) if fila else None
+
+# Sin fila si el producto no existe o el conteo no está abierto.
+_SQL_SUMAR_A_CONTEO = f"""INSERT INTO conteo_items (id_conteo, id_producto, cantidad, cantidad_sistema, ultima_lectura)
+    SELECT ?, p.id_producto, MAX(?, 0), {_SQL_STOCK_FISICO.format(alias='p')}, ?
+    FROM productos p
+    WHERE p.id_producto = ? AND EXISTS (SELECT 1 FROM conteos_inventario WHERE id_conteo = ? AND estado = 'Abierto')
+    ON CONFLICT (id_conteo, id_producto) DO UPDATE SET
+        cantidad = MAX(cantidad + excluded.cantidad, 0),
+        ultima_lectura = excluded.ultima_lectura"""
+
+def _sumar_a_conteo(cursor: sqlite3.Cursor, id_conteo, id_producto, cantidad):
+    cursor.execute(
+        _SQL_SUMAR_A_CONTEO + " RETURNING cantidad, cantidad_sistema",
+        (id_conteo, cantidad, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), id_producto, id_conteo)
+    )
+    return cursor.fetchone()
 
-def _procesar_ventas_pendientes_post_stock(cursor: sqlite3.Cursor, id_producto: int):
+def registrar_lectura_conteo(id_conteo, codigo_barras, cantidad=1):
+    # Una lectura del escáner (código del producto o de un lote). Devuelve (id_producto, nombre,
+    # cantidad contada hasta ahora, stock del sistema al contarlo), o None si el código no corresponde
+    # a ningún producto o el conteo ya no está abierto.
     try:
-        stock_disponible = obtener_stock_total_lotes(id_producto, cursor.connection)
-        if stock_disponible <= 0:
-            return
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            fila = cursor.execute(_SQL_RESOLVER_CODIGO_BARRAS, {'codigo': codigo_barras}).fetchone()
+            if not fila:
+                return None
+            id_producto = fila[0]
+            item = _sumar_a_conteo(cursor, id_conteo, id_producto, cantidad)
+            if item is None:
+                return None
+            nombre = cursor.execute("SELECT nombre FROM productos WHERE id_producto = ?", (id_producto,)).fetchone()[0]
+            return id_producto, nombre, item[0], item[1]
+    except sqlite3.Error as e:
+        print(f"Error al registrar la lectura del conteo: {e}")
+        return None
+
+def registrar_lecturas_conteo(id_conteo, lecturas):
+    # 'lecturas' es una lista de (id_producto, cantidad), p. ej. la descarga de un colector de datos.
+    # Van todas en una transacción. Devuelve la cantidad de lecturas registradas.
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            ahora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            # Con executemany, rowcount suma las filas insertadas o actualizadas: una por lectura registrada.
+            cursor.executemany(
+                _SQL_SUMAR_A_CONTEO,
+                ((id_conteo, cantidad, ahora, id_producto, id_conteo) for id_producto, cantidad in lecturas)
+            )
+            return max(cursor.rowcount, 0)
+    except sqlite3.Error as e:
+        print(f"Error al registrar las lecturas del conteo: {e}")
+        return None
+
+def corregir_cantidad_conteo(id_conteo, id_producto, cantidad):
+    # Reemplaza lo contado de un producto (p. ej. se escaneó de más). Con 0 el producto queda contado en cero.
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.execute(
+                """UPDATE conteo_items SET cantidad = ?, ultima_lectura = ?
+                   WHERE id_conteo = ? AND id_producto = ?
+                     AND id_conteo IN (SELECT id_conteo FROM conteos_inventario WHERE estado = 'Abierto')""",
+                (max(cantidad, 0), datetime.now().strftime('%Y-%m-%d %H:%M:%S'), id_conteo, id_producto)
+            )
+            return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Error al corregir el conteo: {e}")
+        return False
 
-        detalles_pendientes = obtener_detalles_venta_pendientes(id_producto, cursor.connection)
+def _sql_diferencias_conteo(incluir_no_contados):
+    # Todas las diferencias del conteo en una consulta. Con 'incluir_no_contados', los productos con
+    # stock que no se leyeron cuentan como cero (conteo total del local).
+    sql = """
+        SELECT i.id_producto, p.nombre, i.cantidad_sistema, i.cantidad AS cantidad_contada,
+               i.cantidad - i.cantidad_sistema AS diferencia
+        FROM conteo_items i JOIN productos p ON p.id_producto = i.id_producto
+        WHERE i.id_conteo = :id_conteo AND i.cantidad != i.cantidad_sistema
+    """
+    if incluir_no_contados:
+        sql += f"""
+        UNION ALL
+        SELECT p.id_producto, p.nombre, {_SQL_STOCK_FISICO.format(alias='p')}, 0, -{_SQL_STOCK_FISICO.format(alias='p')}
+        FROM productos p
+        WHERE NOT EXISTS (SELECT 1 FROM conteo_items i WHERE i.id_conteo = :id_conteo AND i.id_producto = p.id_producto)
+          AND {_SQL_STOCK_FISICO.format(alias='p')} > 0
+        """
+    return sql
 
-        for detalle in detalles_pendientes:
-            if stock_disponible <= 0:
-                break 
+def obtener_diferencias_conteo(id_conteo, incluir_no_contados=False):
+    with _get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_sql_diferencias_conteo(incluir_no_contados) + " ORDER BY 2", {'id_conteo': id_conteo})
+        return [dict(fila) for fila in cursor.fetchall()]
 
-            cantidad_a_surtir = min(stock_disponible, detalle.cantidad)
+def obtener_items_conteo(id_conteo):
+    with _get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT i.id_producto, p.nombre, i.cantidad, i.cantidad_sistema, i.ultima_lectura
+            FROM conteo_items i JOIN productos p ON p.id_producto = i.id_producto
+            WHERE i.id_conteo = ? ORDER BY i.ultima_lectura DESC
+        """, (id_conteo,))
+        return [dict(fila) for fila in cursor.fetchall()]
 
-            if cantidad_a_surtir == detalle.cantidad:
-                _reducir_stock_de_lotes(cursor, id_producto, cantidad_a_surtir)
-                cursor.execute("UPDATE detalle_venta SET estado = 'Completada' WHERE id_detalle = ?", (detalle.id_detalle,))
-            else:
-                _reducir_stock_de_lotes(cursor, id_producto, cantidad_a_surtir)
-                nueva_cantidad_pendiente = detalle.cantidad - cantidad_a_surtir
-                cursor.execute("UPDATE detalle_venta SET cantidad = ? WHERE id_detalle = ?", (nueva_cantidad_pendiente, detalle.id_detalle))
-            
-            stock_disponible -= cantidad_a_surtir
+def aplicar_conteo(id_conteo, incluir_no_contados=False):
+    # Aplica todas las diferencias en una transacción y cierra el conteo. Los sobrantes se reciben como un
+    # lote sin vencimiento (saldando antes lo que se les debe a ventas pendientes); los faltantes salen de
+    # los lotes por FEFO y después del stock sin lote.
+    # Devuelve {'productos', 'sobrantes', 'faltantes'} (unidades), o None si falló.
+    ahora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn = _get_db_connection()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE conteos_inventario SET estado = 'Aplicado', cierre = ? WHERE id_conteo = ? AND estado = 'Abierto'", (ahora, id_conteo))
+            if cursor.rowcount == 0:
+                print(f"Error al aplicar el conteo: el conteo {id_conteo} no existe o no está abierto.")
+                return None
 
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS diferencias_conteo (id_producto INTEGER PRIMARY KEY, diferencia INTEGER NOT NULL)")
+            cursor.execute("DELETE FROM diferencias_conteo")
+            cursor.execute(
+                f"""INSERT INTO ajustes_stock (id_conteo, id_producto, fecha, cantidad_sistema, cantidad_contada, diferencia)
+                    SELECT :id_conteo, id_producto, :fecha, cantidad_sistema, cantidad_contada, diferencia
+                    FROM ({_sql_diferencias_conteo(incluir_no_contados)})""",
+                {'id_conteo': id_conteo, 'fecha': ahora}
+            )
+            # Los faltantes se limitan a lo que hay ahora: lo vendido después de contar ya salió del stock.
+            cursor.execute(
+                f"""INSERT INTO diferencias_conteo (id_producto, diferencia)
+                    SELECT a.id_producto, MAX(a.diferencia, -{_SQL_STOCK_FISICO.format(alias='p')})
+                    FROM ajustes_stock a JOIN productos p ON p.id_producto = a.id_producto
+                    WHERE a.id_conteo = ?""",
+                (id_conteo,)
+            )
+            cursor.execute("DELETE FROM diferencias_conteo WHERE diferencia = 0")
+
+            # Sobrantes: entran como una recepción sin vencimiento al último costo conocido, así primero
+            # saldan el stock sin lote negativo y completan las ventas pendientes de esos productos.
+            sobrantes = cursor.execute("""
+                SELECT d.id_producto, d.diferencia, NULL, NULL,
+                       (SELECT s.costo_unitario FROM stock s WHERE s.id_producto = d.id_producto AND s.costo_unitario IS NOT NULL ORDER BY s.id_stock DESC LIMIT 1)
+                FROM diferencias_conteo d
+                WHERE d.diferencia > 0
+            """).fetchall()
+            _agregar_lotes_con_cursor(cursor, [tuple(fila) for fila in sobrantes])
+
+            # Faltantes: primero lo que no cubren los lotes sale del stock sin lote; después los lotes por FEFO.
+            cursor.execute("""
+                UPDATE productos SET stock_sin_lote = stock_sin_lote - (f.faltante - f.en_lotes)
+                FROM (
+                    SELECT d.id_producto, -d.diferencia AS faltante,
+                           IFNULL((SELECT SUM(s.cantidad) FROM stock s WHERE s.id_producto = d.id_producto AND s.cantidad > 0), 0) AS en_lotes
+                    FROM diferencias_conteo d WHERE d.diferencia < 0
+                ) f
+                WHERE productos.id_producto = f.id_producto AND f.faltante > f.en_lotes
+            """)
+            cursor.execute("""
+                WITH consumo AS (
+                    SELECT s.id_stock, s.cantidad, -d.diferencia AS faltante,
+                           SUM(s.cantidad) OVER (
+                               PARTITION BY s.id_producto
+                               ORDER BY IFNULL(s.fecha_vencimiento, '9999-12-31'), s.id_stock
+                           ) - s.cantidad AS anteriores
+                    FROM stock s JOIN diferencias_conteo d ON d.id_producto = s.id_producto
+                    WHERE d.diferencia < 0 AND s.cantidad > 0
+                )
+                UPDATE stock SET cantidad = stock.cantidad - MIN(c.cantidad, c.faltante - c.anteriores)
+                FROM consumo c
+                WHERE stock.id_stock = c.id_stock AND c.anteriores < c.faltante
+            """)
+
+            resumen = cursor.execute("""
+                SELECT COUNT(*), IFNULL(SUM(MAX(diferencia, 0)), 0), IFNULL(SUM(MAX(-diferencia, 0)), 0) FROM diferencias_conteo
+            """).fetchone()
+            ids_productos = [fila[0] for fila in cursor.execute("SELECT id_producto FROM diferencias_conteo")]
+            cursor.execute("DELETE FROM diferencias_conteo")
+        _notificar_cambio_productos(ids_productos)
+        return {'productos': resumen[0], 'sobrantes': resumen[1], 'faltantes': resumen[2]}
     except sqlite3.Error as e:
-        print(f"Error procesando ventas pendientes para el producto {id_producto}: {e}")
+        print(f"Error al aplicar el conteo: {e}")
+        return None
 
-def obtener_detalles_venta_pendientes(id_producto, conn=None):
-    should_close = False
-    if conn is None:
-        conn = _get_db_connection()
-        should_close = True
+def cancelar_conteo(id_conteo):
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE conteos_inventario SET estado = 'Cancelado', cierre = ? WHERE id_conteo = ? AND estado = 'Abierto'",
+                (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), id_conteo)
+            )
+            return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Error al cancelar el conteo: {e}")
+        return False
 
-    cursor = conn.cursor()
+# --- Órdenes de compra y recepción de mercadería ---
+# Una orden se arma a mano o desde las sugerencias de reposición y queda 'Pendiente' hasta recibirla.
+# La recepción carga toda la entrega (escaneada o importada) con _agregar_lotes_con_cursor en una sola
+# transacción: los lotes, el stock sin lote negativo que se salda, las ventas pendientes que se
+# completan y lo recibido de la orden se confirman juntos o no se confirma nada.
+
+ESTADOS_ORDEN_ABIERTA = ('Pendiente', 'Parcial')
+
+def crear_orden_compra(items, proveedor=None, observaciones=None):
+    # 'items' es una lista de (id_producto, cantidad[, costo_unitario]); los productos repetidos se suman.
+    # Devuelve el id de la orden, o None si no hay nada que pedir o falló.
+    cantidades, costos = {}, {}
+    for id_producto, cantidad, *resto in items:
+        if cantidad > 0:
+            cantidades[id_producto] = cantidades.get(id_producto, 0) + int(cantidad)
+            if resto and resto[0] is not None:
+                costos[id_producto] = resto[0]
+    if not cantidades:
+        print("Error al crear la orden de compra: no tiene productos.")
+        return None
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO ordenes_compra (proveedor, fecha, observaciones) VALUES (?, ?, ?)",
+                (proveedor, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), observaciones)
+            )
+            id_orden = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO orden_compra_items (id_orden, id_producto, cantidad_pedida, costo_unitario) VALUES (?, ?, ?, ?)",
+                [(id_orden, id_producto, cantidad, costos.get(id_producto)) for id_producto, cantidad in cantidades.items()]
+            )
+            return id_orden
+    except sqlite3.Error as e:
+        print(f"Error al crear la orden de compra: {e}")
+        return None
+
+def crear_orden_compra_desde_sugerencias(dias_analisis=30, dias_cobertura=15, proveedor=None):
+    # Pide lo sugerido menos lo que ya está en camino en otras órdenes abiertas, al último costo conocido.
+    sugerencias = obtener_sugerencias_reposicion(dias_analisis, dias_cobertura)
+    try:
+        cursor = _get_db_connection().cursor()
+        placeholders = ','.join('?' for _ in ESTADOS_ORDEN_ABIERTA)
+        cursor.execute(f"""
+            SELECT i.id_producto, SUM(MAX(i.cantidad_pedida - i.cantidad_recibida, 0))
+            FROM orden_compra_items i JOIN ordenes_compra o ON o.id_orden = i.id_orden
+            WHERE o.estado IN ({placeholders})
+            GROUP BY i.id_producto
+        """, ESTADOS_ORDEN_ABIERTA)
+        en_camino = dict(cursor.fetchall())
+        items = []
+        for sugerencia in sugerencias:
+            id_producto = sugerencia['id_producto']
+            cantidad = int(sugerencia['cantidad_a_comprar']) - en_camino.get(id_producto, 0)
+            if cantidad > 0:
+                items.append((id_producto, cantidad, _ultimo_costo_conocido(cursor, id_producto)))
+    except sqlite3.Error as e:
+        print(f"Error al calcular la orden de compra: {e}")
+        return None
+    return crear_orden_compra(items, proveedor, f"Sugerencia de reposición ({dias_analisis} días de análisis, {dias_cobertura} de cobertura)")
+
+def obtener_ordenes_compra(estado=None):
+    # Las órdenes más recientes primero, con la cantidad de productos y las unidades pedidas y recibidas.
+    cursor = _get_db_connection().cursor()
     cursor.execute("""
-        SELECT dv.* FROM detalle_venta dv
-        JOIN ventas v ON dv.id_venta = v.id_venta
-        WHERE dv.id_producto = ? AND dv.estado = 'Pendiente de Stock' AND dv.cantidad > 0
-        ORDER BY v.fecha_venta ASC
-    """, (id_producto,))
-    filas = cursor.fetchall()
-    
-    if should_close:
-        conn.close()
-        
-    return [DetalleVenta(**dict(fila)) for fila in filas]
+        SELECT o.*, COUNT(i.id_producto) AS productos,
+               IFNULL(SUM(i.cantidad_pedida), 0) AS unidades_pedidas, IFNULL(SUM(i.cantidad_recibida), 0) AS unidades_recibidas
+        FROM ordenes_compra o LEFT JOIN orden_compra_items i ON i.id_orden = o.id_orden
+        WHERE ? IS NULL OR o.estado = ?
+        GROUP BY o.id_orden
+        ORDER BY o.id_orden DESC
+    """, (estado, estado))
+    return [dict(fila) for fila in cursor.fetchall()]
+
+def obtener_items_orden_compra(id_orden):
+    cursor = _get_db_connection().cursor()
+    cursor.execute("""
+        SELECT i.id_producto, p.nombre, p.codigo_barras, i.cantidad_pedida, i.cantidad_recibida,
+               MAX(i.cantidad_pedida - i.cantidad_recibida, 0) AS cantidad_faltante, i.costo_unitario
+        FROM orden_compra_items i JOIN productos p ON p.id_producto = i.id_producto
+        WHERE i.id_orden = ?
+        ORDER BY p.nombre
+    """, (id_orden,))
+    return [dict(fila) for fila in cursor.fetchall()]
+
+def anular_orden_compra(id_orden):
+    # Lo ya recibido queda en el stock; solo deja de esperarse lo que faltaba.
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ','.join('?' for _ in ESTADOS_ORDEN_ABIERTA)
+            cursor.execute(
+                f"UPDATE ordenes_compra SET estado = 'Anulada' WHERE id_orden = ? AND estado IN ({placeholders})",
+                (id_orden, *ESTADOS_ORDEN_ABIERTA)
+            )
+            return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Error al anular la orden de compra: {e}")
+        return False
 
-def realizar_pago_cliente(id_cliente, monto_pago, fecha_pago):
+def recibir_mercaderia(lotes, id_orden=None):
+    # 'lotes' como en agregar_lotes. Con id_orden, lo recibido se descuenta de la orden (los productos que
+    # no estaban pedidos se agregan con cantidad pedida 0) y la orden queda 'Parcial' o 'Recibida'.
+    # Devuelve {'lotes', 'unidades', 'unidades_saldadas', 'ventas_completadas', 'estado_orden'}, o None si falló.
+    if not lotes:
+        print("Error al recibir la mercadería: la recepción está vacía.")
+        return None
+    ahora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    estado_orden = None
+    try:
+        with _get_db_connection() as conn:
+            cursor = conn.cursor()
+            if id_orden is not None:
+                cursor.execute("SELECT estado FROM ordenes_compra WHERE id_orden = ?", (id_orden,))
+                fila = cursor.fetchone()
+                if fila is None or fila[0] not in ESTADOS_ORDEN_ABIERTA:
+                    print(f"Error al recibir la mercadería: la orden {id_orden} no existe o no está abierta.")
+                    return None
+
+            # Sin claves foráneas activas, un id mal importado crearía un lote huérfano.
+            cursor.execute(
+                "SELECT j.value FROM json_each(?) j WHERE NOT EXISTS (SELECT 1 FROM productos p WHERE p.id_producto = j.value)",
+                (json.dumps(sorted({lote[0] for lote in lotes})),)
+            )
+            inexistentes = [fila[0] for fila in cursor.fetchall()]
+            if inexistentes:
+                print(f"Error al recibir la mercadería: productos inexistentes {inexistentes}.")
+                return None
+
+            saldado, completadas = _agregar_lotes_con_cursor(cursor, lotes)
+
+            if id_orden is not None:
+                recibido, costos = {}, {}
+                for id_producto, cantidad, _, _, *resto in lotes:
+                    recibido[id_producto] = recibido.get(id_producto, 0) + cantidad
+                    if resto and resto[0] is not None:
+                        costos[id_producto] = resto[0]
+                cursor.executemany(
+                    """INSERT INTO orden_compra_items (id_orden, id_producto, cantidad_pedida, cantidad_recibida, costo_unitario)
+                       VALUES (?, ?, 0, ?, ?)
+                       ON CONFLICT (id_orden, id_producto) DO UPDATE SET
+                           cantidad_recibida = cantidad_recibida + excluded.cantidad_recibida,
+                           costo_unitario = IFNULL(excluded.costo_unitario, costo_unitario)""",
+                    [(id_orden, id_producto, cantidad, costos.get(id_producto)) for id_producto, cantidad in recibido.items()]
+                )
+                cursor.execute(
+                    """UPDATE ordenes_compra SET ultima_recepcion = ?,
+                           estado = CASE WHEN EXISTS (
+                               SELECT 1 FROM orden_compra_items WHERE id_orden = ordenes_compra.id_orden AND cantidad_recibida < cantidad_pedida
+                           ) THEN 'Parcial' ELSE 'Recibida' END
+                       WHERE id_orden = ?
+                       RETURNING estado""",
+                    (ahora, id_orden)
+                )
+                estado_orden = cursor.fetchone()[0]
+        _notificar_cambio_productos({lote[0] for lote in lotes})
+        return {
+            'lotes': len(lotes),
+            'unidades': sum(lote[1] for lote in lotes),
+            'unidades_saldadas': saldado,
+            'ventas_completadas': completadas,
+            'estado_orden': estado_orden,
+        }
+    except sqlite3.Error as e:
+        print(f"Error al recibir la mercadería: {e}")
+        return None
+
+def realizar_pago_cliente(id_cliente, monto_pago, fecha_pago, forma_pago='Efectivo'):
     try:
         with _get_db_connection() as conn:
             cursor = conn.cursor()
@@ -627,37 +2226,135 @@ def realizar_pago_cliente(id_cliente, monto_pago, fecha_pago):
                    VALUES (?, ?, ?, ?)""",
                 (id_cliente, fecha_pago, 'PAGO', monto_pago)
             )
+            id_turno = _id_turno_abierto(cursor)
+            if id_turno is not None:
+                _sumar_a_turno(cursor, id_turno, forma_pago, cobro=monto_pago)
             conn.commit()
             return True
     except sqlite3.Error as e:
         print(f"Error al registrar el pago del cliente: {e}")
         return False
 
-def obtener_saldo_deudor_cliente(id_cliente):
+def obtener_saldo_deudor_cliente(id_cliente, fecha_valuacion: str = None):
+    # Con 'fecha_valuacion' devuelve el saldo que tenía el cliente ese día, valuado a los precios de ese día.
+    precio = _SQL_PRECIO_DEUDA
+    filtro_fecha = ""
+    params_deuda = [id_cliente]
+    params_pagos = [id_cliente]
+    if fecha_valuacion:
+        hasta = _normalizar_fecha_hasta(fecha_valuacion)
+        precio = _sql_precio_deuda(f"COALESCE({_SQL_PRECIO_A_FECHA.format(alias='p')}, p.precio_venta)")
+        filtro_fecha = " AND m.fecha <= ?"
+        params_deuda = [hasta, id_cliente, hasta]
+        params_pagos = [id_cliente, hasta]
+
     with _get_db_connection() as conn:
         cursor = conn.cursor()
 
-        cursor.execute("""
-            SELECT IFNULL(SUM(dv.cantidad * p.precio_venta), 0)
+        cursor.execute(f"""
+            SELECT IFNULL(SUM(dv.cantidad * {precio}), 0)
             FROM movimientos_cuenta_cliente m
             JOIN detalle_venta dv ON m.id_venta = dv.id_venta
             JOIN productos p ON dv.id_producto = p.id_producto
-            WHERE m.id_cliente = ? AND m.tipo_movimiento = 'DEUDA'
-        """, (id_cliente,))
+            WHERE m.id_cliente = ? AND m.tipo_movimiento = 'DEUDA'{filtro_fecha}
+        """, params_deuda)
         total_deudas_actualizado = cursor.fetchone()[0]
 
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT IFNULL(SUM(monto), 0)
-            FROM movimientos_cuenta_cliente
-            WHERE id_cliente = ? AND tipo_movimiento = 'PAGO'
-        """, (id_cliente,))
+            FROM movimientos_cuenta_cliente m
+            WHERE m.id_cliente = ? AND m.tipo_movimiento = 'PAGO'{filtro_fecha}
+        """, params_pagos)
         total_pagos = cursor.fetchone()[0]
 
         saldo_final = total_deudas_actualizado - total_pagos
         return saldo_final if saldo_final is not None else 0
 
-def obtener_pagos_recibidos_por_rango(start_date: str, end_date: str):
-    with _get_db_connection() as conn:
+# --- Antigüedad de deuda y clientes vencidos ---
+
+# Cada deuda de libreta (revaluada) queda pendiente por lo que no cubren los pagos, aplicados a las
+# deudas más viejas primero (FIFO). Lo pendiente se agrupa según los días transcurridos desde la compra.
+_SQL_ANTIGUEDAD_DEUDA = f"""
+    WITH deudas AS (
+        SELECT m.id_cliente, m.id_movimiento, m.fecha, SUM(dv.cantidad * {_SQL_PRECIO_DEUDA}) AS monto
+        FROM movimientos_cuenta_cliente m
+        JOIN detalle_venta dv ON dv.id_venta = m.id_venta
+        JOIN productos p ON p.id_producto = dv.id_producto
+        WHERE m.tipo_movimiento = 'DEUDA'
+        GROUP BY m.id_movimiento
+    ),
+    pagos AS (
+        SELECT id_cliente, SUM(monto) AS pagado
+        FROM movimientos_cuenta_cliente
+        WHERE tipo_movimiento = 'PAGO'
+        GROUP BY id_cliente
+    ),
+    pendientes AS (
+        SELECT d.id_cliente,
+               julianday(:hoy) - julianday(date(d.fecha)) AS dias,
+               MAX(0, MIN(d.monto, SUM(d.monto) OVER (PARTITION BY d.id_cliente ORDER BY d.fecha, d.id_movimiento)
+                                   - IFNULL(pg.pagado, 0))) AS pendiente
+        FROM deudas d
+        LEFT JOIN pagos pg ON pg.id_cliente = d.id_cliente
+    )
+    SELECT c.id_cliente, c.nombre, c.dni, c.fecha_limite_pago,
+           SUM(CASE WHEN dias <= 30 THEN pendiente ELSE 0 END) AS corriente,
+           SUM(CASE WHEN dias > 30 AND dias <= 60 THEN pendiente ELSE 0 END) AS dias_31_60,
+           SUM(CASE WHEN dias > 60 AND dias <= 90 THEN pendiente ELSE 0 END) AS dias_61_90,
+           SUM(CASE WHEN dias > 90 THEN pendiente ELSE 0 END) AS dias_mas_90,
+           SUM(pendiente) AS total
+    FROM pendientes
+    JOIN cliente c ON c.id_cliente = pendientes.id_cliente
+    GROUP BY c.id_cliente
+    HAVING total > 0.005
+    ORDER BY dias_mas_90 DESC, dias_61_90 DESC, dias_31_60 DESC, total DESC
+"""
+
+# Clientes con la fecha límite de pago vencida y saldo a favor del negocio. Recorre solo los clientes
+# vencidos (índice sobre fecha_limite_pago) y calcula cada saldo con el índice de movimientos.
+_SQL_CLIENTES_VENCIDOS = f"""
+    WITH vencidos AS MATERIALIZED (
+        SELECT c.id_cliente, c.nombre, c.dni, c.fecha_limite_pago,
+               CAST(julianday(:hoy) - julianday(c.fecha_limite_pago) AS INTEGER) AS dias_vencido,
+               IFNULL((SELECT SUM(dv.cantidad * {_SQL_PRECIO_DEUDA})
+                       FROM movimientos_cuenta_cliente m
+                       JOIN detalle_venta dv ON dv.id_venta = m.id_venta
+                       JOIN productos p ON p.id_producto = dv.id_producto
+                       WHERE m.id_cliente = c.id_cliente AND m.tipo_movimiento = 'DEUDA'), 0)
+               - IFNULL((SELECT SUM(m.monto)
+                         FROM movimientos_cuenta_cliente m
+                         WHERE m.id_cliente = c.id_cliente AND m.tipo_movimiento = 'PAGO'), 0) AS saldo_deudor
+        FROM cliente c
+        WHERE c.fecha_limite_pago IS NOT NULL AND c.fecha_limite_pago < :hoy
+    )
+    SELECT * FROM vencidos
+    WHERE saldo_deudor > 0.005
+    ORDER BY dias_vencido DESC, saldo_deudor DESC
+"""
+
+def _parametros_fecha_referencia(fecha_referencia=None):
+    return {'hoy': fecha_referencia or datetime.now().strftime('%Y-%m-%d')}
+
+def obtener_antiguedad_deuda(fecha_referencia=None, desde_snapshot=False):
+    try:
+        cursor = _conexion_lectura(desde_snapshot).cursor()
+        cursor.execute(_SQL_ANTIGUEDAD_DEUDA, _parametros_fecha_referencia(fecha_referencia))
+        return [dict(fila) for fila in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Error al calcular la antigüedad de deuda: {e}")
+        return []
+
+def obtener_clientes_vencidos(fecha_referencia=None, desde_snapshot=False):
+    try:
+        cursor = _conexion_lectura(desde_snapshot).cursor()
+        cursor.execute(_SQL_CLIENTES_VENCIDOS, _parametros_fecha_referencia(fecha_referencia))
+        return [dict(fila) for fila in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Error al obtener clientes vencidos: {e}")
+        return []
+
+def obtener_pagos_recibidos_por_rango(start_date: str, end_date: str, desde_snapshot=False):
+    with _conexion_lectura(desde_snapshot) as conn:
         cursor = conn.cursor()
         cursor.execute(
             """SELECT IFNULL(SUM(monto), 0) FROM movimientos_cuenta_cliente
@@ -667,28 +2364,40 @@ def obtener_pagos_recibidos_por_rango(start_date: str, end_date: str):
         total_pagos = cursor.fetchone()[0]
         return total_pagos
 
-def obtener_movimientos_cliente(id_cliente):
-    with _get_db_connection() as conn:
-        cursor = conn.cursor()
+def iter_movimientos(id_cliente=None, tamano_lote=TAMANO_LOTE_LECTURA):
+    conn = _get_db_connection()
+    cursor = conn.cursor()
+    try:
+        filtro = "WHERE m.id_cliente = ?" if id_cliente is not None else ""
+        params = (id_cliente,) if id_cliente is not None else ()
         cursor.execute(
-            """
+            f"""
             SELECT
+                m.id_movimiento,
+                m.id_cliente,
                 m.fecha,
                 m.tipo_movimiento,
                 m.id_venta,
                 CASE
                     WHEN m.tipo_movimiento = 'PAGO' THEN m.monto
-                    ELSE (SELECT SUM(dv.cantidad * p.precio_venta) FROM detalle_venta dv JOIN productos p ON dv.id_producto = p.id_producto WHERE dv.id_venta = m.id_venta)
+                    ELSE (SELECT SUM(dv.cantidad * {_SQL_PRECIO_DEUDA}) FROM detalle_venta dv JOIN productos p ON dv.id_producto = p.id_producto WHERE dv.id_venta = m.id_venta)
                 END AS monto_actualizado,
                 (SELECT GROUP_CONCAT(p.nombre || ' (x' || dv.cantidad || ')', ', ')
                  FROM detalle_venta dv
                  JOIN productos p ON dv.id_producto = p.id_producto
                  WHERE dv.id_venta = m.id_venta) as detalle_productos
             FROM movimientos_cuenta_cliente m
-            WHERE m.id_cliente = ? ORDER BY m.fecha DESC, m.id_movimiento DESC""",
-            (id_cliente,)
+            {filtro} ORDER BY m.fecha DESC, m.id_movimiento DESC""",
+            params
         )
-        return [dict(fila) for fila in cursor.fetchall()]
+        for filas in _iterar_en_lotes(cursor, tamano_lote):
+            for fila in filas:
+                yield dict(fila)
+    finally:
+        cursor.close()
+
+def obtener_movimientos_cliente(id_cliente):
+    return list(iter_movimientos(id_cliente))
 
 def actualizar_ruta_pdf(id_venta, ruta_pdf):
     try:
@@ -701,8 +2410,8 @@ def actualizar_ruta_pdf(id_venta, ruta_pdf):
         print(f"Error al actualizar la ruta del PDF: {e}")
         return False
 
-def obtener_venta_por_id(id_venta: int):
-    with _get_db_connection() as conn:
+def obtener_venta_por_id(id_venta: int, desde_snapshot=False):
+    with _conexion_lectura(desde_snapshot) as conn:
         cursor = conn.cursor()
 
         cursor.execute(
@@ -718,7 +2427,10 @@ def obtener_venta_por_id(id_venta: int):
             return None
 
         v_dict = dict(venta_data)
-        venta = Venta(**v_dict)
+        venta = Venta(
+            fecha_venta=v_dict['fecha_venta'], id_cliente=v_dict['id_cliente'], total=v_dict['total'],
+            forma_pago=v_dict['forma_pago'], observaciones=v_dict['observaciones'], id_venta=v_dict['id_venta']
+        )
         venta.ruta_pdf_ticket = v_dict.get('ruta_pdf_ticket')
         venta.nombre_cliente = v_dict['nombre_cliente'] or "Consumidor Final"
 
@@ -729,12 +2441,23 @@ def obtener_venta_por_id(id_venta: int):
         detalles_data = cursor.fetchall()
         venta.detalles = [DetalleVenta(**dict(d)) for d in detalles_data]
 
-        return venta
+        cursor.execute(
+            """SELECT dvp.id_detalle, dvp.id_promocion, dvp.monto FROM detalle_venta_promociones dvp
+               JOIN detalle_venta dv ON dv.id_detalle = dvp.id_detalle
+               WHERE dv.id_venta = ?""",
+            (id_venta,)
+        )
+        detalles_por_id = {detalle.id_detalle: detalle for detalle in venta.detalles}
+        for id_detalle, id_promocion, monto in cursor.fetchall():
+            detalles_por_id[id_detalle].promociones.append((id_promocion, monto))
 
-def obtener_ventas_por_rango_de_fechas(start_date: str, end_date: str):
-    with _get_db_connection() as conn:
-        cursor = conn.cursor()
+        return venta
 
+def iter_ventas(start_date: str, end_date: str, incluir_detalles=True, tamano_lote=TAMANO_LOTE_LECTURA):
+    conn = _get_db_connection()
+    cursor = conn.cursor()
+    cursor_detalles = conn.cursor()
+    try:
         cursor.execute(
             """SELECT v.*, c.nombre as nombre_cliente 
                FROM ventas v 
@@ -743,34 +2466,110 @@ def obtener_ventas_por_rango_de_fechas(start_date: str, end_date: str):
                ORDER BY v.fecha_venta DESC""",
             (start_date, end_date)
         )
-        ventas_data = cursor.fetchall()
-
-        ventas_dict = {}
-        for v_data in ventas_data:
-            v_dict = dict(v_data)
-            id_venta = v_dict['id_venta']
-            venta = Venta(
-                id_venta=id_venta,
-                fecha_venta=v_dict['fecha_venta'],
-                total=v_dict['total'],
-                forma_pago=v_dict['forma_pago'],
-                id_cliente=v_dict['id_cliente']
+
+        for ventas_data in _iterar_en_lotes(cursor, tamano_lote):
+            ventas_dict = {}
+            for v_data in ventas_data:
+                v_dict = dict(v_data)
+                id_venta = v_dict['id_venta']
+                venta = Venta(
+                    id_venta=id_venta,
+                    fecha_venta=v_dict['fecha_venta'],
+                    total=v_dict['total'],
+                    forma_pago=v_dict['forma_pago'],
+                    id_cliente=v_dict['id_cliente']
+                )
+                venta.ruta_pdf_ticket = v_dict.get('ruta_pdf_ticket')
+                venta.nombre_cliente = v_dict['nombre_cliente'] or "Consumidor Final"
+                ventas_dict[id_venta] = venta
+
+            if incluir_detalles:
+                ids_ventas = tuple(ventas_dict.keys())
+                placeholders = ','.join('?' for _ in ids_ventas)
+                query = f"SELECT id_detalle, id_venta, id_producto, cantidad, precio_unitario, descuento, estado, subtotal, cantidad_pendiente FROM detalle_venta WHERE id_venta IN ({placeholders})"
+                cursor_detalles.execute(query, ids_ventas)
+                for d_data in cursor_detalles.fetchall():
+                    ventas_dict[d_data['id_venta']].detalles.append(DetalleVenta(**dict(d_data)))
+
+            yield from ventas_dict.values()
+    finally:
+        cursor.close()
+        cursor_detalles.close()
+
+def obtener_ventas_por_rango_de_fechas(start_date: str, end_date: str):
+    return list(iter_ventas(start_date, end_date))
+
+# --- Búsqueda de ventas ---
+# Cada filtro usa su índice: producto por idx_detalle_venta_producto_venta, cliente y forma de pago por
+# índices compuestos con la fecha (ya vienen ordenados), monto por idx_ventas_total y el texto libre de
+# las observaciones por ventas_fts. La paginación es por clave (fecha, id) de la última fila de la
+# página anterior: pedir la página 100 cuesta lo mismo que pedir la primera.
+
+TAMANO_PAGINA_BUSQUEDA_VENTAS = 50
+_UMBRAL_RANGO_MONTO_SELECTIVO = 2000
+
+def _consulta_fts(texto: str) -> str:
+    # Cada palabra se busca como prefijo; las comillas evitan que la sintaxis de FTS5 (AND, *, -) se interprete.
+    palabras = [palabra.replace('"', '') for palabra in texto.split()]
+    return ' '.join(f'"{palabra}"*' for palabra in palabras if palabra)
+
+def buscar_ventas(id_producto=None, id_cliente=None, monto_minimo=None, monto_maximo=None, forma_pago=None, texto=None,
+                  fecha_desde=None, fecha_hasta=None, despues_de=None, limite=TAMANO_PAGINA_BUSQUEDA_VENTAS, desde_snapshot=False):
+    # Devuelve una página de ventas, de la más reciente a la más vieja. Para la página siguiente se pasa
+    # 'despues_de' = (fecha_venta, id_venta) de la última fila recibida.
+    condiciones, params = [], []
+    if id_producto is not None:
+        condiciones.append("v.id_venta IN (SELECT dv.id_venta FROM detalle_venta dv WHERE dv.id_producto = ?)")
+        params.append(id_producto)
+    if id_cliente is not None:
+        condiciones.append("v.id_cliente = ?")
+        params.append(id_cliente)
+    if forma_pago:
+        condiciones.append("v.forma_pago = ?")
+        params.append(forma_pago)
+    consulta_fts = _consulta_fts(texto) if texto else ''
+    if consulta_fts:
+        condiciones.append("v.id_venta IN (SELECT rowid FROM ventas_fts WHERE ventas_fts MATCH ?)")
+        params.append(consulta_fts)
+    if fecha_desde:
+        condiciones.append("v.fecha_venta >= ?")
+        params.append(fecha_desde)
+    if fecha_hasta:
+        condiciones.append("v.fecha_venta <= ?")
+        params.append(_normalizar_fecha_hasta(fecha_hasta))
+    if despues_de:
+        condiciones.append("(v.fecha_venta, v.id_venta) < (?, ?)")
+        params.extend(despues_de)
+
+    try:
+        with _conexion_lectura(desde_snapshot) as conn:
+            cursor = conn.cursor()
+            if monto_minimo is not None or monto_maximo is not None:
+                rango = (-1e308 if monto_minimo is None else monto_minimo, 1e308 if monto_maximo is None else monto_maximo)
+                # Sin saber los valores, SQLite supone que un rango de montos abarca muchas ventas y recorre
+                # por fecha. Si el rango trae pocas filas (se cuentan por el índice, con tope), se le avisa
+                # con likelihood() para que busque por idx_ventas_total y ordene solo esas.
+                cursor.execute("SELECT COUNT(*) FROM (SELECT 1 FROM ventas WHERE total BETWEEN ? AND ? LIMIT ?)", rango + (_UMBRAL_RANGO_MONTO_SELECTIVO,))
+                if cursor.fetchone()[0] < _UMBRAL_RANGO_MONTO_SELECTIVO:
+                    condiciones.append("likelihood(v.total BETWEEN ? AND ?, 0.001)")
+                else:
+                    condiciones.append("v.total BETWEEN ? AND ?")
+                params.extend(rango)
+            where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+            cursor.execute(
+                f"""SELECT v.id_venta, v.fecha_venta, v.total, v.forma_pago, v.observaciones, v.id_cliente,
+                           IFNULL(c.nombre, 'Consumidor Final') AS nombre_cliente
+                    FROM ventas v
+                    LEFT JOIN cliente c ON c.id_cliente = v.id_cliente
+                    {where}
+                    ORDER BY v.fecha_venta DESC, v.id_venta DESC
+                    LIMIT ?""",
+                params + [limite]
             )
-            venta.ruta_pdf_ticket = v_dict.get('ruta_pdf_ticket')
-            venta.nombre_cliente = v_dict['nombre_cliente'] or "Consumidor Final"
-            ventas_dict[id_venta] = venta
-
-        if ventas_dict:
-            ids_ventas = tuple(ventas_dict.keys())
-            placeholders = ','.join('?' for _ in ids_ventas)
-            query = f"SELECT id_detalle, id_venta, id_producto, cantidad, precio_unitario, descuento, estado, subtotal FROM detalle_venta WHERE id_venta IN ({placeholders})"
-            cursor.execute(query, ids_ventas)
-            detalles_data = cursor.fetchall()
-            for d_data in detalles_data:
-                detalle_dict = dict(d_data)
-                ventas_dict[d_data['id_venta']].detalles.append(DetalleVenta(**detalle_dict))
-
-        return list(ventas_dict.values())
+            return [dict(fila) for fila in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Error al buscar ventas: {e}")
+        return []
 
 def verificar_usuario(nombre_usuario: str, contrasena: str):
     with _get_db_connection() as conn:
@@ -831,11 +2630,7 @@ def obtener_productos_por_ids(product_ids: list):
         filas = cursor.fetchall()
         return [Producto(**dict(fila)) for fila in filas]
 
-def obtener_sugerencias_reposicion(dias_analisis=30, dias_cobertura=15):
-    fecha_inicio = datetime.now() - timedelta(days=dias_analisis)
-    fecha_inicio_str = fecha_inicio.strftime('%Y-%m-%d %H:%M:%S')
-
-    query = """
+_SQL_SUGERENCIAS_REPOSICION = """
     SELECT
         p.id_producto, p.nombre, (IFNULL(total_stock.stock_lotes, 0) + p.stock_sin_lote) AS stock_actual,
         COALESCE(v.total_vendido, 0) AS ventas_periodo,
@@ -858,30 +2653,418 @@ def obtener_sugerencias_reposicion(dias_analisis=30, dias_cobertura=15):
     HAVING cantidad_a_comprar > 0 OR (stock_actual < 5 AND ventas_periodo > 0) 
     ORDER BY
         cantidad_a_comprar DESC;
-    """
+"""
+
+def _parametros_sugerencias(dias_analisis, dias_cobertura):
+    fecha_inicio = datetime.now() - timedelta(days=dias_analisis)
+    fecha_inicio_str = fecha_inicio.strftime('%Y-%m-%d %H:%M:%S')
+    dias_analisis_float = max(float(dias_analisis), 1.0)
+    return (dias_analisis_float, dias_analisis_float, dias_cobertura, dias_analisis_float, dias_cobertura, fecha_inicio_str)
+
+def obtener_sugerencias_reposicion(dias_analisis=30, dias_cobertura=15):
     try:
         with _get_db_connection() as conn:
             cursor = conn.cursor()
-            dias_analisis_float = max(float(dias_analisis), 1.0)
-            params = (dias_analisis_float, dias_analisis_float, dias_cobertura, dias_analisis_float, dias_cobertura, fecha_inicio_str)
-            cursor.execute(query, params)
+            cursor.execute(_SQL_SUGERENCIAS_REPOSICION, _parametros_sugerencias(dias_analisis, dias_cobertura))
             sugerencias = cursor.fetchall()
             return sugerencias
     except sqlite3.Error as e:
         print(f"Error al obtener sugerencias de reposición: {e}")
         return []
 
-def crear_backup_seguro(ruta_backup: str):
-    conn_origen = _get_db_connection()
-    conn_destino = sqlite3.connect(ruta_backup)
+# --- Actualización masiva de precios ---
+
+def _normalizar_texto_sql(texto):
+    return _normalizar_texto(texto) if texto is not None else None
+
+def _registrar_funciones_sql(conexion: sqlite3.Connection):
+    conexion.create_function("normalizar", 1, _normalizar_texto_sql, deterministic=True)
+
+def _escapar_like(texto: str) -> str:
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _filtro_productos_sql(nombre_like=None, solo_poco_stock=False, umbral_stock=5):
+    # Mismos criterios que iter_productos, evaluados dentro de SQLite (requiere _registrar_funciones_sql).
+    condiciones = []
+    params = []
+    if nombre_like:
+        condiciones.append("normalizar(p.nombre) LIKE ? ESCAPE '\\'")
+        params.append(f"%{_escapar_like(_normalizar_texto(nombre_like))}%")
+    if solo_poco_stock:
+        condiciones.append("(IFNULL((SELECT SUM(s.cantidad) FROM stock s WHERE s.id_producto = p.id_producto), 0) + p.stock_sin_lote) <= ?")
+        params.append(umbral_stock)
+    where = " WHERE " + " AND ".join(condiciones) if condiciones else ""
+    return where, params
+
+def _consulta_cambios_precio(tipo_regla, valor, redondeo=None, nombre_like=None, solo_poco_stock=False, umbral_stock=5):
+    if tipo_regla == 'porcentaje':
+        expresion = "p.precio_venta * (1 + ? / 100.0)"
+    elif tipo_regla == 'monto':
+        expresion = "p.precio_venta + ?"
+    else:
+        raise ValueError(f"Regla de precio desconocida: {tipo_regla}")
+
+    if redondeo:
+        expresion = f"ROUND(({expresion}) / ?) * ?"
+        params = [valor, redondeo, redondeo]
+    else:
+        expresion = f"ROUND({expresion}, 2)"
+        params = [valor]
+
+    where, params_filtro = _filtro_productos_sql(nombre_like, solo_poco_stock, umbral_stock)
+    query = f"""
+        SELECT id_producto, nombre, precio_actual, precio_nuevo FROM (
+            SELECT p.id_producto, p.nombre, p.precio_venta AS precio_actual, {expresion} AS precio_nuevo
+            FROM productos p{where}
+        )
+        WHERE precio_nuevo > 0 AND precio_nuevo != precio_actual
+    """
+    return query, params + params_filtro
+
+def previsualizar_actualizacion_precios(tipo_regla, valor, redondeo=None, nombre_like=None, solo_poco_stock=False, umbral_stock=5, limite_ejemplos=20):
+    query, params = _consulta_cambios_precio(tipo_regla, valor, redondeo, nombre_like, solo_poco_stock, umbral_stock)
+    try:
+        with _get_db_connection() as conn:
+            _registrar_funciones_sql(conn)
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM ({query})", params)
+            cantidad = cursor.fetchone()[0]
+            cursor.execute(f"{query} ORDER BY nombre LIMIT ?", params + [limite_ejemplos])
+            return {'cantidad': cantidad, 'ejemplos': [dict(fila) for fila in cursor.fetchall()]}
+    except sqlite3.Error as e:
+        print(f"Error al previsualizar la actualización de precios: {e}")
+        return {'cantidad': 0, 'ejemplos': []}
+
+def actualizar_precios_masivo(tipo_regla, valor, redondeo=None, nombre_like=None, solo_poco_stock=False, umbral_stock=5):
+    # Calcula los precios nuevos una sola vez en una tabla temporal y, en la misma transacción,
+    # actualiza productos y agrega el historial. Devuelve la cantidad de productos modificados.
+    query, params = _consulta_cambios_precio(tipo_regla, valor, redondeo, nombre_like, solo_poco_stock, umbral_stock)
+    conn = _get_db_connection()
+    try:
+        _registrar_funciones_sql(conn)
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS cambios_precio (id_producto INTEGER PRIMARY KEY, precio_nuevo REAL NOT NULL)")
+            cursor.execute("DELETE FROM cambios_precio")
+            cursor.execute(f"INSERT INTO cambios_precio (id_producto, precio_nuevo) SELECT id_producto, precio_nuevo FROM ({query})", params)
+            cursor.execute("""
+                UPDATE productos SET precio_venta = c.precio_nuevo
+                FROM cambios_precio c
+                WHERE productos.id_producto = c.id_producto
+            """)
+            cantidad = cursor.rowcount
+            cursor.execute(
+                "INSERT INTO historial_precios (id_producto, precio, fecha_desde) SELECT id_producto, precio_nuevo, ? FROM cambios_precio",
+                (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),)
+            )
+            cursor.execute("DELETE FROM cambios_precio")
+        _notificar_cambio_productos()
+        return cantidad
+    except sqlite3.Error as e:
+        print(f"Error en la actualización masiva de precios: {e}")
+        return None
+
+# --- Consultas columnares (pandas) para reportes y exportaciones ---
+# pandas se importa dentro de cada función: el resto del módulo no depende de él.
+
+_SQL_VENTAS_REPORTE = """
+    SELECT v.id_venta, v.fecha_venta, IFNULL(c.nombre, 'Consumidor Final') AS nombre_cliente, v.total, v.forma_pago
+    FROM ventas v
+    LEFT JOIN cliente c ON v.id_cliente = c.id_cliente
+    WHERE DATE(v.fecha_venta) BETWEEN ? AND ?
+    ORDER BY v.fecha_venta DESC
+"""
+
+_SQL_DETALLES_REPORTE = """
+    SELECT dv.id_detalle, dv.id_venta, v.fecha_venta, dv.id_producto, p.nombre AS nombre_producto,
+           dv.cantidad, dv.precio_unitario, dv.descuento, dv.subtotal, dv.estado, v.forma_pago
+    FROM detalle_venta dv
+    JOIN ventas v ON dv.id_venta = v.id_venta
+    LEFT JOIN productos p ON dv.id_producto = p.id_producto
+    WHERE DATE(v.fecha_venta) BETWEEN ? AND ?
+    ORDER BY v.fecha_venta DESC, dv.id_detalle
+"""
+
+_TIPOS_COLUMNAS_REPORTE = {
+    'id_venta': 'int64',
+    'id_detalle': 'int64',
+    'id_producto': 'int64',
+    'id_cliente': 'Int64',
+    'cantidad': 'int64',
+    'total': 'float64',
+    'precio_unitario': 'float64',
+    'descuento': 'float64',
+    'subtotal': 'float64',
+    'stock_actual': 'float64',
+    'ventas_periodo': 'int64',
+    'venta_diaria_prom': 'float64',
+    'stock_sugerido': 'float64',
+    'cantidad_a_comprar': 'int64',
+    'unidades': 'int64',
+    'ingresos': 'float64',
+    'costo': 'float64',
+    'margen': 'float64',
+    'margen_pct': 'float64',
+    'forma_pago': 'category',
+    'estado': 'category',
+}
+
+_COLUMNAS_FECHA_REPORTE = ('fecha_venta', 'fecha')
+
+def _columna_entera(serie, nullable):
+    # Con nulos se usa el entero nullable de pandas ('Int64'); si algún valor tiene decimales (p. ej. un
+    # REAL que no viene de ROUND) la columna queda float64 en vez de truncarse.
+    import pandas as pd
+
+    numeros = pd.to_numeric(serie)
+    if not (numeros.dropna() % 1 == 0).all():
+        return numeros.astype('float64')
+    return numeros.astype('Int64' if nullable or numeros.isna().any() else 'int64')
+
+def _dataframe_desde_filas(filas, columnas):
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(filas, columns=columnas)
+    for columna in columnas:
+        if columna in _COLUMNAS_FECHA_REPORTE:
+            df[columna] = pd.to_datetime(df[columna], format="ISO8601", errors="coerce")
+        elif _TIPOS_COLUMNAS_REPORTE.get(columna) in ('int64', 'Int64'):
+            df[columna] = _columna_entera(df[columna], nullable=_TIPOS_COLUMNAS_REPORTE[columna] == 'Int64')
+        elif columna in _TIPOS_COLUMNAS_REPORTE:
+            df[columna] = df[columna].astype(_TIPOS_COLUMNAS_REPORTE[columna])
+    return df
+
+def _consulta_a_dataframe(query, params=(), desde_snapshot=False):
+    conn = _conexion_lectura(desde_snapshot)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        columnas = [d[0] for d in cursor.description]
+        return _dataframe_desde_filas(cursor.fetchall(), columnas)
+    finally:
+        cursor.close()
+
+def iter_consulta_dataframe(query, params=(), tamano_lote=TAMANO_LOTE_LECTURA, desde_snapshot=False):
+    conn = _conexion_lectura(desde_snapshot)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        columnas = [d[0] for d in cursor.description]
+        for filas in _iterar_en_lotes(cursor, tamano_lote):
+            yield _dataframe_desde_filas(filas, columnas)
+    finally:
+        cursor.close()
+
+# --- Márgenes ---
+# Los reportes de margen suman el resumen diario (una fila por día y producto con ventas), así que
+# un año entero son a lo sumo 365 x productos filas leídas por rango de la clave primaria.
+
+_AGRUPACIONES_MARGEN = {
+    'producto': ("r.id_producto, IFNULL(p.nombre, 'ID ' || r.id_producto) AS nombre", "r.id_producto", "margen DESC"),
+    'dia': ("r.fecha", "r.fecha", "r.fecha"),
+    'mes': ("substr(r.fecha, 1, 7) AS mes", "substr(r.fecha, 1, 7)", "mes"),
+}
+
+def _consulta_margenes(agrupar_por):
+    columnas, agrupacion, orden = _AGRUPACIONES_MARGEN[agrupar_por]
+    return f"""
+        SELECT {columnas},
+               SUM(r.unidades) AS unidades, SUM(r.ingresos) AS ingresos, SUM(r.costo) AS costo,
+               SUM(r.ingresos) - SUM(r.costo) AS margen,
+               CASE WHEN SUM(r.ingresos) > 0 THEN (SUM(r.ingresos) - SUM(r.costo)) * 100.0 / SUM(r.ingresos) END AS margen_pct
+        FROM resumen_margen_diario r
+        LEFT JOIN productos p ON p.id_producto = r.id_producto
+        WHERE r.fecha BETWEEN ? AND ?
+        GROUP BY {agrupacion}
+        ORDER BY {orden}
+    """
 
+def obtener_margenes(fecha_inicio: str, fecha_fin: str, agrupar_por='producto', desde_snapshot=False):
+    # 'agrupar_por': 'producto', 'dia' o 'mes'.
     try:
-        with conn_destino:
-            conn_origen.backup(conn_destino, pages=1, progress=None)
+        cursor = _conexion_lectura(desde_snapshot).cursor()
+        cursor.execute(_consulta_margenes(agrupar_por), (fecha_inicio, fecha_fin))
+        return [dict(fila) for fila in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Error al obtener márgenes: {e}")
+        return []
+
+def reconstruir_resumen_margen():
+    # Para cuando se cargan ventas sin pasar por registrar_venta.
+    try:
+        with _get_db_connection() as conn:
+            conn.execute("DELETE FROM resumen_margen_diario")
+            conn.execute(_SQL_RECONSTRUIR_RESUMEN_MARGEN)
         return True
+    except sqlite3.Error as e:
+        print(f"Error al reconstruir el resumen de márgenes: {e}")
+        return False
+
+def obtener_ventas_df(start_date: str, end_date: str, desde_snapshot=False):
+    return _consulta_a_dataframe(_SQL_VENTAS_REPORTE, (start_date, end_date), desde_snapshot)
+
+def iter_ventas_df(start_date: str, end_date: str, tamano_lote=TAMANO_LOTE_LECTURA, desde_snapshot=False):
+    return iter_consulta_dataframe(_SQL_VENTAS_REPORTE, (start_date, end_date), tamano_lote, desde_snapshot)
+
+def obtener_detalles_ventas_df(start_date: str, end_date: str, desde_snapshot=False):
+    return _consulta_a_dataframe(_SQL_DETALLES_REPORTE, (start_date, end_date), desde_snapshot)
+
+def obtener_sugerencias_reposicion_df(dias_analisis=30, dias_cobertura=15, desde_snapshot=False):
+    return _consulta_a_dataframe(_SQL_SUGERENCIAS_REPOSICION, _parametros_sugerencias(dias_analisis, dias_cobertura), desde_snapshot)
+
+def obtener_margenes_df(fecha_inicio: str, fecha_fin: str, agrupar_por='producto', desde_snapshot=False):
+    return _consulta_a_dataframe(_consulta_margenes(agrupar_por), (fecha_inicio, fecha_fin), desde_snapshot)
+
+def obtener_antiguedad_deuda_df(fecha_referencia=None, desde_snapshot=False):
+    return _consulta_a_dataframe(_SQL_ANTIGUEDAD_DEUDA, _parametros_fecha_referencia(fecha_referencia), desde_snapshot)
+
+PASOS_BACKUP_OBJETIVO = 100
+PAGINAS_MINIMAS_POR_PASO = 256
+PREFIJO_BACKUP_AUTOMATICO = "backup_easyst_auto_"
+
+def _calcular_sha256(ruta: str, tamano_bloque=1024 * 1024) -> str:
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+def _eliminar_si_existe(ruta: str):
+    if os.path.exists(ruta):
+        os.remove(ruta)
+
+def _paginas_por_paso(conexion: sqlite3.Connection) -> int:
+    # Unos ~100 pasos por backup: suficientes para mostrar progreso sin volver a copiar página por página.
+    total_paginas = conexion.execute("PRAGMA page_count").fetchone()[0]
+    return max(PAGINAS_MINIMAS_POR_PASO, total_paginas // PASOS_BACKUP_OBJETIVO)
+
+def _quick_check(conexion: sqlite3.Connection) -> bool:
+    resultado = conexion.execute("PRAGMA quick_check").fetchone()[0]
+    return resultado == "ok"
+
+def crear_backup_seguro(ruta_backup: str, progreso=None, comprimir=False):
+    ruta_sqlite = ruta_backup + ".tmp" if comprimir else ruta_backup
+    conn_origen = _get_db_connection()
+    conn_destino = sqlite3.connect(ruta_sqlite)
+
+    def _notificar_progreso(status, restantes, total):
+        if progreso:
+            progreso(total - restantes, total)
+
+    try:
+        conn_origen.backup(conn_destino, pages=_paginas_por_paso(conn_origen), progress=_notificar_progreso)
+        if not _quick_check(conn_destino):
+            raise sqlite3.DatabaseError("La copia no superó la verificación 'quick_check'.")
     except sqlite3.Error as e:
         print(f"Error durante el backup de SQLite: {e}")
+        conn_destino.close()
+        _eliminar_si_existe(ruta_sqlite)
+        return False
+    conn_destino.close()
+
+    try:
+        if comprimir:
+            with open(ruta_sqlite, 'rb') as entrada, gzip.open(ruta_backup, 'wb') as salida:
+                shutil.copyfileobj(entrada, salida, 1024 * 1024)
+            os.remove(ruta_sqlite)
+
+        with open(ruta_backup + ".sha256", 'w', encoding='utf-8') as f:
+            f.write(f"{_calcular_sha256(ruta_backup)}  {os.path.basename(ruta_backup)}\n")
+        return True
+    except OSError as e:
+        print(f"Error al escribir el archivo de backup: {e}")
+        _eliminar_si_existe(ruta_sqlite)
+        return False
+
+def _descomprimir_backup(ruta_backup: str) -> tuple[str, bool]:
+    if not ruta_backup.endswith(".gz"):
+        return ruta_backup, False
+
+    fd, ruta_temporal = tempfile.mkstemp(suffix=".db")
+    with os.fdopen(fd, 'wb') as salida, gzip.open(ruta_backup, 'rb') as entrada:
+        shutil.copyfileobj(entrada, salida, 1024 * 1024)
+    return ruta_temporal, True
+
+def verificar_backup(ruta_backup: str):
+    ruta_checksum = ruta_backup + ".sha256"
+    if os.path.exists(ruta_checksum):
+        with open(ruta_checksum, 'r', encoding='utf-8') as f:
+            checksum_esperado = f.read().split()[0]
+        if checksum_esperado != _calcular_sha256(ruta_backup):
+            print(f"El checksum del backup '{ruta_backup}' no coincide.")
+            return False
+
+    ruta_sqlite, es_temporal = _descomprimir_backup(ruta_backup)
+    try:
+        conn = sqlite3.connect(f"file:{ruta_sqlite}?mode=ro", uri=True)
+        try:
+            return _quick_check(conn)
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error al verificar el backup: {e}")
         return False
     finally:
-        conn_origen.close()
-        conn_destino.close()
+        if es_temporal:
+            _eliminar_si_existe(ruta_sqlite)
+
+def crear_backup_automatico(directorio: str, conservar=7, comprimir=True, progreso=None):
+    os.makedirs(directorio, exist_ok=True)
+    nombre = f"{PREFIJO_BACKUP_AUTOMATICO}{datetime.now().strftime('%Y-%m-%d_%H%M%S')}.db"
+    if comprimir:
+        nombre += ".gz"
+    ruta_backup = os.path.join(directorio, nombre)
+
+    if not crear_backup_seguro(ruta_backup, progreso=progreso, comprimir=comprimir):
+        return None
+    aplicar_retencion_backups(directorio, conservar)
+    return ruta_backup
+
+def aplicar_retencion_backups(directorio: str, conservar=7):
+    backups = sorted(
+        nombre for nombre in os.listdir(directorio)
+        if nombre.startswith(PREFIJO_BACKUP_AUTOMATICO) and (nombre.endswith(".db") or nombre.endswith(".db.gz"))
+    )
+    a_eliminar = backups[:-conservar] if conservar > 0 else backups
+    for nombre in a_eliminar:
+        ruta = os.path.join(directorio, nombre)
+        _eliminar_si_existe(ruta)
+        _eliminar_si_existe(ruta + ".sha256")
+    return a_eliminar
+
+def restaurar_backup(ruta_backup: str, progreso=None):
+    if not verificar_backup(ruta_backup):
+        return False
+
+    ruta_sqlite, es_temporal = _descomprimir_backup(ruta_backup)
+    if not es_temporal:
+        # Nunca migramos el archivo original del usuario: trabajamos sobre una copia.
+        fd, ruta_temporal = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        shutil.copyfile(ruta_sqlite, ruta_temporal)
+        ruta_sqlite = ruta_temporal
+
+    def _notificar_progreso(status, restantes, total):
+        if progreso:
+            progreso(total - restantes, total)
+
+    conn_backup = sqlite3.connect(ruta_sqlite)
+    conn_backup.row_factory = sqlite3.Row
+    try:
+        inicializar_bd(conn_backup, reiniciar_estado=False)
+        version = conn_backup.execute("PRAGMA user_version").fetchone()[0]
+        if version != LATEST_SCHEMA_VERSION:
+            raise sqlite3.DatabaseError(f"No se pudo migrar el backup (versión {version}).")
+
+        # pages=-1 copia todo en un único paso: la BD en uso queda bloqueada en exclusiva
+        # durante la copia y nadie llega a ver un estado a medio restaurar.
+        conn_live = _get_db_connection()
+        conn_backup.backup(conn_live, pages=-1, progress=_notificar_progreso)
+        _reiniciar_estado_bd()
+        return True
+    except sqlite3.Error as e:
+        print(f"Error al restaurar el backup: {e}")
+        return False
+    finally:
+        conn_backup.close()
+        _eliminar_si_existe(ruta_sqlite)
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+
+class BaseDatosAsync:
+    # Fachada asyncio sobre database.py para la API HTTP y los flujos de cobro asíncronos.
+    # Cada llamada corre en un pool acotado de hilos; cada hilo tiene su propia conexión, que
+    # database._get_db_connection() reutiliza. Las funciones síncronas (las vistas Tk) no cambian.
+    #
+    # Al vencer el timeout o cancelarse la tarea se interrumpe la consulta en curso. Una escritura
+    # interrumpida se revierte, pero si ya había terminado el resultado se descarta igual: quien
+    # llama no debe asumir que una venta con timeout no se registró.
+    FUNCIONES_EXPUESTAS = (
+        'obtener_productos', 'obtener_producto_por_id', 'obtener_producto_por_codigo_barras',
+        'obtener_producto_por_nombre', 'obtener_productos_por_ids', 'agregar_producto', 'actualizar_producto',
+        'obtener_lotes_por_producto', 'agregar_lote', 'agregar_lotes', 'actualizar_lote',
+        'obtener_clientes', 'obtener_cliente_por_id', 'agregar_cliente', 'actualizar_cliente',
+        'obtener_saldo_deudor_cliente', 'obtener_movimientos_cliente', 'realizar_pago_cliente',
+        'registrar_venta', 'obtener_venta_por_id', 'obtener_ventas_por_rango_de_fechas',
+        'obtener_pagos_recibidos_por_rango', 'obtener_sugerencias_reposicion',
+        'obtener_precio_a_fecha', 'obtener_precios_a_fecha', 'obtener_promociones', 'resolver_precios_lista',
+        'obtener_turno_abierto', 'obtener_reporte_turno', 'buscar_ventas', 'verificar_usuario',
+    )
+
+    def __init__(self, max_hilos=4, timeout_segundos=30.0):
+        self.timeout_segundos = timeout_segundos
+        self._conexiones = []
+        self._bloqueo = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_hilos, thread_name_prefix="easyst-bd", initializer=self._inicializar_hilo
+        )
+
+    def _inicializar_hilo(self):
+        conexion = database._nueva_conexion_bd(check_same_thread=False)
+        database._conexion_por_hilo.conexion = conexion
+        with self._bloqueo:
+            self._conexiones.append(conexion)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.cerrar()
+
+    def cerrar(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._bloqueo:
+            for conexion in self._conexiones:
+                conexion.close()
+            self._conexiones.clear()
+
+    def __getattr__(self, nombre):
+        if nombre in self.FUNCIONES_EXPUESTAS:
+            funcion = getattr(database, nombre)
+
+            async def llamada(*args, timeout=None, **kwargs):
+                return await self.ejecutar(funcion, *args, timeout=timeout, **kwargs)
+            llamada.__name__ = nombre
+            return llamada
+        raise AttributeError(nombre)
+
+    async def buscar_productos(self, texto=None, solo_poco_stock=False, timeout=None):
+        return await self.ejecutar(database.obtener_productos, nombre_like=texto, solo_poco_stock=solo_poco_stock, timeout=timeout)
+
+    async def ejecutar(self, funcion, *args, timeout=None, **kwargs):
+        # Ejecuta cualquier función bloqueante de database.py en el pool.
+        estado = {'conexion': None, 'activa': False}
+        bloqueo_estado = threading.Lock()
+
+        def tarea():
+            with bloqueo_estado:
+                estado['conexion'] = database._conexion_por_hilo.conexion
+                estado['activa'] = True
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                with bloqueo_estado:
+                    estado['activa'] = False
+
+        futuro = asyncio.get_running_loop().run_in_executor(self._executor, tarea)
+        limite = self.timeout_segundos if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(futuro, limite)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # Si la tarea todavía no empezó, el executor la descarta; si está corriendo, se corta la consulta.
+            with bloqueo_estado:
+                if estado['activa']:
+                    estado['conexion'].interrupt()
+            futuro.add_done_callback(_descartar_resultado)
+            raise
+
+
+def _descartar_resultado(futuro):
+    # Evita el aviso "exception was never retrieved" de las tareas interrumpidas.
+    if not futuro.cancelled():
+        futuro.exception()
@@ -4,11 +4,33 @@ import sys
 import os
 import configparser
 import hashlib
+import threading
 from datetime import datetime
 from PIL import Image, ImageTk  
 from database import (inicializar_bd, verificar_usuario, cambiar_contrasena_usuario, 
-                      get_persistent_path, crear_backup_seguro)
-from views import StockView, VentasView, ClientesView, ReportesView, resource_path
+                      get_persistent_path, crear_backup_seguro, crear_backup_automatico, restaurar_backup,
+                      actualizar_vencimientos)
+from views import StockView, VentasView, ClientesView, CajaView, ReportesView, resource_path, DIAS_AVISO_VENCIMIENTO
+from replicacion import DestinoDirectorioLocal, ReplicadorWAL
+from carga_historica import cargar_ventas_historicas
+from exportacion_jsonl import exportar_bd_jsonl, importar_bd_jsonl
+
+config = configparser.ConfigParser()
+config.read(resource_path('config.ini'))
+
+BACKUP_AUTOMATICO = config.getboolean('Backup', 'Automatico', fallback=False)
+BACKUP_DIRECTORIO = config.get('Backup', 'Directorio', fallback=get_persistent_path('backups'))
+BACKUP_INTERVALO_HORAS = config.getfloat('Backup', 'IntervaloHoras', fallback=24)
+BACKUP_CONSERVAR = config.getint('Backup', 'Conservar', fallback=7)
+BACKUP_COMPRIMIR = config.getboolean('Backup', 'Comprimir', fallback=True)
+
+# Replicación continua del WAL: deshabilitada mientras no se configure un directorio de réplica.
+REPLICACION_DIRECTORIO = config.get('Replicacion', 'Directorio', fallback='')
+REPLICACION_INTERVALO_SEGUNDOS = config.getfloat('Replicacion', 'IntervaloSegundos', fallback=1.0)
+REPLICACION_SNAPSHOT_HORAS = config.getfloat('Replicacion', 'IntervaloSnapshotHoras', fallback=24)
+REPLICACION_CONSERVAR = config.getint('Replicacion', 'ConservarGeneraciones', fallback=3)
+
+VENCIMIENTOS_INTERVALO_MINUTOS = config.getfloat('Negocio', 'IntervaloEscaneoVencimientosMinutos', fallback=10)
 
 class LoginWindow(tk.Tk):
     def __init__(self):
@@ -87,10 +109,11 @@ class LoginWindow(tk.Tk):
             messagebox.showerror("Error de Acceso", "Usuario o contraseña incorrectos.")
 
 class App(tk.Tk):
-    def __init__(self, user_role: str):
+    def __init__(self, user_role: str, usuario: str = None):
         super().__init__()
-        self.current_user = None
+        self.current_user = usuario
         self.user_role = user_role
+        self.current_view_class = None
 
         self.title("EasySt - Sistema de Gestión")
         self.geometry("1280x720")
@@ -101,6 +124,16 @@ class App(tk.Tk):
         self.create_main_layout(self.user_role)
         self.after(100, lambda: self.show_view(VentasView))
 
+        if BACKUP_AUTOMATICO:
+            self.after(60 * 1000, self.ejecutar_backup_automatico)
+
+        self.after(5 * 1000, self.ejecutar_escaneo_vencimientos)
+
+        self.replicador = None
+        if REPLICACION_DIRECTORIO:
+            self.iniciar_replicacion()
+        self.protocol("WM_DELETE_WINDOW", self.al_cerrar)
+
     def setup_styles(self):
         style = ttk.Style(self)
         
@@ -147,6 +180,7 @@ class App(tk.Tk):
         ttk.Button(self.sidebar_frame, text="Ventas", style="Sidebar.TButton", command=lambda: self.show_view(VentasView)).pack(fill="x", pady=2)
         ttk.Button(self.sidebar_frame, text="Stock / Productos", style="Sidebar.TButton", command=lambda: self.show_view(StockView)).pack(fill="x", pady=2)
         ttk.Button(self.sidebar_frame, text="Clientes", style="Sidebar.TButton", command=lambda: self.show_view(ClientesView)).pack(fill="x", pady=2)
+        ttk.Button(self.sidebar_frame, text="Caja", style="Sidebar.TButton", command=lambda: self.show_view(CajaView)).pack(fill="x", pady=2)
 
         if user_role == "Administrador":
             ttk.Button(self.sidebar_frame, text="Reportes", style="Sidebar.TButton", command=lambda: self.show_view(ReportesView)).pack(fill="x", pady=2)
@@ -155,6 +189,7 @@ class App(tk.Tk):
 
             ttk.Button(self.sidebar_frame, text="Crear Copia de Seguridad", style="Sidebar.TButton", command=self.create_backup).pack(fill="x", pady=2)
             ttk.Button(self.sidebar_frame, text="Restaurar Copia", style="Sidebar.TButton", command=self.restore_backup).pack(fill="x", pady=2)
+            ttk.Button(self.sidebar_frame, text="Importar Ventas Históricas", style="Sidebar.TButton", command=self.importar_ventas_historicas).pack(fill="x", pady=2)
 
         else:
             ttk.Button(self.sidebar_frame, text="Reportes", style="Disabled.TButton", state="disabled").pack(fill="x", pady=2)
@@ -187,6 +222,7 @@ class App(tk.Tk):
         
         view = ViewClass(self.main_container)
         view.pack(side="top", fill="both", expand=True)
+        self.current_view_class = ViewClass
 
         if hasattr(view, 'on_view_enter'):
             view.on_view_enter()
@@ -202,24 +238,75 @@ class App(tk.Tk):
                 title="Guardar Copia de Seguridad como...",
                 defaultextension=".db",
                 initialfile=default_filename,
-                filetypes=[("Archivos de Base de Datos", "*.db"), ("Todos los archivos", "*.*")]
+                filetypes=[("Archivos de Base de Datos", "*.db"), ("Base de Datos Comprimida", "*.db.gz"), ("Todos los archivos", "*.*")]
             )
 
             if backup_path:
-                if crear_backup_seguro(backup_path):
-                    messagebox.showinfo("Copia de Seguridad Creada", f"La copia de seguridad se ha guardado con éxito en:\n{backup_path}")
-                else:
-                    messagebox.showerror("Error al Crear Copia", "No se pudo crear la copia de seguridad. Revise los registros para más detalles.")
+                self.iniciar_backup_en_segundo_plano(backup_path)
 
         except Exception as e:
             messagebox.showerror("Error al Crear Copia", f"No se pudo crear la copia de seguridad:\n{e}")
 
+    def iniciar_backup_en_segundo_plano(self, backup_path):
+        ventana_progreso = BackupProgressWindow(self)
+
+        def progreso(copiadas, total):
+            self.after(0, ventana_progreso.actualizar, copiadas, total)
+
+        def tarea():
+            exito = crear_backup_seguro(backup_path, progreso=progreso, comprimir=backup_path.endswith(".gz"))
+            self.after(0, self.finalizar_backup, ventana_progreso, backup_path, exito)
+
+        threading.Thread(target=tarea, daemon=True).start()
+
+    def finalizar_backup(self, ventana_progreso, backup_path, exito):
+        ventana_progreso.destroy()
+        if exito:
+            messagebox.showinfo("Copia de Seguridad Creada", f"La copia de seguridad se ha guardado y verificado con éxito en:\n{backup_path}")
+        else:
+            messagebox.showerror("Error al Crear Copia", "No se pudo crear la copia de seguridad. Revise los registros para más detalles.")
+
+    def ejecutar_backup_automatico(self):
+        def tarea():
+            ruta = crear_backup_automatico(BACKUP_DIRECTORIO, conservar=BACKUP_CONSERVAR, comprimir=BACKUP_COMPRIMIR)
+            if ruta:
+                print(f"Copia de seguridad automática creada en: {ruta}")
+            else:
+                print("Advertencia: No se pudo crear la copia de seguridad automática.")
+
+        threading.Thread(target=tarea, daemon=True).start()
+        self.after(int(BACKUP_INTERVALO_HORAS * 3600 * 1000), self.ejecutar_backup_automatico)
+
+    def ejecutar_escaneo_vencimientos(self, dias=DIAS_AVISO_VENCIMIENTO):
+        # Mantiene al día la lista de lotes por vencer que muestra Reportes; tras el primer escaneo
+        # solo se vuelven a leer los productos cuyos lotes cambiaron. El primero usa la misma ventana
+        # que propone Reportes; los siguientes (dias=None) la que haya quedado elegida ahí.
+        threading.Thread(target=actualizar_vencimientos, args=(dias,), daemon=True).start()
+        self.after(int(VENCIMIENTOS_INTERVALO_MINUTOS * 60 * 1000), self.ejecutar_escaneo_vencimientos, None)
+
+    def iniciar_replicacion(self):
+        replicador = ReplicadorWAL(
+            DestinoDirectorioLocal(REPLICACION_DIRECTORIO),
+            intervalo_segundos=REPLICACION_INTERVALO_SEGUNDOS,
+            intervalo_snapshot_segundos=REPLICACION_SNAPSHOT_HORAS * 3600,
+            conservar_generaciones=REPLICACION_CONSERVAR
+        )
+        if replicador.iniciar():
+            self.replicador = replicador
+        else:
+            messagebox.showwarning("Replicación", f"No se pudo iniciar la replicación continua en '{REPLICACION_DIRECTORIO}'.\n\nLa aplicación seguirá funcionando sin réplica.")
+
+    def al_cerrar(self):
+        if self.replicador:
+            self.replicador.detener()
+        self.destroy()
+
     def restore_backup(self):
         confirm = messagebox.askyesno(
             "¡ADVERTENCIA! Restaurar Copia de Seguridad",
             "Está a punto de reemplazar TODOS los datos actuales (productos, ventas, clientes, etc.) "
             "con los datos de un archivo de copia de seguridad.\n\n"
-            "Esta acción NO SE PUEDE DESHACER.\n\n"
+            "Esta acción NO SE PUEDE DESHACER. Las ventas en curso se descartarán.\n\n"
             "¿Está seguro de que desea continuar?",
             icon='warning'
         )
@@ -229,18 +316,99 @@ class App(tk.Tk):
 
         backup_path = filedialog.askopenfilename(
             title="Seleccionar archivo de Copia de Seguridad para restaurar",
-            filetypes=[("Archivos de Base de Datos", "*.db"), ("Todos los archivos", "*.*")]
+            filetypes=[("Archivos de Base de Datos", "*.db *.db.gz"), ("Todos los archivos", "*.*")]
         )
 
         if backup_path:
-            try:
-                import shutil
-                db_file_path = get_persistent_path('easyst.db')
-                shutil.copyfile(backup_path, db_file_path)
-                messagebox.showinfo("Restauración Exitosa", "La base de datos ha sido restaurada.\n\nLa aplicación debe reiniciarse para aplicar los cambios. Por favor, ciérrela y vuelva a abrirla.")
-                self.destroy()
-            except Exception as e:
-                messagebox.showerror("Error de Restauración", f"No se pudo restaurar la base de datos:\n{e}")
+            ventana_progreso = BackupProgressWindow(self, titulo="Restaurando Copia de Seguridad")
+
+            def progreso(copiadas, total):
+                self.after(0, ventana_progreso.actualizar, copiadas, total)
+
+            def tarea():
+                exito = restaurar_backup(backup_path, progreso=progreso)
+                self.after(0, self.finalizar_restauracion, ventana_progreso, exito)
+
+            threading.Thread(target=tarea, daemon=True).start()
+
+    def finalizar_restauracion(self, ventana_progreso, exito):
+        ventana_progreso.destroy()
+        if exito:
+            if self.current_view_class:
+                self.show_view(self.current_view_class)
+            messagebox.showinfo("Restauración Exitosa", "La base de datos ha sido restaurada y las vistas se han recargado.")
+        else:
+            messagebox.showerror("Error de Restauración", "No se pudo restaurar la base de datos. El archivo no es válido o no supera la verificación.\n\nLos datos actuales no se han modificado.")
+
+    def importar_ventas_historicas(self):
+        ruta_csv = filedialog.askopenfilename(
+            title="Seleccionar ventas exportadas del sistema anterior",
+            filetypes=[("Archivos CSV", "*.csv"), ("Todos los archivos", "*.*")]
+        )
+        if not ruta_csv:
+            return
+        if not messagebox.askyesno(
+            "Importar Ventas Históricas",
+            "Las ventas del archivo se agregarán al historial sin descontar stock.\n\n"
+            "Durante la importación no se pueden registrar ventas. ¿Desea continuar?"
+        ):
+            return
+
+        ventana_progreso = BackupProgressWindow(self, titulo="Importando Ventas Históricas")
+        ventana_progreso.status_var.set("Leyendo el archivo...")
+        ventana_progreso.progress_bar.config(mode="indeterminate")
+        ventana_progreso.progress_bar.start()
+
+        def progreso(lineas):
+            self.after(0, ventana_progreso.status_var.set, f"Líneas cargadas: {lineas}")
+
+        def tarea():
+            informe = cargar_ventas_historicas(ruta_csv, progreso=progreso)
+            self.after(0, self.finalizar_importacion_historica, ventana_progreso, informe)
+
+        threading.Thread(target=tarea, daemon=True).start()
+
+    def finalizar_importacion_historica(self, ventana_progreso, informe):
+        ventana_progreso.destroy()
+        if informe is None:
+            messagebox.showerror("Error de Importación", "No se pudieron importar las ventas. Revise que el archivo tenga las columnas fecha, cantidad, precio_unitario y producto o codigo_barras.\n\nNo se modificó ningún dato.")
+            return
+        mensaje = (f"Ventas importadas: {informe['ventas']} ({informe['lineas']} líneas)\n"
+                   f"Productos creados: {informe['productos_creados']}\n"
+                   f"Clientes creados: {informe['clientes_creados']}\n"
+                   f"Tiempo: {informe['segundos']:.1f} s ({informe['filas_por_segundo']:.0f} líneas/s)")
+        if informe['cantidad_rechazadas']:
+            detalle = "\n".join(f"Fila {fila}: {motivo}" for fila, motivo in informe['rechazadas'][:10])
+            mensaje += f"\n\nFilas rechazadas: {informe['cantidad_rechazadas']}\n{detalle}"
+        messagebox.showinfo("Importación Finalizada", mensaje)
+        if self.current_view_class:
+            self.show_view(self.current_view_class)
+
+
+class BackupProgressWindow(tk.Toplevel):
+    def __init__(self, parent, titulo="Creando Copia de Seguridad"):
+        super().__init__(parent)
+        self.title(titulo)
+        self.geometry("400x120")
+        self.resizable(False, False)
+        self.transient(parent)
+        self.protocol("WM_DELETE_WINDOW", lambda: None)
+
+        main_frame = ttk.Frame(self, padding=20)
+        main_frame.pack(fill="both", expand=True)
+
+        self.status_var = tk.StringVar(value="Preparando copia...")
+        ttk.Label(main_frame, textvariable=self.status_var).pack(anchor="w")
+        self.progress_bar = ttk.Progressbar(main_frame, orient="horizontal", mode="determinate", maximum=100)
+        self.progress_bar.pack(fill="x", pady=10)
+
+    def actualizar(self, copiadas, total):
+        porcentaje = (copiadas / total * 100) if total else 100
+        self.progress_bar["value"] = porcentaje
+        if copiadas >= total:
+            self.status_var.set("Verificando la copia...")
+        else:
+            self.status_var.set(f"Copiando páginas: {copiadas} de {total} ({porcentaje:.0f}%)")
 
 
 class ChangePasswordWindow(tk.Toplevel):
@@ -330,6 +498,10 @@ if __name__ == "__main__":
         if os.path.exists(db_file_to_clean):
             try:
                 os.remove(db_file_to_clean)
+                # Archivos auxiliares del modo WAL.
+                for sufijo in ("-wal", "-shm"):
+                    if os.path.exists(db_file_to_clean + sufijo):
+                        os.remove(db_file_to_clean + sufijo)
                 print(f"Éxito: Se ha eliminado '{db_file_to_clean}' para preparar el empaquetado.")
             except OSError as e:
                 print(f"Error: No se pudo eliminar '{db_file_to_clean}'. Causa: {e}")
@@ -337,6 +509,33 @@ if __name__ == "__main__":
             print(f"Información: El archivo '{db_file_to_clean}' no existe. No se necesita limpieza.")
         sys.exit(0)
 
+    elif "--exportar-jsonl" in sys.argv or "--importar-jsonl" in sys.argv:
+        # Uso por línea de comandos, sin abrir ventanas:
+        #   easyst --exportar-jsonl <directorio>   /   easyst --importar-jsonl <directorio>
+        exportar = "--exportar-jsonl" in sys.argv
+        opcion = "--exportar-jsonl" if exportar else "--importar-jsonl"
+        posicion = sys.argv.index(opcion)
+        if posicion + 1 >= len(sys.argv):
+            print(f"Uso: {os.path.basename(sys.argv[0])} {opcion} <directorio>")
+            sys.exit(2)
+        directorio = sys.argv[posicion + 1]
+
+        def progreso(tabla, filas):
+            print(f"  {tabla:<30} {filas:>10} filas", end="\r", flush=True)
+
+        inicializar_bd()
+        if exportar:
+            manifiesto = exportar_bd_jsonl(directorio, progreso=progreso)
+            if manifiesto:
+                total = sum(tabla['filas'] for tabla in manifiesto['tablas'])
+                print(f"\nÉxito: Se exportaron {len(manifiesto['tablas'])} tablas ({total} filas) a '{directorio}'.")
+            exito = manifiesto is not None
+        else:
+            exito = importar_bd_jsonl(directorio, progreso=progreso)
+            if exito:
+                print(f"\nÉxito: Se importaron los datos de '{directorio}'.")
+        sys.exit(0 if exito else 1)
+
     else:
         if not verificar_licencia():
             tk.Tk().withdraw()
@@ -352,6 +551,5 @@ if __name__ == "__main__":
         login_window.mainloop()
 
         if login_window.logged_in:
-            app = App(user_role=login_window.user_role)
-            app.current_user = login_window.entered_username
+            app = App(user_role=login_window.user_role, usuario=login_window.entered_username)
             app.mainloop()
\ No newline at end of file
@@ -0,0 +1,184 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+
+import database
+
+# Exportación completa de la BD a un directorio con un archivo JSON Lines comprimido por tabla
+# (<tabla>.jsonl.gz, una fila por línea como lista de valores) y un manifiesto con las columnas, la
+# cantidad de filas y el SHA-256 del contenido sin comprimir de cada tabla. Las filas salen ordenadas
+# por clave y el gzip sin fecha: dos exportaciones de la misma BD dan archivos idénticos, así que
+# sirven también para comparar dos locales.
+#
+# Ambas direcciones leen y escriben de a lotes (fetchmany / executemany): la memoria no depende del
+# tamaño de la BD. La importación carga todo en una BD temporal, verifica cada tabla contra el
+# manifiesto y recién entonces reemplaza la BD en uso, igual que restaurar_backup.
+
+FORMATO_EXPORTACION = 1
+NOMBRE_MANIFIESTO = 'manifiesto.json'
+
+
+def _codificar_valor(valor):
+    if isinstance(valor, bytes):
+        return {'$base64': base64.b64encode(valor).decode('ascii')}
+    raise TypeError(f"Tipo no exportable: {type(valor).__name__}")
+
+
+def _decodificar_fila(fila):
+    return [base64.b64decode(v['$base64']) if isinstance(v, dict) else v for v in fila]
+
+
+def _tablas_exportables(conn):
+    # Las tablas de búsqueda de texto (virtuales y sus tablas internas) se rearman solas al importar.
+    return conn.execute(
+        """SELECT name, wr FROM pragma_table_list
+           WHERE schema = 'main' AND type = 'table' AND name NOT LIKE 'sqlite_%'
+           ORDER BY name"""
+    ).fetchall()
+
+
+def _columnas_y_orden(conn, tabla, sin_rowid):
+    info = conn.execute(f'PRAGMA table_info("{tabla}")').fetchall()
+    columnas = [fila[1] for fila in info]
+    if sin_rowid:
+        orden = ', '.join(f'"{fila[1]}"' for fila in sorted((f for f in info if f[5]), key=lambda f: f[5]))
+    else:
+        orden = 'rowid'
+    return columnas, orden
+
+
+def exportar_bd_jsonl(directorio, progreso=None, tamano_lote=database.TAMANO_LOTE_LECTURA):
+    # Devuelve el manifiesto escrito, o None si falló. progreso(tabla, filas_exportadas).
+    conn = database._get_db_connection()
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        # Una sola transacción de lectura: todas las tablas salen del mismo instante de la BD.
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        manifiesto = {
+            'formato': FORMATO_EXPORTACION,
+            'version_esquema': conn.execute("PRAGMA user_version").fetchone()[0],
+            'fecha': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'tablas': [],
+        }
+        for tabla, sin_rowid in _tablas_exportables(conn):
+            columnas, orden = _columnas_y_orden(conn, tabla, sin_rowid)
+            archivo = f"{tabla}.jsonl.gz"
+            sha256 = hashlib.sha256()
+            filas = 0
+            cursor = conn.execute(f"""SELECT {', '.join(f'"{c}"' for c in columnas)} FROM "{tabla}" ORDER BY {orden}""")
+            with gzip.GzipFile(os.path.join(directorio, archivo), 'wb', mtime=0) as salida:
+                while True:
+                    lote = cursor.fetchmany(tamano_lote)
+                    if not lote:
+                        break
+                    datos = ''.join(
+                        json.dumps(list(fila), ensure_ascii=False, separators=(',', ':'), default=_codificar_valor) + '\n'
+                        for fila in lote
+                    ).encode('utf-8')
+                    sha256.update(datos)
+                    salida.write(datos)
+                    filas += len(lote)
+                    if progreso:
+                        progreso(tabla, filas)
+            manifiesto['tablas'].append({'nombre': tabla, 'archivo': archivo, 'columnas': columnas, 'filas': filas, 'sha256': sha256.hexdigest()})
+        conn.rollback()
+
+        # El manifiesto va último: si existe, la exportación está completa.
+        with open(os.path.join(directorio, NOMBRE_MANIFIESTO), 'w', encoding='utf-8') as f:
+            json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+        return manifiesto
+    except (sqlite3.Error, OSError, TypeError) as e:
+        print(f"Error al exportar la base de datos: {e}")
+        if conn.in_transaction:
+            conn.rollback()
+        return None
+
+
+def leer_manifiesto(directorio):
+    try:
+        with open(os.path.join(directorio, NOMBRE_MANIFIESTO), encoding='utf-8') as f:
+            manifiesto = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error al leer el manifiesto de la exportación: {e}")
+        return None
+    if manifiesto.get('formato') != FORMATO_EXPORTACION:
+        print(f"Formato de exportación no soportado: {manifiesto.get('formato')}")
+        return None
+    return manifiesto
+
+
+def _importar_tabla(conn, directorio, tabla, tamano_lote, progreso):
+    # Carga una tabla del manifiesto; las columnas que ya no existen se descartan y las nuevas toman su
+    # valor por defecto (exportaciones de una versión anterior). Lanza ValueError si no coincide el SHA-256.
+    existentes = {fila[1] for fila in conn.execute(f'PRAGMA table_info("{tabla["nombre"]}")')}
+    if not existentes:
+        print(f"Advertencia: la tabla '{tabla['nombre']}' ya no existe; se omite.")
+        return
+    posiciones = [i for i, columna in enumerate(tabla['columnas']) if columna in existentes]
+    columnas = ', '.join(f'"{tabla["columnas"][i]}"' for i in posiciones)
+    sql = f"""INSERT INTO "{tabla['nombre']}" ({columnas}) VALUES ({', '.join('?' for _ in posiciones)})"""
+    todas = len(posiciones) == len(tabla['columnas'])
+
+    conn.execute(f'DELETE FROM "{tabla["nombre"]}"')
+    sha256 = hashlib.sha256()
+    filas = 0
+    lote = []
+    with gzip.open(os.path.join(directorio, tabla['archivo']), 'rb') as entrada:
+        for linea in entrada:
+            sha256.update(linea)
+            fila = _decodificar_fila(json.loads(linea))
+            lote.append(fila if todas else [fila[i] for i in posiciones])
+            if len(lote) >= tamano_lote:
+                conn.executemany(sql, lote)
+                filas += len(lote)
+                lote.clear()
+                if progreso:
+                    progreso(tabla['nombre'], filas)
+    conn.executemany(sql, lote)
+    filas += len(lote)
+    if progreso:
+        progreso(tabla['nombre'], filas)
+
+    if sha256.hexdigest() != tabla['sha256'] or filas != tabla['filas']:
+        raise ValueError(f"La tabla '{tabla['nombre']}' no coincide con el manifiesto (archivo dañado o modificado).")
+
+
+def importar_bd_jsonl(directorio, progreso=None, tamano_lote=database.TAMANO_LOTE_LECTURA):
+    # Reemplaza todos los datos de la BD en uso por los de la exportación. Devuelve True si se importó;
+    # ante cualquier error la BD en uso no se modifica.
+    manifiesto = leer_manifiesto(directorio)
+    if manifiesto is None:
+        return False
+    if manifiesto['version_esquema'] > database.LATEST_SCHEMA_VERSION:
+        print(f"La exportación es de una versión más nueva del sistema (esquema {manifiesto['version_esquema']}).")
+        return False
+
+    fd, ruta_temporal = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    conn_temporal = sqlite3.connect(ruta_temporal)
+    try:
+        database.inicializar_bd(conn_temporal, reiniciar_estado=False)
+        with conn_temporal:
+            for tabla in manifiesto['tablas']:
+                _importar_tabla(conn_temporal, directorio, tabla, tamano_lote, progreso)
+        if not database._quick_check(conn_temporal):
+            raise sqlite3.DatabaseError("La BD importada no superó la verificación 'quick_check'.")
+
+        # Igual que al restaurar un backup: se copia todo en un paso y nadie ve un estado intermedio.
+        conn_temporal.backup(database._get_db_connection(), pages=-1)
+        database._reiniciar_estado_bd()
+        return True
+    except (sqlite3.Error, OSError, ValueError, EOFError) as e:
+        print(f"Error al importar la base de datos: {e}")
+        return False
+    finally:
+        conn_temporal.close()
+        database._eliminar_si_existe(ruta_temporal)
+        for sufijo in ("-wal", "-shm"):
+            database._eliminar_si_existe(ruta_temporal + sufijo)
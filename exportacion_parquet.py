@@ -0,0 +1,236 @@
+import itertools
+import os
+import shutil
+import sqlite3
+import time
+
+import database
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: solo lo necesita esta exportación
+    pa = pq = None
+
+# Exportación de ventas, inventario y cuentas de clientes a Parquet para analizar con herramientas
+# externas (Power BI, Excel/Power Query, pandas, DuckDB...). Las tablas con fecha se parten por mes al
+# estilo Hive (<directorio>/ventas/mes=2024-03/ventas-2024-03.parquet) y las demás van en un solo
+# archivo (<directorio>/productos.parquet). Las filas se leen del cursor de a lotes ordenadas por fecha
+# y cada lote se escribe como un grupo de filas: la memoria no depende del tamaño de la BD.
+#
+# En modo incremental solo se reescriben el último mes ya exportado (pudo quedar a medias) y los
+# posteriores. Las ventas cargadas después con fecha anterior (p. ej. con carga_historica) requieren
+# una exportación completa.
+
+TAMANO_LOTE_PARQUET = 50000
+COMPRESION_PARQUET = 'zstd'
+
+# nombre: (consulta, columna que define el mes o None, [(columna, tipo)])
+# La consulta de los conjuntos por mes recibe la fecha desde la que exportar y debe venir ordenada por esa columna.
+# Las fechas pasan por date()/datetime(): lo que no es una fecha ISO (p. ej. un vencimiento importado de
+# Excel como '15/03/2025' o una fecha límite escrita a mano) sale NULL en vez de frenar la exportación.
+# El filtro y el orden usan la columna original (con la tabla adelante) para aprovechar los índices.
+_CONJUNTOS = {
+    'ventas': ("""
+        SELECT v.id_venta, datetime(v.fecha_venta) AS fecha_venta, v.id_cliente, v.total, v.forma_pago, v.id_turno, v.observaciones
+        FROM ventas v WHERE v.fecha_venta >= ? ORDER BY v.fecha_venta, v.id_venta
+    """, 'fecha_venta', [
+        ('id_venta', 'entero'), ('fecha_venta', 'fecha_hora'), ('id_cliente', 'entero'), ('total', 'real'),
+        ('forma_pago', 'texto'), ('id_turno', 'entero'), ('observaciones', 'texto'),
+    ]),
+    'detalle_venta': ("""
+        SELECT d.id_detalle, d.id_venta, datetime(v.fecha_venta) AS fecha_venta, d.id_producto, d.cantidad, d.precio_unitario, d.descuento,
+               d.descuento_promocion, d.subtotal, d.costo_total, d.estado, d.cantidad_pendiente
+        FROM ventas v JOIN detalle_venta d ON d.id_venta = v.id_venta
+        WHERE v.fecha_venta >= ? ORDER BY v.fecha_venta, v.id_venta
+    """, 'fecha_venta', [
+        ('id_detalle', 'entero'), ('id_venta', 'entero'), ('fecha_venta', 'fecha_hora'), ('id_producto', 'entero'),
+        ('cantidad', 'entero'), ('precio_unitario', 'real'), ('descuento', 'real'), ('descuento_promocion', 'real'),
+        ('subtotal', 'real'), ('costo_total', 'real'), ('estado', 'texto'), ('cantidad_pendiente', 'entero'),
+    ]),
+    'movimientos_clientes': ("""
+        SELECT m.id_movimiento, m.id_cliente, m.id_venta, datetime(m.fecha) AS fecha, m.tipo_movimiento, m.monto
+        FROM movimientos_cuenta_cliente m WHERE m.fecha >= ? ORDER BY m.fecha, m.id_movimiento
+    """, 'fecha', [
+        ('id_movimiento', 'entero'), ('id_cliente', 'entero'), ('id_venta', 'entero'), ('fecha', 'fecha_hora'),
+        ('tipo_movimiento', 'texto'), ('monto', 'real'),
+    ]),
+    'productos': ("""
+        SELECT id_producto, nombre, codigo_barras, precio_venta, volumen, descripcion, stock_sin_lote
+        FROM productos ORDER BY id_producto
+    """, None, [
+        ('id_producto', 'entero'), ('nombre', 'texto'), ('codigo_barras', 'texto'), ('precio_venta', 'real'),
+        ('volumen', 'real'), ('descripcion', 'texto'), ('stock_sin_lote', 'entero'),
+    ]),
+    'stock': ("""
+        SELECT id_stock, id_producto, cantidad, date(fecha_vencimiento) AS fecha_vencimiento, codigo_barras, costo_unitario
+        FROM stock ORDER BY id_stock
+    """, None, [
+        ('id_stock', 'entero'), ('id_producto', 'entero'), ('cantidad', 'entero'), ('fecha_vencimiento', 'fecha'),
+        ('codigo_barras', 'texto'), ('costo_unitario', 'real'),
+    ]),
+    'clientes': ("""
+        SELECT id_cliente, nombre, dni, date(fecha_limite_pago) AS fecha_limite_pago, id_lista_precios FROM cliente ORDER BY id_cliente
+    """, None, [
+        ('id_cliente', 'entero'), ('nombre', 'texto'), ('dni', 'texto'), ('fecha_limite_pago', 'fecha'),
+        ('id_lista_precios', 'entero'),
+    ]),
+}
+
+PREFIJO_PARTICION = 'mes='
+
+
+def parquet_disponible():
+    return pa is not None
+
+
+def _tipo_arrow(tipo):
+    return {
+        'entero': pa.int64(),
+        'real': pa.float64(),
+        'texto': pa.string(),
+        'fecha_hora': pa.timestamp('ms'),  # Parquet no tiene segundos como unidad
+        'fecha': pa.date32(),
+    }[tipo]
+
+
+def _esquema(columnas):
+    return pa.schema([(nombre, _tipo_arrow(tipo)) for nombre, tipo in columnas])
+
+
+def _lote_arrow(filas, esquema):
+    # Las fechas se guardan como texto ISO en SQLite; Arrow las convierte al tipo de fecha de la columna.
+    arreglos = []
+    for valores, campo in zip(zip(*filas), esquema):
+        if pa.types.is_timestamp(campo.type) or pa.types.is_date(campo.type):
+            arreglos.append(pa.array(valores, pa.string()).cast(campo.type))
+        else:
+            arreglos.append(pa.array(valores, campo.type))
+    return pa.RecordBatch.from_arrays(arreglos, schema=esquema)
+
+
+class _EscritorParquet:
+    # Escribe a un archivo temporal y lo renombra al cerrar: un corte a mitad de camino no deja un
+    # Parquet incompleto con el nombre definitivo.
+    def __init__(self, ruta, esquema, compresion):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self.ruta = ruta
+        self.ruta_temporal = ruta + '.tmp'
+        self.escritor = pq.ParquetWriter(self.ruta_temporal, esquema, compression=compresion)
+
+    def escribir(self, lote):
+        self.escritor.write_batch(lote)
+
+    def cerrar(self):
+        self.escritor.close()
+        os.replace(self.ruta_temporal, self.ruta)
+
+    def descartar(self):
+        self.escritor.close()
+        database._eliminar_si_existe(self.ruta_temporal)
+
+
+def _cursor_tuplas(conn):
+    # Sin sqlite3.Row: con millones de filas armar cada Row cuesta más que leerla.
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor
+
+
+def _meses_exportados(directorio_conjunto):
+    if not os.path.isdir(directorio_conjunto):
+        return []
+    return sorted(nombre[len(PREFIJO_PARTICION):] for nombre in os.listdir(directorio_conjunto) if nombre.startswith(PREFIJO_PARTICION))
+
+
+def _exportar_por_mes(conn, directorio, nombre, consulta, columna_fecha, esquema, incremental, tamano_lote, compresion, progreso):
+    directorio_conjunto = os.path.join(directorio, nombre)
+    meses_previos = _meses_exportados(directorio_conjunto)
+    desde_mes = meses_previos[-1] if incremental and meses_previos else None
+    posicion_fecha = esquema.get_field_index(columna_fecha)
+
+    cursor = _cursor_tuplas(conn)
+    cursor.execute(consulta, (f"{desde_mes}-01" if desde_mes else '',))
+    meses, filas, sin_fecha, mes_actual, escritor = [], 0, 0, None, None
+    try:
+        for lote in database._iterar_en_lotes(cursor, tamano_lote):
+            # Una fila sin fecha válida no tiene mes al que ir; se cuenta y se avisa al final.
+            con_fecha = [fila for fila in lote if fila[posicion_fecha] is not None]
+            sin_fecha += len(lote) - len(con_fecha)
+            # Como las filas vienen ordenadas por fecha, cada mes es un tramo contiguo del lote.
+            for mes, tramo in itertools.groupby(con_fecha, key=lambda fila: fila[posicion_fecha][:7]):
+                if mes != mes_actual:
+                    if escritor:
+                        escritor.cerrar()
+                        escritor = None
+                    mes_actual = mes
+                    meses.append(mes)
+                    ruta = os.path.join(directorio_conjunto, f"{PREFIJO_PARTICION}{mes}", f"{nombre}-{mes}.parquet")
+                    escritor = _EscritorParquet(ruta, esquema, compresion)
+                escritor.escribir(_lote_arrow(list(tramo), esquema))
+            filas += len(con_fecha)
+            if progreso:
+                progreso(nombre, filas)
+        if escritor:
+            escritor.cerrar()
+            escritor = None
+    finally:
+        if escritor:
+            escritor.descartar()
+    if sin_fecha:
+        print(f"Advertencia: {sin_fecha} filas de '{nombre}' no tienen una fecha válida y no se exportaron.")
+
+    # Los meses que ya no tienen filas (ventas borradas, o una exportación completa sobre un directorio
+    # viejo) se quitan para que el conjunto refleje la BD.
+    for mes in meses_previos:
+        if (desde_mes is None or mes >= desde_mes) and mes not in meses:
+            shutil.rmtree(os.path.join(directorio_conjunto, f"{PREFIJO_PARTICION}{mes}"), ignore_errors=True)
+    return {'filas': filas, 'meses': meses}
+
+
+def _exportar_completo(conn, directorio, nombre, consulta, esquema, tamano_lote, compresion, progreso):
+    escritor = _EscritorParquet(os.path.join(directorio, f"{nombre}.parquet"), esquema, compresion)
+    filas = 0
+    try:
+        cursor = _cursor_tuplas(conn)
+        cursor.execute(consulta)
+        for lote in database._iterar_en_lotes(cursor, tamano_lote):
+            escritor.escribir(_lote_arrow(lote, esquema))
+            filas += len(lote)
+            if progreso:
+                progreso(nombre, filas)
+        escritor.cerrar()
+    except BaseException:
+        escritor.descartar()
+        raise
+    return {'filas': filas, 'meses': None}
+
+
+def exportar_parquet(directorio, incremental=False, progreso=None, tamano_lote=TAMANO_LOTE_PARQUET, compresion=COMPRESION_PARQUET):
+    # Devuelve {'conjuntos': {nombre: {'filas', 'meses'}}, 'segundos'}, o None si falló.
+    # progreso(conjunto, filas_exportadas). 'meses' es None en los conjuntos sin partición.
+    if not parquet_disponible():
+        print("Error: la exportación a Parquet requiere el paquete 'pyarrow' (pip install pyarrow).")
+        return None
+    inicio = time.perf_counter()
+    conn = database._get_db_connection()
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        # Una sola transacción de lectura: ventas, detalle y stock salen del mismo instante de la BD.
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        conjuntos = {}
+        for nombre, (consulta, columna_fecha, columnas) in _CONJUNTOS.items():
+            esquema = _esquema(columnas)
+            if columna_fecha:
+                conjuntos[nombre] = _exportar_por_mes(conn, directorio, nombre, consulta, columna_fecha, esquema,
+                                                      incremental, tamano_lote, compresion, progreso)
+            else:
+                conjuntos[nombre] = _exportar_completo(conn, directorio, nombre, consulta, esquema, tamano_lote, compresion, progreso)
+        conn.rollback()
+        return {'conjuntos': conjuntos, 'segundos': time.perf_counter() - inicio}
+    except (sqlite3.Error, OSError, pa.ArrowException) as e:
+        print(f"Error al exportar a Parquet: {e}")
+        if conn.in_transaction:
+            conn.rollback()
+        return None
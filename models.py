@@ -1,7 +1,7 @@
 
 
 class Producto:
-    def __init__(self, nombre, precio_venta, volumen=None, codigo_barras=None, descripcion=None, id_producto=None, cantidad_stock=0, stock_sin_lote=0, fecha_vencimiento=None):
+    def __init__(self, nombre, precio_venta, volumen=None, codigo_barras=None, descripcion=None, id_producto=None, cantidad_stock=0, stock_sin_lote=0, fecha_vencimiento=None, costo_unitario=None):
         self.id_producto = id_producto
         self.nombre = nombre
         self.precio_venta = precio_venta
@@ -12,7 +12,9 @@ class Producto:
         self.stock_sin_lote = stock_sin_lote
         self.num_lotes = 0
         self.vencimiento_proximo = None
+        self.dias_para_vencer = None
         self.fecha_vencimiento = fecha_vencimiento
+        self.costo_unitario = costo_unitario
 
     def __repr__(self):
         return (f"Producto(id={self.id_producto}, nombre='{self.nombre}', "
@@ -20,12 +22,13 @@ class Producto:
 
 
 class Cliente:
-    def __init__(self, nombre, dni=None, id_cliente=None, saldo_deudor=0.0, fecha_limite_pago=None):
+    def __init__(self, nombre, dni=None, id_cliente=None, saldo_deudor=0.0, fecha_limite_pago=None, id_lista_precios=None):
         self.id_cliente = id_cliente
         self.nombre = nombre
         self.dni = dni
         self.saldo_deudor = saldo_deudor
         self.fecha_limite_pago = fecha_limite_pago
+        self.id_lista_precios = id_lista_precios
 
     def __repr__(self):
         return f"Cliente(id={self.id_cliente}, nombre='{self.nombre}', deuda=${self.saldo_deudor})"
@@ -50,7 +53,7 @@ class Venta:
 
 
 class DetalleVenta:
-    def __init__(self, id_producto, cantidad, precio_unitario, id_venta=None, id_detalle=None, descuento=0.0, estado="Completada", subtotal=None):
+    def __init__(self, id_producto, cantidad, precio_unitario, id_venta=None, id_detalle=None, descuento=0.0, estado="Completada", subtotal=None, cantidad_pendiente=0, id_stock=None, costo_total=0.0, descuento_promocion=0.0, promociones=None):
         self.id_detalle = id_detalle
         self.id_venta = id_venta
         self.id_producto = id_producto
@@ -58,12 +61,40 @@ class DetalleVenta:
         self.precio_unitario = precio_unitario
         self.descuento = descuento
         self.estado = estado
+        self.cantidad_pendiente = cantidad_pendiente
+        self.id_stock = id_stock
+        self.costo_total = costo_total
+        self.descuento_promocion = descuento_promocion
+        self.promociones = promociones or []  # [(id_promocion, monto)] aplicadas a esta línea
         self.subtotal = subtotal if subtotal is not None else self.calcular_subtotal()
 
     def calcular_subtotal(self):
-        subtotal_bruto = self.cantidad * self.precio_unitario
+        subtotal_bruto = self.cantidad * self.precio_unitario - self.descuento_promocion
         return subtotal_bruto * (1 - self.descuento / 100)
 
     def __repr__(self):
         return (f"DetalleVenta(prod_id={self.id_producto}, cant={self.cantidad}, "
-                f"subtotal=${self.subtotal:.2f}, estado='{self.estado}')")
\ No newline at end of file
+                f"subtotal=${self.subtotal:.2f}, estado='{self.estado}')")
+
+
+class Promocion:
+    # tipo: 'nxm' (llevá 'cantidad', pagá 'valor'), 'unidad_n' (la unidad número 'cantidad' con 'valor'% off),
+    # 'combo' (los productos juntos por $'valor') o 'porcentaje' ('valor'% off).
+    # 'productos' es {id_producto: unidades}; las unidades solo cuentan en los combos.
+    def __init__(self, nombre, tipo, productos=None, cantidad=1, valor=0.0, prioridad=0, fecha_desde=None, fecha_hasta=None, dias_semana=None, hora_desde=None, hora_hasta=None, activa=True, id_promocion=None):
+        self.id_promocion = id_promocion
+        self.nombre = nombre
+        self.tipo = tipo
+        self.productos = productos or {}
+        self.cantidad = cantidad
+        self.valor = valor
+        self.prioridad = prioridad
+        self.fecha_desde = fecha_desde
+        self.fecha_hasta = fecha_hasta
+        self.dias_semana = dias_semana  # dígitos de datetime.weekday(): "0123456" = todos los días
+        self.hora_desde = hora_desde
+        self.hora_hasta = hora_hasta
+        self.activa = activa
+
+    def __repr__(self):
+        return f"Promocion(id={self.id_promocion}, nombre='{self.nombre}', tipo='{self.tipo}')"
@@ -0,0 +1,282 @@
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import database
+
+TIPOS_PROMOCION = ('nxm', 'unidad_n', 'combo', 'porcentaje')
+
+# Las reglas se compilan una vez en un índice id_producto -> componente. Un componente agrupa las
+# reglas que comparten productos (directa o indirectamente): solo ahí puede haber competencia por
+# las mismas unidades, así que un cambio en una línea del carrito solo reevalúa su componente.
+# Dentro de un componente las reglas se aplican por prioridad y cada una consume las unidades que
+# usa: una unidad nunca recibe dos promociones.
+
+
+class _Regla(ABC):
+    def __init__(self, promocion):
+        self.id_promocion = promocion.id_promocion
+        self.nombre = promocion.nombre
+        self.prioridad = promocion.prioridad
+        self.productos = promocion.productos
+        self.fecha_desde = promocion.fecha_desde[:10] if promocion.fecha_desde else None
+        self.fecha_hasta = promocion.fecha_hasta[:10] if promocion.fecha_hasta else None
+        self.dias_semana = {int(d) for d in promocion.dias_semana if d.isdigit()} if promocion.dias_semana else None
+        self.minuto_desde = _minuto_del_dia(promocion.hora_desde)
+        self.minuto_hasta = _minuto_del_dia(promocion.hora_hasta)
+        self.temporal = any(x is not None for x in (self.fecha_desde, self.fecha_hasta, self.dias_semana, self.minuto_desde, self.minuto_hasta))
+
+    def vigente(self, momento: datetime) -> bool:
+        if not self.temporal:
+            return True
+        fecha = momento.strftime('%Y-%m-%d')
+        if self.fecha_desde and fecha < self.fecha_desde:
+            return False
+        if self.fecha_hasta and fecha > self.fecha_hasta:
+            return False
+        if self.dias_semana is not None and momento.weekday() not in self.dias_semana:
+            return False
+        minuto = momento.hour * 60 + momento.minute
+        desde = 0 if self.minuto_desde is None else self.minuto_desde
+        hasta = 24 * 60 if self.minuto_hasta is None else self.minuto_hasta
+        if desde <= hasta:
+            return desde <= minuto < hasta
+        return minuto >= desde or minuto < hasta  # franja que cruza la medianoche
+
+    @abstractmethod
+    def aplicar(self, disponibles: dict, precios: dict, descuentos: dict):
+        # Descuenta de 'disponibles' las unidades que usa y agrega (id_promocion, monto) a 'descuentos'.
+        ...
+
+
+class _ReglaPorGrupos(_Regla):
+    # 'nxm' y 'unidad_n': las unidades de todos los productos de la regla se ordenan de mayor a
+    # menor precio y se arman grupos de 'tamano'; las últimas 'bonificadas' de cada grupo (las más
+    # baratas) llevan 'porcentaje' de descuento. Se cuenta por línea, no por unidad.
+    def __init__(self, promocion, tamano, bonificadas, porcentaje):
+        super().__init__(promocion)
+        self.tamano = tamano
+        self.bonificadas = bonificadas
+        self.porcentaje = porcentaje
+
+    def _bonificadas_hasta(self, posicion):
+        grupos, resto = divmod(posicion, self.tamano)
+        return grupos * self.bonificadas + max(0, resto - (self.tamano - self.bonificadas))
+
+    def aplicar(self, disponibles, precios, descuentos):
+        lineas = sorted(
+            ((precios[id_producto], id_producto) for id_producto, unidades in disponibles.items() if unidades > 0 and id_producto in self.productos),
+            reverse=True
+        )
+        total = sum(disponibles[id_producto] for _, id_producto in lineas)
+        limite = (total // self.tamano) * self.tamano
+        posicion = 0
+        for precio, id_producto in lineas:
+            if posicion >= limite:
+                break
+            desde, hasta = posicion, min(posicion + disponibles[id_producto], limite)
+            bonificadas = self._bonificadas_hasta(hasta) - self._bonificadas_hasta(desde)
+            disponibles[id_producto] -= hasta - desde
+            if bonificadas:
+                descuentos.setdefault(id_producto, []).append((self.id_promocion, round(bonificadas * precio * self.porcentaje / 100, 2)))
+            posicion = hasta
+
+
+class _ReglaCombo(_Regla):
+    # Cada combo completo se cobra 'precio_combo'; el descuento se reparte entre las líneas en
+    # proporción a lo que aporta cada una.
+    def __init__(self, promocion):
+        super().__init__(promocion)
+        self.precio_combo = promocion.valor
+
+    def aplicar(self, disponibles, precios, descuentos):
+        combos = min(disponibles.get(id_producto, 0) // unidades for id_producto, unidades in self.productos.items())
+        if combos <= 0:
+            return
+        valor_lineas = {id_producto: combos * unidades * precios[id_producto] for id_producto, unidades in self.productos.items()}
+        valor_total = sum(valor_lineas.values())
+        descuento = round(valor_total - combos * self.precio_combo, 2)
+        if descuento <= 0:
+            return
+        repartido = 0.0
+        ultimo = len(valor_lineas) - 1
+        for i, (id_producto, valor) in enumerate(valor_lineas.items()):
+            disponibles[id_producto] -= combos * self.productos[id_producto]
+            monto = round(descuento - repartido, 2) if i == ultimo else round(descuento * valor / valor_total, 2)
+            repartido += monto
+            if monto:
+                descuentos.setdefault(id_producto, []).append((self.id_promocion, monto))
+
+
+class _ReglaPorcentaje(_Regla):
+    def __init__(self, promocion):
+        super().__init__(promocion)
+        self.porcentaje = promocion.valor
+
+    def aplicar(self, disponibles, precios, descuentos):
+        for id_producto, unidades in disponibles.items():
+            if unidades > 0 and id_producto in self.productos:
+                disponibles[id_producto] = 0
+                descuentos.setdefault(id_producto, []).append((self.id_promocion, round(unidades * precios[id_producto] * self.porcentaje / 100, 2)))
+
+
+def _minuto_del_dia(hora):
+    if not hora:
+        return None
+    horas, minutos = hora.split(':')[:2]
+    return int(horas) * 60 + int(minutos)
+
+
+def compilar_regla(promocion):
+    # Devuelve None si la regla no puede dar descuento (mal cargada o sin productos).
+    if not promocion.productos:
+        return None
+    if promocion.tipo == 'nxm' and 0 <= promocion.valor < promocion.cantidad:
+        return _ReglaPorGrupos(promocion, int(promocion.cantidad), int(promocion.cantidad - promocion.valor), 100)
+    if promocion.tipo == 'unidad_n' and promocion.cantidad >= 1 and 0 < promocion.valor <= 100:
+        return _ReglaPorGrupos(promocion, int(promocion.cantidad), 1, promocion.valor)
+    if promocion.tipo == 'combo' and promocion.valor >= 0 and all(unidades > 0 for unidades in promocion.productos.values()):
+        return _ReglaCombo(promocion)
+    if promocion.tipo == 'porcentaje' and 0 < promocion.valor <= 100:
+        return _ReglaPorcentaje(promocion)
+    return None
+
+
+class _Componente:
+    def __init__(self, indice, reglas):
+        self.indice = indice
+        self.reglas = sorted(reglas, key=lambda r: (-r.prioridad, r.id_promocion))
+        self.productos = frozenset(id_producto for regla in reglas for id_producto in regla.productos)
+        self.temporales = tuple(regla for regla in self.reglas if regla.temporal)
+
+    def vigencias(self, momento):
+        return tuple(regla.vigente(momento) for regla in self.temporales)
+
+    def evaluar(self, lineas: dict, momento: datetime) -> dict:
+        # lineas: {id_producto: (cantidad, precio_unitario)}. Devuelve {id_producto: [(id_promocion, monto)]}.
+        # Solo se miran las líneas del carrito que tocan al componente (o al revés, lo que sea más chico).
+        if len(lineas) <= len(self.productos):
+            en_carrito = [(p, linea) for p, linea in lineas.items() if p in self.productos]
+        else:
+            en_carrito = [(p, lineas[p]) for p in self.productos if p in lineas]
+        disponibles = {}
+        precios = {}
+        for id_producto, (cantidad, precio) in en_carrito:
+            if cantidad > 0:
+                disponibles[id_producto] = cantidad
+                precios[id_producto] = precio
+        descuentos = {}
+        if not disponibles:
+            return descuentos
+        for regla in self.reglas:
+            if regla.vigente(momento):
+                regla.aplicar(disponibles, precios, descuentos)
+        return descuentos
+
+
+class MotorPromociones:
+    def __init__(self, promociones):
+        reglas = [regla for regla in map(compilar_regla, promociones) if regla is not None]
+        self.nombres = {regla.id_promocion: regla.nombre for regla in reglas}
+
+        # Union-find sobre productos: dos reglas con un producto en común caen en el mismo componente.
+        padre = {}
+
+        def raiz(x):
+            while padre.setdefault(x, x) != x:
+                padre[x] = padre[padre[x]]
+                x = padre[x]
+            return x
+
+        for regla in reglas:
+            ids = list(regla.productos)
+            for id_producto in ids[1:]:
+                padre[raiz(id_producto)] = raiz(ids[0])
+            raiz(ids[0])
+
+        reglas_por_raiz = {}
+        for regla in reglas:
+            reglas_por_raiz.setdefault(raiz(next(iter(regla.productos))), []).append(regla)
+        self.componentes = [_Componente(i, grupo) for i, grupo in enumerate(reglas_por_raiz.values())]
+        self.componente_por_producto = {
+            id_producto: componente for componente in self.componentes for id_producto in componente.productos
+        }
+
+    def evaluar(self, lineas: dict, momento: datetime = None) -> dict:
+        # Evaluación completa de un carrito: {id_producto: [(id_promocion, monto)]}.
+        momento = momento or datetime.now()
+        descuentos = {}
+        for componente in {self.componente_por_producto[p] for p in lineas if p in self.componente_por_producto}:
+            descuentos.update(componente.evaluar(lineas, momento))
+        return descuentos
+
+
+class CarritoPromociones:
+    # Evaluación incremental para el carrito de VentasView. Guarda las líneas y los descuentos
+    # vigentes; cada cambio recalcula solo los componentes de los productos tocados y los que tienen
+    # una regla horaria que entró o salió de vigencia. Si se recompiló el motor, recalcula todo.
+    def __init__(self, motor=None):
+        self._motor_fijo = motor
+        self._motor = None
+        self.lineas = {}
+        self._vigencias = {}  # solo componentes con reglas temporales y líneas en el carrito
+        self._descuentos_por_componente = {}
+        self.descuentos = {}
+
+    def actualizar(self, cambios: dict, momento: datetime = None) -> dict:
+        # cambios: {id_producto: (cantidad, precio_unitario), o None si la línea se quitó}.
+        momento = momento or datetime.now()
+        motor = self._motor_fijo or obtener_motor_promociones()
+        if motor is not self._motor:
+            self._motor = motor
+            self._vigencias = {}
+            self._descuentos_por_componente = {}
+            self.descuentos = {}
+            cambios = {**dict.fromkeys(self.lineas), **cambios}
+
+        for id_producto, linea in cambios.items():
+            if linea is None:
+                self.lineas.pop(id_producto, None)
+            else:
+                self.lineas[id_producto] = linea
+
+        indice = motor.componente_por_producto
+        a_recalcular = {indice[p] for p in cambios if p in indice}
+        for indice_componente, vigencias in self._vigencias.items():
+            componente = motor.componentes[indice_componente]
+            if componente.vigencias(momento) != vigencias:
+                a_recalcular.add(componente)
+
+        for componente in a_recalcular:
+            for id_producto in self._descuentos_por_componente.pop(componente.indice, {}):
+                del self.descuentos[id_producto]
+            self._vigencias.pop(componente.indice, None)
+            if not componente.productos.isdisjoint(self.lineas):
+                descuentos = componente.evaluar(self.lineas, momento)
+                self._descuentos_por_componente[componente.indice] = descuentos
+                self.descuentos.update(descuentos)
+                if componente.temporales:
+                    self._vigencias[componente.indice] = componente.vigencias(momento)
+        return self.descuentos
+
+    def sincronizar(self, lineas: dict, momento: datetime = None) -> dict:
+        # Igual que actualizar(), pero recibe el carrito completo y calcula qué cambió.
+        cambios = {p: linea for p, linea in lineas.items() if self.lineas.get(p) != linea}
+        cambios.update((p, None) for p in self.lineas if p not in lineas)
+        return self.actualizar(cambios, momento)
+
+
+_motor_promociones = {'motor': None}
+_bloqueo_motor_promociones = threading.Lock()
+
+def obtener_motor_promociones():
+    with _bloqueo_motor_promociones:
+        if _motor_promociones['motor'] is None:
+            _motor_promociones['motor'] = MotorPromociones(database.obtener_promociones(solo_activas=True))
+        return _motor_promociones['motor']
+
+@database.al_reiniciar_bd
+@database.al_cambiar_promociones
+def invalidar_motor_promociones():
+    with _bloqueo_motor_promociones:
+        _motor_promociones['motor'] = None
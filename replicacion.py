@@ -0,0 +1,440 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import database
+
+# Formato del archivo WAL de SQLite (https://www.sqlite.org/fileformat.html#the_write_ahead_log).
+TAMANO_CABECERA_WAL = 32
+TAMANO_CABECERA_FRAME = 24
+_FORMATO_CABECERA_WAL = '>8I'
+_FORMATO_CABECERA_FRAME = '>6I'
+_MAGICOS_WAL = (0x377f0682, 0x377f0683)
+
+FORMATO_MARCA_TIEMPO = '%Y%m%dT%H%M%S%f'
+CLAVE_SNAPSHOT = 'snapshot.db.gz'
+
+
+class DestinoReplica(ABC):
+    # Interfaz mínima que necesita el replicador: un almacén de objetos por clave ("gen/wal/seg.wal").
+    # Un destino remoto (SFTP, S3, etc.) sólo tiene que implementar estos cuatro métodos; si falta
+    # alguno, el error aparece al crear el destino y no en medio de la replicación.
+    @abstractmethod
+    def escribir(self, clave: str, datos: bytes):
+        ...
+
+    @abstractmethod
+    def leer(self, clave: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def listar(self, prefijo: str = '') -> list:
+        ...
+
+    @abstractmethod
+    def eliminar(self, clave: str):
+        ...
+
+    def subir_archivo(self, clave: str, ruta_local: str):
+        with open(ruta_local, 'rb') as f:
+            self.escribir(clave, f.read())
+
+    def descargar_archivo(self, clave: str, ruta_local: str):
+        with open(ruta_local, 'wb') as f:
+            f.write(self.leer(clave))
+
+
+class DestinoDirectorioLocal(DestinoReplica):
+    # Réplica en un directorio local o montado (disco externo, carpeta de red).
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, *clave.split('/'))
+
+    def _escribir_atomico(self, clave: str, copiar):
+        ruta = self._ruta(clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        ruta_temporal = ruta + '.tmp'
+        with open(ruta_temporal, 'wb') as f:
+            copiar(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(ruta_temporal, ruta)
+
+    def escribir(self, clave: str, datos: bytes):
+        self._escribir_atomico(clave, lambda f: f.write(datos))
+
+    def leer(self, clave: str) -> bytes:
+        with open(self._ruta(clave), 'rb') as f:
+            return f.read()
+
+    def listar(self, prefijo: str = '') -> list:
+        claves = []
+        for raiz, _, archivos in os.walk(self.directorio):
+            for nombre in archivos:
+                if nombre.endswith('.tmp'):
+                    continue
+                relativa = os.path.relpath(os.path.join(raiz, nombre), self.directorio)
+                clave = relativa.replace(os.sep, '/')
+                if clave.startswith(prefijo):
+                    claves.append(clave)
+        return sorted(claves)
+
+    def eliminar(self, clave: str):
+        ruta = self._ruta(clave)
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+    def subir_archivo(self, clave: str, ruta_local: str):
+        def copiar(destino):
+            with open(ruta_local, 'rb') as origen:
+                shutil.copyfileobj(origen, destino)
+        self._escribir_atomico(clave, copiar)
+
+    def descargar_archivo(self, clave: str, ruta_local: str):
+        shutil.copyfile(self._ruta(clave), ruta_local)
+
+
+def _leer_cabecera_wal(ruta_wal: str):
+    # Devuelve (tamano_pagina, salt1, salt2) o None si el WAL no existe o todavía no tiene cabecera válida.
+    try:
+        with open(ruta_wal, 'rb') as f:
+            datos = f.read(TAMANO_CABECERA_WAL)
+    except FileNotFoundError:
+        return None
+    if len(datos) < TAMANO_CABECERA_WAL:
+        return None
+    magico, _, tamano_pagina, _, salt1, salt2, _, _ = struct.unpack(_FORMATO_CABECERA_WAL, datos)
+    if magico not in _MAGICOS_WAL:
+        return None
+    return tamano_pagina, salt1, salt2
+
+def _fin_ultimo_commit(ruta_wal: str, desplazamiento: int, tamano_pagina: int, salt1: int, salt2: int) -> int:
+    # Recorre las cabeceras de los frames desde 'desplazamiento' y devuelve el desplazamiento donde
+    # termina el último frame de commit. Solo lee los 24 bytes de cada cabecera, no las páginas. Los
+    # frames con otras sales son restos de un ciclo anterior del WAL y marcan el final de los datos válidos.
+    tamano_frame = TAMANO_CABECERA_FRAME + tamano_pagina
+    posicion = max(desplazamiento, TAMANO_CABECERA_WAL)
+    fin_commit = desplazamiento
+    with open(ruta_wal, 'rb') as f:
+        tamano_archivo = os.fstat(f.fileno()).st_size
+        while posicion + tamano_frame <= tamano_archivo:
+            f.seek(posicion)
+            _, paginas_tras_commit, frame_salt1, frame_salt2, _, _ = struct.unpack(
+                _FORMATO_CABECERA_FRAME, f.read(TAMANO_CABECERA_FRAME))
+            if (frame_salt1, frame_salt2) != (salt1, salt2):
+                break
+            posicion += tamano_frame
+            if paginas_tras_commit:
+                fin_commit = posicion
+    return fin_commit
+
+def _clave_segmento(generacion: str, indice: int, desplazamiento: int, marca: str) -> str:
+    return f"{generacion}/wal/{indice:08d}_{desplazamiento:012d}_{marca}.wal"
+
+def _datos_segmento(clave: str):
+    # "gen/wal/00000001_000000004152_20240101T...wal" -> (1, 4152, datetime)
+    indice, desplazamiento, marca = os.path.basename(clave)[:-len('.wal')].split('_')
+    return int(indice), int(desplazamiento), datetime.strptime(marca, FORMATO_MARCA_TIEMPO)
+
+
+class ReplicadorWAL:
+    # Envía continuamente los frames confirmados del WAL a un DestinoReplica.
+    #
+    # Una "generación" es un snapshot completo más la secuencia ininterrumpida de segmentos WAL
+    # posteriores. Cada reinicio del WAL incrementa el "índice" dentro de la generación; si se
+    # detecta un hueco (frames que se checkpointearon antes de enviarse), se abre una generación
+    # nueva con su propio snapshot. El retraso máximo es 'intervalo_segundos'.
+    def __init__(self, destino: DestinoReplica, ruta_bd: str = None, intervalo_segundos: float = 1.0,
+                 intervalo_snapshot_segundos: float = 24 * 3600, umbral_checkpoint_bytes: int = 4 * 1024 * 1024,
+                 conservar_generaciones: int = 3):
+        self.destino = destino
+        self.ruta_bd = ruta_bd or database.DB_FILE
+        self.ruta_wal = self.ruta_bd + '-wal'
+        self.intervalo_segundos = intervalo_segundos
+        self.intervalo_snapshot_segundos = intervalo_snapshot_segundos
+        self.umbral_checkpoint_bytes = umbral_checkpoint_bytes
+        self.conservar_generaciones = conservar_generaciones
+
+        self.generacion = None
+        self.inicio_generacion = None
+        self.indice = 0
+        self.desplazamiento = 0
+        self.sales = None
+        self.ultima_sincronizacion = None
+
+        self._conn_escritura = None
+        self._conn_lectura = None
+        self._bloqueo = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def abrir(self) -> bool:
+        try:
+            self._conn_escritura = sqlite3.connect(self.ruta_bd, isolation_level=None, check_same_thread=False)
+            modo = self._conn_escritura.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            if modo.lower() != 'wal':
+                raise sqlite3.OperationalError(f"No se pudo activar el modo WAL (modo actual: {modo}).")
+            self._conn_lectura = sqlite3.connect(self.ruta_bd, isolation_level=None, check_same_thread=False)
+            self._fijar_lectura()
+            return True
+        except sqlite3.Error as e:
+            print(f"Error al iniciar la replicación: {e}")
+            self.cerrar()
+            return False
+
+    def cerrar(self):
+        for conexion in (self._conn_lectura, self._conn_escritura):
+            if conexion:
+                conexion.close()
+        self._conn_lectura = None
+        self._conn_escritura = None
+
+    def iniciar(self) -> bool:
+        if not self.abrir():
+            return False
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+        self._hilo.start()
+        return True
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo:
+            self._hilo.join()
+            self._hilo = None
+        self.cerrar()
+
+    def _bucle(self):
+        while True:
+            try:
+                self.sincronizar()
+            except (sqlite3.Error, OSError) as e:
+                print(f"Error en la replicación WAL (se reintentará): {e}")
+            if self._detener.wait(self.intervalo_segundos):
+                break
+
+    def estado(self) -> dict:
+        retraso = None
+        if self.ultima_sincronizacion:
+            retraso = (datetime.now() - self.ultima_sincronizacion).total_seconds()
+        return {
+            'generacion': self.generacion,
+            'indice': self.indice,
+            'desplazamiento': self.desplazamiento,
+            'ultima_sincronizacion': self.ultima_sincronizacion,
+            'retraso_segundos': retraso,
+        }
+
+    def _fijar_lectura(self):
+        # Mantener una transacción de lectura abierta impide que otra conexión reinicie el WAL
+        # (y descarte frames) entre dos sincronizaciones.
+        self._conn_lectura.execute("BEGIN")
+        self._conn_lectura.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+    def _liberar_lectura(self):
+        if self._conn_lectura.in_transaction:
+            self._conn_lectura.execute("COMMIT")
+
+    def sincronizar(self):
+        with self._bloqueo:
+            cabecera, fin = self._fijar_bajo_bloqueo()
+            if fin is None:
+                self._iniciar_generacion(cabecera)
+                cabecera, fin = self._fijar_bajo_bloqueo()
+            self._enviar_frames(fin)
+            if self.desplazamiento >= self.umbral_checkpoint_bytes:
+                self._checkpoint_bajo_bloqueo()
+            self.ultima_sincronizacion = datetime.now()
+
+    def _fijar_bajo_bloqueo(self):
+        # El bloqueo de escritura se toma solo para leer cabeceras y fijar la lectura: con él tomado ninguna
+        # venta puede estar a medio escribir en el WAL. La transacción de lectura que queda abierta impide
+        # que el WAL se reinicie, así que los frames hasta 'fin' se pueden leer y enviar sin el bloqueo:
+        # un destino lento (carpeta de red) no demora las ventas.
+        # Devuelve (cabecera, fin del último commit), con fin None si hace falta una generación nueva.
+        self._conn_escritura.execute("BEGIN IMMEDIATE")
+        try:
+            cabecera = _leer_cabecera_wal(self.ruta_wal)
+            if self._requiere_generacion_nueva(cabecera):
+                fin = None
+            elif cabecera:
+                tamano_pagina, salt1, salt2 = cabecera
+                fin = _fin_ultimo_commit(self.ruta_wal, self.desplazamiento, tamano_pagina, salt1, salt2)
+            else:
+                fin = self.desplazamiento
+            self._liberar_lectura()
+            self._fijar_lectura()
+            return cabecera, fin
+        finally:
+            self._conn_escritura.execute("COMMIT")
+
+    def _checkpoint_bajo_bloqueo(self):
+        # Soltar la lectura permite que el WAL se reinicie; solo se hace si todo lo confirmado ya se envió,
+        # si no, se reintenta en la próxima sincronización.
+        self._conn_escritura.execute("BEGIN IMMEDIATE")
+        try:
+            cabecera = _leer_cabecera_wal(self.ruta_wal)
+            if cabecera is None or (cabecera[1], cabecera[2]) != self.sales:
+                return
+            if _fin_ultimo_commit(self.ruta_wal, self.desplazamiento, *cabecera) > self.desplazamiento:
+                return
+            self._liberar_lectura()
+            self._conn_lectura.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            self._fijar_lectura()
+        finally:
+            self._conn_escritura.execute("COMMIT")
+
+    def _requiere_generacion_nueva(self, cabecera) -> bool:
+        if self.generacion is None:
+            return True
+        if (datetime.now() - self.inicio_generacion).total_seconds() >= self.intervalo_snapshot_segundos:
+            return True
+        if cabecera is None:
+            return False
+        _, salt1, salt2 = cabecera
+        if self.sales is None:
+            self.sales = (salt1, salt2)
+        elif (salt1, salt2) != self.sales:
+            # Un reinicio normal incrementa salt1 en uno; como el ciclo anterior se envió completo
+            # antes de soltar la lectura, no se perdió nada. Cualquier otro salto indica un hueco.
+            if salt1 != (self.sales[0] + 1) & 0xFFFFFFFF:
+                print("Replicación WAL: se perdió continuidad con el WAL, se iniciará una nueva generación.")
+                return True
+            self.indice += 1
+            self.desplazamiento = 0
+            self.sales = (salt1, salt2)
+        return False
+
+    def _enviar_frames(self, fin):
+        # Se llama sin el bloqueo de escritura: la lectura fijada protege el tramo hasta 'fin'.
+        if fin <= max(self.desplazamiento, TAMANO_CABECERA_WAL):
+            return
+        with open(self.ruta_wal, 'rb') as f:
+            f.seek(self.desplazamiento)
+            datos = f.read(fin - self.desplazamiento)
+        marca = datetime.now().strftime(FORMATO_MARCA_TIEMPO)
+        clave = _clave_segmento(self.generacion, self.indice, self.desplazamiento, marca)
+        self.destino.escribir(clave, datos)
+        self.desplazamiento = fin
+
+    def _iniciar_generacion(self, cabecera):
+        # El snapshot se toma desde la transacción de lectura (recién fijada bajo el bloqueo de escritura),
+        # así que es coherente con 'cabecera' sin bloquear las ventas mientras se copia la base.
+        ahora = datetime.now()
+        generacion = ahora.strftime(FORMATO_MARCA_TIEMPO)
+        fd_bd, ruta_snapshot = tempfile.mkstemp(suffix='.db')
+        os.close(fd_bd)
+        ruta_comprimida = ruta_snapshot + '.gz'
+        try:
+            conn_snapshot = sqlite3.connect(ruta_snapshot)
+            try:
+                self._conn_lectura.backup(conn_snapshot)
+            finally:
+                conn_snapshot.close()
+            with open(ruta_snapshot, 'rb') as entrada, gzip.open(ruta_comprimida, 'wb') as salida:
+                shutil.copyfileobj(entrada, salida)
+            self.destino.subir_archivo(f"{generacion}/{CLAVE_SNAPSHOT}", ruta_comprimida)
+        finally:
+            database._eliminar_si_existe(ruta_snapshot)
+            database._eliminar_si_existe(ruta_comprimida)
+
+        self.generacion = generacion
+        self.inicio_generacion = ahora
+        self.indice = 0
+        self.desplazamiento = 0
+        self.sales = (cabecera[1], cabecera[2]) if cabecera else None
+        aplicar_retencion_generaciones(self.destino, self.conservar_generaciones)
+
+
+def listar_generaciones(destino: DestinoReplica) -> list:
+    sufijo = '/' + CLAVE_SNAPSHOT
+    return sorted(clave[:-len(sufijo)] for clave in destino.listar() if clave.endswith(sufijo))
+
+def aplicar_retencion_generaciones(destino: DestinoReplica, conservar: int = 3) -> int:
+    generaciones = listar_generaciones(destino)
+    eliminadas = 0
+    for generacion in generaciones[:max(0, len(generaciones) - conservar)]:
+        # El snapshot va al final: si se interrumpe, la generación incompleta sigue sin listarse como válida.
+        claves = destino.listar(generacion + '/')
+        for clave in sorted(claves, key=lambda c: c.endswith(CLAVE_SNAPSHOT)):
+            destino.eliminar(clave)
+        eliminadas += 1
+    return eliminadas
+
+def _aplicar_wal(ruta_bd: str, datos_wal: bytes):
+    with open(ruta_bd + '-wal', 'wb') as f:
+        f.write(datos_wal)
+    conexion = sqlite3.connect(ruta_bd)
+    try:
+        conexion.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    finally:
+        conexion.close()
+
+def restaurar_a_momento(destino: DestinoReplica, ruta_salida: str, momento: datetime = None):
+    # Reconstruye en 'ruta_salida' la base tal como estaba en 'momento' (o la última versión replicada):
+    # toma el snapshot más reciente anterior a ese momento y le aplica los segmentos WAL hasta esa hora.
+    # El archivo resultante se puede cargar con database.restaurar_backup.
+    momento = momento or datetime.now()
+    candidatas = [g for g in listar_generaciones(destino)
+                  if datetime.strptime(g, FORMATO_MARCA_TIEMPO) <= momento]
+    if not candidatas:
+        print(f"No hay ninguna generación replicada anterior a {momento}.")
+        return None
+    generacion = candidatas[-1]
+
+    segmentos_por_indice = {}
+    for clave in destino.listar(f"{generacion}/wal/"):
+        indice, desplazamiento, marca = _datos_segmento(clave)
+        segmentos_por_indice.setdefault(indice, []).append((desplazamiento, marca, clave))
+
+    ruta_comprimida = ruta_salida + '.gz.tmp'
+    try:
+        for ruta in (ruta_salida, ruta_salida + '-wal', ruta_salida + '-shm'):
+            database._eliminar_si_existe(ruta)
+        destino.descargar_archivo(f"{generacion}/{CLAVE_SNAPSHOT}", ruta_comprimida)
+        with gzip.open(ruta_comprimida, 'rb') as entrada, open(ruta_salida, 'wb') as salida:
+            shutil.copyfileobj(entrada, salida)
+
+        conexion = sqlite3.connect(ruta_salida)
+        conexion.execute("PRAGMA journal_mode=WAL").fetchone()
+        conexion.close()
+
+        alcanzado = False
+        for indice in sorted(segmentos_por_indice):
+            datos_wal = bytearray()
+            for desplazamiento, marca, clave in sorted(segmentos_por_indice[indice]):
+                if marca > momento:
+                    alcanzado = True
+                    break
+                if desplazamiento != len(datos_wal):
+                    raise ValueError(f"Falta un segmento WAL antes de '{clave}'.")
+                datos_wal.extend(destino.leer(clave))
+            if datos_wal:
+                _aplicar_wal(ruta_salida, bytes(datos_wal))
+            if alcanzado:
+                break
+
+        conexion = sqlite3.connect(ruta_salida)
+        try:
+            conexion.execute("PRAGMA journal_mode=DELETE").fetchone()
+            if not database._quick_check(conexion):
+                raise sqlite3.DatabaseError("La base reconstruida no superó la verificación 'quick_check'.")
+        finally:
+            conexion.close()
+        return ruta_salida
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(f"Error al restaurar desde la réplica: {e}")
+        for ruta in (ruta_salida, ruta_salida + '-wal', ruta_salida + '-shm'):
+            database._eliminar_si_existe(ruta)
+        return None
+    finally:
+        database._eliminar_si_existe(ruta_comprimida)
@@ -0,0 +1,265 @@
+import csv
+import hashlib
+import json
+import sqlite3
+import time
+from datetime import datetime
+
+import database
+
+# Sincronización de listas de precios completas de proveedores. Cada fila se identifica por su código
+# de barras o, si no tiene, por el nombre normalizado, y se resume en un hash que se guarda en
+# listas_proveedores. En la siguiente lista, las filas con el mismo hash se saltean sin buscar el
+# producto; solo las demás se comparan con la BD:
+#   - nuevos:          la fila no corresponde a ningún producto; se crea sin stock
+#   - cambios_precio:  el precio de la lista difiere del precio de venta; se actualiza y va al historial
+#   - discontinuados:  estaban en la lista anterior del proveedor y ya no; quedan marcados con fecha_baja
+# Todo se aplica en una sola transacción. Con aplicar=False se calcula el mismo informe y se descarta.
+#
+# Columnas (la primera fila es el encabezado; el orden no importa):
+#   codigo_barras y/o nombre     al menos una
+#   precio_venta (o precio)      obligatoria
+#   volumen, descripcion         opcionales; solo se usan al crear productos
+
+PREFIJO_CLAVE_NOMBRE = 'nombre:'
+MAXIMO_RECHAZOS_INFORMADOS = 100
+# Un precio que se multiplica o se divide por más que esto se rechaza: casi siempre es un error de
+# formato de la lista (miles leídos como decimales) y no un cambio de precio real.
+MAXIMA_VARIACION_PRECIO = 10
+
+
+def _validar_encabezado(encabezado):
+    faltantes = []
+    if 'codigo_barras' not in encabezado and 'nombre' not in encabezado:
+        faltantes.append('codigo_barras o nombre')
+    if 'precio_venta' not in encabezado and 'precio' not in encabezado:
+        faltantes.append('precio_venta')
+    if faltantes:
+        raise ValueError(f"faltan las columnas: {', '.join(faltantes)}")
+    return encabezado
+
+
+def _leer_filas(ruta):
+    # Devuelve (número de fila, dict columna -> texto, separador decimal) de a una; los .xlsx se leen en
+    # modo read_only y sus celdas numéricas llegan con punto decimal.
+    if ruta.lower().endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook
+        libro = load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            filas = libro.active.iter_rows(values_only=True)
+            encabezado = _validar_encabezado([str(c).strip().lower() if c is not None else '' for c in next(filas, ())])
+            for numero, fila in enumerate(filas, start=2):
+                yield numero, {c: ('' if v is None else str(v).strip()) for c, v in zip(encabezado, fila)}, '.'
+        finally:
+            libro.close()
+        return
+    with open(ruta, newline='', encoding='utf-8-sig') as archivo:
+        encabezado = archivo.readline()
+        delimitador = ';' if encabezado.count(';') > encabezado.count(',') else ','
+        archivo.seek(0)
+        lector = csv.reader(archivo, delimiter=delimitador)
+        separador_decimal = database._separador_decimal(delimitador)
+        encabezado = _validar_encabezado([c.strip().lower() for c in next(lector, [])])
+        for numero, fila in enumerate(lector, start=2):
+            yield numero, {c: v.strip() for c, v in zip(encabezado, fila)}, separador_decimal
+
+
+def _clave(codigo, nombre):
+    if codigo:
+        return codigo
+    return PREFIJO_CLAVE_NOMBRE + ' '.join(database._normalizar_texto(nombre).split())
+
+
+def _hash_fila(nombre, precio, volumen, descripcion):
+    contenido = '\x1f'.join((nombre, f"{precio:.2f}", volumen, descripcion))
+    return hashlib.blake2b(contenido.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class _Productos:
+    # Índices de productos por código de barras (del producto o de sus lotes) y por nombre normalizado.
+    # Se arman recién cuando aparece la primera fila que cambió.
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.por_id = None
+
+    def _cargar(self):
+        self.por_id, self.por_codigo, self.por_nombre = {}, {}, {}
+        for id_producto, nombre, codigo, precio in self.cursor.execute("SELECT id_producto, nombre, codigo_barras, precio_venta FROM productos"):
+            self.por_id[id_producto] = (nombre, precio)
+            if codigo:
+                self.por_codigo[codigo] = id_producto
+            self.por_nombre.setdefault(_clave(None, nombre), id_producto)
+        for codigo, id_producto in self.cursor.execute("SELECT codigo_barras, id_producto FROM stock WHERE codigo_barras IS NOT NULL"):
+            self.por_codigo.setdefault(codigo, id_producto)
+
+    def buscar(self, id_previo, codigo, clave_nombre):
+        if self.por_id is None:
+            self._cargar()
+        # Si la fila ya se había asociado a un producto se respeta, aunque después se le haya cambiado el nombre.
+        if id_previo in self.por_id:
+            return id_previo
+        if codigo and codigo in self.por_codigo:
+            return self.por_codigo[codigo]
+        return self.por_nombre.get(clave_nombre) if clave_nombre else None
+
+    def datos(self, id_producto):
+        return self.por_id[id_producto]
+
+    def agregar(self, id_producto, nombre, codigo, precio):
+        self.por_id[id_producto] = (nombre, precio)
+        if codigo:
+            self.por_codigo[codigo] = id_producto
+        self.por_nombre.setdefault(_clave(None, nombre), id_producto)
+
+
+def sincronizar_lista_proveedor(ruta, proveedor, aplicar=True):
+    # Devuelve el informe de cambios, o None si el archivo no se pudo leer o la BD falló.
+    # informe: lineas, sin_cambios, nuevos, cambios_precio, discontinuados, rechazadas, aplicado, segundos.
+    inicio = time.perf_counter()
+    conn = database._get_db_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    ahora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    informe = {'lineas': 0, 'sin_cambios': 0, 'nuevos': [], 'cambios_precio': [], 'discontinuados': [],
+               'rechazadas': [], 'cantidad_rechazadas': 0, 'aplicado': False}
+
+    def rechazar(numero, motivo):
+        informe['cantidad_rechazadas'] += 1
+        if len(informe['rechazadas']) < MAXIMO_RECHAZOS_INFORMADOS:
+            informe['rechazadas'].append((numero, motivo))
+
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        anteriores = {
+            clave: (hash_fila, id_producto, fecha_baja)
+            for clave, hash_fila, id_producto, fecha_baja in cursor.execute(
+                "SELECT clave, hash_fila, id_producto, fecha_baja FROM listas_proveedores WHERE proveedor = ?", (proveedor,)
+            )
+        }
+        productos = _Productos(cursor)
+        vistas = set()
+        estado_nuevo, precios_nuevos, ids_modificados = [], [], []
+
+        for numero, fila, separador_decimal in _leer_filas(ruta):
+            if not any(fila.values()):
+                continue
+            informe['lineas'] += 1
+            codigo, nombre = fila.get('codigo_barras', ''), fila.get('nombre', '')
+            if codigo.endswith('.0') and codigo[:-2].isdigit():
+                codigo = codigo[:-2]  # Excel guarda los códigos numéricos como float
+            try:
+                precio = database._numero(fila.get('precio_venta') or fila.get('precio', ''), separador_decimal=separador_decimal)
+            except ValueError:
+                rechazar(numero, "precio inválido o faltante")
+                continue
+            if precio <= 0 or not (codigo or nombre):
+                rechazar(numero, "falta el código de barras y el nombre" if precio > 0 else "precio inválido o faltante")
+                continue
+            clave = _clave(codigo, nombre)
+            if clave in vistas:
+                rechazar(numero, f"fila repetida ('{codigo or nombre}')")
+                continue
+            vistas.add(clave)
+
+            volumen, descripcion = fila.get('volumen', ''), fila.get('descripcion', '')
+            hash_fila = _hash_fila(nombre, precio, volumen, descripcion)
+            anterior = anteriores.get(clave)
+            if anterior and anterior[0] == hash_fila and anterior[2] is None:
+                informe['sin_cambios'] += 1
+                continue
+
+            id_producto = productos.buscar(anterior[1] if anterior else None, codigo, _clave(None, nombre) if nombre else None)
+            if id_producto is None:
+                if not nombre:
+                    rechazar(numero, f"el código '{codigo}' no corresponde a ningún producto y la fila no tiene nombre")
+                    continue
+                try:
+                    volumen = database._numero(volumen, 0, separador_decimal) or None
+                except ValueError:
+                    volumen = None
+                cursor.execute(
+                    "INSERT INTO productos (nombre, precio_venta, volumen, codigo_barras, descripcion) VALUES (?, ?, ?, ?, ?)",
+                    (nombre, precio, volumen, codigo or None, descripcion or None)
+                )
+                id_producto = cursor.lastrowid
+                database._registrar_cambio_precio(cursor, id_producto, precio, ahora)
+                productos.agregar(id_producto, nombre, codigo, precio)
+                informe['nuevos'].append({'id_producto': id_producto, 'nombre': nombre, 'codigo_barras': codigo or None, 'precio': precio})
+                ids_modificados.append(id_producto)
+            else:
+                nombre_actual, precio_actual = productos.datos(id_producto)
+                if precio_actual > 0 and not 1 / MAXIMA_VARIACION_PRECIO <= precio / precio_actual <= MAXIMA_VARIACION_PRECIO:
+                    rechazar(numero, f"el precio de '{nombre_actual}' pasaría de {precio_actual:.2f} a {precio:.2f}; revise el formato de la lista")
+                    continue
+                if abs(precio_actual - precio) >= 0.005:
+                    precios_nuevos.append((precio, id_producto))
+                    informe['cambios_precio'].append({'id_producto': id_producto, 'nombre': nombre_actual, 'precio_anterior': precio_actual, 'precio_nuevo': precio})
+                    ids_modificados.append(id_producto)
+            estado_nuevo.append((proveedor, clave, id_producto, hash_fila, precio, ahora))
+
+        cursor.executemany("UPDATE productos SET precio_venta = ? WHERE id_producto = ?", precios_nuevos)
+        cursor.executemany(
+            "INSERT INTO historial_precios (id_producto, precio, fecha_desde) VALUES (?, ?, ?)",
+            ((id_producto, precio, ahora) for precio, id_producto in precios_nuevos)
+        )
+        cursor.executemany(
+            """INSERT INTO listas_proveedores (proveedor, clave, id_producto, hash_fila, precio, fecha_sincronizacion, fecha_baja)
+               VALUES (?, ?, ?, ?, ?, ?, NULL)
+               ON CONFLICT (proveedor, clave) DO UPDATE SET
+                   id_producto = excluded.id_producto, hash_fila = excluded.hash_fila, precio = excluded.precio,
+                   fecha_sincronizacion = excluded.fecha_sincronizacion, fecha_baja = NULL""",
+            estado_nuevo
+        )
+
+        bajas = [(clave, id_producto) for clave, (_, id_producto, fecha_baja) in anteriores.items() if clave not in vistas and fecha_baja is None]
+        cursor.executemany(
+            "UPDATE listas_proveedores SET fecha_baja = ? WHERE proveedor = ? AND clave = ?",
+            ((ahora, proveedor, clave) for clave, _ in bajas)
+        )
+        nombres = dict(cursor.execute(
+            "SELECT p.id_producto, p.nombre FROM productos p WHERE p.id_producto IN (SELECT j.value FROM json_each(?) j)",
+            (json.dumps([id_producto for _, id_producto in bajas if id_producto]),)
+        ).fetchall()) if bajas else {}
+        for clave, id_producto in bajas:
+            existe = id_producto in nombres
+            informe['discontinuados'].append({'id_producto': id_producto if existe else None, 'nombre': nombres[id_producto] if existe else clave, 'clave': clave})
+
+        cursor.execute(
+            """INSERT INTO proveedores_sincronizados (proveedor, ultima_sincronizacion) VALUES (?, ?)
+               ON CONFLICT (proveedor) DO UPDATE SET ultima_sincronizacion = excluded.ultima_sincronizacion""",
+            (proveedor, ahora)
+        )
+
+        if aplicar:
+            conn.commit()
+            informe['aplicado'] = True
+            if ids_modificados:
+                database._notificar_cambio_productos(ids_modificados)
+        else:
+            conn.rollback()
+        informe['segundos'] = time.perf_counter() - inicio
+        return informe
+    except (sqlite3.Error, OSError, csv.Error, UnicodeDecodeError, ValueError) as e:
+        print(f"Error al sincronizar la lista del proveedor '{proveedor}': {e}")
+        if conn.in_transaction:
+            conn.rollback()
+        return None
+
+
+def obtener_proveedores_sincronizados():
+    # [(proveedor, fecha de la última sincronización, artículos vigentes)]
+    # fecha_sincronizacion de las filas solo cambia cuando la fila cambió; la fecha de cada proveedor
+    # sale de proveedores_sincronizados (las BD anteriores a esa tabla usan la de las filas).
+    try:
+        cursor = database._get_db_connection().cursor()
+        cursor.execute("""
+            SELECT l.proveedor, COALESCE(MAX(s.ultima_sincronizacion), MAX(l.fecha_sincronizacion)) AS ultima,
+                   SUM(l.fecha_baja IS NULL) AS vigentes
+            FROM listas_proveedores l LEFT JOIN proveedores_sincronizados s ON s.proveedor = l.proveedor
+            GROUP BY l.proveedor ORDER BY l.proveedor
+        """)
+        return [tuple(fila) for fila in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Error al obtener los proveedores: {e}")
+        return []
+
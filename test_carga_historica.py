@@ -0,0 +1,70 @@
+"""
+Pruebas de la carga de ventas históricas (carga_historica.py).
+Usan una BD en memoria y un CSV escrito en un directorio temporal.
+"""
+
+import pytest
+
+import database
+from models import Producto, Cliente
+from carga_historica import cargar_ventas_historicas
+
+
+CSV_HISTORICO = """Comprobante;Fecha;Codigo_Barras;Producto;Cantidad;Precio_Unitario;Forma_Pago;Cliente;Observaciones
+A-1;15/03/2019 10:30;779001;Yerba;2;1.250,50;Libreta;30111222;Entrega a domicilio
+A-1;15/03/2019 10:30;;Galletitas Surtidas;1;300;Libreta;30111222;
+A-2;2019-03-16 18:00:00;779001;Yerba;1;1300;Efectivo;;
+A-3;sin fecha;779001;Yerba;1;1300;Efectivo;;
+A-4;2019-03-17;;Yerba;3;1000;;Juana Pérez;
+"""
+
+def test_carga_historica_no_toca_stock_y_rearma_derivados(db_conn, tmp_path):
+    """Carga ventas, deudas y productos nuevos sin tocar el stock; márgenes, búsqueda e índices quedan al día."""
+    id_yerba = database.agregar_producto(Producto(nombre="Yerba", precio_venta=1500, codigo_barras="779001", cantidad_stock=10, costo_unitario=900))
+    id_cliente = database.agregar_cliente(Cliente(nombre="Juan Gómez", dni="30111222"))
+    indices_antes = db_conn.execute("SELECT name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') ORDER BY name").fetchall()
+
+    ruta = tmp_path / "historico.csv"
+    ruta.write_text(CSV_HISTORICO, encoding="utf-8")
+    avances = []
+    informe = cargar_ventas_historicas(str(ruta), delimitador=';', progreso=avances.append, tamano_lote=2)
+
+    assert (informe['lineas'], informe['ventas'], informe['productos_creados'], informe['clientes_creados']) == (4, 3, 1, 1)
+    assert informe['cantidad_rechazadas'] == 1 and informe['rechazadas'][0][0] == 5
+    assert informe['filas_por_segundo'] > 0 and avances[-1] == 4
+
+    ventas = db_conn.execute("SELECT fecha_venta, total, forma_pago, id_cliente FROM ventas ORDER BY id_venta").fetchall()
+    assert [tuple(v) for v in ventas] == [
+        ("2019-03-15 10:30:00", 2801, "Libreta", id_cliente),
+        ("2019-03-16 18:00:00", 1300, "Efectivo", None),
+        ("2019-03-17 00:00:00", 3000, "Efectivo", id_cliente + 1),
+    ]
+    assert database.obtener_stock_total_lotes(id_yerba) == 10
+    galletitas = database.obtener_producto_por_nombre("Galletitas Surtidas")
+    assert galletitas.cantidad_stock == 0
+    assert database.obtener_historial_precios(galletitas.id_producto) == [{"precio": 300, "fecha_desde": "2019-03-15 10:30:00"}]
+    assert database.obtener_saldo_deudor_cliente(id_cliente) == 2 * 1500 + 300  # la libreta se revalúa a precio actual
+
+    margenes = database.obtener_margenes("2019-03-01", "2019-03-31", agrupar_por='dia')
+    assert [(m['fecha'], m['ingresos'], m['costo']) for m in margenes] == [("2019-03-15", 2801, 1800), ("2019-03-16", 1300, 900), ("2019-03-17", 3000, 2700)]
+    assert [v['total'] for v in database.buscar_ventas(texto="domicilio")] == [2801]
+    assert db_conn.execute("SELECT name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') ORDER BY name").fetchall() == indices_antes
+
+def test_carga_historica_toma_el_costo_del_archivo(db_conn, tmp_path):
+    """Con la columna costo_unitario el margen usa el costo de la época y no el último conocido."""
+    database.agregar_producto(Producto(nombre="Yerba", precio_venta=1500, cantidad_stock=10, costo_unitario=900))
+    ruta = tmp_path / "historico.csv"
+    ruta.write_text("fecha,producto,cantidad,precio_unitario,costo_unitario\n2019-01-01,Yerba,2,500,$ 300\n2019-01-02,Yerba,1,500,\n", encoding="utf-8")
+
+    cargar_ventas_historicas(str(ruta))
+
+    margenes = database.obtener_margenes("2019-01-01", "2019-01-31", agrupar_por='dia')
+    assert [(m['fecha'], m['costo']) for m in margenes] == [("2019-01-01", 600), ("2019-01-02", 900)]
+
+def test_carga_historica_sin_columnas_obligatorias_no_modifica_nada(db_conn, tmp_path):
+    """Un archivo sin las columnas mínimas se rechaza antes de escribir."""
+    ruta = tmp_path / "historico.csv"
+    ruta.write_text("fecha,producto,total\n2019-01-01,Yerba,100\n", encoding="utf-8")
+
+    assert cargar_ventas_historicas(str(ruta)) is None
+    assert db_conn.execute("SELECT COUNT(*) FROM ventas").fetchone()[0] == 0
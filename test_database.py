@@ -4,6 +4,8 @@ Estas pruebas utilizan una base de datos SQLite en memoria para asegurar el aisl
 """
 import pytest
 import sqlite3
+import os
+import threading
 
 # Importar los módulos de la aplicación ANTES de las fixtures para que los parches funcionen
 import database
@@ -59,7 +61,7 @@ def test_inicializar_bd_crea_tablas_y_admin(db_conn: sqlite3.Connection):
     # Verificar que las tablas existen
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
     tables = [row[0] for row in cursor.fetchall()]
-    expected_tables = ['cliente', 'detalle_venta', 'movimientos_cuenta_cliente', 'productos', 'sqlite_sequence', 'stock', 'usuarios', 'ventas']
+    expected_tables = ['ajustes_stock', 'cliente', 'conteo_items', 'conteos_inventario', 'detalle_venta', 'detalle_venta_promociones', 'historial_precios', 'listas_precios', 'listas_proveedores', 'movimientos_cuenta_cliente', 'orden_compra_items', 'ordenes_compra', 'precios_lista', 'productos', 'promocion_productos', 'promociones', 'proveedores_sincronizados', 'resumen_margen_diario', 'sqlite_sequence', 'stock', 'totales_turno', 'turnos_caja', 'usuarios', 'ventas', 'ventas_fts', 'ventas_fts_config', 'ventas_fts_data', 'ventas_fts_docsize', 'ventas_fts_idx']
     assert tables == expected_tables
 
     # Verificar que el usuario admin fue creado
@@ -104,6 +106,36 @@ def test_obtener_productos_busqueda_flexible(db_conn):
     assert len(found_products) == 1, "La búsqueda flexible no encontró el producto 'Café Molido' al buscar 'cafe'."
     assert found_products[0].nombre == "Café Molido"
 
+def test_cache_productos_se_invalida_con_cambios_de_stock_y_producto(db_conn):
+    """Las búsquedas repetidas salen de la caché; lotes, ventas y ediciones la invalidan."""
+    producto_id = database.agregar_producto(Producto(nombre="Fideos", precio_venta=80, codigo_barras="123"))
+    database.agregar_lote(producto_id, 10, "2030-01-01")
+    metricas_previas = database.obtener_metricas_cache_productos()
+
+    assert database.obtener_producto_por_id(producto_id).cantidad_stock == 10
+    assert database.obtener_producto_por_codigo_barras("123").cantidad_stock == 10
+    assert database.obtener_producto_por_nombre("Fideos").cantidad_stock == 10
+    metricas = database.obtener_metricas_cache_productos()
+    assert metricas['aciertos'] - metricas_previas['aciertos'] == 2
+    assert metricas['fallos'] - metricas_previas['fallos'] == 1
+
+    # Un cambio hecho por fuera de las funciones del módulo solo se ve sin caché.
+    db_conn.execute("UPDATE stock SET cantidad = 7 WHERE id_producto = ? AND cantidad = 10", (producto_id,))
+    assert database.obtener_producto_por_id(producto_id).cantidad_stock == 10
+    assert database.obtener_producto_por_id(producto_id, usar_cache=False).cantidad_stock == 7
+
+    venta = Venta(fecha_venta="2024-01-01 10:00:00", forma_pago="Efectivo")
+    venta.detalles.append(DetalleVenta(id_producto=producto_id, cantidad=2, precio_unitario=80))
+    database.registrar_venta(venta)
+    assert database.obtener_producto_por_codigo_barras("123").cantidad_stock == 5
+
+    producto = database.obtener_producto_por_id(producto_id)
+    producto.nombre, producto.codigo_barras = "Fideos Tirabuzón", "456"
+    database.actualizar_producto(producto)
+    assert database.obtener_producto_por_codigo_barras("123") is None
+    assert database.obtener_producto_por_nombre("Fideos") is None
+    assert database.obtener_producto_por_codigo_barras("456").nombre == "Fideos Tirabuzón"
+
 def test_agregar_lote_consolida_stock(db_conn):
     """Prueba que agregar un lote con fecha existente actualiza en vez de crear uno nuevo."""
     p = Producto(nombre="Yogur", precio_venta=80, cantidad_stock=10, fecha_vencimiento="2024-12-31") # type: ignore
@@ -135,6 +167,61 @@ def test_agregar_lote_salda_deuda_stock_negativo(db_conn):
     assert len(lotes) == 1
     assert lotes[0]['cantidad'] == 7 # 12 (lote) - 5 (deuda) = 7
 
+def test_agregar_lotes_surte_ventas_pendientes_fifo(db_conn):
+    """Las líneas vendidas sin stock quedan pendientes y los lotes que llegan las surten por fecha de venta."""
+    producto_id = database.agregar_producto(Producto(nombre="Harina", precio_venta=100, cantidad_stock=0)) # type: ignore
+    otro_id = database.agregar_producto(Producto(nombre="Azúcar", precio_venta=90, cantidad_stock=0)) # type: ignore
+
+    # Se registra primero la venta más nueva para comprobar que el orden es por fecha y no por alta.
+    for fecha, cantidad in (("2023-10-02", 3), ("2023-10-01", 4)):
+        venta = Venta(fecha_venta=fecha, forma_pago="Efectivo") # type: ignore
+        venta.detalles.append(DetalleVenta(id_producto=producto_id, cantidad=cantidad, precio_unitario=100)) # type: ignore
+        venta.calcular_total()
+        database.registrar_venta(venta)
+
+    pendientes = database.obtener_detalles_venta_pendientes(producto_id)
+    assert [(d.cantidad, d.cantidad_pendiente) for d in pendientes] == [(4, 4), (3, 3)]
+
+    plan = " ".join(str(tuple(fila)) for fila in db_conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id_detalle FROM detalle_venta WHERE id_producto = ? AND estado = 'Pendiente de Stock'", (producto_id,)))
+    assert "idx_detalle_venta_pendientes" in plan
+
+    # Una sola recepción con varios productos: 5 unidades saldan la venta más vieja y parte de la otra.
+    assert database.agregar_lotes([(producto_id, 5, "2025-01-01", None), (otro_id, 2, None, None)])
+    pendientes = database.obtener_detalles_venta_pendientes(producto_id)
+    assert [(d.cantidad, d.cantidad_pendiente) for d in pendientes] == [(3, 2)]
+    assert database.obtener_producto_por_id(producto_id).stock_sin_lote == -2
+
+    database.agregar_lote(producto_id, 10, "2025-02-01")
+    assert database.obtener_detalles_venta_pendientes(producto_id) == []
+    assert database.obtener_producto_por_id(producto_id).cantidad_stock == 8
+    estados = db_conn.execute("SELECT DISTINCT estado FROM detalle_venta WHERE id_producto = ?", (producto_id,)).fetchall()
+    assert [fila[0] for fila in estados] == ["Completada"]
+
+def test_venta_con_lotes_y_stock_sin_lote_negativo_no_deja_pendientes_huerfanos(db_conn):
+    """Con lotes y stock_sin_lote negativo a la vez, lo pendiente sigue sumando la deuda y se salda al recibir."""
+    producto_id = database.agregar_producto(Producto(nombre="Leche", precio_venta=100, cantidad_stock=0)) # type: ignore
+
+    def vender(cantidad):
+        venta = Venta(fecha_venta="2023-10-01 10:00:00", forma_pago="Efectivo") # type: ignore
+        venta.detalles.append(DetalleVenta(id_producto=producto_id, cantidad=cantidad, precio_unitario=100)) # type: ignore
+        venta.calcular_total()
+        return database.registrar_venta(venta)
+
+    vender(2)  # stock_sin_lote = -2, una línea con 2 pendientes
+    with db_conn:  # un lote cargado por fuera de agregar_lotes (p. ej. una versión anterior)
+        db_conn.execute("UPDATE stock SET cantidad = 5 WHERE id_producto = ?", (producto_id,))
+
+    vender(4)  # sale de los lotes: se entrega completa y la deuda no cambia
+    pendientes = database.obtener_detalles_venta_pendientes(producto_id)
+    assert sum(d.cantidad_pendiente for d in pendientes) == 2
+    assert database.obtener_producto_por_id(producto_id, usar_cache=False).stock_sin_lote == -2
+
+    database.agregar_lote(producto_id, 3, "2025-01-01")
+    assert database.obtener_detalles_venta_pendientes(producto_id) == []
+    assert database.obtener_producto_por_id(producto_id, usar_cache=False).stock_sin_lote == 0
+    assert database.obtener_producto_por_id(producto_id, usar_cache=False).cantidad_stock == 2
+
 def test_reducir_stock_de_lotes_fefo(db_conn):
     """Prueba que el stock se reduce de los lotes más próximos a vencer (FEFO)."""
     p = Producto(nombre="Jamón", precio_venta=400, cantidad_stock=0) # type: ignore
@@ -163,6 +250,49 @@ def test_reducir_stock_de_lotes_fefo(db_conn):
     # Corregimos la aserción para que sea más clara y precisa.
     assert lote_nov['cantidad'] == (10 - (8 - 5))
 
+def test_resolver_codigo_barras_de_lote_y_venta_del_lote_escaneado(db_conn):
+    """Un código de lote resuelve a (producto, lote) y la venta descuenta primero de ese lote."""
+    producto_id = database.agregar_producto(Producto(nombre="Salame", precio_venta=900, codigo_barras="779001"))
+    database.agregar_lote(producto_id, 5, "2024-10-31", "LOTE-A")
+    database.agregar_lote(producto_id, 5, "2024-12-31", "LOTE-B")
+    id_lote_b = db_conn.execute("SELECT id_stock FROM stock WHERE codigo_barras = 'LOTE-B'").fetchone()[0]
+
+    producto, id_stock = database.resolver_codigo_barras("779001")
+    assert producto.id_producto == producto_id and id_stock is None
+    producto, id_stock = database.resolver_codigo_barras("LOTE-B")
+    assert producto.id_producto == producto_id and id_stock == id_lote_b
+    assert database.resolver_codigo_barras("NO-EXISTE") is None
+
+    venta = Venta(fecha_venta="2024-10-01 10:00:00", forma_pago="Efectivo")
+    venta.detalles.append(DetalleVenta(id_producto=producto_id, cantidad=7, precio_unitario=900, id_stock=id_stock))
+    database.registrar_venta(venta)
+
+    cantidades = dict(db_conn.execute("SELECT codigo_barras, cantidad FROM stock WHERE codigo_barras IS NOT NULL").fetchall())
+    assert cantidades == {"LOTE-A": 3, "LOTE-B": 0}
+
+def test_vencimientos_por_lote_con_escaneo_incremental(db_conn):
+    """Los lotes con stock dentro de la ventana aparecen con sus días restantes y el escaneo sigue los cambios."""
+    yogur_id = database.agregar_producto(Producto(nombre="Yogur", precio_venta=80))
+    queso_id = database.agregar_producto(Producto(nombre="Queso", precio_venta=300))
+    database.agregar_lote(yogur_id, 5, "2024-01-10")
+    database.agregar_lote(yogur_id, 3, "2024-03-01")  # Fuera de la ventana de 30 días
+    database.agregar_lote(queso_id, 4, "2023-12-25")  # Ya vencido, pero con stock
+
+    vencimientos = database.actualizar_vencimientos(30, fecha_referencia="2024-01-01")
+    assert [(l['nombre'], l['cantidad'], l['dias_para_vencer']) for l in vencimientos] == [("Queso", 4, -7), ("Yogur", 5, 9)]
+    assert vencimientos == database.obtener_lotes_por_vencer(30, fecha_referencia="2024-01-01")
+
+    venta = Venta(fecha_venta="2024-01-01 10:00:00", forma_pago="Efectivo")
+    venta.detalles.append(DetalleVenta(id_producto=yogur_id, cantidad=5, precio_unitario=80))
+    database.registrar_venta(venta)
+    database.agregar_lote(queso_id, 2, "2024-01-05")
+
+    vencimientos = database.actualizar_vencimientos(30, fecha_referencia="2024-01-01")
+    assert [(l['nombre'], l['cantidad'], l['fecha_vencimiento']) for l in vencimientos] == [
+        ("Queso", 4, "2023-12-25"), ("Queso", 2, "2024-01-05")
+    ]
+    assert vencimientos == database.obtener_lotes_por_vencer(30, fecha_referencia="2024-01-01")
+
 
 # --- Pruebas de Ventas ---
 
@@ -513,6 +643,68 @@ def test_saldo_deudor_se_actualiza_con_precio_producto(db_conn, setup_cliente_de
     assert saldo_final == 140 # 240 - 100
 
 
+def test_lista_de_precios_con_escalas_y_deuda_revaluada(db_conn, setup_cliente_deuda):
+    """La lista del cliente resuelve precios por escala de cantidad y la deuda de libreta se revalúa con ella."""
+    p1_id, cliente_id = setup_cliente_deuda
+    p2_id = database.agregar_producto(Producto(nombre="Harina", precio_venta=200, cantidad_stock=50)) # type: ignore
+    id_lista = database.agregar_lista_precios("Mayorista", ajuste_porcentaje=-10)
+    assert database.guardar_precios_lista(id_lista, [(p1_id, 1, 45), (p1_id, 10, 40)])
+
+    cliente = database.obtener_cliente_por_id(cliente_id)
+    cliente.id_lista_precios = id_lista
+    assert database.actualizar_cliente(cliente)
+
+    # Pan según la escala alcanzada; Harina no figura en la lista y lleva el ajuste general.
+    assert database.resolver_precios_lista(id_lista, {p1_id: 4, p2_id: 1}) == {p1_id: 45, p2_id: 180}
+    assert database.resolver_precios_lista(id_lista, {p1_id: 12}) == {p1_id: 40}
+
+    harina = database.obtener_producto_por_id(p2_id)
+    harina.precio_venta = 300
+    database.actualizar_producto(harina)
+    assert database.resolver_precios_lista(id_lista, {p2_id: 1}) == {p2_id: 270}
+
+    venta = Venta(fecha_venta="2023-10-01", forma_pago="Libreta", id_cliente=cliente_id) # type: ignore
+    venta.detalles.append(DetalleVenta(id_producto=p1_id, cantidad=12, precio_unitario=40)) # type: ignore
+    venta.detalles.append(DetalleVenta(id_producto=p2_id, cantidad=1, precio_unitario=270)) # type: ignore
+    venta.calcular_total()
+    database.registrar_venta(venta)
+    assert database.obtener_saldo_deudor_cliente(cliente_id) == 750
+
+    # Un cambio en la lista revalúa la deuda y se refleja en la resolución cacheada.
+    assert database.guardar_precios_lista(id_lista, [(p1_id, 10, 35)])
+    assert database.resolver_precios_lista(id_lista, {p1_id: 12}) == {p1_id: 35}
+    assert database.obtener_saldo_deudor_cliente(cliente_id) == 690
+    assert [c.saldo_deudor for c in database.obtener_clientes() if c.id_cliente == cliente_id] == [690]
+
+
+def test_antiguedad_deuda_y_clientes_vencidos(db_conn, setup_cliente_deuda):
+    """Los pagos saldan primero las deudas más viejas; lo pendiente se agrupa por antigüedad y se listan los vencidos."""
+    p1_id, _ = setup_cliente_deuda
+    ana = database.agregar_cliente(Cliente(nombre="Ana", fecha_limite_pago="2024-01-15"))
+    beto = database.agregar_cliente(Cliente(nombre="Beto", fecha_limite_pago="2024-03-01"))
+    carla = database.agregar_cliente(Cliente(nombre="Carla"))
+
+    def fiar(id_cliente, fecha, cantidad):
+        venta = Venta(fecha_venta=fecha, forma_pago="Libreta", id_cliente=id_cliente)
+        venta.detalles.append(DetalleVenta(id_producto=p1_id, cantidad=cantidad, precio_unitario=50))
+        venta.calcular_total()
+        database.registrar_venta(venta)
+
+    fiar(ana, "2024-01-01 10:00:00", 4)   # $200
+    fiar(ana, "2024-02-20 10:00:00", 2)   # $100
+    database.realizar_pago_cliente(ana, 150, "2024-02-25")
+    fiar(beto, "2023-11-01 10:00:00", 2)  # $100
+    fiar(carla, "2024-03-01 10:00:00", 2)  # $100, sin fecha límite
+
+    antiguedad = {fila['nombre']: fila for fila in database.obtener_antiguedad_deuda("2024-03-10")}
+    assert (antiguedad["Ana"]['corriente'], antiguedad["Ana"]['dias_61_90'], antiguedad["Ana"]['total']) == (100, 50, 150)
+    assert (antiguedad["Beto"]['dias_mas_90'], antiguedad["Beto"]['total']) == (100, 100)
+    assert antiguedad["Carla"]['corriente'] == 100
+
+    vencidos = database.obtener_clientes_vencidos("2024-03-10")
+    assert [(c['nombre'], c['dias_vencido'], c['saldo_deudor']) for c in vencidos] == [("Ana", 55, 150), ("Beto", 9, 100)]
+
+
 # --- Pruebas de Reportes y Sugerencias ---
 
 def test_obtener_sugerencias_reposicion(db_conn):
@@ -565,4 +757,493 @@ def test_obtener_sugerencias_reposicion(db_conn):
 
     # El producto lento no debería aparecer porque su stock (20-2=18) es suficiente
     sugerencia_lento = next((s for s in sugerencias if s['id_producto'] == p_lento_id), None)
-    assert sugerencia_lento is None
\ No newline at end of file
+    assert sugerencia_lento is None
+
+# --- Pruebas de Historial de Precios ---
+
+def test_historial_precios_consulta_a_fecha_e_inflacion(db_conn, setup_cliente_deuda):
+    """Cada cambio de precio queda registrado y se puede consultar el precio vigente en cualquier fecha."""
+    p1_id, cliente_id = setup_cliente_deuda # Pan a $50
+    db_conn.execute("UPDATE historial_precios SET fecha_desde = '2024-01-01 00:00:00' WHERE id_producto = ?", (p1_id,))
+    db_conn.commit()
+
+    venta = Venta(fecha_venta="2024-02-10 10:00:00", forma_pago="Libreta", id_cliente=cliente_id) # type: ignore
+    venta.detalles.append(DetalleVenta(id_producto=p1_id, cantidad=2, precio_unitario=50)) # type: ignore
+    venta.calcular_total()
+    database.registrar_venta(venta)
+
+    pan = database.obtener_producto_por_id(p1_id)
+    database.actualizar_producto(pan) # Sin cambio de precio: no agrega historial
+    pan.precio_venta = 75
+    database.actualizar_producto(pan)
+    db_conn.execute("UPDATE historial_precios SET fecha_desde = '2024-03-01 09:00:00' WHERE id_producto = ? AND precio = 75", (p1_id,))
+    db_conn.commit()
+
+    assert [h['precio'] for h in database.obtener_historial_precios(p1_id)] == [50, 75]
+    assert database.obtener_precio_a_fecha(p1_id, "2023-12-31") is None
+    assert database.obtener_precio_a_fecha(p1_id, "2024-02-29") == 50
+    assert database.obtener_precio_a_fecha(p1_id, "2024-03-01") == 75
+    assert database.obtener_precios_a_fecha("2024-02-01")[p1_id] == 50
+
+    # La deuda se puede valuar a los precios de una fecha pasada.
+    assert database.obtener_saldo_deudor_cliente(cliente_id, fecha_valuacion="2024-02-20") == 100
+    assert database.obtener_saldo_deudor_cliente(cliente_id) == 150
+
+    reporte = database.obtener_reporte_inflacion("2024-01-15", "2024-03-15", nombre_like="Pan")
+    assert reporte['productos_comparados'] == 1
+    assert reporte['variacion_promedio_pct'] == pytest.approx(50)
+    assert reporte['variacion_ponderada_pct'] == pytest.approx(50)
+
+def test_actualizar_precios_masivo_por_filtro_con_redondeo(db_conn):
+    """El aumento masivo se previsualiza, se aplica en una transacción y deja registro en el historial."""
+    yerba_id = database.agregar_producto(Producto(nombre="Yerba Mate", precio_venta=1000, cantidad_stock=10)) # type: ignore
+    suave_id = database.agregar_producto(Producto(nombre="YERBA Suave", precio_venta=1234, cantidad_stock=10)) # type: ignore
+    arroz_id = database.agregar_producto(Producto(nombre="Arroz", precio_venta=500, cantidad_stock=10)) # type: ignore
+
+    vista_previa = database.previsualizar_actualizacion_precios('porcentaje', 10, redondeo=10, nombre_like="yerba")
+    assert vista_previa['cantidad'] == 2
+    assert {e['nombre']: e['precio_nuevo'] for e in vista_previa['ejemplos']} == {"Yerba Mate": 1100, "YERBA Suave": 1360}
+
+    assert database.actualizar_precios_masivo('porcentaje', 10, redondeo=10, nombre_like="yerba") == 2
+
+    assert database.obtener_producto_por_id(yerba_id).precio_venta == 1100
+    assert database.obtener_producto_por_id(suave_id).precio_venta == 1360
+    assert database.obtener_producto_por_id(arroz_id).precio_venta == 500
+    assert [h['precio'] for h in database.obtener_historial_precios(suave_id)] == [1234, 1360]
+
+    # Repetir una regla que no cambia ningún precio no modifica nada.
+    assert database.actualizar_precios_masivo('monto', 0, nombre_like="yerba") == 0
+
+def test_costo_fifo_por_venta_y_margenes(db_conn):
+    """Cada venta guarda el costo de los lotes que consumió (FEFO) y el resumen diario alimenta los márgenes."""
+    p_id = database.agregar_producto(Producto(nombre="Aceite", precio_venta=100, cantidad_stock=5, fecha_vencimiento="2030-01-01", costo_unitario=40)) # type: ignore
+    database.agregar_lote(p_id, 10, "2031-01-01", costo_unitario=60)
+
+    def vender(fecha, cantidad):
+        venta = Venta(fecha_venta=fecha, forma_pago="Efectivo")
+        venta.detalles.append(DetalleVenta(id_producto=p_id, cantidad=cantidad, precio_unitario=100))
+        venta.calcular_total()
+        return database.registrar_venta(venta)
+
+    id_venta = vender("2024-05-01 10:00:00", 7)  # 5 x $40 + 2 x $60
+    vender("2024-05-02 18:30:00", 1)
+
+    assert database.obtener_venta_por_id(id_venta).detalles[0].costo_total == 320
+
+    por_producto = database.obtener_margenes("2024-05-01", "2024-05-31")
+    assert [(m['nombre'], m['unidades'], m['ingresos'], m['costo'], m['margen']) for m in por_producto] == [("Aceite", 8, 800, 380, 420)]
+    por_dia = database.obtener_margenes("2024-05-01", "2024-05-31", agrupar_por='dia')
+    assert [(m['fecha'], m['costo']) for m in por_dia] == [("2024-05-01", 320), ("2024-05-02", 60)]
+
+    assert database.reconstruir_resumen_margen()
+    assert database.obtener_margenes("2024-05-01", "2024-05-31", agrupar_por='mes') == [
+        {'mes': "2024-05", 'unidades': 8, 'ingresos': 800, 'costo': 380, 'margen': 420, 'margen_pct': 52.5}
+    ]
+
+def test_turno_de_caja_acumula_por_forma_de_pago_y_cierra(db_conn, setup_cliente_deuda):
+    """Las ventas y cobros de libreta suman al turno abierto; el cierre arma el reporte Z con esos totales."""
+    p1_id, cliente_id = setup_cliente_deuda
+
+    def vender(forma_pago, cantidad, id_cliente=None):
+        venta = Venta(fecha_venta="2024-05-01 10:00:00", forma_pago=forma_pago, id_cliente=id_cliente)
+        venta.detalles.append(DetalleVenta(id_producto=p1_id, cantidad=cantidad, precio_unitario=50))
+        venta.calcular_total()
+        return database.registrar_venta(venta)
+
+    vender("Efectivo", 1)  # sin turno abierto: se registra igual, sin turno
+    id_turno = database.abrir_turno("cajero1", 1000, fecha_apertura="2024-05-01 08:00:00")
+    assert database.abrir_turno("cajero2") is None  # una sola caja abierta a la vez
+
+    vender("Efectivo", 2)
+    vender("Efectivo", 1)
+    vender("Tarjeta", 3)
+    vender("Libreta", 4, cliente_id)
+    assert database.realizar_pago_cliente(cliente_id, 120, "2024-05-01 12:00:00")
+    assert database.realizar_pago_cliente(cliente_id, 30, "2024-05-01 12:05:00", forma_pago="Transferencia")
+
+    reporte = database.cerrar_turno(id_turno, 1250, fecha_cierre="2024-05-01 16:00:00")
+    assert [(t['forma_pago'], t['cantidad_ventas'], t['total_ventas'], t['total_cobros']) for t in reporte['totales']] == [
+        ("Efectivo", 2, 150, 120), ("Libreta", 1, 200, 0), ("Tarjeta", 1, 150, 0), ("Transferencia", 0, 0, 30)
+    ]
+    assert (reporte['cantidad_ventas'], reporte['total_ventas'], reporte['efectivo_esperado'], reporte['diferencia']) == (4, 500, 1270, -20)
+    assert database.cerrar_turno(id_turno, 0) is None
+
+    # Los contadores coinciden con las ventas del turno.
+    cursor = db_conn.execute("SELECT forma_pago, COUNT(*), SUM(total) FROM ventas WHERE id_turno = ? GROUP BY forma_pago", (id_turno,))
+    assert {f: (n, t) for f, n, t in cursor.fetchall()} == {
+        t['forma_pago']: (t['cantidad_ventas'], t['total_ventas']) for t in reporte['totales'] if t['cantidad_ventas']
+    }
+
+    id_otro = database.abrir_turno("cajero2", fecha_apertura="2024-05-02 08:00:00")
+    assert database.obtener_turno_abierto()['id_turno'] == id_otro
+    assert [t['id_turno'] for t in database.obtener_turnos()] == [id_otro, id_turno]
+    assert [(t['total_ventas'], t['diferencia']) for t in database.obtener_turnos(usuario="cajero1", fecha_desde="2024-05-01", fecha_hasta="2024-05-01")] == [(500, -20)]
+    assert database.obtener_turnos(usuario="cajero1", fecha_desde="2024-05-02") == []
+
+def test_buscar_ventas_por_filtros_texto_y_paginas(db_conn, setup_cliente_deuda):
+    """La búsqueda combina producto, cliente, monto, forma de pago y texto libre, y pagina por clave."""
+    p1_id, cliente_id = setup_cliente_deuda
+    p2_id = database.agregar_producto(Producto(nombre="Caja de Té", precio_venta=300, cantidad_stock=50)) # type: ignore
+
+    def vender(dia, id_producto, cantidad, forma_pago="Efectivo", id_cliente=None, observaciones=None):
+        venta = Venta(fecha_venta=f"2024-05-{dia:02d} 10:00:00", forma_pago=forma_pago, id_cliente=id_cliente, observaciones=observaciones)
+        venta.detalles.append(DetalleVenta(id_producto=id_producto, cantidad=cantidad, precio_unitario=100))
+        venta.calcular_total()
+        return database.registrar_venta(venta)
+
+    v1 = vender(1, p1_id, 1, observaciones="Envío a domicilio")
+    v2 = vender(2, p2_id, 2, "Libreta", cliente_id, observaciones="Retira el sábado")
+    v3 = vender(3, p2_id, 5, "Tarjeta")
+    v4 = vender(4, p1_id, 2, "Libreta", cliente_id)
+
+    def ids(**filtros):
+        return [v['id_venta'] for v in database.buscar_ventas(**filtros)]
+
+    assert ids() == [v4, v3, v2, v1]
+    assert ids(id_producto=p2_id) == [v3, v2]
+    assert ids(id_producto=p2_id, id_cliente=cliente_id) == [v2]
+    assert ids(monto_minimo=150, monto_maximo=450) == [v4, v2]
+    assert ids(forma_pago="Tarjeta") == [v3]
+    assert ids(texto="envio domic") == [v1]  # sin tildes y por prefijo
+    assert ids(texto='retira -sabado') == [v2]  # la sintaxis de FTS5 (el NOT '-') se toma como texto
+    assert ids(fecha_desde="2024-05-02", fecha_hasta="2024-05-03") == [v3, v2]
+
+    db_conn.execute("UPDATE ventas SET observaciones = 'Pagó con cambio' WHERE id_venta = ?", (v1,))
+    assert ids(texto="envio") == [] and ids(texto="cambio") == [v1]
+
+    primera = database.buscar_ventas(limite=3)
+    ultima = primera[-1]
+    assert [v['id_venta'] for v in database.buscar_ventas(limite=3, despues_de=(ultima['fecha_venta'], ultima['id_venta']))] == [v1]
+    assert primera[1]['nombre_cliente'] == "Consumidor Final"
+
+# --- Pruebas de Lectura en Streaming ---
+
+def test_iter_ventas_recorre_en_lotes_con_detalles(db_conn, setup_venta):
+    """Verifica que iter_ventas entrega todas las ventas con sus detalles aunque el lote sea chico."""
+    p1_id, p2_id, _ = setup_venta
+    for dia in range(1, 6):
+        venta = Venta(fecha_venta=f"2023-10-0{dia} 10:00:00", forma_pago="Efectivo") # type: ignore
+        venta.detalles.append(DetalleVenta(id_producto=p1_id, cantidad=1, precio_unitario=50)) # type: ignore
+        venta.detalles.append(DetalleVenta(id_producto=p2_id, cantidad=1, precio_unitario=90)) # type: ignore
+        venta.calcular_total()
+        database.registrar_venta(venta)
+
+    ventas = list(database.iter_ventas("2023-10-01", "2023-10-31", tamano_lote=2))
+    assert len(ventas) == 5
+    assert all(len(v.detalles) == 2 for v in ventas)
+    assert [v.fecha_venta[:10] for v in ventas] == sorted((v.fecha_venta[:10] for v in ventas), reverse=True)
+
+    ventas_sin_detalle = list(database.iter_ventas("2023-10-01", "2023-10-31", incluir_detalles=False, tamano_lote=2))
+    assert len(ventas_sin_detalle) == 5
+    assert all(v.detalles == [] for v in ventas_sin_detalle)
+
+def test_iter_productos_aplica_filtros_por_lote(db_conn):
+    """Verifica que iter_productos filtra por nombre y poco stock igual que obtener_productos."""
+    for i in range(7):
+        database.agregar_producto(Producto(nombre=f"Galleta {i}", precio_venta=10, cantidad_stock=i)) # type: ignore
+    database.agregar_producto(Producto(nombre="Té Verde", precio_venta=10, cantidad_stock=1)) # type: ignore
+
+    galletas = list(database.iter_productos(nombre_like="galleta", tamano_lote=3))
+    assert len(galletas) == 7
+
+    poco_stock = list(database.iter_productos(nombre_like="galleta", solo_poco_stock=True, umbral_stock=2, tamano_lote=3))
+    assert sorted(p.cantidad_stock for p in poco_stock) == [0, 1, 2]
+
+    assert [p.nombre for p in database.iter_productos(nombre_like="te verde")] == ["Té Verde"]
+
+def test_iter_clientes_aplica_filtros_por_lote(db_conn):
+    """Verifica que iter_clientes filtra por nombre o DNI igual que obtener_clientes."""
+    for i in range(5):
+        database.agregar_cliente(Cliente(nombre=f"Cliente {i}", dni=f"3000{i}")) # type: ignore
+    database.agregar_cliente(Cliente(nombre="José Pérez", dni="12345")) # type: ignore
+
+    assert len(list(database.iter_clientes(nombre_o_dni="cliente", tamano_lote=2))) == 5
+    assert [c.nombre for c in database.iter_clientes(nombre_o_dni="jose")] == ["José Pérez"]
+    assert [c.dni for c in database.iter_clientes(nombre_o_dni="30003", tamano_lote=2)] == ["30003"]
+    assert list(database.iter_clientes(solo_con_deuda=True)) == []
+
+def test_obtener_ventas_df_tipos_columnares(db_conn, setup_venta):
+    """Verifica que las consultas columnares devuelven fechas y categorías con el dtype correcto."""
+    pd = pytest.importorskip("pandas")
+    p1_id, _, cliente_id = setup_venta
+    for forma_pago in ("Efectivo", "Libreta", "Efectivo"):
+        venta = Venta(fecha_venta="2023-10-05 09:30:00", forma_pago=forma_pago, id_cliente=cliente_id) # type: ignore
+        venta.detalles.append(DetalleVenta(id_producto=p1_id, cantidad=2, precio_unitario=50)) # type: ignore
+        venta.calcular_total()
+        database.registrar_venta(venta)
+
+    df = database.obtener_ventas_df("2023-10-01", "2023-10-31")
+    assert len(df) == 3
+    assert pd.api.types.is_datetime64_any_dtype(df['fecha_venta'])
+    assert isinstance(df['forma_pago'].dtype, pd.CategoricalDtype)
+    assert df['total'].sum() == 300
+
+    detalles = database.obtener_detalles_ventas_df("2023-10-01", "2023-10-31")
+    assert isinstance(detalles['estado'].dtype, pd.CategoricalDtype)
+    assert set(detalles['nombre_producto']) == {"Pan"}
+
+    chunks = list(database.iter_ventas_df("2023-10-01", "2023-10-31", tamano_lote=2))
+    assert [len(c) for c in chunks] == [2, 1]
+
+def test_columnas_enteras_con_nulos_o_decimales_no_fallan(db_conn):
+    """Los enteros con NULL pasan a Int64 y los REAL con decimales quedan float, sin truncar."""
+    pd = pytest.importorskip("pandas")
+    df = database._dataframe_desde_filas([(1, None, 2.5), (2, 3, 4.0)], ['id_venta', 'cantidad', 'cantidad_a_comprar'])
+    assert str(df['id_venta'].dtype) == 'int64'
+    assert str(df['cantidad'].dtype) == 'Int64' and df['cantidad'].isna().sum() == 1
+    assert df['cantidad_a_comprar'].tolist() == [2.5, 4.0]
+    assert str(database._dataframe_desde_filas([(1.0,)], ['cantidad_a_comprar'])['cantidad_a_comprar'].dtype) == 'int64'
+
+def test_iter_ventas_df_memoria_pico_no_crece_con_las_filas(db_conn):
+    """El pico de memoria de la lectura por lotes depende del tamaño del lote, no del total de ventas."""
+    pytest.importorskip("pandas")
+    import tracemalloc
+
+    def pico_exportando(cantidad_ventas):
+        with db_conn:
+            db_conn.execute("DELETE FROM ventas")
+            db_conn.executemany(
+                "INSERT INTO ventas (fecha_venta, total, forma_pago) VALUES (?, ?, ?)",
+                [(f"2024-03-{1 + i % 28:02d} 10:00:00", 100.0, "Efectivo") for i in range(cantidad_ventas)]
+            )
+        tracemalloc.start()
+        filas = sum(len(df) for df in database.iter_ventas_df("2024-03-01", "2024-03-31", tamano_lote=500))
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert filas == cantidad_ventas
+        return pico
+
+    assert pico_exportando(20000) < pico_exportando(2000) * 1.5
+
+def test_reportes_leen_del_snapshot_hasta_refrescarlo(db_conn, setup_venta):
+    """Los reportes usan una copia en memoria: las ventas nuevas aparecen al refrescarla, no antes."""
+    p1_id, _, _ = setup_venta
+
+    def vender():
+        venta = Venta(fecha_venta="2023-10-05 09:30:00", forma_pago="Efectivo") # type: ignore
+        venta.detalles.append(DetalleVenta(id_producto=p1_id, cantidad=1, precio_unitario=50)) # type: ignore
+        venta.calcular_total()
+        return database.registrar_venta(venta)
+
+    id_venta = vender()
+    database.refrescar_snapshot_reportes()
+    assert database.obtener_pagos_recibidos_por_rango("2023-10-01", "2023-10-31", desde_snapshot=True) == 0
+    assert database.obtener_venta_por_id(id_venta, desde_snapshot=True).total == 50
+
+    vender()
+    snapshot = database._get_reporting_connection()
+    assert snapshot.execute("SELECT COUNT(*) FROM ventas").fetchone()[0] == 1
+    with pytest.raises(sqlite3.OperationalError):
+        snapshot.execute("DELETE FROM ventas")
+
+    lectura_en_curso = snapshot.execute("SELECT id_venta FROM ventas")
+    database.refrescar_snapshot_reportes()
+    assert database._get_reporting_connection().execute("SELECT COUNT(*) FROM ventas").fetchone()[0] == 2
+    # Quien ya estaba leyendo de la copia anterior termina sin errores.
+    assert [fila[0] for fila in lectura_en_curso.fetchall()] == [id_venta]
+    assert snapshot.execute("SELECT COUNT(*) FROM ventas").fetchone()[0] == 1
+
+def test_snapshot_de_reportes_no_se_copia_en_el_hilo_que_lo_pide(tmp_path, monkeypatch):
+    """Sin copia se lee la BD en solo lectura; una copia vencida se sigue usando mientras se renueva aparte."""
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "easyst.db"))
+    database.inicializar_bd()
+    database.agregar_producto(Producto(nombre="Yerba", precio_venta=100)) # type: ignore
+
+    lectura = database._get_reporting_connection()
+    assert lectura.execute("SELECT COUNT(*) FROM productos").fetchone()[0] == 1
+    with pytest.raises(sqlite3.OperationalError):
+        lectura.execute("DELETE FROM productos")
+    primera_copia = threading.Event()
+    database.refrescar_snapshot_reportes_en_segundo_plano(primera_copia.set)
+    assert primera_copia.wait(5)
+    snapshot = database._get_reporting_connection()
+
+    # La renovación queda trabada: quien pide el reporte no la espera.
+    database.agregar_producto(Producto(nombre="Arroz", precio_venta=100)) # type: ignore
+    continuar = threading.Event()
+    refrescar_original = database.refrescar_snapshot_reportes
+    monkeypatch.setattr(database, "refrescar_snapshot_reportes", lambda: continuar.wait(5) and refrescar_original())
+    assert database._get_reporting_connection(minutos_vigencia=0) is snapshot
+    assert snapshot.execute("SELECT COUNT(*) FROM productos").fetchone()[0] == 1
+
+    renovada = threading.Event()
+    database.refrescar_snapshot_reportes_en_segundo_plano(renovada.set)
+    continuar.set()
+    assert renovada.wait(5)
+    assert database._get_reporting_connection().execute("SELECT COUNT(*) FROM productos").fetchone()[0] == 2
+
+# --- Pruebas de Copias de Seguridad ---
+
+def test_crear_backup_seguro_verifica_y_comprime(db_conn, tmp_path):
+    """Verifica que el backup reporta progreso, escribe su checksum y puede comprimirse."""
+    database.agregar_producto(Producto(nombre="Arroz", precio_venta=100, cantidad_stock=3)) # type: ignore
+    avances = []
+
+    ruta = str(tmp_path / "copia.db")
+    assert database.crear_backup_seguro(ruta, progreso=lambda copiadas, total: avances.append((copiadas, total)))
+    assert avances and avances[-1][0] == avances[-1][1]
+    assert (tmp_path / "copia.db.sha256").exists()
+    assert database.verificar_backup(ruta)
+
+    with sqlite3.connect(ruta) as copia:
+        assert copia.execute("SELECT nombre FROM productos").fetchone()[0] == "Arroz"
+
+    ruta_gz = str(tmp_path / "copia.db.gz")
+    assert database.crear_backup_seguro(ruta_gz, comprimir=True)
+    assert not (tmp_path / "copia.db.gz.tmp").exists()
+    assert database.verificar_backup(ruta_gz)
+
+    # Un archivo alterado no debe pasar la verificación del checksum.
+    with open(ruta_gz, 'ab') as f:
+        f.write(b"basura")
+    assert not database.verificar_backup(ruta_gz)
+
+def test_backup_automatico_aplica_retencion(db_conn, tmp_path):
+    """Verifica que solo se conservan los N backups automáticos más recientes."""
+    for i in range(4):
+        (tmp_path / f"{database.PREFIJO_BACKUP_AUTOMATICO}2024-01-0{i + 1}_000000.db.gz").write_bytes(b"")
+    (tmp_path / "backup_manual.db").write_bytes(b"")
+
+    ruta = database.crear_backup_automatico(str(tmp_path), conservar=2)
+    assert ruta is not None
+
+    automaticos = sorted(p.name for p in tmp_path.glob(f"{database.PREFIJO_BACKUP_AUTOMATICO}*.db.gz"))
+    assert len(automaticos) == 2
+    assert automaticos[-1] == os.path.basename(ruta)
+    assert (tmp_path / "backup_manual.db").exists()
+
+def test_restaurar_backup_migra_y_reemplaza_en_caliente(db_conn, tmp_path):
+    """Verifica que restaurar un backup de un esquema viejo lo migra y reemplaza la BD abierta."""
+    database.agregar_producto(Producto(nombre="Dato Actual", precio_venta=10, cantidad_stock=1)) # type: ignore
+
+    # Backup con el esquema de la versión 4 (sin la columna stock.codigo_barras).
+    ruta_backup = str(tmp_path / "viejo.db")
+    viejo = sqlite3.connect(ruta_backup)
+    viejo.executescript("""
+        CREATE TABLE productos (id_producto INTEGER PRIMARY KEY NOT NULL, nombre TEXT NOT NULL, precio_venta REAL NOT NULL,
+            volumen REAL, codigo_barras TEXT UNIQUE, descripcion TEXT, stock_sin_lote INTEGER NOT NULL DEFAULT 0);
+        CREATE TABLE stock (id_stock INTEGER PRIMARY KEY AUTOINCREMENT, id_producto INTEGER NOT NULL, cantidad INTEGER NOT NULL,
+            fecha_vencimiento TEXT);
+        INSERT INTO productos (nombre, precio_venta) VALUES ('Dato Restaurado', 99);
+        INSERT INTO stock (id_producto, cantidad) VALUES (1, 7);
+        PRAGMA user_version = 4;
+    """)
+    viejo.close()
+
+    reinicios = []
+    database.al_reiniciar_bd(lambda: reinicios.append(True))
+    try:
+        assert database.restaurar_backup(ruta_backup)
+    finally:
+        database._CALLBACKS_REINICIO_BD.pop()
+
+    assert reinicios == [True]
+    assert [p.nombre for p in database.obtener_productos()] == ["Dato Restaurado"]
+    assert database.obtener_producto_por_id(1).cantidad_stock == 7
+    assert db_conn.execute("PRAGMA user_version").fetchone()[0] == database.LATEST_SCHEMA_VERSION
+    columnas_stock = [fila['name'] for fila in db_conn.execute("PRAGMA table_info(stock)")]
+    assert "codigo_barras" in columnas_stock
+
+    # El archivo original del usuario no se modifica.
+    with sqlite3.connect(ruta_backup) as original:
+        assert original.execute("PRAGMA user_version").fetchone()[0] == 4
+
+def test_restaurar_backup_invalido_no_modifica_datos(db_conn, tmp_path):
+    """Un archivo que no es una BD válida no debe tocar los datos actuales."""
+    database.agregar_producto(Producto(nombre="Intacto", precio_venta=10, cantidad_stock=1)) # type: ignore
+    ruta_backup = tmp_path / "roto.db"
+    ruta_backup.write_bytes(b"esto no es una base de datos" * 100)
+
+    assert not database.restaurar_backup(str(ruta_backup))
+    assert [p.nombre for p in database.obtener_productos()] == ["Intacto"]
+
+def test_conteo_de_inventario_aplica_diferencias_en_una_transaccion(db_conn):
+    """Las lecturas se acumulan por producto; al aplicar, las diferencias respetan lo vendido durante el conteo."""
+    id_yerba = database.agregar_producto(Producto(nombre="Yerba", precio_venta=100, codigo_barras="111", cantidad_stock=10))
+    database.agregar_lote(id_yerba, 5, "2024-01-01", codigo_barras="111-L")
+    id_fideos = database.agregar_producto(Producto(nombre="Fideos", precio_venta=50, codigo_barras="222", cantidad_stock=4, costo_unitario=30))
+    id_arroz = database.agregar_producto(Producto(nombre="Arroz", precio_venta=80, cantidad_stock=3))
+
+    id_conteo = database.iniciar_conteo("repositor")
+    assert database.iniciar_conteo("otro") is None
+    assert database.registrar_lectura_conteo(id_conteo, "111", 11) == (id_yerba, "Yerba", 11, 15)
+    assert database.registrar_lectura_conteo(id_conteo, "111-L") == (id_yerba, "Yerba", 12, 15)  # el código del lote cuenta para el producto
+    assert database.registrar_lecturas_conteo(id_conteo, [(id_fideos, 5), (9999, 1), (id_fideos, 2)]) == 2
+    assert database.corregir_cantidad_conteo(id_conteo, id_fideos, 6)
+    assert database.registrar_lectura_conteo(id_conteo, "999") is None
+
+    # Se vende una yerba después de contarla: el faltante sigue siendo de 3 unidades.
+    venta = Venta(fecha_venta="2024-05-01 10:00:00", forma_pago="Efectivo")
+    venta.detalles.append(DetalleVenta(id_producto=id_yerba, cantidad=1, precio_unitario=100))
+    venta.calcular_total()
+    assert database.registrar_venta(venta)
+
+    abierto = database.obtener_conteo_abierto()
+    assert (abierto['id_conteo'], abierto['productos_contados'], abierto['unidades_contadas']) == (id_conteo, 2, 18)
+    assert [(d['nombre'], d['diferencia']) for d in database.obtener_diferencias_conteo(id_conteo)] == [("Fideos", 2), ("Yerba", -3)]
+    assert [(d['nombre'], d['diferencia']) for d in database.obtener_diferencias_conteo(id_conteo, incluir_no_contados=True)] == [("Arroz", -3), ("Fideos", 2), ("Yerba", -3)]
+
+    assert database.aplicar_conteo(id_conteo, incluir_no_contados=True) == {'productos': 3, 'sobrantes': 2, 'faltantes': 6}
+    assert database.obtener_producto_por_id(id_yerba, usar_cache=False).cantidad_stock == 11
+    assert {lote['fecha_vencimiento']: lote['cantidad'] for lote in database.obtener_lotes_por_producto(id_yerba)} == {"2024-01-01": 1, None: 10}  # FEFO
+    assert database.obtener_producto_por_id(id_fideos, usar_cache=False).cantidad_stock == 6
+    assert database.obtener_producto_por_id(id_arroz, usar_cache=False).cantidad_stock == 0
+    ajustes = db_conn.execute("SELECT id_producto, cantidad_sistema, cantidad_contada, diferencia FROM ajustes_stock WHERE id_conteo = ? ORDER BY id_producto", (id_conteo,)).fetchall()
+    assert [tuple(a) for a in ajustes] == [(id_yerba, 15, 12, -3), (id_fideos, 4, 6, 2), (id_arroz, 3, 0, -3)]
+
+    assert database.obtener_conteo_abierto() is None
+    assert database.aplicar_conteo(id_conteo) is None
+    assert database.registrar_lectura_conteo(id_conteo, "111") is None
+
+def test_conteo_con_sobrante_salda_las_ventas_pendientes(db_conn):
+    """Lo que sobra al contar un producto que se vendió sin stock completa primero las ventas pendientes."""
+    id_harina = database.agregar_producto(Producto(nombre="Harina", precio_venta=100))
+    venta = Venta(fecha_venta="2024-05-01 10:00:00", forma_pago="Efectivo")
+    venta.detalles.append(DetalleVenta(id_producto=id_harina, cantidad=2, precio_unitario=100))
+    venta.calcular_total()
+    assert database.registrar_venta(venta)
+
+    id_conteo = database.iniciar_conteo()
+    assert database.registrar_lecturas_conteo(id_conteo, [(id_harina, 3)]) == 1
+    assert database.aplicar_conteo(id_conteo) == {'productos': 1, 'sobrantes': 3, 'faltantes': 0}
+
+    assert database.obtener_detalles_venta_pendientes(id_harina) == []
+    assert database.obtener_producto_por_id(id_harina, usar_cache=False).stock_sin_lote == 0
+    assert [(l['fecha_vencimiento'], l['cantidad']) for l in database.obtener_lotes_por_producto(id_harina)] == [(None, 1)]
+
+def test_orden_de_compra_desde_sugerencias_y_recepcion_en_una_transaccion(db_conn):
+    """La orden pide lo sugerido menos lo ya pedido; la recepción carga los lotes, salda deudas y ventas pendientes."""
+    id_harina = database.agregar_producto(Producto(nombre="Harina", precio_venta=100, cantidad_stock=0)) # type: ignore
+    id_azucar = database.agregar_producto(Producto(nombre="Azúcar", precio_venta=90)) # type: ignore
+    database.agregar_lote(id_azucar, 40, "2026-01-01", costo_unitario=50)
+    for id_producto, cantidad in ((id_harina, 6), (id_azucar, 30)):
+        venta = Venta(fecha_venta=database.datetime.now() - database.timedelta(days=1), forma_pago="Efectivo") # type: ignore
+        venta.detalles.append(DetalleVenta(id_producto=id_producto, cantidad=cantidad, precio_unitario=100)) # type: ignore
+        venta.calcular_total()
+        database.registrar_venta(venta)
+
+    # 30 días de análisis y 30 de cobertura: se pide lo vendido menos el stock (la harina debe 6 unidades).
+    id_orden = database.crear_orden_compra_desde_sugerencias(30, 30, proveedor="Molino")
+    items = {i['id_producto']: i for i in database.obtener_items_orden_compra(id_orden)}
+    assert {k: i['cantidad_pedida'] for k, i in items.items()} == {id_harina: 12, id_azucar: 20}
+    assert items[id_azucar]['costo_unitario'] == 50
+    # Con todo ya pedido, una segunda orden no tiene nada que pedir.
+    assert database.crear_orden_compra_desde_sugerencias(30, 30) is None
+
+    # Falla en mitad de la entrega (producto inexistente): no se aplica nada.
+    assert database.recibir_mercaderia([(id_harina, 8, "2026-03-01", None, 40), (9999, 1, None, None)], id_orden) is None
+    assert database.obtener_detalles_venta_pendientes(id_harina) != []
+    assert database.obtener_items_orden_compra(id_orden)[0]['cantidad_recibida'] == 0
+
+    resumen = database.recibir_mercaderia([(id_harina, 8, "2026-03-01", None, 40), (id_harina, 2, "2026-03-01", None, 40)], id_orden)
+    assert resumen == {'lotes': 2, 'unidades': 10, 'unidades_saldadas': 6, 'ventas_completadas': 1, 'estado_orden': 'Parcial'}
+    assert database.obtener_detalles_venta_pendientes(id_harina) == []
+    assert database.obtener_producto_por_id(id_harina, usar_cache=False).stock_sin_lote == 0
+    assert [l['cantidad'] for l in database.obtener_lotes_por_producto(id_harina)] == [4]
+
+    resumen = database.recibir_mercaderia([(id_harina, 2, None, None), (id_azucar, 20, "2026-01-01", None, 80)], id_orden)
+    assert resumen['estado_orden'] == 'Recibida'
+    assert database.obtener_ordenes_compra('Recibida')[0]['unidades_recibidas'] == 32
+    assert database.obtener_lotes_por_producto(id_azucar)[0]['costo_unitario'] == 70
+    assert database.recibir_mercaderia([(id_harina, 1, None, None)], id_orden) is None
+    assert not database.anular_orden_compra(id_orden)
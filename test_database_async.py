@@ -0,0 +1,64 @@
+"""
+Pruebas de la fachada asyncio (database_async.py).
+Usan una BD en archivo: cada hilo del pool abre su propia conexión, algo que una BD en memoria no permite.
+"""
+import asyncio
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+import database
+from database_async import BaseDatosAsync
+from models import Producto, Venta, DetalleVenta
+
+
+@pytest.fixture
+def bd_en_archivo(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "easyst.db"))
+    database.inicializar_bd()
+    config_mock = MagicMock()
+    config_mock.getboolean.return_value = False
+    with patch('database.configparser.ConfigParser', return_value=config_mock):
+        yield
+
+
+def test_ventas_y_busquedas_concurrentes(bd_en_archivo):
+    """Ventas y búsquedas en paralelo desde el event loop; cada venta descuenta su stock."""
+    database.agregar_producto(Producto(nombre="Yerba Mate", precio_venta=100.0, codigo_barras="779"))
+    producto = database.obtener_producto_por_codigo_barras("779")
+    database.agregar_lote(producto.id_producto, 20, "2030-01-01")
+
+    def venta():
+        v = Venta(fecha_venta="2025-01-01 10:00:00", total=100.0, forma_pago="Efectivo")
+        v.detalles.append(DetalleVenta(id_producto=producto.id_producto, cantidad=1, precio_unitario=100.0))
+        return v
+
+    async def flujo():
+        async with BaseDatosAsync(max_hilos=4) as db:
+            return await asyncio.gather(
+                *(db.registrar_venta(venta()) for _ in range(10)),
+                *(db.buscar_productos("yerba") for _ in range(10)),
+            )
+
+    resultados = asyncio.run(flujo())
+
+    ids_venta = resultados[:10]
+    assert all(ids_venta) and len(set(ids_venta)) == 10
+    assert all(len(encontrados) == 1 for encontrados in resultados[10:])
+    assert database.obtener_stock_total_lotes(producto.id_producto) == 10
+
+def test_timeout_interrumpe_la_consulta_y_libera_el_hilo(bd_en_archivo):
+    """Una consulta que excede el timeout se interrumpe; el único hilo del pool queda libre para la siguiente."""
+    def consulta_interminable():
+        conn = database._get_db_connection()
+        return conn.execute(
+            "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT count(*) FROM n"
+        ).fetchone()
+
+    async def flujo():
+        async with BaseDatosAsync(max_hilos=1) as db:
+            with pytest.raises(asyncio.TimeoutError):
+                await db.ejecutar(consulta_interminable, timeout=0.2)
+            return await db.obtener_productos(timeout=5)
+
+    assert asyncio.run(flujo()) == []
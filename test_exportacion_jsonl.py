@@ -0,0 +1,67 @@
+"""
+Pruebas de la exportación e importación en JSON Lines (exportacion_jsonl.py).
+La BD en uso es una BD en memoria; los archivos van a un directorio temporal.
+"""
+import gzip
+import json
+
+import pytest
+
+import database
+from models import Producto, Cliente, Venta, DetalleVenta
+from exportacion_jsonl import exportar_bd_jsonl, importar_bd_jsonl, NOMBRE_MANIFIESTO
+
+
+@pytest.fixture
+def local_con_ventas(db_conn):
+    id_producto = database.agregar_producto(Producto(nombre="Café Molido", precio_venta=2500.75, codigo_barras="779123", cantidad_stock=8))
+    id_cliente = database.agregar_cliente(Cliente(nombre="Ana Núñez", dni="28999111"))
+    venta = Venta(fecha_venta="2024-06-01 09:15:00", forma_pago="Libreta", id_cliente=id_cliente, observaciones="Pasa a retirar el lunes")
+    venta.detalles.append(DetalleVenta(id_producto=id_producto, cantidad=3, precio_unitario=2500.75))
+    venta.calcular_total()
+    database.registrar_venta(venta)
+    return id_producto, id_cliente
+
+
+def test_exportacion_es_determinista_y_la_importacion_restaura_todo(db_conn, local_con_ventas, tmp_path):
+    """Exportar dos veces da los mismos archivos; importar deja la BD como estaba al exportar."""
+    id_producto, id_cliente = local_con_ventas
+    manifiesto = exportar_bd_jsonl(str(tmp_path / "a"), tamano_lote=2)
+    exportar_bd_jsonl(str(tmp_path / "b"))
+
+    tablas = {t['nombre']: t for t in manifiesto['tablas']}
+    assert 'ventas_fts' not in tablas and 'sqlite_sequence' not in tablas
+    assert (tablas['ventas']['filas'], tablas['usuarios']['filas']) == (1, 1)
+    for tabla in manifiesto['tablas']:
+        assert (tmp_path / "a" / tabla['archivo']).read_bytes() == (tmp_path / "b" / tabla['archivo']).read_bytes()
+
+    database.agregar_producto(Producto(nombre="Producto Nuevo", precio_venta=10))
+    db_conn.execute("DELETE FROM movimientos_cuenta_cliente")
+    db_conn.commit()
+
+    avances = []
+    assert importar_bd_jsonl(str(tmp_path / "a"), progreso=lambda tabla, filas: avances.append(tabla), tamano_lote=2)
+    assert 'productos' in avances
+    assert [p.nombre for p in database.obtener_productos()] == ["Café Molido"]
+    assert database.obtener_producto_por_id(id_producto).precio_venta == 2500.75
+    assert database.obtener_saldo_deudor_cliente(id_cliente) == 3 * 2500.75
+    assert [v['observaciones'] for v in database.buscar_ventas(texto="retirar")] == ["Pasa a retirar el lunes"]
+    assert database.verificar_usuario("admin", "admin") == "Administrador"
+
+def test_importacion_con_archivo_alterado_no_modifica_la_bd(db_conn, local_con_ventas, tmp_path):
+    """Si una tabla no coincide con el SHA-256 del manifiesto, la BD en uso queda intacta."""
+    directorio = tmp_path / "exportacion"
+    manifiesto = exportar_bd_jsonl(str(directorio))
+    archivo = directorio / next(t['archivo'] for t in manifiesto['tablas'] if t['nombre'] == 'productos')
+    with gzip.open(archivo, 'rt', encoding='utf-8') as f:
+        filas = [json.loads(linea) for linea in f]
+    filas[0][2] = 1.0  # precio_venta
+    with gzip.open(archivo, 'wt', encoding='utf-8') as f:
+        f.writelines(json.dumps(fila) + '\n' for fila in filas)
+
+    database.agregar_producto(Producto(nombre="Alta Posterior", precio_venta=10))
+    assert not importar_bd_jsonl(str(directorio))
+    assert sorted(p.nombre for p in database.obtener_productos()) == ["Alta Posterior", "Café Molido"]
+
+    (directorio / NOMBRE_MANIFIESTO).unlink()
+    assert not importar_bd_jsonl(str(directorio))
@@ -0,0 +1,79 @@
+"""
+Pruebas de la exportación a Parquet (exportacion_parquet.py).
+Se omiten si pyarrow no está instalado.
+"""
+import os
+from datetime import datetime
+
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+import database
+from models import Producto, Cliente, Venta, DetalleVenta
+from exportacion_parquet import exportar_parquet
+
+
+def _vender(id_producto, cantidad, fecha, id_cliente=None, forma_pago="Efectivo"):
+    venta = Venta(fecha_venta=fecha, id_cliente=id_cliente, forma_pago=forma_pago)
+    venta.detalles.append(DetalleVenta(id_producto=id_producto, cantidad=cantidad, precio_unitario=100))
+    venta.calcular_total()
+    return database.registrar_venta(venta)
+
+
+def _meses(directorio, conjunto):
+    return sorted(os.listdir(os.path.join(directorio, conjunto)))
+
+
+def test_exportacion_parquet_particiona_por_mes_con_tipos(db_conn, tmp_path):
+    """Ventas, detalle y movimientos salen partidos por mes; productos y stock en un archivo cada uno."""
+    id_prod = database.agregar_producto(Producto(nombre="Yerba", precio_venta=100, cantidad_stock=50))
+    id_cliente = database.agregar_cliente(Cliente(nombre="Ana", dni="1"))
+    _vender(id_prod, 2, datetime(2024, 1, 31, 23, 59))
+    _vender(id_prod, 1, datetime(2024, 2, 1, 8, 0), id_cliente=id_cliente, forma_pago="Libreta")
+    _vender(id_prod, 3, datetime(2024, 2, 15, 12, 0))
+
+    informe = exportar_parquet(str(tmp_path), tamano_lote=2)
+
+    assert informe['conjuntos']['ventas'] == {'filas': 3, 'meses': ['2024-01', '2024-02']}
+    assert _meses(tmp_path, 'detalle_venta') == ['mes=2024-01', 'mes=2024-02']
+    febrero = pq.read_table(tmp_path / 'ventas' / 'mes=2024-02' / 'ventas-2024-02.parquet')
+    assert febrero.column('total').to_pylist() == [100, 300]
+    assert str(febrero.schema.field('fecha_venta').type) == 'timestamp[ms]'
+    assert pq.read_metadata(tmp_path / 'ventas' / 'mes=2024-02' / 'ventas-2024-02.parquet').row_group(0).column(0).compression == 'ZSTD'
+    assert pq.read_table(tmp_path / 'movimientos_clientes').num_rows == 1
+    assert pq.read_table(tmp_path / 'stock.parquet').column('cantidad').to_pylist() == [44]
+    assert pq.read_table(tmp_path / 'productos.parquet').column('nombre').to_pylist() == ["Yerba"]
+
+def test_exportacion_parquet_incremental_solo_reescribe_meses_nuevos(db_conn, tmp_path):
+    """El modo incremental deja intactos los meses anteriores al último exportado."""
+    id_prod = database.agregar_producto(Producto(nombre="Yerba", precio_venta=100, cantidad_stock=50))
+    _vender(id_prod, 1, datetime(2024, 1, 10))
+    _vender(id_prod, 1, datetime(2024, 2, 10))
+    exportar_parquet(str(tmp_path))
+    enero = tmp_path / 'ventas' / 'mes=2024-01' / 'ventas-2024-01.parquet'
+    modificado_enero = os.stat(enero).st_mtime_ns
+    os.utime(enero, ns=(modificado_enero - 10**9, modificado_enero - 10**9))
+
+    _vender(id_prod, 4, datetime(2024, 2, 20))
+    _vender(id_prod, 5, datetime(2024, 3, 1))
+    informe = exportar_parquet(str(tmp_path), incremental=True)
+
+    assert informe['conjuntos']['ventas'] == {'filas': 3, 'meses': ['2024-02', '2024-03']}
+    assert os.stat(enero).st_mtime_ns == modificado_enero - 10**9
+    assert pq.read_table(tmp_path / 'ventas').column('total').to_pylist() == [100, 100, 400, 500]
+
+def test_exportacion_parquet_fechas_no_iso_salen_nulas(db_conn, tmp_path):
+    """Un vencimiento o una fecha límite escritos a mano no frenan la exportación: salen como NULL."""
+    id_prod = database.agregar_producto(Producto(nombre="Yerba", precio_venta=100))
+    database.agregar_lote(id_prod, 5, "15/03/2025")
+    database.agregar_lote(id_prod, 2, "2025-04-01")
+    database.agregar_cliente(Cliente(nombre="Ana", dni="1", fecha_limite_pago="fin de mes"))
+
+    informe = exportar_parquet(str(tmp_path))
+
+    assert informe is not None
+    stock = pq.read_table(tmp_path / 'stock.parquet')
+    vencimientos = dict(zip(stock.column('cantidad').to_pylist(), stock.column('fecha_vencimiento').to_pylist()))
+    assert (vencimientos[5], str(vencimientos[2])) == (None, "2025-04-01")
+    assert pq.read_table(tmp_path / 'clientes.parquet').column('fecha_limite_pago').to_pylist() == [None]
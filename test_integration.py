@@ -467,16 +467,30 @@ def test_creacion_backup(db_conn, monkeypatch, tmp_path):
     mock_messagebox = MagicMock()
     monkeypatch.setattr('easyst.messagebox', mock_messagebox)
 
+    # La copia se hace en un hilo; lo reemplazamos por uno que ejecuta la tarea en el acto.
+    class HiloSincronico:
+        def __init__(self, target, daemon=None):
+            self.target = target
+        def start(self):
+            self.target()
+    monkeypatch.setattr('easyst.threading.Thread', HiloSincronico)
+    monkeypatch.setattr('easyst.BackupProgressWindow', MagicMock())
+
     # --- 2. ACCIÓN ---
     from easyst import App
     # En lugar de instanciar la clase App (lo que causa problemas con Tkinter),
-    # llamamos directamente al método `create_backup` de la clase.
-    # Pasamos `None` como `self` porque el método no lo usa internamente.
-    App.create_backup(None)
+    # usamos un objeto simulado que delega en los métodos reales de la clase.
+    app_simulada = MagicMock()
+    app_simulada.after = lambda delay, func, *args: func(*args)
+    app_simulada.iniciar_backup_en_segundo_plano = lambda ruta: App.iniciar_backup_en_segundo_plano(app_simulada, ruta)
+    app_simulada.finalizar_backup = lambda *args: App.finalizar_backup(app_simulada, *args)
+    App.create_backup(app_simulada)
 
     # --- 3. VERIFICACIÓN ---
     # Verificar que se intentó crear el backup en la ruta correcta.
-    mock_backup.assert_called_once_with(str(ruta_backup_simulada))
+    mock_backup.assert_called_once()
+    assert mock_backup.call_args.args[0] == str(ruta_backup_simulada)
+    assert mock_backup.call_args.kwargs['comprimir'] is False
     # Verificar que se mostró un mensaje de éxito.
     mock_messagebox.showinfo.assert_called_once()
 
@@ -0,0 +1,82 @@
+"""
+Pruebas del motor de promociones (promociones.py).
+Las reglas se arman en memoria salvo en la prueba de persistencia, que usa una BD en memoria.
+"""
+from datetime import datetime
+
+import pytest
+
+import database
+from models import Producto, Venta, DetalleVenta, Promocion
+from promociones import MotorPromociones, CarritoPromociones, obtener_motor_promociones
+
+HORA_PICO = datetime(2024, 5, 1, 19, 0)
+FUERA_DE_HORA = datetime(2024, 5, 1, 21, 0)
+
+REGLAS = [
+    Promocion("2x1 Gaseosas", 'nxm', {1: 1, 2: 1}, cantidad=2, valor=1, id_promocion=1),
+    Promocion("3ra al 50%", 'unidad_n', {3: 1}, cantidad=3, valor=50, id_promocion=2),
+    Promocion("Combo Fernet", 'combo', {4: 1, 5: 2}, valor=100, prioridad=5, id_promocion=3),
+    Promocion("Happy Hour", 'porcentaje', {4: 1, 6: 1}, valor=10, hora_desde="18:00", hora_hasta="20:00", id_promocion=4),
+]
+
+
+def test_motor_aplica_cada_tipo_sin_repetir_unidades():
+    """Cada tipo de regla calcula su descuento y una unidad usada por una promoción no recibe otra."""
+    motor = MotorPromociones(REGLAS)
+    lineas = {1: (3, 100), 2: (2, 80), 3: (7, 10), 4: (3, 60), 5: (5, 30), 6: (1, 50)}
+
+    descuentos = motor.evaluar(lineas, HORA_PICO)
+
+    # 2x1 mezclando productos: grupos (100, 100) y (100, 80); la unidad más barata de cada grupo es gratis.
+    assert descuentos[1] == [(1, 100)] and descuentos[2] == [(1, 80)]
+    assert descuentos[3] == [(2, 10)]                      # dos grupos de 3: 2 x $10 al 50%
+    assert descuentos[4] == [(3, 20), (4, 6)]              # 2 combos primero (prioridad), la 3ra unidad va al happy hour
+    assert descuentos[5] == [(3, 20)]
+    assert descuentos[6] == [(4, 5)]
+
+    assert 6 not in motor.evaluar(lineas, FUERA_DE_HORA)
+
+def test_carrito_incremental_coincide_con_la_evaluacion_completa():
+    """Los cambios línea a línea (y el paso del horario) dan lo mismo que evaluar el carrito entero."""
+    motor = MotorPromociones(REGLAS)
+    carrito = CarritoPromociones(motor)
+
+    carrito.actualizar({4: (1, 60), 6: (2, 50)}, HORA_PICO)
+    assert carrito.descuentos == {4: [(4, 6)], 6: [(4, 10)]}
+
+    carrito.actualizar({5: (2, 30)}, HORA_PICO)
+    assert carrito.descuentos == {4: [(3, 10)], 5: [(3, 10)], 6: [(4, 10)]}
+
+    # Sin cambios en el carrito, el fin del happy hour igual se refleja.
+    assert carrito.actualizar({}, FUERA_DE_HORA) == {4: [(3, 10)], 5: [(3, 10)]}
+
+    lineas = {1: (5, 100), 4: (1, 60), 5: (2, 30)}
+    assert carrito.sincronizar(lineas, FUERA_DE_HORA) == motor.evaluar(lineas, FUERA_DE_HORA)
+    assert carrito.actualizar({5: None}, FUERA_DE_HORA) == {1: [(1, 200)]}
+
+
+def test_promociones_persistidas_y_aplicadas_en_la_venta(db_conn):
+    """El motor se compila desde la BD, se recompila al editar una regla y la venta guarda lo aplicado."""
+    id_gaseosa = database.agregar_producto(Producto(nombre="Gaseosa", precio_venta=100, cantidad_stock=10))
+    promocion = Promocion("2x1 Gaseosa", 'nxm', {id_gaseosa: 1}, cantidad=2, valor=1)
+    id_promocion = database.agregar_promocion(promocion)
+
+    carrito = CarritoPromociones()
+    assert carrito.actualizar({id_gaseosa: (3, 100)}) == {id_gaseosa: [(id_promocion, 100)]}
+
+    promocion.cantidad, promocion.valor = 3, 2
+    assert database.actualizar_promocion(promocion)
+    assert obtener_motor_promociones().evaluar({id_gaseosa: (3, 100)}) == {id_gaseosa: [(id_promocion, 100)]}
+    assert carrito.actualizar({id_gaseosa: (2, 100)}) == {}
+
+    detalle = DetalleVenta(id_producto=id_gaseosa, cantidad=3, precio_unitario=100, descuento_promocion=100, promociones=[(id_promocion, 100)])
+    venta = Venta(fecha_venta="2024-05-01 10:00:00", forma_pago="Efectivo")
+    venta.detalles.append(detalle)
+    venta.calcular_total()
+    id_venta = database.registrar_venta(venta)
+
+    assert venta.total == 200
+    guardada = database.obtener_venta_por_id(id_venta)
+    assert (guardada.detalles[0].descuento_promocion, guardada.detalles[0].promociones) == (100, [(id_promocion, 100)])
+    assert [(p['nombre'], p['monto']) for p in database.obtener_promociones_aplicadas(id_venta)] == [("2x1 Gaseosa", 100)]
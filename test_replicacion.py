@@ -0,0 +1,141 @@
+"""
+Pruebas del replicador continuo de WAL (replicacion.py).
+Usan una BD en archivo (el modo WAL no existe en memoria) y un DestinoDirectorioLocal como réplica.
+"""
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from replicacion import DestinoDirectorioLocal, DestinoReplica, ReplicadorWAL, listar_generaciones, restaurar_a_momento
+
+
+@pytest.fixture
+def bd_en_archivo(tmp_path):
+    ruta = str(tmp_path / "easyst.db")
+    conn = sqlite3.connect(ruta)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA wal_autocheckpoint=0")
+    conn.execute("CREATE TABLE ventas (id INTEGER PRIMARY KEY, total REAL)")
+    conn.commit()
+    yield ruta, conn
+    conn.close()
+
+def _registrar(conn, *totales):
+    conn.executemany("INSERT INTO ventas (total) VALUES (?)", [(t,) for t in totales])
+    conn.commit()
+
+def _totales(ruta):
+    conn = sqlite3.connect(ruta)
+    try:
+        return [fila[0] for fila in conn.execute("SELECT total FROM ventas ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def test_replicacion_restaura_a_un_momento_dado(bd_en_archivo, tmp_path):
+    """Los segmentos WAL enviados permiten reconstruir la BD en cualquier momento posterior al snapshot."""
+    ruta, conn = bd_en_archivo
+    destino = DestinoDirectorioLocal(str(tmp_path / "replica"))
+    replicador = ReplicadorWAL(destino, ruta_bd=ruta)
+    assert replicador.abrir()
+    try:
+        _registrar(conn, 100)
+        replicador.sincronizar()
+        time.sleep(0.01)
+        momento_intermedio = datetime.now()
+        time.sleep(0.01)
+        _registrar(conn, 200, 300)
+        replicador.sincronizar()
+    finally:
+        replicador.cerrar()
+
+    assert len(listar_generaciones(destino)) == 1
+    assert replicador.estado()['retraso_segundos'] is not None
+
+    ruta_intermedia = str(tmp_path / "intermedia.db")
+    assert restaurar_a_momento(destino, ruta_intermedia, momento_intermedio) == ruta_intermedia
+    assert _totales(ruta_intermedia) == [100]
+
+    ruta_final = str(tmp_path / "final.db")
+    assert restaurar_a_momento(destino, ruta_final) == ruta_final
+    assert _totales(ruta_final) == [100, 200, 300]
+
+def test_replicacion_sigue_la_misma_generacion_tras_reiniciar_el_wal(bd_en_archivo, tmp_path):
+    """Tras el checkpoint del replicador el WAL se reinicia: se abre un índice nuevo sin perder frames ni tomar otro snapshot."""
+    ruta, conn = bd_en_archivo
+    destino = DestinoDirectorioLocal(str(tmp_path / "replica"))
+    replicador = ReplicadorWAL(destino, ruta_bd=ruta, umbral_checkpoint_bytes=0)
+    assert replicador.abrir()
+    try:
+        replicador.sincronizar()
+        generacion = replicador.generacion
+        for total in (10, 20, 30):
+            _registrar(conn, total)
+            replicador.sincronizar()
+    finally:
+        replicador.cerrar()
+
+    assert replicador.generacion == generacion
+    assert replicador.indice >= 2
+    assert listar_generaciones(destino) == [generacion]
+
+    ruta_restaurada = str(tmp_path / "restaurada.db")
+    assert restaurar_a_momento(destino, ruta_restaurada) == ruta_restaurada
+    assert _totales(ruta_restaurada) == [10, 20, 30]
+
+def test_replicacion_no_bloquea_ventas_mientras_escribe_en_el_destino(bd_en_archivo, tmp_path):
+    """El envío al destino ocurre sin el bloqueo de escritura: se puede vender mientras el destino está lento."""
+    ruta, conn = bd_en_archivo
+
+    class DestinoLento(DestinoDirectorioLocal):
+        def __init__(self, directorio):
+            super().__init__(directorio)
+            self.escribiendo = threading.Event()
+            self.continuar = threading.Event()
+
+        def escribir(self, clave, datos):
+            self.escribiendo.set()
+            assert self.continuar.wait(5)
+            super().escribir(clave, datos)
+
+    destino = DestinoLento(str(tmp_path / "replica"))
+    replicador = ReplicadorWAL(destino, ruta_bd=ruta)
+    assert replicador.abrir()
+    try:
+        destino.continuar.set()
+        replicador.sincronizar()
+        destino.continuar.clear()
+        destino.escribiendo.clear()
+        _registrar(conn, 100)
+        hilo = threading.Thread(target=replicador.sincronizar)
+        hilo.start()
+        assert destino.escribiendo.wait(5)
+        venta = sqlite3.connect(ruta, timeout=0.2)
+        try:
+            venta.execute("INSERT INTO ventas (total) VALUES (200)")
+            venta.commit()
+        finally:
+            venta.close()
+        destino.continuar.set()
+        hilo.join(5)
+        replicador.sincronizar()
+    finally:
+        destino.continuar.set()
+        replicador.cerrar()
+
+    ruta_final = str(tmp_path / "final.db")
+    assert restaurar_a_momento(destino, ruta_final) == ruta_final
+    assert _totales(ruta_final) == [100, 200]
+
+def test_destino_incompleto_falla_al_crearse():
+    """Un destino que no implementa toda la interfaz se rechaza al instanciarlo."""
+    class DestinoSinEliminar(DestinoReplica):
+        def escribir(self, clave, datos): pass
+        def leer(self, clave): return b''
+        def listar(self, prefijo=''): return []
+
+    with pytest.raises(TypeError):
+        DestinoSinEliminar()
@@ -0,0 +1,115 @@
+"""
+Pruebas de la sincronización de listas de precios de proveedores (sincronizacion_proveedores.py).
+Usan una BD en memoria y listas escritas en un directorio temporal.
+"""
+
+import pytest
+from openpyxl import Workbook
+
+import database
+from models import Producto
+from sincronizacion_proveedores import sincronizar_lista_proveedor, obtener_proveedores_sincronizados
+
+
+def _precio(conn, id_producto):
+    return conn.execute("SELECT precio_venta FROM productos WHERE id_producto = ?", (id_producto,)).fetchone()[0]
+
+
+def test_sincronizacion_aplica_solo_los_cambios(db_conn, tmp_path):
+    """La primera lista asocia y crea productos; la segunda solo cambia precios, altas y bajas."""
+    id_yerba = database.agregar_producto(Producto(nombre="Yerba Suave 1kg", precio_venta=1000, codigo_barras="779001"))
+    id_azucar = database.agregar_producto(Producto(nombre="Azúcar", precio_venta=500))
+    ruta = tmp_path / "lista.csv"
+    ruta.write_text(
+        "codigo_barras;nombre;precio\n"
+        "779001;YERBA SUAVE X 1 KG;1.000,00\n"
+        ";azucar;550\n"
+        "779003;Fideos Tirabuzón;800\n"
+        ";;100\n",
+        encoding="utf-8"
+    )
+
+    informe = sincronizar_lista_proveedor(str(ruta), "Distribuidora Norte")
+
+    assert informe['aplicado'] and informe['lineas'] == 4 and informe['cantidad_rechazadas'] == 1
+    assert [c['id_producto'] for c in informe['cambios_precio']] == [id_azucar]
+    assert [n['nombre'] for n in informe['nuevos']] == ["Fideos Tirabuzón"]
+    assert _precio(db_conn, id_azucar) == 550
+    assert database.obtener_historial_precios(id_azucar)[-1]['precio'] == 550
+    id_fideos = informe['nuevos'][0]['id_producto']
+
+    # El comercio renombra el producto: la fila ya asociada sigue apuntando al mismo.
+    with db_conn:
+        db_conn.execute("UPDATE productos SET nombre = 'Azúcar Ledesma' WHERE id_producto = ?", (id_azucar,))
+    ruta.write_text(
+        "codigo_barras;nombre;precio\n"
+        "779001;YERBA SUAVE X 1 KG;1.000,00\n"
+        ";azucar;600\n"
+        "779004;Arroz;700\n",
+        encoding="utf-8"
+    )
+    informe = sincronizar_lista_proveedor(str(ruta), "Distribuidora Norte")
+
+    assert informe['sin_cambios'] == 1
+    assert informe['cambios_precio'] == [{'id_producto': id_azucar, 'nombre': 'Azúcar Ledesma', 'precio_anterior': 550, 'precio_nuevo': 600}]
+    assert [n['nombre'] for n in informe['nuevos']] == ["Arroz"]
+    assert [(d['id_producto'], d['clave']) for d in informe['discontinuados']] == [(id_fideos, "779003")]
+    assert _precio(db_conn, id_yerba) == 1000
+    assert obtener_proveedores_sincronizados()[0][0::2] == ("Distribuidora Norte", 3)
+
+def test_sincronizacion_sin_aplicar_no_modifica_nada(db_conn, tmp_path):
+    """Con aplicar=False se obtiene el informe completo y la BD queda igual (también desde Excel)."""
+    id_yerba = database.agregar_producto(Producto(nombre="Yerba", precio_venta=1000, codigo_barras="779001"))
+    libro = Workbook()
+    libro.active.append(["Codigo_Barras", "Nombre", "Precio_Venta"])
+    libro.active.append([779001, "Yerba", 1200])
+    libro.active.append([None, "Galletitas", 300.5])
+    ruta = tmp_path / "lista.xlsx"
+    libro.save(ruta)
+
+    informe = sincronizar_lista_proveedor(str(ruta), "Mayorista", aplicar=False)
+
+    assert not informe['aplicado']
+    assert informe['cambios_precio'][0]['precio_nuevo'] == 1200 and len(informe['nuevos']) == 1
+    assert _precio(db_conn, id_yerba) == 1000
+    assert db_conn.execute("SELECT COUNT(*) FROM productos").fetchone()[0] == 1
+    assert db_conn.execute("SELECT COUNT(*) FROM listas_proveedores").fetchone()[0] == 0
+    assert sincronizar_lista_proveedor(str(tmp_path / "no_existe.csv"), "Mayorista") is None
+
+def test_sincronizacion_lee_los_miles_con_punto_y_rechaza_saltos_de_precio(db_conn, tmp_path):
+    """En una lista separada por ';', '2.500' son dos mil quinientos; un precio 100 veces menor no se aplica."""
+    id_aceite = database.agregar_producto(Producto(nombre="Aceite", precio_venta=2400, codigo_barras="7790"))
+    id_arroz = database.agregar_producto(Producto(nombre="Arroz", precio_venta=1200, codigo_barras="7791"))
+    id_sal = database.agregar_producto(Producto(nombre="Sal", precio_venta=900, codigo_barras="7792"))
+    ruta = tmp_path / "lista.csv"
+    ruta.write_text("codigo_barras;nombre;precio\n7790;Aceite;2.500\n7791;Arroz;1.250\n7792;Sal;9,50\n", encoding="utf-8")
+
+    informe = sincronizar_lista_proveedor(str(ruta), "Mayorista")
+
+    assert [(c['id_producto'], c['precio_nuevo']) for c in informe['cambios_precio']] == [(id_aceite, 2500), (id_arroz, 1250)]
+    assert informe['cantidad_rechazadas'] == 1 and informe['rechazadas'][0][0] == 4
+    assert (_precio(db_conn, id_aceite), _precio(db_conn, id_arroz), _precio(db_conn, id_sal)) == (2500, 1250, 900)
+
+def test_numero_rechaza_los_valores_ambiguos():
+    """El separador decimal del archivo decide; lo que no encaja con él no se lee con otra escala."""
+    assert database._numero("2.500") == database._numero("2.500", separador_decimal=',') == 2500
+    assert database._numero("$ 1.250,50") == database._numero("1,250.50") == 1250.5
+    assert database._numero("2.500", separador_decimal='.') == 2.5
+    for texto, separador in (("1,250", None), ("2.5", ','), ("1.250,50", '.')):
+        with pytest.raises(ValueError):
+            database._numero(texto, separador_decimal=separador)
+
+def test_sincronizacion_sin_cambios_actualiza_la_fecha_del_proveedor(db_conn, tmp_path):
+    """Aplicar una lista igual a la anterior no toca las filas, pero sí la fecha de última sincronización."""
+    ruta = tmp_path / "lista.csv"
+    ruta.write_text("codigo_barras;nombre;precio\n779001;Yerba;1000\n", encoding="utf-8")
+    sincronizar_lista_proveedor(str(ruta), "Mayorista")
+    with db_conn:
+        db_conn.execute("UPDATE listas_proveedores SET fecha_sincronizacion = '2020-01-01 00:00:00'")
+        db_conn.execute("UPDATE proveedores_sincronizados SET ultima_sincronizacion = '2020-01-01 00:00:00'")
+
+    assert sincronizar_lista_proveedor(str(ruta), "Mayorista", aplicar=False)['sin_cambios'] == 1
+    assert obtener_proveedores_sincronizados()[0][1] == '2020-01-01 00:00:00'
+    assert sincronizar_lista_proveedor(str(ruta), "Mayorista")['sin_cambios'] == 1
+    assert obtener_proveedores_sincronizados()[0][1] > '2020-01-01 00:00:00'
+    assert db_conn.execute("SELECT fecha_sincronizacion FROM listas_proveedores").fetchone()[0] == '2020-01-01 00:00:00'
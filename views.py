@@ -11,13 +11,16 @@ import configparser
 import sys
 import threading
 import pandas as pd
+from openpyxl import Workbook
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from escpos.printer import Usb
-from database import (obtener_productos, agregar_producto, obtener_producto_por_codigo_barras, registrar_venta, obtener_producto_por_id, actualizar_producto, obtener_clientes, agregar_cliente, actualizar_cliente, obtener_cliente_por_id, realizar_pago_cliente, obtener_ventas_por_rango_de_fechas, obtener_lotes_por_producto, actualizar_lote, agregar_lote, obtener_movimientos_cliente, obtener_pagos_recibidos_por_rango, inicializar_bd, obtener_sugerencias_reposicion, obtener_producto_por_nombre, obtener_venta_por_id, obtener_productos_por_ids)
-from models import Producto, Venta, DetalleVenta, Cliente
+from database import (obtener_productos, iter_productos, iter_clientes, agregar_producto, resolver_codigo_barras, registrar_venta, obtener_producto_por_id, actualizar_producto, obtener_clientes, agregar_cliente, actualizar_cliente, obtener_cliente_por_id, realizar_pago_cliente, obtener_lotes_por_producto, actualizar_lote, agregar_lote, agregar_lotes, obtener_movimientos_cliente, obtener_pagos_recibidos_por_rango, inicializar_bd, obtener_producto_por_nombre, obtener_venta_por_id, obtener_productos_por_ids, previsualizar_actualizacion_precios, actualizar_precios_masivo, obtener_ventas_df, iter_ventas_df, obtener_sugerencias_reposicion_df, refrescar_snapshot_reportes_en_segundo_plano, snapshot_reportes_vencido, obtener_antiguedad_snapshot_reportes, actualizar_vencimientos, obtener_clientes_vencidos, obtener_antiguedad_deuda_df, obtener_margenes_df, agregar_promocion, actualizar_promocion, obtener_promociones, obtener_listas_precios, agregar_lista_precios, actualizar_lista_precios, obtener_precios_lista, guardar_precios_lista, resolver_precios_lista, abrir_turno, cerrar_turno, obtener_turno_abierto, obtener_reporte_turno, obtener_turnos, obtener_usuarios_turnos, buscar_ventas, TAMANO_PAGINA_BUSQUEDA_VENTAS, iniciar_conteo, obtener_conteo_abierto, registrar_lectura_conteo, corregir_cantidad_conteo, obtener_items_conteo, obtener_diferencias_conteo, aplicar_conteo, cancelar_conteo, crear_orden_compra_desde_sugerencias, obtener_ordenes_compra, obtener_items_orden_compra, anular_orden_compra, recibir_mercaderia)
+from models import Producto, Venta, DetalleVenta, Cliente, Promocion
+from promociones import CarritoPromociones, compilar_regla
+from exportacion_parquet import exportar_parquet, parquet_disponible
+from sincronizacion_proveedores import sincronizar_lista_proveedor, obtener_proveedores_sincronizados
 from datetime import datetime, timedelta
-from collections import defaultdict
 
 def resource_path(relative_path):
     try:
@@ -36,6 +39,9 @@ MODO_PRUEBA_PAGOS = config.getboolean('MercadoPago', 'ModoPrueba', fallback=True
 NOMBRE_NEGOCIO = config.get('Negocio', 'Nombre', fallback='EasySt System')
 
 PERMITIR_STOCK_NEGATIVO = config.getboolean('Negocio', 'PermitirStockNegativo', fallback=False)
+# Al escanear el código de un lote, vender de ese lote en lugar del que vence primero.
+VENDER_DEL_LOTE_ESCANEADO = config.getboolean('Negocio', 'VenderDelLoteEscaneado', fallback=False)
+DIAS_AVISO_VENCIMIENTO = config.getint('Negocio', 'DiasAvisoVencimiento', fallback=20)
 
 PRINTER_VENDOR_ID = config.get('Impresora', 'idVendor', fallback=None)
 PRINTER_PRODUCT_ID = config.get('Impresora', 'idProduct', fallback=None)
@@ -92,6 +98,22 @@ class ToolTip:
                 return
         self.hide_tooltip()
 
+def formatear_fecha(fecha_iso):
+    # 'AAAA-MM-DD' -> 'DD/MM/AAAA' sin pasar por strptime (se usa por fila en listados grandes).
+    return f"{fecha_iso[8:10]}/{fecha_iso[5:7]}/{fecha_iso[0:4]}"
+
+def exportar_filas_a_excel(filepath, encabezados, filas):
+    # Workbook en modo write_only: las filas se vuelcan a disco a medida que llegan.
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet()
+    hoja.append(encabezados)
+    cantidad = 0
+    for fila in filas:
+        hoja.append(fila)
+        cantidad += 1
+    libro.save(filepath)
+    return cantidad
+
 def generar_texto_ticket(venta_obj: Venta):
     ticket_content = f"         *** {NOMBRE_NEGOCIO} ***\n\n"
     ticket_content += f"Fecha: {datetime.strptime(venta_obj.fecha_venta, '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y %H:%M')}\n"
@@ -108,6 +130,8 @@ def generar_texto_ticket(venta_obj: Venta):
             detalle.cantidad, nombre_prod, detalle.precio_unitario, detalle.descuento, detalle.subtotal
         )
         ticket_content += linea
+        if detalle.descuento_promocion:
+            ticket_content += "{:<5} {:<26} {:>7.2f}\n".format("", "  Promoción", -detalle.descuento_promocion)
     
     ticket_content += "----------------------------------------\n"
     ticket_content += f"TOTAL: ${venta_obj.total:.2f}\n\n"
@@ -146,7 +170,13 @@ class StockView(ttk.Frame):
         poco_stock_check.pack(side="left", padx=10)
 
         ttk.Button(controls_frame, text="Buscar", command=self.cargar_productos).pack(side="left", padx=5)
+        ttk.Button(controls_frame, text="Exportar a Excel", command=self.exportar_a_excel).pack(side="right", padx=5)
         ttk.Button(controls_frame, text="Importar desde Excel", command=self.importar_desde_excel).pack(side="right", padx=5)
+        ttk.Button(controls_frame, text="Actualizar Precios", command=self.abrir_actualizacion_masiva_precios).pack(side="right", padx=5)
+        ttk.Button(controls_frame, text="Conteo de Inventario", command=self.abrir_conteo_inventario).pack(side="right", padx=5)
+        ttk.Button(controls_frame, text="Órdenes de Compra", command=lambda: OrdenesCompraWindow(self, callback=self.cargar_productos)).pack(side="right", padx=5)
+        ttk.Button(controls_frame, text="Lista de Proveedor", command=lambda: SincronizacionProveedorWindow(self, callback=self.cargar_productos)).pack(side="right", padx=5)
+        ttk.Button(controls_frame, text="Promociones", command=lambda: PromocionesWindow(self)).pack(side="right", padx=5)
         ttk.Button(controls_frame, text="Añadir Producto", command=self.abrir_ventana_producto).pack(side="right", padx=5)
         self.gestionar_lotes_btn = ttk.Button(controls_frame, text="Gestionar Lotes", command=self.abrir_ventana_gestion_lotes, state="disabled")
         self.gestionar_lotes_btn.pack(side="right", padx=5)
@@ -203,13 +233,10 @@ class StockView(ttk.Frame):
                     tags = ('poco_stock',)
 
                 if prod.vencimiento_proximo:
-                    vencimiento_proximo = datetime.strptime(prod.vencimiento_proximo, "%Y-%m-%d").strftime("%d/%m/%Y")
-                    fecha_mas_cercana = datetime.strptime(prod.vencimiento_proximo, "%Y-%m-%d").date()
-                    hoy = datetime.now().date()
-                    dias_restantes = (fecha_mas_cercana - hoy).days
-                    if dias_restantes < 0:
+                    vencimiento_proximo = formatear_fecha(prod.vencimiento_proximo)
+                    if prod.dias_para_vencer < 0:
                         tags += ('vencido',)
-                    elif dias_restantes <= 20:
+                    elif prod.dias_para_vencer <= DIAS_AVISO_VENCIMIENTO:
                         tags += ('proximo_vencer',)
                 self.tree.insert("", "end", values=(
                     prod.id_producto,
@@ -234,7 +261,7 @@ class StockView(ttk.Frame):
         id_producto_str = selection[0]
         id_producto = int(id_producto_str)
 
-        producto_a_editar = obtener_producto_por_id(id_producto)
+        producto_a_editar = obtener_producto_por_id(id_producto, usar_cache=False)
         if not producto_a_editar:
             messagebox.showerror("Error", "No se pudo encontrar el producto para editar.")
             return
@@ -254,9 +281,40 @@ class StockView(ttk.Frame):
         
         LoteManagementWindow(self, producto=producto, callback=self.cargar_productos)
 
+    def abrir_conteo_inventario(self):
+        # Si quedó un conteo sin terminar se retoma; si no, se ofrece empezar uno.
+        conteo = obtener_conteo_abierto()
+        if conteo is None:
+            if not messagebox.askyesno("Conteo de Inventario", "No hay un conteo en curso. ¿Desea iniciar uno nuevo?", parent=self):
+                return
+            if iniciar_conteo(getattr(self.winfo_toplevel(), 'current_user', None)) is None:
+                messagebox.showerror("Error", "No se pudo iniciar el conteo.", parent=self)
+                return
+            conteo = obtener_conteo_abierto()
+        ConteoInventarioWindow(self, conteo, callback=self.cargar_productos)
+
     def on_product_select(self, event=None):
         self.gestionar_lotes_btn.config(state="normal" if self.tree.selection() else "disabled")
 
+    def exportar_a_excel(self):
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel Files", "*.xlsx")],
+            title="Guardar Stock"
+        )
+        if not filepath:
+            return
+        # Se exporta con los mismos filtros que la lista, leyendo del cursor de a lotes.
+        filas = (
+            (p.id_producto, p.nombre, p.codigo_barras, p.precio_venta, p.cantidad_stock, p.num_lotes, p.vencimiento_proximo)
+            for p in iter_productos(nombre_like=self.search_var.get(), solo_poco_stock=self.poco_stock_var.get())
+        )
+        try:
+            exportar_filas_a_excel(filepath, ["ID", "Nombre", "Código de Barras", "Precio", "Stock", "Lotes", "Próximo Vencimiento"], filas)
+            messagebox.showinfo("Exportar", "Stock exportado con éxito.", parent=self)
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo exportar: {e}", parent=self)
+
     def importar_desde_excel(self):
         filepath = filedialog.askopenfilename(
             title="Seleccionar archivo de Excel para importar",
@@ -288,6 +346,25 @@ class StockView(ttk.Frame):
                     if isinstance(btn, ttk.Button):
                         btn.config(state="disabled")
 
+    def abrir_actualizacion_masiva_precios(self):
+        dialog = BulkPriceDialog(self, "Actualización Masiva de Precios", self.search_var.get().strip(), self.poco_stock_var.get())
+        if not dialog.result:
+            return
+
+        vista_previa = previsualizar_actualizacion_precios(**dialog.result)
+        if vista_previa['cantidad'] == 0:
+            messagebox.showinfo("Sin Cambios", "Ningún producto cambia de precio con esos criterios.", parent=self)
+            return
+        if not messagebox.askyesno("Confirmar Actualización", f"Se actualizará el precio de {vista_previa['cantidad']} productos.\n\n¿Desea continuar?", parent=self):
+            return
+
+        actualizados = actualizar_precios_masivo(**dialog.result)
+        if actualizados is None:
+            messagebox.showerror("Error", "No se pudieron actualizar los precios. No se modificó ningún producto.", parent=self)
+        else:
+            messagebox.showinfo("Precios Actualizados", f"Se actualizaron {actualizados} productos.", parent=self)
+            self.cargar_productos()
+
     def stop_import_feedback(self):
         self.status_var.set("")
         if hasattr(self, 'status_frame') and self.status_frame.winfo_exists():
@@ -315,6 +392,8 @@ class StockView(ttk.Frame):
             exitosos = 0
             fallidos = 0
             errores_detalle = []
+            # Los lotes de productos existentes se reciben juntos al final, en una sola transacción.
+            lotes_recibidos = []
 
             for index, row in df.iterrows():
                 try:
@@ -326,6 +405,7 @@ class StockView(ttk.Frame):
 
                     codigo_barras = str(row['codigo_barras']) if 'codigo_barras' in row and pd.notna(row['codigo_barras']) else None
                     cantidad_stock = int(row['cantidad_stock']) if 'cantidad_stock' in row and pd.notna(row['cantidad_stock']) else 0
+                    costo_unitario = float(row['costo_unitario']) if 'costo_unitario' in row and pd.notna(row['costo_unitario']) else None
                     fecha_vencimiento = None
                     if 'fecha_vencimiento' in row and pd.notna(row['fecha_vencimiento']):
                         if isinstance(row['fecha_vencimiento'], datetime):
@@ -336,10 +416,7 @@ class StockView(ttk.Frame):
                     producto_existente = obtener_producto_por_nombre(nombre)
 
                     if producto_existente:
-                        if agregar_lote(producto_existente.id_producto, cantidad_stock, fecha_vencimiento, codigo_barras):
-                            exitosos += 1
-                        else:
-                            raise Exception("No se pudo añadir el lote al producto existente.")
+                        lotes_recibidos.append((producto_existente.id_producto, cantidad_stock, fecha_vencimiento, codigo_barras, costo_unitario))
                     else:
                         volumen = float(row['volumen']) if 'volumen' in row and pd.notna(row['volumen']) else None
                         descripcion = str(row['descripcion']) if 'descripcion' in row and pd.notna(row['descripcion']) else None
@@ -351,7 +428,8 @@ class StockView(ttk.Frame):
                             codigo_barras=codigo_barras,
                             volumen=volumen,
                             descripcion=descripcion,
-                            fecha_vencimiento=fecha_vencimiento
+                            fecha_vencimiento=fecha_vencimiento,
+                            costo_unitario=costo_unitario
                         )
                         if agregar_producto(nuevo_producto):
                             exitosos += 1
@@ -366,6 +444,13 @@ class StockView(ttk.Frame):
                     fallidos += 1
                     errores_detalle.append(f"Fila {index + 2}: {row.get('nombre', 'Sin Nombre')} - Error: {e}")
 
+            if lotes_recibidos:
+                if agregar_lotes(lotes_recibidos):
+                    exitosos += len(lotes_recibidos)
+                else:
+                    fallidos += len(lotes_recibidos)
+                    errores_detalle.append(f"No se pudieron añadir los {len(lotes_recibidos)} lotes de productos existentes.")
+
             mensaje_final = f"Importación completada.\n\nLotes importados/creados: {exitosos}\nFilas con errores: {fallidos}"
             if fallidos > 0:
                 mensaje_final += "\n\nDetalle de errores:\n" + "\n".join(errores_detalle[:5])
@@ -402,11 +487,19 @@ class ClientesView(ttk.Frame):
         )
         con_deuda_check.pack(side="left", padx=10)
 
+        self.solo_vencidos_var = tk.BooleanVar()
+        ttk.Checkbutton(
+            controls_frame, text="Mostrar solo vencidos",
+            variable=self.solo_vencidos_var, command=self.cargar_clientes
+        ).pack(side="left", padx=10)
+
         ttk.Button(controls_frame, text="Buscar", command=self.cargar_clientes).pack(side="left", padx=5)
         self.edit_client_btn = ttk.Button(controls_frame, text="Editar Cliente", command=self.abrir_ventana_edicion_cliente, state="disabled")
         self.edit_client_btn.pack(side="right", padx=5)
         ttk.Button(controls_frame, text="Añadir Cliente", command=self.abrir_ventana_cliente).pack(side="right", padx=5)
         ttk.Button(controls_frame, text="Registrar Pago", command=self.registrar_pago).pack(side="right")
+        ttk.Button(controls_frame, text="Exportar a Excel", command=self.exportar_a_excel).pack(side="right", padx=5)
+        ttk.Button(controls_frame, text="Listas de Precios", command=lambda: ListasPreciosWindow(self, self.cargar_clientes)).pack(side="right", padx=5)
 
         tree_frame = ttk.Frame(self, padding=(10, 0, 10, 10))
         tree_frame.pack(side="top", fill="both", expand=True, padx=10, pady=(0, 10))
@@ -432,6 +525,24 @@ class ClientesView(ttk.Frame):
 
         self.tree.tag_configure('vencido', background='#FFDDDD')
 
+    def exportar_a_excel(self):
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel Files", "*.xlsx")],
+            title="Guardar Clientes"
+        )
+        if not filepath:
+            return
+        filas = (
+            (c.id_cliente, c.nombre, c.dni, c.saldo_deudor, c.fecha_limite_pago)
+            for c in iter_clientes(nombre_o_dni=self.search_var.get(), solo_con_deuda=self.con_deuda_var.get())
+        )
+        try:
+            exportar_filas_a_excel(filepath, ["ID", "Nombre y Apellido", "DNI", "Saldo Deudor", "Fecha Límite de Pago"], filas)
+            messagebox.showinfo("Exportar", "Clientes exportados con éxito.", parent=self)
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo exportar: {e}", parent=self)
+
     def cargar_clientes(self):
         for item in self.tree.get_children():
             self.tree.delete(item)
@@ -440,19 +551,18 @@ class ClientesView(ttk.Frame):
         solo_con_deuda = self.con_deuda_var.get()
         try:
             clientes = obtener_clientes(nombre_o_dni=query, solo_con_deuda=solo_con_deuda)
+            ids_vencidos = {c['id_cliente'] for c in obtener_clientes_vencidos()}
+            if self.solo_vencidos_var.get():
+                clientes = [c for c in clientes if c.id_cliente in ids_vencidos]
             for cliente in clientes:
-                tags = ()
-                if cliente.fecha_limite_pago and cliente.saldo_deudor > 0:
-                    fecha_limite = datetime.strptime(cliente.fecha_limite_pago, "%Y-%m-%d").date()
-                    if fecha_limite < datetime.now().date():
-                        tags = ('vencido',)
+                tags = ('vencido',) if cliente.id_cliente in ids_vencidos else ()
 
                 self.tree.insert("", "end", values=(
                     cliente.id_cliente,
                     cliente.nombre,
                     cliente.dni or "-",
                     f"${cliente.saldo_deudor:.2f}",
-                    datetime.strptime(cliente.fecha_limite_pago, "%Y-%m-%d").strftime("%d/%m/%Y") if cliente.fecha_limite_pago else "-"
+                    formatear_fecha(cliente.fecha_limite_pago) if cliente.fecha_limite_pago else "-"
                 ), iid=cliente.id_cliente, tags=tags)
         except Exception as e:
             messagebox.showerror("Error de Base de Datos", f"No se pudieron cargar los clientes: {e}")
@@ -507,11 +617,11 @@ class ClientesView(ttk.Frame):
             return
 
         dialog = PaymentDialog(self, cliente=cliente)
-        monto_pago = dialog.result
 
-        if monto_pago:
+        if dialog.result:
+            monto_pago, forma_pago = dialog.result
             fecha_pago_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            if realizar_pago_cliente(id_cliente, monto_pago, fecha_pago_str):
+            if realizar_pago_cliente(id_cliente, monto_pago, fecha_pago_str, forma_pago):
                 messagebox.showinfo("Pago Registrado", "El pago se ha registrado con éxito.")
                 self.cargar_clientes()
 
@@ -521,8 +631,10 @@ class VentasView(ttk.Frame):
         super().__init__(parent)
         self.parent = parent
         self.cliente_seleccionado = None
+        self.id_lista_precios = None
 
         self.current_sale_items = {}
+        self.promociones_carrito = CarritoPromociones()
         self.total_var = tk.StringVar(value="$0.00")
 
         self.search_thread = None
@@ -579,17 +691,19 @@ class VentasView(ttk.Frame):
 
         self.cart_tree = ttk.Treeview(
             cart_frame,
-            columns=("Nombre", "Cantidad", "Precio", "Desc", "Subtotal"),
+            columns=("Nombre", "Cantidad", "Precio", "Desc", "Promo", "Subtotal"),
             show="headings"
         )
         self.cart_tree.heading("Nombre", text="Producto")
         self.cart_tree.heading("Cantidad", text="Cantidad")
         self.cart_tree.heading("Precio", text="Precio Unit.")
         self.cart_tree.heading("Desc", text="Desc. %")
+        self.cart_tree.heading("Promo", text="Promoción")
         self.cart_tree.heading("Subtotal", text="Subtotal")
         self.cart_tree.column("Cantidad", width=100, anchor="center")
         self.cart_tree.column("Precio", width=120, anchor="e")
         self.cart_tree.column("Desc", width=80, anchor="center")
+        self.cart_tree.column("Promo", width=100, anchor="e")
         self.cart_tree.column("Subtotal", width=120, anchor="e")
         self.cart_tree.pack(side="left", fill="both", expand=True)
         self.cart_tree.bind("<Double-1>", self.edit_cart_item_quantity)
@@ -604,7 +718,7 @@ class VentasView(ttk.Frame):
         ttk.Button(summary_frame, text="Finalizar Venta", command=self.finalize_sale, style="Accent.TButton").pack(side="right")
         ttk.Button(summary_frame, text="Cancelar Venta", command=self.cancel_sale).pack(side="right", padx=10)
 
-    def add_product_to_sale(self, product=None):
+    def add_product_to_sale(self, product=None, id_stock=None):
         if not product:
             return
 
@@ -623,21 +737,61 @@ class VentasView(ttk.Frame):
             detalle_existente = self.current_sale_items[product.id_producto]
             detalle_existente.cantidad += cantidad
             detalle_existente.descuento = descuento
+            detalle_existente.precio_unitario = self.precio_para(product, detalle_existente.cantidad)
             detalle_existente.subtotal = detalle_existente.calcular_subtotal()
         else:
             self.current_sale_items[product.id_producto] = DetalleVenta(
                 id_producto=product.id_producto,
                 cantidad=cantidad,
-                precio_unitario=product.precio_venta,
-                descuento=descuento
+                precio_unitario=self.precio_para(product, cantidad),
+                descuento=descuento,
+                id_stock=id_stock if VENDER_DEL_LOTE_ESCANEADO else None
             )
         
-        self.update_cart_display()
+        self.update_cart_display([product.id_producto])
         self.search_var.set("")
         self.hide_suggestions()
         self.search_entry.focus_set()
 
-    def update_cart_display(self):
+    def precio_para(self, product, cantidad):
+        # Con un cliente con lista de precios, el de su lista para esa cantidad (queda en memoria tras la primera consulta).
+        if self.id_lista_precios is None:
+            return product.precio_venta
+        return resolver_precios_lista(self.id_lista_precios, {product.id_producto: cantidad}).get(product.id_producto, product.precio_venta)
+
+    def aplicar_lista_precios(self):
+        # Al asignar o quitar el cliente se vuelve a poner precio a todo el carrito con una sola consulta.
+        if not self.current_sale_items:
+            return
+        if self.id_lista_precios is None:
+            precios = {p.id_producto: p.precio_venta for p in obtener_productos_por_ids(list(self.current_sale_items))}
+        else:
+            precios = resolver_precios_lista(self.id_lista_precios, {id_prod: d.cantidad for id_prod, d in self.current_sale_items.items()})
+        for id_prod, detalle in self.current_sale_items.items():
+            if id_prod in precios:
+                detalle.precio_unitario = precios[id_prod]
+        self.update_cart_display()
+
+    def aplicar_promociones(self, ids_cambiados=None):
+        # Con ids solo se reevalúan las promociones de esos productos; sin ids se compara todo el carrito.
+        # Sin cambios igual se revisan las promociones horarias que empiezan o terminan.
+        if ids_cambiados is None:
+            lineas = {id_prod: (d.cantidad, d.precio_unitario) for id_prod, d in self.current_sale_items.items()}
+            descuentos = self.promociones_carrito.sincronizar(lineas)
+        else:
+            cambios = {}
+            for id_prod in ids_cambiados:
+                detalle = self.current_sale_items.get(id_prod)
+                cambios[id_prod] = (detalle.cantidad, detalle.precio_unitario) if detalle else None
+            descuentos = self.promociones_carrito.actualizar(cambios)
+
+        for id_prod, detalle in self.current_sale_items.items():
+            detalle.promociones = descuentos.get(id_prod, [])
+            detalle.descuento_promocion = sum(monto for _, monto in detalle.promociones)
+            detalle.subtotal = detalle.calcular_subtotal()
+
+    def update_cart_display(self, ids_cambiados=None):
+        self.aplicar_promociones(ids_cambiados)
         product_ids = list(self.current_sale_items.keys())
         
         if not product_ids:
@@ -656,12 +810,12 @@ class VentasView(ttk.Frame):
             product = products_info.get(id_prod)
             if not product: continue
             
-            detalle.subtotal = detalle.calcular_subtotal()
             self.cart_tree.insert("", "end", values=(
                 product.nombre,
                 detalle.cantidad,
                 f"${detalle.precio_unitario:.2f}",
                 f"{detalle.descuento:.1f}%",
+                f"-${detalle.descuento_promocion:.2f}" if detalle.descuento_promocion else "",
                 f"${detalle.subtotal:.2f}"
             ), iid=id_prod)
             total += detalle.subtotal
@@ -673,6 +827,9 @@ class VentasView(ttk.Frame):
             messagebox.showwarning("Venta Vacía", "No hay productos en el carrito.")
             return
 
+        # Las promociones horarias se vuelven a evaluar a la hora del cobro, y el carrito se redibuja
+        # para que el cajero vea el mismo total que se va a cobrar.
+        self.update_cart_display([])
         venta = Venta(fecha_venta=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         venta.id_cliente = self.cliente_seleccionado.id_cliente if self.cliente_seleccionado else None
         venta.detalles = list(self.current_sale_items.values())
@@ -685,6 +842,7 @@ class VentasView(ttk.Frame):
         self.update_cart_display()
         self.search_var.set("")
         self.cliente_seleccionado = None
+        self.id_lista_precios = None
         self.client_label_var.set("Cliente: Consumidor Final")
         self.hide_suggestions()
 
@@ -700,10 +858,17 @@ class VentasView(ttk.Frame):
 
         if selected_client_id:
             self.cliente_seleccionado = obtener_cliente_por_id(selected_client_id)
-            self.client_label_var.set(f"Cliente: {self.cliente_seleccionado.nombre} (DNI: {self.cliente_seleccionado.dni or 'N/A'})")
+            etiqueta = f"Cliente: {self.cliente_seleccionado.nombre} (DNI: {self.cliente_seleccionado.dni or 'N/A'})"
+            self.id_lista_precios = self.cliente_seleccionado.id_lista_precios
+            if self.id_lista_precios is not None:
+                nombre_lista = next((l['nombre'] for l in obtener_listas_precios() if l['id_lista'] == self.id_lista_precios), "")
+                etiqueta += f" - Lista: {nombre_lista}"
+            self.client_label_var.set(etiqueta)
         else:
             self.cliente_seleccionado = None
+            self.id_lista_precios = None
             self.client_label_var.set("Cliente: Consumidor Final")
+        self.aplicar_lista_precios()
 
     def eliminar_item_del_carrito(self, event=None):
         selection = self.cart_tree.selection()
@@ -716,7 +881,7 @@ class VentasView(ttk.Frame):
                 if item_id in self.current_sale_items:
                     del self.current_sale_items[item_id]
             
-            self.update_cart_display()
+            self.update_cart_display([int(item_id_str) for item_id_str in selection])
 
     def edit_cart_item_quantity(self, event=None):
         selection = self.cart_tree.selection()
@@ -734,7 +899,7 @@ class VentasView(ttk.Frame):
         if not producto:
             messagebox.showerror("Error", "El producto ya no se encuentra en la base de datos.")
             del self.current_sale_items[item_id]
-            self.update_cart_display()
+            self.update_cart_display([item_id])
             return
 
         dialog = QuantityDialog(self, producto, initial_quantity=detalle_actual.cantidad, initial_discount=detalle_actual.descuento) # type: ignore
@@ -755,9 +920,10 @@ class VentasView(ttk.Frame):
         else:
             self.current_sale_items[item_id].cantidad = nueva_cantidad
             self.current_sale_items[item_id].descuento = nuevo_descuento
+            self.current_sale_items[item_id].precio_unitario = self.precio_para(producto, nueva_cantidad)
             self.current_sale_items[item_id].subtotal = self.current_sale_items[item_id].calcular_subtotal()
 
-        self.update_cart_display()
+        self.update_cart_display([item_id])
 
     def _perform_search_in_thread(self, query):
         results = obtener_productos(nombre_like=query)
@@ -803,10 +969,11 @@ class VentasView(ttk.Frame):
         else:
             query = self.search_var.get().strip()
             if query:
-                producto_encontrado = obtener_producto_por_codigo_barras(query)
+                resuelto = resolver_codigo_barras(query)
                 
-                if producto_encontrado:
-                    self.add_product_to_sale(producto_encontrado)
+                if resuelto:
+                    producto_encontrado, id_stock = resuelto
+                    self.add_product_to_sale(producto_encontrado, id_stock)
                 else:
                     productos_flexibles = obtener_productos(nombre_like=query)
                     if len(productos_flexibles) == 1:
@@ -1029,15 +1196,17 @@ class LoteManagementWindow(tk.Toplevel):
         main_frame = ttk.Frame(self, padding=10)
         main_frame.pack(fill="both", expand=True)
 
-        self.tree = ttk.Treeview(main_frame, columns=("ID", "Cantidad", "Vencimiento", "CodigoBarras"), show="headings")
+        self.tree = ttk.Treeview(main_frame, columns=("ID", "Cantidad", "Vencimiento", "CodigoBarras", "Costo"), show="headings")
         self.tree.heading("ID", text="ID Lote")
         self.tree.heading("Cantidad", text="Cantidad")
         self.tree.heading("Vencimiento", text="Fecha de Vencimiento")
         self.tree.heading("CodigoBarras", text="Código de Barras")
+        self.tree.heading("Costo", text="Costo Unit.")
         self.tree.column("ID", width=80, anchor="center")
         self.tree.column("Cantidad", width=100, anchor="center")
         self.tree.column("Vencimiento", width=150, anchor="center")
-        self.tree.column("CodigoBarras", width=250)
+        self.tree.column("CodigoBarras", width=200)
+        self.tree.column("Costo", width=100, anchor="e")
         self.tree.pack(fill="both", expand=True)
         self.tree.bind("<Double-1>", self.editar_lote_seleccionado)
 
@@ -1062,14 +1231,15 @@ class LoteManagementWindow(tk.Toplevel):
                 lote['id_stock'],
                 lote['cantidad'],
                 fecha_venc,
-                lote.get('codigo_barras', 'N/A') or "N/A"
+                lote.get('codigo_barras', 'N/A') or "N/A",
+                f"${lote['costo_unitario']:.2f}" if lote.get('costo_unitario') is not None else "N/A"
             ))
 
     def añadir_nuevo_lote(self):
         dialog = LoteFormDialog(self, title="Añadir Nuevo Lote")
         if dialog.result:
-            cantidad, fecha_venc, codigo_barras = dialog.result
-            if agregar_lote(self.producto.id_producto, cantidad, fecha_venc, codigo_barras):
+            cantidad, fecha_venc, codigo_barras, costo_unitario = dialog.result
+            if agregar_lote(self.producto.id_producto, cantidad, fecha_venc, codigo_barras, costo_unitario):
                 self.cargar_lotes()
             else:
                 messagebox.showerror("Error", "No se pudo añadir el nuevo lote.", parent=self)
@@ -1086,7 +1256,7 @@ class LoteManagementWindow(tk.Toplevel):
 
         dialog = LoteFormDialog(self, title="Editar Lote", initial_data=lote_a_editar)
         if dialog.result:
-            cantidad, fecha_venc, codigo_barras = dialog.result
+            cantidad, fecha_venc, codigo_barras, _ = dialog.result
             if actualizar_lote(id_lote, cantidad, fecha_venc, codigo_barras):
                 self.cargar_lotes()
             else:
@@ -1117,6 +1287,12 @@ class LoteFormDialog(simpledialog.Dialog):
         self.cantidad_entry.grid(row=0, column=1, pady=5, sticky="ew")
         self.fecha_entry.grid(row=1, column=1, pady=5, sticky="ew")
         self.codigo_entry.grid(row=2, column=1, pady=5, sticky="ew")
+
+        # El costo se fija al recibir el lote: editarlo después alteraría los márgenes ya registrados.
+        self.costo_var = tk.StringVar(value="")
+        if not self.initial_data:
+            ttk.Label(master, text="Costo Unitario (opcional):").grid(row=3, sticky="w", pady=2)
+            ttk.Entry(master, textvariable=self.costo_var).grid(row=3, column=1, pady=5, sticky="ew")
         
         master.columnconfigure(1, weight=1)
         return self.cantidad_entry
@@ -1138,169 +1314,1071 @@ class LoteFormDialog(simpledialog.Dialog):
 
             codigo_str = codigo_str if codigo_str else None
 
-            self.result = (cantidad, fecha_str, codigo_str)
+            costo_str = self.costo_var.get().strip().replace(',', '.')
+            try:
+                costo = float(costo_str) if costo_str else None
+            except ValueError:
+                messagebox.showwarning("Dato Inválido", "El costo unitario debe ser un número.", parent=self)
+                return
+            if costo is not None and costo < 0:
+                messagebox.showwarning("Dato Inválido", "El costo unitario no puede ser negativo.", parent=self)
+                return
+
+            self.result = (cantidad, fecha_str, codigo_str, costo)
         except ValueError:
             messagebox.showwarning("Formato Incorrecto", "La fecha debe tener el formato AAAA-MM-DD.", parent=self)
         except tk.TclError:
             messagebox.showwarning("Dato Inválido", "La cantidad debe ser un número entero.", parent=self)
 
 
-class PaymentWindow(tk.Toplevel):
-    def __init__(self, parent, venta_obj: Venta, callback):
-        super().__init__(parent)
-        self.parent = parent
-        self.venta = venta_obj
-        self.callback = callback
+class BulkPriceDialog(simpledialog.Dialog):
+    TIPOS_REGLA = {"Porcentaje (%)": "porcentaje", "Monto fijo ($)": "monto"}
+    REDONDEOS = {"Sin redondeo": None, "$1": 1, "$5": 5, "$10": 10, "$50": 50, "$100": 100}
 
-        self.title("Finalizar Venta")
-        self.geometry("400x380")
-        self.resizable(False, False)
-        self.grab_set()
-        self.transient(parent)
+    def __init__(self, parent, title, nombre_like="", solo_poco_stock=False):
+        self.nombre_inicial = nombre_like
+        self.poco_stock_inicial = solo_poco_stock
+        super().__init__(parent, title)
 
-        self.create_widgets()
+    def body(self, master):
+        ttk.Label(master, text="Nombre contiene:").grid(row=0, sticky="w", pady=2)
+        ttk.Label(master, text="Regla:").grid(row=2, sticky="w", pady=2)
+        ttk.Label(master, text="Valor:").grid(row=3, sticky="w", pady=2)
+        ttk.Label(master, text="Redondear a:").grid(row=4, sticky="w", pady=2)
+
+        self.nombre_var = tk.StringVar(value=self.nombre_inicial)
+        self.poco_stock_var = tk.BooleanVar(value=self.poco_stock_inicial)
+        self.tipo_var = tk.StringVar(value=list(self.TIPOS_REGLA)[0])
+        self.valor_var = tk.StringVar()
+        self.redondeo_var = tk.StringVar(value="$10")
+        self.vista_previa_var = tk.StringVar()
+
+        nombre_entry = ttk.Entry(master, textvariable=self.nombre_var)
+        nombre_entry.grid(row=0, column=1, pady=5, sticky="ew")
+        ttk.Checkbutton(master, text="Solo productos con poco stock", variable=self.poco_stock_var).grid(row=1, column=1, sticky="w")
+        ttk.Combobox(master, textvariable=self.tipo_var, values=list(self.TIPOS_REGLA), state="readonly").grid(row=2, column=1, pady=5, sticky="ew")
+        self.valor_entry = ttk.Entry(master, textvariable=self.valor_var)
+        self.valor_entry.grid(row=3, column=1, pady=5, sticky="ew")
+        ttk.Combobox(master, textvariable=self.redondeo_var, values=list(self.REDONDEOS), state="readonly").grid(row=4, column=1, pady=5, sticky="ew")
+
+        ttk.Button(master, text="Vista Previa", command=self.mostrar_vista_previa).grid(row=5, column=0, pady=(10, 0), sticky="w")
+        ttk.Label(master, textvariable=self.vista_previa_var, wraplength=320, justify="left").grid(row=6, column=0, columnspan=2, sticky="w")
 
-    def create_widgets(self):
-        main_frame = ttk.Frame(self, padding=20)
-        main_frame.grid(row=0, column=0, sticky="nsew")
-        self.grid_rowconfigure(0, weight=1)
-        self.grid_columnconfigure(0, weight=1)
+        master.columnconfigure(1, weight=1)
+        return self.valor_entry
+
+    def _leer_parametros(self):
+        valor = float(self.valor_var.get().replace(",", "."))
+        return {
+            'tipo_regla': self.TIPOS_REGLA[self.tipo_var.get()],
+            'valor': valor,
+            'redondeo': self.REDONDEOS[self.redondeo_var.get()],
+            'nombre_like': self.nombre_var.get().strip() or None,
+            'solo_poco_stock': self.poco_stock_var.get(),
+        }
 
-        ttk.Label(main_frame, text="Total a Pagar:", font=("Helvetica", 14)).grid(row=0, column=0, columnspan=2, pady=(0, 5))
-        ttk.Label(main_frame, text=f"${self.venta.total:.2f}", font=("Helvetica", 28, "bold"), foreground="#4CAF50").grid(row=1, column=0, columnspan=2, pady=(0, 20))
+    def mostrar_vista_previa(self):
+        try:
+            parametros = self._leer_parametros()
+        except ValueError:
+            messagebox.showwarning("Dato Inválido", "El valor debe ser un número.", parent=self)
+            return
+        vista_previa = previsualizar_actualizacion_precios(limite_ejemplos=3, **parametros)
+        ejemplos = "\n".join(f"{e['nombre']}: ${e['precio_actual']:.2f} → ${e['precio_nuevo']:.2f}" for e in vista_previa['ejemplos'])
+        self.vista_previa_var.set(f"Productos que cambian de precio: {vista_previa['cantidad']}\n{ejemplos}")
 
-        ttk.Button(main_frame, text="Efectivo", command=self.pay_cash, style="Accent.TButton").grid(row=2, column=0, sticky="ew", padx=(0, 5), pady=5)
-        ttk.Button(main_frame, text="Tarjeta (Débito/Crédito)", command=self.pay_card).grid(row=2, column=1, sticky="ew", padx=(5, 0), pady=5)
-        ttk.Button(main_frame, text="Billetera Virtual (QR)", command=self.pay_qr).grid(row=3, column=0, sticky="ew", padx=(0, 5), pady=5)
-        ttk.Button(main_frame, text="Transferencia Bancaria", command=self.pay_transfer).grid(row=3, column=1, sticky="ew", padx=(5, 0), pady=5)
+    def validate(self):
+        try:
+            self._leer_parametros()
+            return True
+        except ValueError:
+            messagebox.showwarning("Dato Inválido", "El valor debe ser un número.", parent=self)
+            return False
 
-        fiar_button = ttk.Button(main_frame, text="Fiar (Anotar en Libreta)", command=self.pay_credit, state="normal" if self.venta.id_cliente else "disabled")
-        fiar_button.grid(row=4, column=0, columnspan=2, sticky="ew", pady=5)
+    def apply(self):
+        self.result = self._leer_parametros()
 
-        main_frame.grid_columnconfigure(0, weight=1)
-        main_frame.grid_columnconfigure(1, weight=1)
 
-    def pay_cash(self):
-        self.venta.forma_pago = "Efectivo"
-        self.complete_sale()
+class SincronizacionProveedorWindow(tk.Toplevel):
+    # Compara la lista de precios completa de un proveedor con la última sincronizada y muestra solo lo
+    # que cambió; los cambios se aplican recién al confirmar, todos juntos.
+    TIPOS = {'nuevos': "Nuevo", 'cambios_precio': "Cambio de precio", 'discontinuados': "Discontinuado"}
 
-    def pay_card(self):
-        messagebox.showinfo(
-            "Terminal de Pago",
-            "Por favor, utilice el terminal de pago para completar la transacción.",
-            parent=self
-        )
+    def __init__(self, parent, callback=None):
+        super().__init__(parent)
+        self.title("Sincronizar Lista de Proveedor")
+        self.geometry("760x520")
+        self.transient(parent)
+        self.grab_set()
+        self.callback = callback
+        self.informe = None
 
-        pago_aprobado = messagebox.askyesno(
-            "Confirmación de Pago",
-            "¿El pago con tarjeta fue APROBADO?",
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill="both", expand=True)
+
+        datos_frame = ttk.Frame(main_frame)
+        datos_frame.pack(fill="x")
+        ttk.Label(datos_frame, text="Proveedor:").grid(row=0, column=0, sticky="w", pady=2)
+        self.proveedor_var = tk.StringVar()
+        ttk.Combobox(datos_frame, textvariable=self.proveedor_var, values=[p[0] for p in obtener_proveedores_sincronizados()]).grid(row=0, column=1, sticky="ew", padx=5)
+        ttk.Label(datos_frame, text="Archivo:").grid(row=1, column=0, sticky="w", pady=2)
+        self.ruta_var = tk.StringVar()
+        ttk.Entry(datos_frame, textvariable=self.ruta_var).grid(row=1, column=1, sticky="ew", padx=5)
+        ttk.Button(datos_frame, text="Examinar...", command=self.elegir_archivo).grid(row=1, column=2)
+        self.analizar_btn = ttk.Button(datos_frame, text="Analizar", command=lambda: self.sincronizar(aplicar=False))
+        self.analizar_btn.grid(row=0, column=2, sticky="ew")
+        datos_frame.columnconfigure(1, weight=1)
+
+        tree_frame = ttk.Frame(main_frame)
+        tree_frame.pack(fill="both", expand=True, pady=10)
+        self.tree = ttk.Treeview(tree_frame, columns=("Tipo", "Producto", "Anterior", "Nuevo"), show="headings")
+        self.tree.heading("Tipo", text="Cambio")
+        self.tree.heading("Producto", text="Producto")
+        self.tree.heading("Anterior", text="Precio Anterior")
+        self.tree.heading("Nuevo", text="Precio Nuevo")
+        self.tree.column("Tipo", width=130)
+        self.tree.column("Producto", width=320)
+        self.tree.column("Anterior", width=110, anchor="e")
+        self.tree.column("Nuevo", width=110, anchor="e")
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        self.resumen_var = tk.StringVar(value="Elija el proveedor y su lista de precios (Excel o CSV) y presione Analizar.")
+        ttk.Label(main_frame, textvariable=self.resumen_var, wraplength=720, justify="left").pack(fill="x")
+
+        botones_frame = ttk.Frame(main_frame)
+        botones_frame.pack(fill="x", pady=(10, 0))
+        ttk.Button(botones_frame, text="Cerrar", command=self.destroy).pack(side="right")
+        self.aplicar_btn = ttk.Button(botones_frame, text="Aplicar Cambios", command=lambda: self.sincronizar(aplicar=True), state="disabled")
+        self.aplicar_btn.pack(side="right", padx=5)
+        self.exportar_btn = ttk.Button(botones_frame, text="Exportar Informe", command=self.exportar_informe, state="disabled")
+        self.exportar_btn.pack(side="left")
+
+    def elegir_archivo(self):
+        ruta = filedialog.askopenfilename(
+            title="Seleccionar lista de precios del proveedor",
+            filetypes=[("Listas de precios", "*.xlsx *.csv"), ("Todos los archivos", "*.*")],
             parent=self
         )
+        if ruta:
+            self.ruta_var.set(ruta)
+            self.aplicar_btn.config(state="disabled")
+
+    def sincronizar(self, aplicar):
+        proveedor, ruta = self.proveedor_var.get().strip(), self.ruta_var.get().strip()
+        if not proveedor or not ruta:
+            messagebox.showwarning("Datos Incompletos", "Indique el proveedor y el archivo de la lista.", parent=self)
+            return
+        if aplicar and not messagebox.askyesno("Confirmar", "¿Aplicar todos los cambios de la lista?", parent=self):
+            return
+        for boton in (self.analizar_btn, self.aplicar_btn, self.exportar_btn):
+            boton.config(state="disabled")
+        self.resumen_var.set("Procesando la lista, por favor espere...")
 
-        if pago_aprobado:
-            self.venta.forma_pago = "Tarjeta"
-            self.complete_sale()
-        else:
-            messagebox.showerror("Pago Fallido", "La transacción con tarjeta fue rechazada o cancelada.", parent=self)
+        def tarea():
+            informe = sincronizar_lista_proveedor(ruta, proveedor, aplicar=aplicar)
+            self.after(0, self.mostrar_informe, informe)
 
-    def pay_qr(self):
-        if MODO_PRUEBA_PAGOS:
-            messagebox.showinfo("Modo de Prueba", "Simulando generación de QR...", parent=self)
-            pago_aprobado = messagebox.askyesno(
-                "Confirmación de Pago (Prueba)",
-                "¿Simular que el pago con QR fue APROBADO?",
-                parent=self
-            )
-            if pago_aprobado:
-                self.venta.forma_pago = "QR (Simulado)"
-                self.complete_sale()
-            else:
-                messagebox.showerror("Pago Cancelado", "La simulación de pago con QR fue cancelada.", parent=self)
+        threading.Thread(target=tarea, daemon=True).start()
+
+    def mostrar_informe(self, informe):
+        if not self.winfo_exists():
+            return
+        self.analizar_btn.config(state="normal")
+        self.informe = informe
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        if informe is None:
+            self.resumen_var.set("No se pudo procesar la lista. Revise que tenga las columnas codigo_barras o nombre y precio_venta.")
             return
 
+        for fila in self.filas_informe():
+            self.tree.insert("", "end", values=fila)
+        resumen = (f"{informe['lineas']} artículos en la lista: {informe['sin_cambios']} sin cambios, "
+                   f"{len(informe['cambios_precio'])} cambios de precio, {len(informe['nuevos'])} nuevos, "
+                   f"{len(informe['discontinuados'])} discontinuados.")
+        if informe['cantidad_rechazadas']:
+            resumen += f"\nFilas rechazadas: {informe['cantidad_rechazadas']} (" + "; ".join(f"fila {n}: {m}" for n, m in informe['rechazadas'][:3]) + ")"
+        if informe['aplicado']:
+            resumen = "Cambios aplicados. " + resumen
+            if self.callback:
+                self.callback()
+        self.resumen_var.set(resumen)
+        self.exportar_btn.config(state="normal")
+        hay_cambios = informe['nuevos'] or informe['cambios_precio'] or informe['discontinuados']
+        self.aplicar_btn.config(state="normal" if hay_cambios and not informe['aplicado'] else "disabled")
+
+    def filas_informe(self):
+        for cambio in self.informe['cambios_precio']:
+            yield (self.TIPOS['cambios_precio'], cambio['nombre'], f"${cambio['precio_anterior']:.2f}", f"${cambio['precio_nuevo']:.2f}")
+        for nuevo in self.informe['nuevos']:
+            yield (self.TIPOS['nuevos'], nuevo['nombre'], "", f"${nuevo['precio']:.2f}")
+        for baja in self.informe['discontinuados']:
+            yield (self.TIPOS['discontinuados'], baja['nombre'], "", "")
+
+    def exportar_informe(self):
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel Files", "*.xlsx")],
+            title="Guardar Informe de Cambios",
+            parent=self
+        )
+        if not filepath:
+            return
         try:
-            if self.venta.total <= 0:
-                messagebox.showerror("Error", "No se puede generar un pago para una venta con total de $0.00.", parent=self)
-                return
-            
-            if not MP_ACCESS_TOKEN or MP_ACCESS_TOKEN == 'TU_ACCESS_TOKEN_VA_AQUI' or MP_ACCESS_TOKEN == 'NO_CONFIGURADO':
-                messagebox.showerror("Configuración Requerida", 
-                                     "El Access Token de Mercado Pago no está configurado.\n\n"
-                                     "Por favor, edite el archivo 'config.ini' y añada su credencial.", parent=self)
-                return
+            exportar_filas_a_excel(filepath, ["Cambio", "Producto", "Precio Anterior", "Precio Nuevo"], self.filas_informe())
+            messagebox.showinfo("Exportar", "Informe exportado con éxito.", parent=self)
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo exportar: {e}", parent=self)
 
-            sdk = mercadopago.SDK(MP_ACCESS_TOKEN)
 
-            order_data = {
-                "items": [
-                    {
-                        "title": f"Compra en EasySt - Venta #{self.venta.id_venta or 'N/A'}",
-                        "quantity": 1,
-                        "unit_price": self.venta.total
-                    }
-                ],
-                "external_reference": f"VENTA-{self.venta.id_venta or 'NUEVA'}-{datetime.now().timestamp()}",
-                "title": f"Compra en {NOMBRE_NEGOCIO}",
-                "total_amount": self.venta.total,
-                "description": f"Orden de pago para la venta #{self.venta.id_venta or 'N/A'}"
-            }
+class ConteoInventarioWindow(tk.Toplevel):
+    # Conteo físico con el escáner: cada lectura se guarda al instante, así que se puede cerrar la
+    # ventana (o el programa) y seguir después. Las diferencias se aplican todas juntas al final.
+    def __init__(self, parent, conteo, callback=None):
+        super().__init__(parent)
+        self.title("Conteo de Inventario")
+        self.geometry("720x560")
+        self.transient(parent)
+        self.conteo = conteo
+        self.callback = callback
 
-            order_response = sdk.instore_order().create(order_data)
-            
-            if order_response.get("status") not in [200, 201]:
-                error_info = order_response.get("response", {})
-                error_message = error_info.get("message", "Error desconocido de la API.")
-                messagebox.showerror("Error de Mercado Pago", f"No se pudo crear la orden de pago:\n{error_message}\n\nVerifique que su Access Token sea correcto y esté activado para producción.", parent=self)
-                return
-            
-            qr_data_string = order_response["response"].get("qr_data")
-            if not qr_data_string:
-                messagebox.showerror("Error de Mercado Pago", "La API no devolvió los datos del QR.", parent=self)
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill="both", expand=True)
+        ttk.Label(main_frame, text=f"Conteo #{self.conteo['id_conteo']} iniciado el {formatear_fecha(self.conteo['inicio'][:10])}", font=("Helvetica", 11, "bold")).pack(anchor="w")
+
+        lectura_frame = ttk.Frame(main_frame, padding=(0, 10))
+        lectura_frame.pack(fill="x")
+        ttk.Label(lectura_frame, text="Código:").pack(side="left")
+        self.codigo_var = tk.StringVar()
+        self.codigo_entry = ttk.Entry(lectura_frame, textvariable=self.codigo_var, width=25)
+        self.codigo_entry.pack(side="left", padx=5)
+        self.codigo_entry.bind("<Return>", self.registrar_lectura)
+        ttk.Label(lectura_frame, text="Cantidad:").pack(side="left", padx=(10, 0))
+        self.cantidad_var = tk.StringVar(value="1")
+        ttk.Spinbox(lectura_frame, from_=-999, to=9999, textvariable=self.cantidad_var, width=6).pack(side="left", padx=5)
+        self.ultima_var = tk.StringVar()
+        ttk.Label(lectura_frame, textvariable=self.ultima_var, foreground="blue").pack(side="left", padx=10)
+
+        opciones_frame = ttk.Frame(main_frame)
+        opciones_frame.pack(fill="x")
+        self.vista_var = tk.StringVar(value="lecturas")
+        ttk.Radiobutton(opciones_frame, text="Productos contados", variable=self.vista_var, value="lecturas", command=self.cargar_items).pack(side="left")
+        ttk.Radiobutton(opciones_frame, text="Diferencias", variable=self.vista_var, value="diferencias", command=self.cargar_items).pack(side="left", padx=10)
+        self.no_contados_var = tk.BooleanVar()
+        ttk.Checkbutton(opciones_frame, text="Los productos no contados quedan en cero", variable=self.no_contados_var, command=self.cargar_items).pack(side="left", padx=10)
+
+        tree_frame = ttk.Frame(main_frame)
+        tree_frame.pack(fill="both", expand=True, pady=10)
+        self.tree = ttk.Treeview(tree_frame, columns=("Producto", "Contado", "Sistema", "Diferencia"), show="headings")
+        self.tree.heading("Producto", text="Producto")
+        self.tree.heading("Contado", text="Contado")
+        self.tree.heading("Sistema", text="Sistema")
+        self.tree.heading("Diferencia", text="Diferencia")
+        self.tree.column("Producto", width=340)
+        for columna in ("Contado", "Sistema", "Diferencia"):
+            self.tree.column(columna, width=100, anchor="center")
+        self.tree.tag_configure('faltante', background='#FFEBEE')
+        self.tree.tag_configure('sobrante', background='#E8F5E9')
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.bind("<Double-1>", self.corregir_cantidad)
 
-            self.show_qr_window(qr_data_string)
+        botones_frame = ttk.Frame(main_frame)
+        botones_frame.pack(fill="x")
+        ttk.Button(botones_frame, text="Cancelar Conteo", command=self.cancelar).pack(side="left")
+        ttk.Button(botones_frame, text="Cerrar (continuar después)", command=self.destroy).pack(side="right")
+        ttk.Button(botones_frame, text="Aplicar Ajustes", command=self.aplicar).pack(side="right", padx=5)
 
-            pago_aprobado = messagebox.askyesno(
-                "Confirmación de Pago",
-                "El cliente ha escaneado el QR y completado el pago?",
-                parent=self
-            )
+        self.cargar_items()
+        self.codigo_entry.focus_set()
 
-            if pago_aprobado:
-                self.venta.forma_pago = "QR (Mercado Pago)"
-                self.complete_sale()
-            else:
-                messagebox.showerror("Pago Cancelado", "La transacción con QR fue cancelada.", parent=self)
-        except Exception as e:
-            messagebox.showerror("Error de API", f"No se pudo generar el QR de Mercado Pago:\n{e}", parent=self)
+    def _insertar_item(self, id_producto, nombre, contado, sistema, index="end"):
+        diferencia = contado - sistema
+        tags = ('faltante',) if diferencia < 0 else ('sobrante',) if diferencia > 0 else ()
+        self.tree.insert("", index, iid=id_producto, values=(nombre, contado, sistema, f"{diferencia:+d}"), tags=tags)
 
-    def pay_transfer(self):
+    def cargar_items(self):
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        if self.vista_var.get() == "diferencias":
+            for item in obtener_diferencias_conteo(self.conteo['id_conteo'], self.no_contados_var.get()):
+                self._insertar_item(item['id_producto'], item['nombre'], item['cantidad_contada'], item['cantidad_sistema'])
+        else:
+            for item in obtener_items_conteo(self.conteo['id_conteo']):
+                self._insertar_item(item['id_producto'], item['nombre'], item['cantidad'], item['cantidad_sistema'])
+
+    def registrar_lectura(self, event=None):
+        codigo = self.codigo_var.get().strip()
+        self.codigo_var.set("")
+        if not codigo:
+            return
+        try:
+            cantidad = int(self.cantidad_var.get())
+        except ValueError:
+            cantidad = 1
+        resultado = registrar_lectura_conteo(self.conteo['id_conteo'], codigo, cantidad)
+        if resultado is None:
+            self.bell()
+            self.ultima_var.set(f"Código '{codigo}' no encontrado")
+            return
+        id_producto, nombre, contado, sistema = resultado
+        self.ultima_var.set(f"{nombre}: {contado}")
+        self.cantidad_var.set("1")
+        # Solo se actualiza la fila leída: con miles de productos recargar la lista haría esperar al escáner.
+        if self.vista_var.get() == "lecturas":
+            if self.tree.exists(id_producto):
+                self.tree.delete(id_producto)
+            self._insertar_item(id_producto, nombre, contado, sistema, index=0)
+
+    def corregir_cantidad(self, event=None):
+        selection = self.tree.selection()
+        if not selection:
+            return
+        id_producto = int(selection[0])
+        cantidad = simpledialog.askinteger("Corregir Conteo", f"Cantidad contada de {self.tree.set(selection[0], 'Producto')}:", parent=self, minvalue=0)
+        if cantidad is None:
+            return
+        if not corregir_cantidad_conteo(self.conteo['id_conteo'], id_producto, cantidad):
+            messagebox.showwarning("Corregir Conteo", "Solo se pueden corregir productos ya leídos en este conteo.", parent=self)
+        self.cargar_items()
+
+    def aplicar(self):
+        diferencias = obtener_diferencias_conteo(self.conteo['id_conteo'], self.no_contados_var.get())
+        if not messagebox.askyesno(
+            "Aplicar Ajustes",
+            f"Se ajustará el stock de {len(diferencias)} productos y el conteo quedará cerrado.\n\n¿Desea continuar?",
+            parent=self
+        ):
+            return
+        resumen = aplicar_conteo(self.conteo['id_conteo'], self.no_contados_var.get())
+        if resumen is None:
+            messagebox.showerror("Error", "No se pudieron aplicar los ajustes. No se modificó el stock.", parent=self)
+            return
         messagebox.showinfo(
-            "Pago por Transferencia",
-            "Por favor, realice la transferencia y muestre el comprobante.",
+            "Conteo Aplicado",
+            f"Productos ajustados: {resumen['productos']}\nUnidades sobrantes: {resumen['sobrantes']}\nUnidades faltantes: {resumen['faltantes']}",
             parent=self
         )
+        if self.callback:
+            self.callback()
+        self.destroy()
 
-        pago_aprobado = messagebox.askyesno(
-            "Confirmación de Pago",
-            "¿Se recibió la transferencia correctamente?",
-            parent=self
-        )
+    def cancelar(self):
+        if messagebox.askyesno("Cancelar Conteo", "Se descartarán todas las lecturas de este conteo. ¿Desea continuar?", parent=self):
+            cancelar_conteo(self.conteo['id_conteo'])
+            self.destroy()
 
-        if pago_aprobado:
-            self.venta.forma_pago = "Transferencia"
-            self.complete_sale()
-        else:
-            messagebox.showerror("Pago Fallido", "La transferencia fue rechazada o no se confirmó.", parent=self)
 
+class OrdenesCompraWindow(tk.Toplevel):
+    # Órdenes de compra con lo pedido y lo recibido de cada producto. Desde acá se abre la recepción de
+    # una entrega, con o sin orden.
+    def __init__(self, parent, callback=None):
+        super().__init__(parent)
+        self.title("Órdenes de Compra")
+        self.geometry("820x560")
+        self.transient(parent)
+        self.callback = callback
 
-    def pay_credit(self):
-        if not self.venta.id_cliente:
-            messagebox.showerror("Error", "No hay un cliente seleccionado para esta venta.", parent=self)
-            return
-        
-        cliente = obtener_cliente_por_id(self.venta.id_cliente)
-        confirm = messagebox.askyesno(
-            "Confirmar Fiar",
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill="both", expand=True)
+
+        filtro_frame = ttk.Frame(main_frame)
+        filtro_frame.pack(fill="x")
+        self.solo_abiertas_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(filtro_frame, text="Solo pendientes de recibir", variable=self.solo_abiertas_var, command=self.cargar_ordenes).pack(side="left")
+        ttk.Button(filtro_frame, text="Recepción sin Orden", command=lambda: RecepcionMercaderiaWindow(self, callback=self._recepcion_terminada)).pack(side="right")
+
+        self.tree_ordenes = ttk.Treeview(main_frame, columns=("Orden", "Fecha", "Proveedor", "Estado", "Productos", "Pedidas", "Recibidas"), show="headings", height=8)
+        for columna, ancho in (("Orden", 60), ("Fecha", 90), ("Proveedor", 200), ("Estado", 90), ("Productos", 80), ("Pedidas", 80), ("Recibidas", 80)):
+            self.tree_ordenes.heading(columna, text=columna)
+            self.tree_ordenes.column(columna, width=ancho, anchor="w" if columna == "Proveedor" else "center")
+        self.tree_ordenes.pack(fill="x", pady=10)
+        self.tree_ordenes.bind("<<TreeviewSelect>>", self.cargar_items)
+
+        self.tree_items = ttk.Treeview(main_frame, columns=("Producto", "Pedido", "Recibido", "Falta", "Costo"), show="headings")
+        self.tree_items.heading("Producto", text="Producto")
+        self.tree_items.heading("Pedido", text="Pedido")
+        self.tree_items.heading("Recibido", text="Recibido")
+        self.tree_items.heading("Falta", text="Falta")
+        self.tree_items.heading("Costo", text="Costo Unit.")
+        self.tree_items.column("Producto", width=340)
+        for columna in ("Pedido", "Recibido", "Falta", "Costo"):
+            self.tree_items.column(columna, width=90, anchor="center")
+        self.tree_items.pack(fill="both", expand=True)
+
+        botones_frame = ttk.Frame(main_frame, padding=(0, 10, 0, 0))
+        botones_frame.pack(fill="x")
+        ttk.Button(botones_frame, text="Anular Orden", command=self.anular).pack(side="left")
+        ttk.Button(botones_frame, text="Cerrar", command=self.destroy).pack(side="right")
+        ttk.Button(botones_frame, text="Exportar", command=self.exportar).pack(side="right", padx=5)
+        ttk.Button(botones_frame, text="Recibir Mercadería", command=self.recibir).pack(side="right")
+
+        self.ordenes = {}
+        self.cargar_ordenes()
+
+    def cargar_ordenes(self):
+        for item in self.tree_ordenes.get_children():
+            self.tree_ordenes.delete(item)
+        for item in self.tree_items.get_children():
+            self.tree_items.delete(item)
+        ordenes = obtener_ordenes_compra()
+        if self.solo_abiertas_var.get():
+            ordenes = [o for o in ordenes if o['estado'] in ('Pendiente', 'Parcial')]
+        self.ordenes = {o['id_orden']: o for o in ordenes}
+        for o in ordenes:
+            self.tree_ordenes.insert("", "end", iid=o['id_orden'], values=(
+                o['id_orden'], formatear_fecha(o['fecha'][:10]), o['proveedor'] or "", o['estado'],
+                o['productos'], o['unidades_pedidas'], o['unidades_recibidas']
+            ))
+
+    def _orden_seleccionada(self):
+        selection = self.tree_ordenes.selection()
+        return self.ordenes.get(int(selection[0])) if selection else None
+
+    def cargar_items(self, event=None):
+        for item in self.tree_items.get_children():
+            self.tree_items.delete(item)
+        orden = self._orden_seleccionada()
+        if not orden:
+            return
+        for item in obtener_items_orden_compra(orden['id_orden']):
+            self.tree_items.insert("", "end", values=(
+                item['nombre'], item['cantidad_pedida'], item['cantidad_recibida'], item['cantidad_faltante'],
+                f"${item['costo_unitario']:.2f}" if item['costo_unitario'] is not None else "-"
+            ))
+
+    def recibir(self):
+        orden = self._orden_seleccionada()
+        if not orden or orden['estado'] not in ('Pendiente', 'Parcial'):
+            messagebox.showwarning("Recibir Mercadería", "Seleccione una orden pendiente de recibir.", parent=self)
+            return
+        RecepcionMercaderiaWindow(self, orden=orden, callback=self._recepcion_terminada)
+
+    def _recepcion_terminada(self):
+        self.cargar_ordenes()
+        if self.callback:
+            self.callback()
+
+    def exportar(self):
+        orden = self._orden_seleccionada()
+        if not orden:
+            messagebox.showwarning("Exportar", "Seleccione una orden.", parent=self)
+            return
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel Files", "*.xlsx")],
+            title="Guardar Orden de Compra",
+            initialfile=f"orden_compra_{orden['id_orden']}.xlsx",
+            parent=self
+        )
+        if not filepath:
+            return
+        filas = (
+            (i['codigo_barras'], i['nombre'], i['cantidad_pedida'], i['cantidad_recibida'], i['cantidad_faltante'], i['costo_unitario'])
+            for i in obtener_items_orden_compra(orden['id_orden'])
+        )
+        try:
+            exportar_filas_a_excel(filepath, ["codigo_barras", "nombre", "cantidad_pedida", "cantidad_recibida", "cantidad_faltante", "costo_unitario"], filas)
+            messagebox.showinfo("Exportar", "Orden de compra exportada con éxito.", parent=self)
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo exportar: {e}", parent=self)
+
+    def anular(self):
+        orden = self._orden_seleccionada()
+        if not orden:
+            return
+        if not messagebox.askyesno("Anular Orden", f"Se dejará de esperar lo que falta recibir de la orden #{orden['id_orden']}. ¿Desea continuar?", parent=self):
+            return
+        if not anular_orden_compra(orden['id_orden']):
+            messagebox.showwarning("Anular Orden", "Solo se pueden anular órdenes pendientes o parciales.", parent=self)
+        self.cargar_ordenes()
+
+
+class RecepcionMercaderiaWindow(tk.Toplevel):
+    # Arma una entrega completa (escaneada o importada de Excel/CSV) y la carga toda junta al confirmar:
+    # lotes, deudas de stock sin lote, ventas pendientes y lo recibido de la orden van en una transacción.
+    def __init__(self, parent, orden=None, callback=None):
+        super().__init__(parent)
+        self.title(f"Recepción de Mercadería - Orden #{orden['id_orden']}" if orden else "Recepción de Mercadería")
+        self.geometry("780x560")
+        self.transient(parent)
+        self.grab_set()
+        self.orden = orden
+        self.callback = callback
+        # (id_producto, fecha_vencimiento, costo_unitario) -> [nombre, cantidad]
+        self.lineas = {}
+        self.costos_orden = {}
+        if orden:
+            self.costos_orden = {i['id_producto']: i['costo_unitario'] for i in obtener_items_orden_compra(orden['id_orden'])}
+
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill="both", expand=True)
+
+        lectura_frame = ttk.Frame(main_frame)
+        lectura_frame.pack(fill="x")
+        ttk.Label(lectura_frame, text="Código:").grid(row=0, column=0, sticky="w")
+        self.codigo_var = tk.StringVar()
+        self.codigo_entry = ttk.Entry(lectura_frame, textvariable=self.codigo_var, width=22)
+        self.codigo_entry.grid(row=0, column=1, padx=5)
+        self.codigo_entry.bind("<Return>", self.registrar_lectura)
+        ttk.Label(lectura_frame, text="Cantidad:").grid(row=0, column=2, sticky="w")
+        self.cantidad_var = tk.StringVar(value="1")
+        ttk.Spinbox(lectura_frame, from_=1, to=99999, textvariable=self.cantidad_var, width=7).grid(row=0, column=3, padx=5)
+        ttk.Label(lectura_frame, text="Vencimiento (AAAA-MM-DD):").grid(row=1, column=0, sticky="w", pady=5)
+        self.fecha_var = tk.StringVar()
+        ttk.Entry(lectura_frame, textvariable=self.fecha_var, width=22).grid(row=1, column=1, padx=5)
+        ttk.Label(lectura_frame, text="Costo Unit.:").grid(row=1, column=2, sticky="w")
+        self.costo_var = tk.StringVar()
+        ttk.Entry(lectura_frame, textvariable=self.costo_var, width=9).grid(row=1, column=3, padx=5)
+        ttk.Button(lectura_frame, text="Importar Excel/CSV...", command=self.importar).grid(row=0, column=4, padx=10)
+        self.ultima_var = tk.StringVar()
+        ttk.Label(main_frame, textvariable=self.ultima_var, foreground="blue").pack(anchor="w")
+
+        tree_frame = ttk.Frame(main_frame)
+        tree_frame.pack(fill="both", expand=True, pady=10)
+        self.tree = ttk.Treeview(tree_frame, columns=("Producto", "Vencimiento", "Costo", "Cantidad"), show="headings")
+        self.tree.heading("Producto", text="Producto")
+        self.tree.heading("Vencimiento", text="Vencimiento")
+        self.tree.heading("Costo", text="Costo Unit.")
+        self.tree.heading("Cantidad", text="Cantidad")
+        self.tree.column("Producto", width=360)
+        for columna in ("Vencimiento", "Costo", "Cantidad"):
+            self.tree.column(columna, width=110, anchor="center")
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        botones_frame = ttk.Frame(main_frame)
+        botones_frame.pack(fill="x")
+        ttk.Button(botones_frame, text="Quitar Línea", command=self.quitar_linea).pack(side="left")
+        self.total_var = tk.StringVar()
+        ttk.Label(botones_frame, textvariable=self.total_var).pack(side="left", padx=10)
+        ttk.Button(botones_frame, text="Cancelar", command=self.destroy).pack(side="right")
+        ttk.Button(botones_frame, text="Confirmar Recepción", command=self.confirmar).pack(side="right", padx=5)
+
+        self.actualizar_tree()
+        self.codigo_entry.focus_set()
+
+    def _agregar(self, id_producto, nombre, cantidad, fecha_vencimiento, costo_unitario):
+        if costo_unitario is None:
+            costo_unitario = self.costos_orden.get(id_producto)
+        linea = self.lineas.setdefault((id_producto, fecha_vencimiento, costo_unitario), [nombre, 0])
+        linea[1] += cantidad
+
+    def actualizar_tree(self):
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        for indice, ((_, fecha, costo), (nombre, cantidad)) in enumerate(self.lineas.items()):
+            self.tree.insert("", "end", iid=indice, values=(
+                nombre, formatear_fecha(fecha) if fecha else "-", f"${costo:.2f}" if costo is not None else "-", cantidad
+            ))
+        self.total_var.set(f"{len(self.lineas)} líneas, {sum(c for _, c in self.lineas.values())} unidades")
+
+    def _datos_lote(self):
+        # Vencimiento y costo de los campos; lanza ValueError si alguno no es válido.
+        fecha = self.fecha_var.get().strip() or None
+        if fecha:
+            datetime.strptime(fecha, "%Y-%m-%d")
+        costo = self.costo_var.get().strip().replace(',', '.')
+        costo = float(costo) if costo else None
+        if costo is not None and costo < 0:
+            raise ValueError("costo negativo")
+        return fecha, costo
+
+    def registrar_lectura(self, event=None):
+        codigo = self.codigo_var.get().strip()
+        self.codigo_var.set("")
+        if not codigo:
+            return
+        try:
+            cantidad = int(self.cantidad_var.get())
+            fecha, costo = self._datos_lote()
+        except ValueError:
+            messagebox.showwarning("Dato Inválido", "Revise la cantidad, el vencimiento (AAAA-MM-DD) y el costo.", parent=self)
+            return
+        resultado = resolver_codigo_barras(codigo)
+        if resultado is None or cantidad <= 0:
+            self.bell()
+            self.ultima_var.set(f"Código '{codigo}' no encontrado" if resultado is None else "La cantidad debe ser mayor a cero")
+            return
+        producto = resultado[0]
+        self._agregar(producto.id_producto, producto.nombre, cantidad, fecha, costo)
+        self.ultima_var.set(f"{producto.nombre}: +{cantidad}")
+        self.cantidad_var.set("1")
+        self.actualizar_tree()
+
+    def importar(self):
+        # Columnas: codigo_barras (o id_producto) y cantidad; fecha_vencimiento y costo_unitario opcionales.
+        filepath = filedialog.askopenfilename(
+            title="Importar entrega",
+            filetypes=[("Excel o CSV", "*.xlsx *.csv"), ("Todos los archivos", "*.*")],
+            parent=self
+        )
+        if not filepath:
+            return
+        try:
+            if filepath.lower().endswith('.csv'):
+                df = pd.read_csv(filepath, sep=None, engine='python', dtype={'codigo_barras': str})
+            else:
+                df = pd.read_excel(filepath, engine='openpyxl', dtype={'codigo_barras': str})
+        except Exception as e:
+            messagebox.showerror("Error al Importar", f"No se pudo leer el archivo:\n{e}", parent=self)
+            return
+        df.columns = [str(c).strip().lower() for c in df.columns]
+        if 'cantidad' not in df.columns or ('codigo_barras' not in df.columns and 'id_producto' not in df.columns):
+            messagebox.showerror("Error de Formato", "El archivo debe tener las columnas 'cantidad' y 'codigo_barras' (o 'id_producto').", parent=self)
+            return
+
+        agregadas, errores = 0, []
+        for index, row in df.iterrows():
+            try:
+                if 'id_producto' in df.columns and pd.notna(row['id_producto']):
+                    producto = obtener_producto_por_id(int(row['id_producto']))
+                else:
+                    resultado = resolver_codigo_barras(str(row['codigo_barras']).strip()) if pd.notna(row['codigo_barras']) else None
+                    producto = resultado[0] if resultado else None
+                if producto is None:
+                    raise ValueError("producto no encontrado")
+                cantidad = int(row['cantidad'])
+                if cantidad <= 0:
+                    raise ValueError("cantidad inválida")
+                fecha = None
+                if 'fecha_vencimiento' in df.columns and pd.notna(row['fecha_vencimiento']):
+                    fecha = pd.to_datetime(row['fecha_vencimiento']).strftime('%Y-%m-%d')
+                costo = float(row['costo_unitario']) if 'costo_unitario' in df.columns and pd.notna(row['costo_unitario']) else None
+                self._agregar(producto.id_producto, producto.nombre, cantidad, fecha, costo)
+                agregadas += 1
+            except (ValueError, TypeError) as e:
+                errores.append(f"Fila {index + 2}: {e}")
+
+        self.actualizar_tree()
+        mensaje = f"Filas agregadas a la recepción: {agregadas}\nFilas con errores: {len(errores)}"
+        if errores:
+            mensaje += "\n\nDetalle de errores:\n" + "\n".join(errores[:5])
+        messagebox.showinfo("Importar Entrega", mensaje, parent=self)
+
+    def quitar_linea(self):
+        selection = self.tree.selection()
+        if not selection:
+            return
+        clave = list(self.lineas)[int(selection[0])]
+        del self.lineas[clave]
+        self.actualizar_tree()
+
+    def confirmar(self):
+        if not self.lineas:
+            messagebox.showwarning("Recepción Vacía", "Escanee o importe la mercadería recibida.", parent=self)
+            return
+        lotes = [(id_producto, cantidad, fecha, None, costo) for (id_producto, fecha, costo), (_, cantidad) in self.lineas.items()]
+        resumen = recibir_mercaderia(lotes, self.orden['id_orden'] if self.orden else None)
+        if resumen is None:
+            messagebox.showerror("Error", "No se pudo registrar la recepción. No se modificó el stock.", parent=self)
+            return
+        mensaje = (
+            f"Lotes cargados: {resumen['lotes']}\nUnidades recibidas: {resumen['unidades']}\n"
+            f"Unidades que saldaron stock negativo: {resumen['unidades_saldadas']}\n"
+            f"Ventas pendientes completadas: {resumen['ventas_completadas']}"
+        )
+        if resumen['estado_orden']:
+            mensaje += f"\nEstado de la orden: {resumen['estado_orden']}"
+        messagebox.showinfo("Recepción Registrada", mensaje, parent=self)
+        if self.callback:
+            self.callback()
+        self.destroy()
+
+
+class PromocionesWindow(tk.Toplevel):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Promociones")
+        self.geometry("800x400")
+        self.grab_set()
+        self.transient(parent)
+
+        self.create_widgets()
+        self.cargar_promociones()
+
+    def create_widgets(self):
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill="both", expand=True)
+
+        columnas = ("Nombre", "Tipo", "Regla", "Productos", "Vigencia", "Activa")
+        self.tree = ttk.Treeview(main_frame, columns=columnas, show="headings")
+        for columna in columnas:
+            self.tree.heading(columna, text=columna)
+        self.tree.column("Tipo", width=90, anchor="center")
+        self.tree.column("Productos", width=80, anchor="center")
+        self.tree.column("Activa", width=60, anchor="center")
+        self.tree.pack(fill="both", expand=True)
+        self.tree.bind("<Double-1>", self.editar_promocion)
+
+        btn_frame = ttk.Frame(main_frame, padding=(0, 10, 0, 0))
+        btn_frame.pack(fill="x")
+        ttk.Button(btn_frame, text="Nueva Promoción", command=self.nueva_promocion).pack(side="left")
+        ttk.Button(btn_frame, text="Activar / Desactivar", command=self.alternar_activa).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Cerrar", command=self.destroy).pack(side="right")
+
+    def cargar_promociones(self):
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+
+        self.promociones = {p.id_promocion: p for p in obtener_promociones()}
+        for promocion in self.promociones.values():
+            vigencia = " ".join(filter(None, (
+                f"{promocion.hora_desde}-{promocion.hora_hasta}" if promocion.hora_desde or promocion.hora_hasta else None,
+                "".join(PromocionFormDialog.DIAS[int(d)] for d in promocion.dias_semana) if promocion.dias_semana else None,
+                f"hasta {formatear_fecha(promocion.fecha_hasta)}" if promocion.fecha_hasta else None,
+            ))) or "Siempre"
+            self.tree.insert("", "end", iid=promocion.id_promocion, values=(
+                promocion.nombre,
+                promocion.tipo,
+                PromocionFormDialog.describir_regla(promocion),
+                len(promocion.productos),
+                vigencia,
+                "Sí" if promocion.activa else "No"
+            ))
+
+    def nueva_promocion(self):
+        dialog = PromocionFormDialog(self, "Nueva Promoción")
+        if dialog.result:
+            if agregar_promocion(dialog.result):
+                self.cargar_promociones()
+            else:
+                messagebox.showerror("Error", "No se pudo guardar la promoción.", parent=self)
+
+    def editar_promocion(self, event=None):
+        selection = self.tree.selection()
+        if not selection:
+            return
+        dialog = PromocionFormDialog(self, "Editar Promoción", self.promociones[int(selection[0])])
+        if dialog.result:
+            if actualizar_promocion(dialog.result):
+                self.cargar_promociones()
+            else:
+                messagebox.showerror("Error", "No se pudo actualizar la promoción.", parent=self)
+
+    def alternar_activa(self):
+        selection = self.tree.selection()
+        if not selection:
+            return
+        promocion = self.promociones[int(selection[0])]
+        promocion.activa = not promocion.activa
+        actualizar_promocion(promocion)
+        self.cargar_promociones()
+
+
+class PromocionFormDialog(simpledialog.Dialog):
+    TIPOS = {
+        "Llevá N, pagá M (2x1, 3x2)": 'nxm',
+        "N-ésima unidad con % off": 'unidad_n',
+        "Combo a precio fijo": 'combo',
+        "Porcentaje de descuento": 'porcentaje',
+    }
+    DIAS = "LMXJVSD"
+
+    def __init__(self, parent, title, promocion=None):
+        self.promocion = promocion
+        super().__init__(parent, title)
+
+    @staticmethod
+    def describir_regla(promocion):
+        if promocion.tipo == 'nxm':
+            return f"{promocion.cantidad}x{promocion.valor:g}"
+        if promocion.tipo == 'unidad_n':
+            return f"{promocion.cantidad}ª unidad {promocion.valor:g}% off"
+        if promocion.tipo == 'combo':
+            return f"Combo ${promocion.valor:.2f}"
+        return f"{promocion.valor:g}% off"
+
+    def body(self, master):
+        p = self.promocion
+        etiquetas = {0: "Nombre:", 1: "Tipo:", 2: "N (unidades):", 3: "Valor (M, % o $):", 4: "Prioridad:",
+                     5: "Productos:", 7: "Días:", 8: "Horario (HH:MM a HH:MM):", 9: "Vigencia (AAAA-MM-DD):"}
+        for fila, texto in etiquetas.items():
+            ttk.Label(master, text=texto).grid(row=fila, sticky="w", pady=2)
+
+        tipo_inicial = next((k for k, v in self.TIPOS.items() if p and v == p.tipo), list(self.TIPOS)[0])
+        self.nombre_var = tk.StringVar(value=p.nombre if p else "")
+        self.tipo_var = tk.StringVar(value=tipo_inicial)
+        self.cantidad_var = tk.StringVar(value=str(p.cantidad) if p else "2")
+        self.valor_var = tk.StringVar(value=f"{p.valor:g}" if p else "1")
+        self.prioridad_var = tk.StringVar(value=str(p.prioridad) if p else "0")
+        self.productos_var = tk.StringVar(value=self._productos_a_texto(p.productos) if p else "")
+        self.dias_vars = [tk.BooleanVar(value=not p or not p.dias_semana or str(i) in p.dias_semana) for i in range(7)]
+        self.hora_desde_var = tk.StringVar(value=(p.hora_desde or "") if p else "")
+        self.hora_hasta_var = tk.StringVar(value=(p.hora_hasta or "") if p else "")
+        self.fecha_desde_var = tk.StringVar(value=(p.fecha_desde or "") if p else "")
+        self.fecha_hasta_var = tk.StringVar(value=(p.fecha_hasta or "") if p else "")
+
+        nombre_entry = ttk.Entry(master, textvariable=self.nombre_var, width=40)
+        nombre_entry.grid(row=0, column=1, pady=5, sticky="ew")
+        ttk.Combobox(master, textvariable=self.tipo_var, values=list(self.TIPOS), state="readonly").grid(row=1, column=1, pady=5, sticky="ew")
+        ttk.Entry(master, textvariable=self.cantidad_var).grid(row=2, column=1, pady=5, sticky="ew")
+        ttk.Entry(master, textvariable=self.valor_var).grid(row=3, column=1, pady=5, sticky="ew")
+        ttk.Entry(master, textvariable=self.prioridad_var).grid(row=4, column=1, pady=5, sticky="ew")
+        ttk.Entry(master, textvariable=self.productos_var).grid(row=5, column=1, pady=5, sticky="ew")
+        ttk.Label(master, text="Códigos o nombres separados por ';'. En combos: 'código x unidades'.", foreground="grey").grid(row=6, column=0, columnspan=2, sticky="w")
+
+        dias_frame = ttk.Frame(master)
+        dias_frame.grid(row=7, column=1, sticky="w")
+        for i, letra in enumerate(self.DIAS):
+            ttk.Checkbutton(dias_frame, text=letra, variable=self.dias_vars[i]).pack(side="left")
+        horario_frame = ttk.Frame(master)
+        horario_frame.grid(row=8, column=1, sticky="w")
+        ttk.Entry(horario_frame, textvariable=self.hora_desde_var, width=8).pack(side="left")
+        ttk.Entry(horario_frame, textvariable=self.hora_hasta_var, width=8).pack(side="left", padx=5)
+        vigencia_frame = ttk.Frame(master)
+        vigencia_frame.grid(row=9, column=1, sticky="w")
+        ttk.Entry(vigencia_frame, textvariable=self.fecha_desde_var, width=12).pack(side="left")
+        ttk.Entry(vigencia_frame, textvariable=self.fecha_hasta_var, width=12).pack(side="left", padx=5)
+        master.columnconfigure(1, weight=1)
+        return nombre_entry
+
+    @staticmethod
+    def _productos_a_texto(productos):
+        nombres = {prod.id_producto: prod.codigo_barras or prod.nombre for prod in obtener_productos_por_ids(list(productos))}
+        return "; ".join(
+            f"{nombres.get(id_producto, id_producto)}" + (f" x {unidades}" if unidades > 1 else "")
+            for id_producto, unidades in productos.items()
+        )
+
+    @staticmethod
+    def _resolver_producto(texto):
+        resuelto = resolver_codigo_barras(texto)
+        if resuelto:
+            return resuelto[0]
+        return obtener_producto_por_nombre(texto)
+
+    def _leer_promocion(self):
+        # Lanza ValueError con un mensaje para el usuario si algún dato no es válido.
+        nombre = self.nombre_var.get().strip()
+        if not nombre:
+            raise ValueError("Ingrese un nombre.")
+        try:
+            cantidad = int(self.cantidad_var.get())
+            valor = float(self.valor_var.get().replace(",", "."))
+            prioridad = int(self.prioridad_var.get() or 0)
+        except ValueError:
+            raise ValueError("N y prioridad deben ser enteros y el valor un número.")
+
+        productos = {}
+        for item in filter(None, (x.strip() for x in self.productos_var.get().split(";"))):
+            texto, _, unidades = item.rpartition(" x ") if " x " in item else (item, "", "1")
+            producto = self._resolver_producto(texto.strip())
+            if not producto:
+                raise ValueError(f"No se encontró el producto '{texto.strip()}'.")
+            if not unidades.strip().isdigit() or int(unidades) < 1:
+                raise ValueError(f"Unidades inválidas para '{texto.strip()}'.")
+            productos[producto.id_producto] = int(unidades)
+        if not productos:
+            raise ValueError("Indique al menos un producto.")
+
+        try:
+            for fecha in (self.fecha_desde_var.get().strip(), self.fecha_hasta_var.get().strip()):
+                if fecha:
+                    datetime.strptime(fecha, "%Y-%m-%d")
+            for hora in (self.hora_desde_var.get().strip(), self.hora_hasta_var.get().strip()):
+                if hora:
+                    datetime.strptime(hora, "%H:%M")
+        except ValueError:
+            raise ValueError("Las fechas deben tener el formato AAAA-MM-DD y los horarios HH:MM.")
+
+        dias = "".join(str(i) for i, var in enumerate(self.dias_vars) if var.get())
+        if not dias:
+            raise ValueError("Seleccione al menos un día.")
+        promocion = Promocion(
+            nombre=nombre,
+            tipo=self.TIPOS[self.tipo_var.get()],
+            productos=productos,
+            cantidad=cantidad,
+            valor=valor,
+            prioridad=prioridad,
+            fecha_desde=self.fecha_desde_var.get().strip() or None,
+            fecha_hasta=self.fecha_hasta_var.get().strip() or None,
+            dias_semana=dias if len(dias) < 7 else None,
+            hora_desde=self.hora_desde_var.get().strip() or None,
+            hora_hasta=self.hora_hasta_var.get().strip() or None,
+            activa=self.promocion.activa if self.promocion else True,
+            id_promocion=self.promocion.id_promocion if self.promocion else None,
+        )
+        if compilar_regla(promocion) is None:
+            raise ValueError("La regla no da ningún descuento: revise N y el valor para el tipo elegido.")
+        return promocion
+
+    def validate(self):
+        try:
+            self._leer_promocion()
+            return True
+        except ValueError as e:
+            messagebox.showwarning("Dato Inválido", str(e), parent=self)
+            return False
+
+    def apply(self):
+        self.result = self._leer_promocion()
+
+
+class PaymentWindow(tk.Toplevel):
+    def __init__(self, parent, venta_obj: Venta, callback):
+        super().__init__(parent)
+        self.parent = parent
+        self.venta = venta_obj
+        self.callback = callback
+
+        self.title("Finalizar Venta")
+        self.geometry("400x380")
+        self.resizable(False, False)
+        self.grab_set()
+        self.transient(parent)
+
+        self.create_widgets()
+
+    def create_widgets(self):
+        main_frame = ttk.Frame(self, padding=20)
+        main_frame.grid(row=0, column=0, sticky="nsew")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        ttk.Label(main_frame, text="Total a Pagar:", font=("Helvetica", 14)).grid(row=0, column=0, columnspan=2, pady=(0, 5))
+        ttk.Label(main_frame, text=f"${self.venta.total:.2f}", font=("Helvetica", 28, "bold"), foreground="#4CAF50").grid(row=1, column=0, columnspan=2, pady=(0, 20))
+
+        ttk.Button(main_frame, text="Efectivo", command=self.pay_cash, style="Accent.TButton").grid(row=2, column=0, sticky="ew", padx=(0, 5), pady=5)
+        ttk.Button(main_frame, text="Tarjeta (Débito/Crédito)", command=self.pay_card).grid(row=2, column=1, sticky="ew", padx=(5, 0), pady=5)
+        ttk.Button(main_frame, text="Billetera Virtual (QR)", command=self.pay_qr).grid(row=3, column=0, sticky="ew", padx=(0, 5), pady=5)
+        ttk.Button(main_frame, text="Transferencia Bancaria", command=self.pay_transfer).grid(row=3, column=1, sticky="ew", padx=(5, 0), pady=5)
+
+        fiar_button = ttk.Button(main_frame, text="Fiar (Anotar en Libreta)", command=self.pay_credit, state="normal" if self.venta.id_cliente else "disabled")
+        fiar_button.grid(row=4, column=0, columnspan=2, sticky="ew", pady=5)
+
+        main_frame.grid_columnconfigure(0, weight=1)
+        main_frame.grid_columnconfigure(1, weight=1)
+
+    def pay_cash(self):
+        self.venta.forma_pago = "Efectivo"
+        self.complete_sale()
+
+    def pay_card(self):
+        messagebox.showinfo(
+            "Terminal de Pago",
+            "Por favor, utilice el terminal de pago para completar la transacción.",
+            parent=self
+        )
+
+        pago_aprobado = messagebox.askyesno(
+            "Confirmación de Pago",
+            "¿El pago con tarjeta fue APROBADO?",
+            parent=self
+        )
+
+        if pago_aprobado:
+            self.venta.forma_pago = "Tarjeta"
+            self.complete_sale()
+        else:
+            messagebox.showerror("Pago Fallido", "La transacción con tarjeta fue rechazada o cancelada.", parent=self)
+
+    def pay_qr(self):
+        if MODO_PRUEBA_PAGOS:
+            messagebox.showinfo("Modo de Prueba", "Simulando generación de QR...", parent=self)
+            pago_aprobado = messagebox.askyesno(
+                "Confirmación de Pago (Prueba)",
+                "¿Simular que el pago con QR fue APROBADO?",
+                parent=self
+            )
+            if pago_aprobado:
+                self.venta.forma_pago = "QR (Simulado)"
+                self.complete_sale()
+            else:
+                messagebox.showerror("Pago Cancelado", "La simulación de pago con QR fue cancelada.", parent=self)
+            return
+
+        try:
+            if self.venta.total <= 0:
+                messagebox.showerror("Error", "No se puede generar un pago para una venta con total de $0.00.", parent=self)
+                return
+            
+            if not MP_ACCESS_TOKEN or MP_ACCESS_TOKEN == 'TU_ACCESS_TOKEN_VA_AQUI' or MP_ACCESS_TOKEN == 'NO_CONFIGURADO':
+                messagebox.showerror("Configuración Requerida", 
+                                     "El Access Token de Mercado Pago no está configurado.\n\n"
+                                     "Por favor, edite el archivo 'config.ini' y añada su credencial.", parent=self)
+                return
+
+            sdk = mercadopago.SDK(MP_ACCESS_TOKEN)
+
+            order_data = {
+                "items": [
+                    {
+                        "title": f"Compra en EasySt - Venta #{self.venta.id_venta or 'N/A'}",
+                        "quantity": 1,
+                        "unit_price": self.venta.total
+                    }
+                ],
+                "external_reference": f"VENTA-{self.venta.id_venta or 'NUEVA'}-{datetime.now().timestamp()}",
+                "title": f"Compra en {NOMBRE_NEGOCIO}",
+                "total_amount": self.venta.total,
+                "description": f"Orden de pago para la venta #{self.venta.id_venta or 'N/A'}"
+            }
+
+            order_response = sdk.instore_order().create(order_data)
+            
+            if order_response.get("status") not in [200, 201]:
+                error_info = order_response.get("response", {})
+                error_message = error_info.get("message", "Error desconocido de la API.")
+                messagebox.showerror("Error de Mercado Pago", f"No se pudo crear la orden de pago:\n{error_message}\n\nVerifique que su Access Token sea correcto y esté activado para producción.", parent=self)
+                return
+            
+            qr_data_string = order_response["response"].get("qr_data")
+            if not qr_data_string:
+                messagebox.showerror("Error de Mercado Pago", "La API no devolvió los datos del QR.", parent=self)
+
+            self.show_qr_window(qr_data_string)
+
+            pago_aprobado = messagebox.askyesno(
+                "Confirmación de Pago",
+                "El cliente ha escaneado el QR y completado el pago?",
+                parent=self
+            )
+
+            if pago_aprobado:
+                self.venta.forma_pago = "QR (Mercado Pago)"
+                self.complete_sale()
+            else:
+                messagebox.showerror("Pago Cancelado", "La transacción con QR fue cancelada.", parent=self)
+        except Exception as e:
+            messagebox.showerror("Error de API", f"No se pudo generar el QR de Mercado Pago:\n{e}", parent=self)
+
+    def pay_transfer(self):
+        messagebox.showinfo(
+            "Pago por Transferencia",
+            "Por favor, realice la transferencia y muestre el comprobante.",
+            parent=self
+        )
+
+        pago_aprobado = messagebox.askyesno(
+            "Confirmación de Pago",
+            "¿Se recibió la transferencia correctamente?",
+            parent=self
+        )
+
+        if pago_aprobado:
+            self.venta.forma_pago = "Transferencia"
+            self.complete_sale()
+        else:
+            messagebox.showerror("Pago Fallido", "La transferencia fue rechazada o no se confirmó.", parent=self)
+
+
+    def pay_credit(self):
+        if not self.venta.id_cliente:
+            messagebox.showerror("Error", "No hay un cliente seleccionado para esta venta.", parent=self)
+            return
+        
+        cliente = obtener_cliente_por_id(self.venta.id_cliente)
+        confirm = messagebox.askyesno(
+            "Confirmar Fiar",
             f"¿Desea añadir ${self.venta.total:.2f} a la deuda de {cliente.nombre}?",
             parent=self
         )
@@ -1416,6 +2494,199 @@ class QuantityDialog(simpledialog.Dialog):
         self.bind("<Escape>", self.cancel)
         box.pack()
 
+class ListasPreciosWindow(tk.Toplevel):
+    def __init__(self, parent, callback):
+        super().__init__(parent)
+        self.callback = callback
+        self.title("Listas de Precios")
+        self.geometry("850x400")
+        self.grab_set()
+        self.transient(parent)
+
+        self.create_widgets()
+        self.cargar_listas()
+
+    def create_widgets(self):
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill="both", expand=True)
+
+        listas_frame = ttk.Frame(main_frame)
+        listas_frame.pack(side="left", fill="y")
+        self.tree_listas = ttk.Treeview(listas_frame, columns=("Nombre", "Ajuste", "Clientes"), show="headings")
+        self.tree_listas.heading("Nombre", text="Lista")
+        self.tree_listas.heading("Ajuste", text="Ajuste %")
+        self.tree_listas.heading("Clientes", text="Clientes")
+        self.tree_listas.column("Nombre", width=150)
+        self.tree_listas.column("Ajuste", width=70, anchor="center")
+        self.tree_listas.column("Clientes", width=70, anchor="center")
+        self.tree_listas.pack(fill="y", expand=True)
+        self.tree_listas.bind("<<TreeviewSelect>>", lambda e: self.cargar_precios())
+        self.tree_listas.bind("<Double-1>", self.editar_lista)
+        ttk.Button(listas_frame, text="Nueva Lista", command=self.nueva_lista).pack(fill="x", pady=(10, 0))
+
+        precios_frame = ttk.Frame(main_frame, padding=(10, 0, 0, 0))
+        precios_frame.pack(side="left", fill="both", expand=True)
+        self.tree_precios = ttk.Treeview(precios_frame, columns=("Producto", "PrecioVenta", "Desde", "Precio"), show="headings")
+        self.tree_precios.heading("Producto", text="Producto")
+        self.tree_precios.heading("PrecioVenta", text="Precio Venta")
+        self.tree_precios.heading("Desde", text="Desde (unid.)")
+        self.tree_precios.heading("Precio", text="Precio Lista")
+        for columna in ("PrecioVenta", "Desde", "Precio"):
+            self.tree_precios.column(columna, width=100, anchor="e")
+        self.tree_precios.pack(fill="both", expand=True)
+
+        btn_frame = ttk.Frame(precios_frame, padding=(0, 10, 0, 0))
+        btn_frame.pack(fill="x")
+        ttk.Button(btn_frame, text="Agregar / Modificar Precio", command=self.agregar_precio).pack(side="left")
+        ttk.Button(btn_frame, text="Quitar Precio", command=self.quitar_precio).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Cerrar", command=self.on_close).pack(side="right")
+
+    def lista_seleccionada(self):
+        selection = self.tree_listas.selection()
+        return int(selection[0]) if selection else None
+
+    def cargar_listas(self):
+        seleccion = self.lista_seleccionada()
+        for item in self.tree_listas.get_children():
+            self.tree_listas.delete(item)
+        self.listas = {l['id_lista']: l for l in obtener_listas_precios()}
+        for lista in self.listas.values():
+            self.tree_listas.insert("", "end", iid=lista['id_lista'], values=(lista['nombre'], f"{lista['ajuste_porcentaje']:g}", lista['clientes']))
+        if seleccion in self.listas:
+            self.tree_listas.selection_set(seleccion)
+
+    def cargar_precios(self):
+        for item in self.tree_precios.get_children():
+            self.tree_precios.delete(item)
+        id_lista = self.lista_seleccionada()
+        if id_lista is None:
+            return
+        for fila in obtener_precios_lista(id_lista):
+            self.tree_precios.insert("", "end", iid=f"{fila['id_producto']}-{fila['cantidad_minima']}", values=(
+                fila['nombre'], f"${fila['precio_venta']:.2f}", fila['cantidad_minima'], f"${fila['precio']:.2f}"
+            ))
+
+    def nueva_lista(self):
+        dialog = ListaPreciosDialog(self, "Nueva Lista de Precios")
+        if dialog.result:
+            if agregar_lista_precios(*dialog.result):
+                self.cargar_listas()
+            else:
+                messagebox.showerror("Error", "No se pudo crear la lista (¿nombre repetido?).", parent=self)
+
+    def editar_lista(self, event=None):
+        id_lista = self.lista_seleccionada()
+        if id_lista is None:
+            return
+        dialog = ListaPreciosDialog(self, "Editar Lista de Precios", self.listas[id_lista])
+        if dialog.result:
+            if actualizar_lista_precios(id_lista, *dialog.result):
+                self.cargar_listas()
+            else:
+                messagebox.showerror("Error", "No se pudo actualizar la lista.", parent=self)
+
+    def agregar_precio(self):
+        id_lista = self.lista_seleccionada()
+        if id_lista is None:
+            messagebox.showwarning("Sin Lista", "Seleccione una lista de precios.", parent=self)
+            return
+        dialog = PrecioListaDialog(self, "Precio de Lista")
+        if dialog.result:
+            if guardar_precios_lista(id_lista, [dialog.result]):
+                self.cargar_precios()
+            else:
+                messagebox.showerror("Error", "No se pudo guardar el precio.", parent=self)
+
+    def quitar_precio(self):
+        id_lista = self.lista_seleccionada()
+        selection = self.tree_precios.selection()
+        if id_lista is None or not selection:
+            return
+        precios = [tuple(map(int, iid.split("-"))) + (None,) for iid in selection]
+        if guardar_precios_lista(id_lista, precios):
+            self.cargar_precios()
+
+    def on_close(self):
+        self.callback()
+        self.destroy()
+
+
+class ListaPreciosDialog(simpledialog.Dialog):
+    def __init__(self, parent, title, lista=None):
+        self.lista = lista
+        super().__init__(parent, title)
+
+    def body(self, master):
+        ttk.Label(master, text="Nombre:").grid(row=0, sticky="w", pady=2)
+        ttk.Label(master, text="Ajuste general (%):").grid(row=1, sticky="w", pady=2)
+        ttk.Label(master, text="Se aplica al precio de venta de los productos sin precio en la lista (ej.: -10).", foreground="grey", wraplength=300).grid(row=2, columnspan=2, sticky="w")
+
+        self.nombre_var = tk.StringVar(value=self.lista['nombre'] if self.lista else "")
+        self.ajuste_var = tk.StringVar(value=f"{self.lista['ajuste_porcentaje']:g}" if self.lista else "0")
+        nombre_entry = ttk.Entry(master, textvariable=self.nombre_var)
+        nombre_entry.grid(row=0, column=1, pady=5, sticky="ew")
+        ttk.Entry(master, textvariable=self.ajuste_var).grid(row=1, column=1, pady=5, sticky="ew")
+        master.columnconfigure(1, weight=1)
+        return nombre_entry
+
+    def validate(self):
+        if not self.nombre_var.get().strip():
+            messagebox.showwarning("Dato Inválido", "Ingrese un nombre.", parent=self)
+            return False
+        try:
+            float(self.ajuste_var.get().replace(",", "."))
+            return True
+        except ValueError:
+            messagebox.showwarning("Dato Inválido", "El ajuste debe ser un número.", parent=self)
+            return False
+
+    def apply(self):
+        self.result = (self.nombre_var.get().strip(), float(self.ajuste_var.get().replace(",", ".")))
+
+
+class PrecioListaDialog(simpledialog.Dialog):
+    def body(self, master):
+        ttk.Label(master, text="Producto (código o nombre):").grid(row=0, sticky="w", pady=2)
+        ttk.Label(master, text="Desde (unidades):").grid(row=1, sticky="w", pady=2)
+        ttk.Label(master, text="Precio:").grid(row=2, sticky="w", pady=2)
+
+        self.producto_var = tk.StringVar()
+        self.cantidad_var = tk.StringVar(value="1")
+        self.precio_var = tk.StringVar()
+        producto_entry = ttk.Entry(master, textvariable=self.producto_var)
+        producto_entry.grid(row=0, column=1, pady=5, sticky="ew")
+        ttk.Entry(master, textvariable=self.cantidad_var).grid(row=1, column=1, pady=5, sticky="ew")
+        ttk.Entry(master, textvariable=self.precio_var).grid(row=2, column=1, pady=5, sticky="ew")
+        master.columnconfigure(1, weight=1)
+        return producto_entry
+
+    def _leer(self):
+        texto = self.producto_var.get().strip()
+        resuelto = resolver_codigo_barras(texto)
+        producto = resuelto[0] if resuelto else obtener_producto_por_nombre(texto)
+        if not producto:
+            raise ValueError(f"No se encontró el producto '{texto}'.")
+        try:
+            cantidad_minima = int(self.cantidad_var.get())
+            precio = float(self.precio_var.get().replace(",", "."))
+        except ValueError:
+            raise ValueError("La cantidad debe ser un entero y el precio un número.")
+        if cantidad_minima < 1 or precio < 0:
+            raise ValueError("La cantidad debe ser al menos 1 y el precio no puede ser negativo.")
+        return (producto.id_producto, cantidad_minima, precio)
+
+    def validate(self):
+        try:
+            self._leer()
+            return True
+        except ValueError as e:
+            messagebox.showwarning("Dato Inválido", str(e), parent=self)
+            return False
+
+    def apply(self):
+        self.result = self._leer()
+
+
 class ClientFormWindow(tk.Toplevel):
     def __init__(self, parent, callback, cliente_a_editar=None):
         super().__init__(parent)
@@ -1423,7 +2694,7 @@ class ClientFormWindow(tk.Toplevel):
         self.cliente_a_editar = cliente_a_editar
 
         self.title("Editar Cliente" if cliente_a_editar else "Añadir Cliente")
-        self.geometry("350x250")
+        self.geometry("350x290")
         self.resizable(False, False)
         self.grab_set()
         self.transient(parent)
@@ -1451,6 +2722,12 @@ class ClientFormWindow(tk.Toplevel):
         ttk.Label(main_frame, text="Fecha Límite Pago (AAAA-MM-DD):").grid(row=2, column=0, sticky="w", pady=5)
         ttk.Entry(main_frame, textvariable=self.vars["fecha_limite_pago"]).grid(row=2, column=1, sticky="ew", pady=5)
 
+        self.listas = {"(Ninguna)": None}
+        self.listas.update({l['nombre']: l['id_lista'] for l in obtener_listas_precios()})
+        self.lista_var = tk.StringVar(value="(Ninguna)")
+        ttk.Label(main_frame, text="Lista de Precios:").grid(row=3, column=0, sticky="w", pady=5)
+        ttk.Combobox(main_frame, textvariable=self.lista_var, values=list(self.listas), state="readonly").grid(row=3, column=1, sticky="ew", pady=5)
+
         main_frame.columnconfigure(1, weight=1)
 
         btn_frame = ttk.Frame(self, padding=(0,0,0,10))
@@ -1463,6 +2740,7 @@ class ClientFormWindow(tk.Toplevel):
         self.vars["nombre"].set(c.nombre)
         self.vars["dni"].set(c.dni or "")
         self.vars["fecha_limite_pago"].set(c.fecha_limite_pago or "")
+        self.lista_var.set(next((nombre for nombre, id_lista in self.listas.items() if id_lista == c.id_lista_precios), "(Ninguna)"))
 
     def guardar_cliente(self):
         nombre = self.vars["nombre"].get().strip()
@@ -1479,11 +2757,13 @@ class ClientFormWindow(tk.Toplevel):
                 return
 
         dni = self.vars["dni"].get().strip() or None
+        id_lista_precios = self.listas[self.lista_var.get()]
 
         if self.cliente_a_editar:
             self.cliente_a_editar.nombre = nombre
             self.cliente_a_editar.dni = dni
             self.cliente_a_editar.fecha_limite_pago = fecha_limite
+            self.cliente_a_editar.id_lista_precios = id_lista_precios
             if actualizar_cliente(self.cliente_a_editar):
                 messagebox.showinfo("í‰xito", "Cliente actualizado.", parent=self)
                 self.destroy()
@@ -1491,7 +2771,7 @@ class ClientFormWindow(tk.Toplevel):
             else:
                 messagebox.showerror("Error", "No se pudo actualizar el cliente.", parent=self)
         else:
-            nuevo_cliente = Cliente(nombre=nombre, dni=dni, fecha_limite_pago=fecha_limite)
+            nuevo_cliente = Cliente(nombre=nombre, dni=dni, fecha_limite_pago=fecha_limite, id_lista_precios=id_lista_precios)
             if agregar_cliente(nuevo_cliente):
                 messagebox.showinfo("í‰xito", "Cliente creado.", parent=self)
                 self.destroy()
@@ -1515,7 +2795,11 @@ class PaymentDialog(simpledialog.Dialog):
         self.entry.focus_set()
         self.entry.select_range(0, tk.END)
 
-        ttk.Button(master, text="Pagar Totalidad", command=self.set_total_payment).grid(row=2, column=1, sticky="e", pady=5)
+        ttk.Label(master, text="Forma de Pago:").grid(row=2, column=0, sticky="w")
+        self.forma_pago_var = tk.StringVar(value="Efectivo")
+        ttk.Combobox(master, textvariable=self.forma_pago_var, values=["Efectivo", "Tarjeta", "Transferencia"], state="readonly").grid(row=2, column=1, sticky="ew", pady=5)
+
+        ttk.Button(master, text="Pagar Totalidad", command=self.set_total_payment).grid(row=3, column=1, sticky="e", pady=5)
         return self.entry
 
     def set_total_payment(self):
@@ -1531,7 +2815,7 @@ class PaymentDialog(simpledialog.Dialog):
                 if not messagebox.askyesno("Confirmación", "El monto es mayor a la deuda actual. ¿Desea registrarlo como saldo a favor?"):
                     return
             
-            self.result = monto
+            self.result = (monto, self.forma_pago_var.get())
             self.destroy() # Close ONLY if valid
         except tk.TclError:
             messagebox.showerror("Error", "Ingrese un número válido.", parent=self)
@@ -1708,6 +2992,159 @@ class ClientAccountDetailWindow(tk.Toplevel):
             pass
 
 
+class CajaView(ttk.Frame):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.parent = parent
+        self.usuario = getattr(self.winfo_toplevel(), 'current_user', None) or "Sin usuario"
+        self.create_widgets()
+        self.cargar_turno_abierto()
+        self.cargar_historial()
+
+    def create_widgets(self):
+        turno_frame = ttk.LabelFrame(self, text="Turno Actual", padding=10)
+        turno_frame.pack(side="top", fill="x", padx=10, pady=10)
+
+        self.estado_turno_var = tk.StringVar()
+        ttk.Label(turno_frame, textvariable=self.estado_turno_var, font=("Helvetica", 12, "bold")).pack(side="left")
+        self.cerrar_btn = ttk.Button(turno_frame, text="Cerrar Turno", command=self.cerrar_turno, style="Accent.TButton")
+        self.cerrar_btn.pack(side="right", padx=5)
+        self.abrir_btn = ttk.Button(turno_frame, text="Abrir Turno", command=self.abrir_turno)
+        self.abrir_btn.pack(side="right", padx=5)
+
+        historial_frame = ttk.LabelFrame(self, text="Historial de Turnos", padding=10)
+        historial_frame.pack(side="top", fill="both", expand=True, padx=10, pady=(0, 10))
+
+        filtros_frame = ttk.Frame(historial_frame)
+        filtros_frame.pack(fill="x", pady=(0, 5))
+        ttk.Label(filtros_frame, text="Cajero:").pack(side="left")
+        self.filtro_usuario_var = tk.StringVar(value="Todos")
+        self.filtro_usuario_cb = ttk.Combobox(filtros_frame, textvariable=self.filtro_usuario_var, state="readonly", width=15)
+        self.filtro_usuario_cb.pack(side="left", padx=5)
+        ttk.Label(filtros_frame, text="Desde (AAAA-MM-DD):").pack(side="left", padx=(10, 0))
+        self.fecha_desde_var = tk.StringVar(value=(datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
+        ttk.Entry(filtros_frame, textvariable=self.fecha_desde_var, width=12).pack(side="left", padx=5)
+        ttk.Label(filtros_frame, text="Hasta:").pack(side="left")
+        self.fecha_hasta_var = tk.StringVar(value=datetime.now().strftime('%Y-%m-%d'))
+        ttk.Entry(filtros_frame, textvariable=self.fecha_hasta_var, width=12).pack(side="left", padx=5)
+        ttk.Button(filtros_frame, text="Buscar", command=self.cargar_historial).pack(side="left", padx=5)
+        ttk.Button(filtros_frame, text="Ver Reporte Z", command=self.ver_reporte).pack(side="right")
+
+        columnas = ("ID", "Cajero", "Apertura", "Cierre", "Ventas", "Total Ventas", "Cobros", "Diferencia")
+        self.tree = ttk.Treeview(historial_frame, columns=columnas, show="headings")
+        for columna in columnas:
+            self.tree.heading(columna, text=columna)
+        self.tree.column("ID", width=50, anchor="center")
+        self.tree.column("Ventas", width=70, anchor="center")
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar = ttk.Scrollbar(historial_frame, orient="vertical", command=self.tree.yview)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.bind("<Double-1>", self.ver_reporte)
+
+    def cargar_turno_abierto(self):
+        self.turno_abierto = obtener_turno_abierto()
+        if self.turno_abierto:
+            self.estado_turno_var.set(f"Turno #{self.turno_abierto['id_turno']} abierto por {self.turno_abierto['usuario']} desde {self.turno_abierto['apertura']}")
+            self.abrir_btn.config(state="disabled")
+            self.cerrar_btn.config(state="normal")
+        else:
+            self.estado_turno_var.set("No hay un turno de caja abierto. Las ventas no se asignarán a ningún turno.")
+            self.abrir_btn.config(state="normal")
+            self.cerrar_btn.config(state="disabled")
+
+    def cargar_historial(self):
+        usuarios = obtener_usuarios_turnos()
+        self.filtro_usuario_cb['values'] = ["Todos"] + usuarios
+        usuario = self.filtro_usuario_var.get()
+        turnos = obtener_turnos(
+            usuario=None if usuario == "Todos" else usuario,
+            fecha_desde=self.fecha_desde_var.get().strip() or None,
+            fecha_hasta=self.fecha_hasta_var.get().strip() or None
+        )
+        self.tree.delete(*self.tree.get_children())
+        for turno in turnos:
+            diferencia = "" if turno['diferencia'] is None else f"${turno['diferencia']:.2f}"
+            self.tree.insert("", "end", iid=turno['id_turno'], values=(
+                turno['id_turno'], turno['usuario'], turno['apertura'], turno['cierre'] or "Abierto",
+                turno['cantidad_ventas'], f"${turno['total_ventas']:.2f}", f"${turno['total_cobros']:.2f}", diferencia
+            ))
+
+    def abrir_turno(self):
+        monto_inicial = simpledialog.askfloat("Abrir Turno", f"Cajero: {self.usuario}\n\nMonto inicial en caja ($):", parent=self, minvalue=0.0, initialvalue=0.0)
+        if monto_inicial is None:
+            return
+        if abrir_turno(self.usuario, monto_inicial) is None:
+            messagebox.showerror("Error", "No se pudo abrir el turno. Verifique que no haya otro turno abierto.")
+        self.cargar_turno_abierto()
+        self.cargar_historial()
+
+    def cerrar_turno(self):
+        if not self.turno_abierto:
+            return
+        monto_contado = simpledialog.askfloat("Cerrar Turno", "Efectivo contado en caja ($):", parent=self, minvalue=0.0)
+        if monto_contado is None:
+            return
+        reporte = cerrar_turno(self.turno_abierto['id_turno'], monto_contado)
+        if reporte is None:
+            messagebox.showerror("Error", "No se pudo cerrar el turno.")
+        else:
+            TurnoReportWindow(self, reporte)
+        self.cargar_turno_abierto()
+        self.cargar_historial()
+
+    def ver_reporte(self, event=None):
+        selection = self.tree.selection()
+        if not selection:
+            messagebox.showwarning("Sin Selección", "Seleccione un turno para ver su reporte.")
+            return
+        reporte = obtener_reporte_turno(int(selection[0]))
+        if reporte:
+            TurnoReportWindow(self, reporte)
+
+
+class TurnoReportWindow(tk.Toplevel):
+    # Reporte Z de un turno: lo vendido y cobrado por forma de pago y el arqueo del efectivo.
+    def __init__(self, parent, reporte):
+        super().__init__(parent)
+        self.title(f"Reporte Z - Turno #{reporte['id_turno']}")
+        self.transient(parent)
+        self.grab_set()
+
+        main_frame = ttk.Frame(self, padding=15)
+        main_frame.pack(fill="both", expand=True)
+
+        ttk.Label(main_frame, text=f"Cajero: {reporte['usuario']}", font=("Helvetica", 11, "bold")).pack(anchor="w")
+        ttk.Label(main_frame, text=f"Apertura: {reporte['apertura']}    Cierre: {reporte['cierre'] or 'Abierto'}").pack(anchor="w", pady=(0, 10))
+
+        tree = ttk.Treeview(main_frame, columns=("Forma", "Ventas", "Total", "Cobros"), show="headings", height=6)
+        tree.heading("Forma", text="Forma de Pago")
+        tree.heading("Ventas", text="Cant. Ventas")
+        tree.heading("Total", text="Total Ventas")
+        tree.heading("Cobros", text="Cobros Cta. Cte.")
+        tree.column("Ventas", width=90, anchor="center")
+        for total in reporte['totales']:
+            tree.insert("", "end", values=(total['forma_pago'], total['cantidad_ventas'], f"${total['total_ventas']:.2f}", f"${total['total_cobros']:.2f}"))
+        tree.pack(fill="both", expand=True)
+
+        resumen_frame = ttk.Frame(main_frame, padding=(0, 10, 0, 0))
+        resumen_frame.pack(fill="x")
+        filas = [
+            ("Ventas del turno:", f"{reporte['cantidad_ventas']} (${reporte['total_ventas']:.2f})"),
+            ("Cobros de cuenta corriente:", f"${reporte['total_cobros']:.2f}"),
+            ("Monto inicial:", f"${reporte['monto_inicial']:.2f}"),
+            ("Efectivo esperado:", f"${reporte['efectivo_esperado']:.2f}"),
+        ]
+        if reporte['monto_contado'] is not None:
+            filas.append(("Efectivo contado:", f"${reporte['monto_contado']:.2f}"))
+            filas.append(("Diferencia:", f"${reporte['diferencia']:.2f}"))
+        for i, (etiqueta, valor) in enumerate(filas):
+            ttk.Label(resumen_frame, text=etiqueta, font=("Helvetica", 10, "bold")).grid(row=i, column=0, sticky="w", padx=(0, 10))
+            ttk.Label(resumen_frame, text=valor).grid(row=i, column=1, sticky="w")
+
+        ttk.Button(main_frame, text="Cerrar", command=self.destroy).pack(pady=(10, 0))
+
+
 class ReportesView(ttk.Frame):
     def __init__(self, parent):
         super().__init__(parent)
@@ -1723,6 +3160,22 @@ class ReportesView(ttk.Frame):
         notebook.add(self.restock_frame, text="Sugerencias de Reposición")
         self.create_restock_suggestion_widgets()
 
+        self.expiry_frame = ttk.Frame(notebook)
+        notebook.add(self.expiry_frame, text="Vencimientos")
+        self.create_expiry_report_widgets()
+
+        self.aging_frame = ttk.Frame(notebook)
+        notebook.add(self.aging_frame, text="Antigüedad de Deuda")
+        self.create_aging_report_widgets()
+
+        self.margin_frame = ttk.Frame(notebook)
+        notebook.add(self.margin_frame, text="Márgenes")
+        self.create_margin_report_widgets()
+
+        self.search_frame = ttk.Frame(notebook)
+        notebook.add(self.search_frame, text="Buscar Ventas")
+        self.create_sales_search_widgets()
+
     def create_sales_report_widgets(self):
         controls_frame = ttk.Frame(self.sales_frame, padding=10)
         controls_frame.pack(fill="x")
@@ -1733,9 +3186,14 @@ class ReportesView(ttk.Frame):
         periodo_cb.pack(side="left", padx=5)
         periodo_cb.bind("<<ComboboxSelected>>", self.on_period_change)
         
-        ttk.Button(controls_frame, text="Actualizar", command=self.cargar_reporte).pack(side="left", padx=5)
+        self.boton_actualizar = ttk.Button(controls_frame, text="Actualizar", command=self.actualizar_datos)
+        self.boton_actualizar.pack(side="left", padx=5)
         ttk.Button(controls_frame, text="Ver Detalle Venta", command=self.mostrar_detalle_venta).pack(side="left", padx=5)
         ttk.Button(controls_frame, text="Exportar a Excel", command=self.exportar_a_excel).pack(side="right", padx=5)
+        self.boton_parquet = ttk.Button(controls_frame, text="Exportar para Análisis", command=self.exportar_para_analisis)
+        self.boton_parquet.pack(side="right", padx=5)
+        self.snapshot_var = tk.StringVar()
+        ttk.Label(controls_frame, textvariable=self.snapshot_var, foreground="grey").pack(side="right", padx=10)
 
         content_frame = ttk.Frame(self.sales_frame)
         content_frame.pack(fill="both", expand=True, padx=10, pady=5)
@@ -1777,8 +3235,20 @@ class ReportesView(ttk.Frame):
     def on_period_change(self, event=None):
         self.cargar_reporte()
 
-    def cargar_reporte(self):
-        periodo = self.periodo_var.get()
+    def actualizar_datos(self):
+        # Los reportes leen de una copia en memoria; "Actualizar" la renueva con los datos actuales.
+        # La copia de una BD grande tarda: se hace en segundo plano y el reporte se recarga al terminar.
+        self.boton_actualizar.config(state="disabled")
+        self.snapshot_var.set("Actualizando datos...")
+        refrescar_snapshot_reportes_en_segundo_plano(lambda: self.after(0, self.finalizar_actualizacion_datos))
+
+    def finalizar_actualizacion_datos(self):
+        self.boton_actualizar.config(state="normal")
+        # Si la copia falló no se vuelve a pedir sola: el reporte queda con lo que había.
+        self.cargar_reporte(renovar_vencido=False)
+
+    @staticmethod
+    def rango_del_periodo(periodo):
         now = datetime.now()
         
         if periodo == "Hoy":
@@ -1793,26 +3263,36 @@ class ReportesView(ttk.Frame):
         else: # Año actual
             start_date = now.strftime("%Y-01-01")
             end_date = now.strftime("%Y-%m-%d")
+        return start_date, end_date
+
+    def cargar_reporte(self, renovar_vencido=True):
+        # Con la copia vencida (o sin copia todavía) se muestra lo que hay y se recarga al renovarla.
+        if renovar_vencido and snapshot_reportes_vencido():
+            self.actualizar_datos()
+        start_date, end_date = self.rango_del_periodo(self.periodo_var.get())
 
-        self.ventas_actuales = obtener_ventas_por_rango_de_fechas(start_date, end_date)
+        self.rango_actual = (start_date, end_date)
+        self.ventas_df = obtener_ventas_df(start_date, end_date, desde_snapshot=True)
+        antiguedad = obtener_antiguedad_snapshot_reportes()
+        if antiguedad is not None:
+            self.snapshot_var.set(f"Datos al {(datetime.now() - antiguedad).strftime('%H:%M:%S')}")
         
         for item in self.tree.get_children():
             self.tree.delete(item)
         
-        total_periodo = 0
-        for venta in self.ventas_actuales:
+        fechas_fmt = self.ventas_df['fecha_venta'].dt.strftime("%d/%m/%Y %H:%M")
+        for venta, fecha_fmt in zip(self.ventas_df.itertuples(index=False), fechas_fmt):
             self.tree.insert("", "end", iid=venta.id_venta, values=(
                 venta.id_venta,
-                datetime.strptime(venta.fecha_venta, "%Y-%m-%d %H:%M:%S").strftime("%d/%m/%Y %H:%M"),
+                fecha_fmt,
                 venta.nombre_cliente,
                 f"${venta.total:.2f}",
                 venta.forma_pago
             ))
-            total_periodo += venta.total
         
-        self.total_ventas_var.set(f"${total_periodo:.2f}")
+        self.total_ventas_var.set(f"${self.ventas_df['total'].sum():.2f}")
 
-        total_pagos_recibidos = obtener_pagos_recibidos_por_rango(start_date, end_date)
+        total_pagos_recibidos = obtener_pagos_recibidos_por_rango(start_date, end_date, desde_snapshot=True)
         self.total_pagos_recibidos_var.set(f"${total_pagos_recibidos:.2f}")
 
         self.actualizar_grafico()
@@ -1822,7 +3302,7 @@ class ReportesView(ttk.Frame):
         if not selection: return
         
         id_venta = int(selection[0])
-        venta = next((v for v in self.ventas_actuales if v.id_venta == id_venta), None)
+        venta = obtener_venta_por_id(id_venta, desde_snapshot=True)
         
         if venta:
             SaleDetailWindow(self, venta)
@@ -1830,21 +3310,13 @@ class ReportesView(ttk.Frame):
     def actualizar_grafico(self):
         self.ax.clear()
         
-        if not self.ventas_actuales:
+        if self.ventas_df.empty:
             self.canvas.draw()
             return
-            
-        fechas = [datetime.strptime(v.fecha_venta, "%Y-%m-%d %H:%M:%S").date() for v in self.ventas_actuales]
-        totales = defaultdict(float)
-        
-        for v in self.ventas_actuales:
-             fecha = datetime.strptime(v.fecha_venta, "%Y-%m-%d %H:%M:%S").date()
-             totales[fecha] += v.total
-             
-        fechas_unicas = sorted(list(totales.keys()))
-        montos = [totales[f] for f in fechas_unicas]
+
+        totales = self.ventas_df.groupby(self.ventas_df['fecha_venta'].dt.normalize())['total'].sum().sort_index()
         
-        self.ax.plot(fechas_unicas, montos, marker='o', linestyle='-')
+        self.ax.plot(totales.index, totales.values, marker='o', linestyle='-')
         self.ax.set_title("Ventas por Día")
         self.ax.grid(True)
         self.fig.autofmt_xdate()
@@ -1852,7 +3324,7 @@ class ReportesView(ttk.Frame):
         self.canvas.draw()
 
     def exportar_a_excel(self):
-        if not self.ventas_actuales:
+        if self.ventas_df.empty:
              messagebox.showwarning("Sin Datos", "No hay ventas para exportar.")
              return
 
@@ -1863,24 +3335,58 @@ class ReportesView(ttk.Frame):
         )
         
         if not filepath: return
-        
-        data = []
-        for v in self.ventas_actuales:
-            data.append({
-                "ID Venta": v.id_venta,
-                "Fecha": v.fecha_venta,
-                "Cliente": v.nombre_cliente,
-                "Total": v.total,
-                "Forma Pago": v.forma_pago
-            })
-            
-        df = pd.DataFrame(data)
+
+        start_date, end_date = self.rango_actual
+        filas = (
+            fila
+            for df in iter_ventas_df(start_date, end_date, desde_snapshot=True)
+            for fila in df.itertuples(index=False, name=None)
+        )
         try:
-            df.to_excel(filepath, index=False)
+            exportar_filas_a_excel(filepath, ["ID Venta", "Fecha", "Cliente", "Total", "Forma Pago"], filas)
             messagebox.showinfo("Exportar", "Reporte exportado con éxito.")
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo exportar: {e}")
 
+    def exportar_para_analisis(self):
+        # Ventas, detalle, stock y cuentas de clientes en Parquet por mes, sin el límite de filas de Excel.
+        if not parquet_disponible():
+            messagebox.showerror("Exportar para Análisis", "Falta el paquete 'pyarrow'. Instálelo para exportar en formato Parquet.", parent=self)
+            return
+        directorio = filedialog.askdirectory(title="Carpeta de exportación para análisis", parent=self)
+        if not directorio:
+            return
+        incremental = messagebox.askyesnocancel(
+            "Exportar para Análisis",
+            "¿Exportar solo los meses nuevos?\n\nSí: agrega los meses posteriores a la última exportación de esta carpeta.\n"
+            "No: vuelve a exportar todo el historial.",
+            parent=self
+        )
+        if incremental is None:
+            return
+
+        self.boton_parquet.config(state="disabled")
+        texto_snapshot = self.snapshot_var.get()
+
+        def progreso(conjunto, filas):
+            self.after(0, self.snapshot_var.set, f"Exportando {conjunto}: {filas} filas...")
+
+        def tarea():
+            informe = exportar_parquet(directorio, incremental=incremental, progreso=progreso)
+            self.after(0, self.finalizar_exportacion_analisis, informe, texto_snapshot)
+
+        threading.Thread(target=tarea, daemon=True).start()
+
+    def finalizar_exportacion_analisis(self, informe, texto_snapshot):
+        self.boton_parquet.config(state="normal")
+        self.snapshot_var.set(texto_snapshot)
+        if informe is None:
+            messagebox.showerror("Exportar para Análisis", "No se pudo completar la exportación.", parent=self)
+            return
+        lineas = [f"{nombre}: {datos['filas']} filas" + (f" ({len(datos['meses'])} meses)" if datos['meses'] is not None else "")
+                  for nombre, datos in informe['conjuntos'].items()]
+        messagebox.showinfo("Exportar para Análisis", "Exportación finalizada en {:.1f} s.\n\n{}".format(informe['segundos'], "\n".join(lineas)), parent=self)
+
     def create_restock_suggestion_widgets(self):
         f = ttk.Frame(self.restock_frame, padding=10)
         f.pack(fill="x")
@@ -1897,6 +3403,7 @@ class ReportesView(ttk.Frame):
 
         ttk.Button(f, text="Generar Sugerencias", command=self.generar_sugerencias).pack(side="left", padx=10)
         ttk.Button(f, text="Exportar", command=self.exportar_sugerencias_a_excel).pack(side="right")
+        ttk.Button(f, text="Generar Orden de Compra", command=self.generar_orden_compra).pack(side="right", padx=5)
 
         self.tree_sugg = ttk.Treeview(self.restock_frame, columns=("Producto", "Stock Actual", "Ventas Periodo", "Venta Prom/Dia", "Stock Sugerido", "A Comprar"), show="headings")
         self.tree_sugg.heading("Producto", text="Producto")
@@ -1908,7 +3415,7 @@ class ReportesView(ttk.Frame):
         
         self.tree_sugg.pack(fill="both", expand=True, padx=10, pady=10)
 
-        self.sugerencias_data = []
+        self.sugerencias_df = None
 
     def generar_sugerencias(self):
         try:
@@ -1921,20 +3428,38 @@ class ReportesView(ttk.Frame):
         for item in self.tree_sugg.get_children():
             self.tree_sugg.delete(item)
 
-        self.sugerencias_data = obtener_sugerencias_reposicion(dias_an, dias_cob)
+        self.sugerencias_df = obtener_sugerencias_reposicion_df(dias_an, dias_cob, desde_snapshot=True)
         
-        for row in self.sugerencias_data:
+        for row in self.sugerencias_df.itertuples(index=False):
             self.tree_sugg.insert("", "end", values=(
-                row['nombre'],
-                row['stock_actual'],
-                row['ventas_periodo'],
-                f"{row['venta_diaria_prom']:.2f}",
-                f"{row['stock_sugerido']:.2f}",
-                int(row['cantidad_a_comprar'])
+                row.nombre,
+                f"{row.stock_actual:g}",
+                row.ventas_periodo,
+                f"{row.venta_diaria_prom:.2f}",
+                f"{row.stock_sugerido:.2f}",
+                row.cantidad_a_comprar
             ))
 
+    def generar_orden_compra(self):
+        try:
+            dias_an = int(self.dias_analisis_entry.get())
+            dias_cob = int(self.dias_cobertura_entry.get())
+        except ValueError:
+            messagebox.showerror("Error", "Ingrese números válidos para los días.")
+            return
+        proveedor = simpledialog.askstring("Orden de Compra", "Proveedor (opcional):", parent=self)
+        if proveedor is None:
+            return
+        # Las sugerencias se recalculan sobre la BD (no el snapshot) y se descuenta lo ya pedido en otras órdenes.
+        id_orden = crear_orden_compra_desde_sugerencias(dias_an, dias_cob, proveedor.strip() or None)
+        if id_orden is None:
+            messagebox.showinfo("Orden de Compra", "No se generó la orden: no hay productos para reponer o ya están pedidos en otras órdenes abiertas.", parent=self)
+            return
+        messagebox.showinfo("Orden de Compra", f"Se generó la orden de compra #{id_orden}.", parent=self)
+        OrdenesCompraWindow(self)
+
     def exportar_sugerencias_a_excel(self):
-        if not self.sugerencias_data:
+        if self.sugerencias_df is None or self.sugerencias_df.empty:
              messagebox.showwarning("Sin Datos", "Genere las sugerencias primero.")
              return
 
@@ -1946,14 +3471,361 @@ class ReportesView(ttk.Frame):
         
         if not filepath: return
         
-        data = [dict(row) for row in self.sugerencias_data]
-        df = pd.DataFrame(data)
         try:
-            df.to_excel(filepath, index=False)
+            self.sugerencias_df.to_excel(filepath, index=False)
             messagebox.showinfo("Exportar", "Sugerencias exportadas con éxito.")
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo exportar: {e}")
 
+    def create_expiry_report_widgets(self):
+        f = ttk.Frame(self.expiry_frame, padding=10)
+        f.pack(fill="x")
+
+        ttk.Label(f, text="Vencen en los próximos (días):").pack(side="left")
+        self.dias_vencimiento_entry = ttk.Entry(f, width=5)
+        self.dias_vencimiento_entry.pack(side="left", padx=5)
+        self.dias_vencimiento_entry.insert(0, str(DIAS_AVISO_VENCIMIENTO))
+
+        ttk.Button(f, text="Actualizar", command=self.cargar_vencimientos).pack(side="left", padx=10)
+        ttk.Button(f, text="Exportar", command=self.exportar_vencimientos_a_excel).pack(side="right")
+        self.resumen_vencimientos_var = tk.StringVar()
+        ttk.Label(f, textvariable=self.resumen_vencimientos_var, foreground="grey").pack(side="right", padx=10)
+
+        self.tree_venc = ttk.Treeview(self.expiry_frame, columns=("Producto", "Lote", "Cantidad", "Vencimiento", "Dias"), show="headings")
+        self.tree_venc.heading("Producto", text="Producto")
+        self.tree_venc.heading("Lote", text="Cód. Lote")
+        self.tree_venc.heading("Cantidad", text="Cantidad")
+        self.tree_venc.heading("Vencimiento", text="Vencimiento")
+        self.tree_venc.heading("Dias", text="Días Restantes")
+        self.tree_venc.column("Cantidad", width=80, anchor="center")
+        self.tree_venc.column("Vencimiento", width=100, anchor="center")
+        self.tree_venc.column("Dias", width=100, anchor="center")
+        self.tree_venc.tag_configure('vencido', background='#FFCDD2', foreground='black')
+        self.tree_venc.pack(fill="both", expand=True, padx=10, pady=10)
+
+        self.vencimientos = []
+
+    def cargar_vencimientos(self):
+        try:
+            dias = int(self.dias_vencimiento_entry.get())
+        except ValueError:
+            messagebox.showerror("Error", "Ingrese un número válido de días.")
+            return
+
+        # El escaneo en segundo plano mantiene la lista al día y acá solo se completan los cambios
+        # recientes, pero con otra ventana o con el cambio de día se relee todo: va en un hilo aparte.
+        self.resumen_vencimientos_var.set("Buscando lotes por vencer...")
+
+        def tarea():
+            vencimientos = actualizar_vencimientos(dias)
+            self.after(0, self.mostrar_vencimientos, vencimientos)
+
+        threading.Thread(target=tarea, daemon=True).start()
+
+    def mostrar_vencimientos(self, vencimientos):
+        self.vencimientos = vencimientos
+        for item in self.tree_venc.get_children():
+            self.tree_venc.delete(item)
+
+        for lote in self.vencimientos:
+            self.tree_venc.insert("", "end", iid=lote['id_stock'], values=(
+                lote['nombre'],
+                lote['codigo_barras'] or "",
+                lote['cantidad'],
+                formatear_fecha(lote['fecha_vencimiento']),
+                lote['dias_para_vencer']
+            ), tags=('vencido',) if lote['dias_para_vencer'] < 0 else ())
+
+        unidades = sum(lote['cantidad'] for lote in self.vencimientos)
+        self.resumen_vencimientos_var.set(f"{len(self.vencimientos)} lotes, {unidades} unidades")
+
+    def exportar_vencimientos_a_excel(self):
+        if not self.vencimientos:
+             messagebox.showwarning("Sin Datos", "No hay lotes por vencer para exportar.")
+             return
+
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel Files", "*.xlsx")],
+            title="Guardar Lotes por Vencer"
+        )
+
+        if not filepath: return
+
+        filas = (
+            (lote['nombre'], lote['codigo_barras'], lote['cantidad'], lote['fecha_vencimiento'], lote['dias_para_vencer'])
+            for lote in self.vencimientos
+        )
+        try:
+            exportar_filas_a_excel(filepath, ["Producto", "Cód. Lote", "Cantidad", "Vencimiento", "Días Restantes"], filas)
+            messagebox.showinfo("Exportar", "Lotes por vencer exportados con éxito.")
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo exportar: {e}")
+
+    def create_aging_report_widgets(self):
+        f = ttk.Frame(self.aging_frame, padding=10)
+        f.pack(fill="x")
+
+        ttk.Button(f, text="Generar Reporte", command=self.generar_antiguedad_deuda).pack(side="left")
+        ttk.Button(f, text="Exportar", command=self.exportar_antiguedad_deuda_a_excel).pack(side="right")
+        self.total_deuda_var = tk.StringVar()
+        ttk.Label(f, textvariable=self.total_deuda_var, font=("Helvetica", 10, "bold")).pack(side="right", padx=10)
+
+        columnas = ("Cliente", "DNI", "Fecha Limite", "0-30", "31-60", "61-90", "+90", "Total")
+        self.tree_aging = ttk.Treeview(self.aging_frame, columns=columnas, show="headings")
+        for columna, titulo in zip(columnas, ("Cliente", "DNI", "Fecha Límite", "0-30 días", "31-60 días", "61-90 días", "+90 días", "Total")):
+            self.tree_aging.heading(columna, text=titulo)
+        for columna in columnas[3:]:
+            self.tree_aging.column(columna, width=100, anchor="e")
+        self.tree_aging.pack(fill="both", expand=True, padx=10, pady=10)
+
+        self.antiguedad_df = None
+
+    def generar_antiguedad_deuda(self):
+        for item in self.tree_aging.get_children():
+            self.tree_aging.delete(item)
+
+        self.antiguedad_df = obtener_antiguedad_deuda_df(desde_snapshot=True)
+
+        for row in self.antiguedad_df.itertuples(index=False):
+            self.tree_aging.insert("", "end", iid=row.id_cliente, values=(
+                row.nombre,
+                row.dni or "-",
+                formatear_fecha(row.fecha_limite_pago) if row.fecha_limite_pago else "-",
+                f"${row.corriente:.2f}",
+                f"${row.dias_31_60:.2f}",
+                f"${row.dias_61_90:.2f}",
+                f"${row.dias_mas_90:.2f}",
+                f"${row.total:.2f}"
+            ))
+        self.total_deuda_var.set(f"Total adeudado: ${self.antiguedad_df['total'].sum():.2f}")
+
+    def exportar_antiguedad_deuda_a_excel(self):
+        if self.antiguedad_df is None or self.antiguedad_df.empty:
+             messagebox.showwarning("Sin Datos", "Genere el reporte primero.")
+             return
+
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel Files", "*.xlsx")],
+            title="Guardar Antigüedad de Deuda"
+        )
+
+        if not filepath: return
+
+        try:
+            self.antiguedad_df.to_excel(filepath, index=False)
+            messagebox.showinfo("Exportar", "Reporte exportado con éxito.")
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo exportar: {e}")
+
+    AGRUPACIONES_MARGEN = {"Producto": "producto", "Día": "dia", "Mes": "mes"}
+
+    def create_margin_report_widgets(self):
+        f = ttk.Frame(self.margin_frame, padding=10)
+        f.pack(fill="x")
+
+        ttk.Label(f, text="Período:").pack(side="left")
+        self.periodo_margen_var = tk.StringVar(value="Este Mes")
+        ttk.Combobox(f, textvariable=self.periodo_margen_var, values=["Hoy", "Esta Semana", "Este Mes", "Año Actual"], state="readonly", width=12).pack(side="left", padx=5)
+        ttk.Label(f, text="Agrupar por:").pack(side="left", padx=(10, 0))
+        self.agrupacion_margen_var = tk.StringVar(value="Producto")
+        ttk.Combobox(f, textvariable=self.agrupacion_margen_var, values=list(self.AGRUPACIONES_MARGEN), state="readonly", width=10).pack(side="left", padx=5)
+
+        ttk.Button(f, text="Generar Reporte", command=self.generar_margenes).pack(side="left", padx=10)
+        ttk.Button(f, text="Exportar", command=self.exportar_margenes_a_excel).pack(side="right")
+        self.total_margen_var = tk.StringVar()
+        ttk.Label(f, textvariable=self.total_margen_var, font=("Helvetica", 10, "bold")).pack(side="right", padx=10)
+
+        columnas = ("Grupo", "Unidades", "Ingresos", "Costo", "Margen", "MargenPct")
+        self.tree_margen = ttk.Treeview(self.margin_frame, columns=columnas, show="headings")
+        for columna, titulo in zip(columnas, ("Producto / Fecha", "Unidades", "Ingresos", "Costo", "Margen", "Margen %")):
+            self.tree_margen.heading(columna, text=titulo)
+        for columna in columnas[1:]:
+            self.tree_margen.column(columna, width=100, anchor="e")
+        self.tree_margen.pack(fill="both", expand=True, padx=10, pady=10)
+
+        self.margenes_df = None
+
+    def generar_margenes(self):
+        for item in self.tree_margen.get_children():
+            self.tree_margen.delete(item)
+
+        agrupar_por = self.AGRUPACIONES_MARGEN[self.agrupacion_margen_var.get()]
+        start_date, end_date = self.rango_del_periodo(self.periodo_margen_var.get())
+        self.margenes_df = obtener_margenes_df(start_date, end_date, agrupar_por, desde_snapshot=True)
+
+        for row in self.margenes_df.itertuples(index=False):
+            if agrupar_por == 'producto':
+                grupo = row.nombre
+            elif agrupar_por == 'dia':
+                grupo = formatear_fecha(row.fecha)
+            else:
+                grupo = row.mes
+            self.tree_margen.insert("", "end", values=(
+                grupo,
+                row.unidades,
+                f"${row.ingresos:.2f}",
+                f"${row.costo:.2f}",
+                f"${row.margen:.2f}",
+                f"{row.margen_pct:.1f}%" if pd.notna(row.margen_pct) else "-"
+            ))
+
+        ingresos = self.margenes_df['ingresos'].sum()
+        margen = self.margenes_df['margen'].sum()
+        self.total_margen_var.set(f"Margen total: ${margen:.2f}" + (f" ({margen * 100 / ingresos:.1f}%)" if ingresos else ""))
+
+    def exportar_margenes_a_excel(self):
+        if self.margenes_df is None or self.margenes_df.empty:
+             messagebox.showwarning("Sin Datos", "Genere el reporte primero.")
+             return
+
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel Files", "*.xlsx")],
+            title="Guardar Reporte de Márgenes"
+        )
+
+        if not filepath: return
+
+        try:
+            self.margenes_df.to_excel(filepath, index=False)
+            messagebox.showinfo("Exportar", "Reporte exportado con éxito.")
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo exportar: {e}")
+
+    def create_sales_search_widgets(self):
+        filtros = ttk.Frame(self.search_frame, padding=10)
+        filtros.pack(fill="x")
+
+        ttk.Label(filtros, text="Producto (nombre o código):").grid(row=0, column=0, sticky="w")
+        self.busqueda_producto_var = tk.StringVar()
+        ttk.Entry(filtros, textvariable=self.busqueda_producto_var, width=25).grid(row=0, column=1, sticky="w", padx=5)
+
+        ttk.Label(filtros, text="Cliente:").grid(row=0, column=2, sticky="w", padx=(10, 0))
+        self.busqueda_id_cliente = None
+        self.busqueda_cliente_var = tk.StringVar(value="Todos")
+        ttk.Label(filtros, textvariable=self.busqueda_cliente_var, width=20).grid(row=0, column=3, sticky="w", padx=5)
+        ttk.Button(filtros, text="Elegir...", command=self.elegir_cliente_busqueda).grid(row=0, column=4, padx=2)
+        ttk.Button(filtros, text="Quitar", command=self.quitar_cliente_busqueda).grid(row=0, column=5, padx=2)
+
+        ttk.Label(filtros, text="Monto desde:").grid(row=1, column=0, sticky="w", pady=(5, 0))
+        montos = ttk.Frame(filtros)
+        montos.grid(row=1, column=1, sticky="w", padx=5, pady=(5, 0))
+        self.busqueda_monto_desde_var = tk.StringVar()
+        ttk.Entry(montos, textvariable=self.busqueda_monto_desde_var, width=9).pack(side="left")
+        ttk.Label(montos, text="hasta:").pack(side="left", padx=5)
+        self.busqueda_monto_hasta_var = tk.StringVar()
+        ttk.Entry(montos, textvariable=self.busqueda_monto_hasta_var, width=9).pack(side="left")
+
+        ttk.Label(filtros, text="Forma de pago:").grid(row=1, column=2, sticky="w", padx=(10, 0), pady=(5, 0))
+        self.busqueda_forma_pago_var = tk.StringVar(value="Todas")
+        ttk.Combobox(filtros, textvariable=self.busqueda_forma_pago_var, values=["Todas", "Efectivo", "Tarjeta", "Transferencia", "Libreta"], state="readonly", width=15).grid(row=1, column=3, sticky="w", padx=5, pady=(5, 0))
+
+        ttk.Label(filtros, text="Observaciones:").grid(row=2, column=0, sticky="w", pady=(5, 0))
+        self.busqueda_texto_var = tk.StringVar()
+        texto_entry = ttk.Entry(filtros, textvariable=self.busqueda_texto_var, width=25)
+        texto_entry.grid(row=2, column=1, sticky="w", padx=5, pady=(5, 0))
+        texto_entry.bind("<Return>", lambda e: self.ejecutar_busqueda_ventas())
+        ttk.Button(filtros, text="Buscar", command=self.ejecutar_busqueda_ventas, style="Accent.TButton").grid(row=2, column=3, sticky="w", padx=5, pady=(5, 0))
+
+        columnas = ("ID", "Fecha", "Cliente", "Total", "Pago", "Observaciones")
+        self.tree_busqueda = ttk.Treeview(self.search_frame, columns=columnas, show="headings")
+        for columna, titulo in zip(columnas, ("ID Venta", "Fecha", "Cliente", "Total", "Forma Pago", "Observaciones")):
+            self.tree_busqueda.heading(columna, text=titulo)
+        self.tree_busqueda.column("ID", width=60, anchor="center")
+        self.tree_busqueda.column("Total", width=90, anchor="e")
+        self.tree_busqueda.pack(fill="both", expand=True, padx=10)
+        self.tree_busqueda.bind("<Double-1>", self.mostrar_detalle_busqueda)
+
+        paginas = ttk.Frame(self.search_frame, padding=10)
+        paginas.pack(fill="x")
+        self.busqueda_anterior_btn = ttk.Button(paginas, text="< Anterior", command=self.pagina_anterior_busqueda, state="disabled")
+        self.busqueda_anterior_btn.pack(side="left")
+        self.busqueda_pagina_var = tk.StringVar()
+        ttk.Label(paginas, textvariable=self.busqueda_pagina_var).pack(side="left", padx=10)
+        self.busqueda_siguiente_btn = ttk.Button(paginas, text="Siguiente >", command=self.pagina_siguiente_busqueda, state="disabled")
+        self.busqueda_siguiente_btn.pack(side="left")
+
+        # Cada página se pide a partir de la última venta de la anterior; se guarda el inicio de cada
+        # página visitada para poder volver.
+        self.busqueda_filtros = None
+        self.busqueda_inicios = []
+
+    def elegir_cliente_busqueda(self):
+        dialog = SelectClientDialog(self)
+        if dialog.result:
+            cliente = obtener_cliente_por_id(dialog.result)
+            self.busqueda_id_cliente = dialog.result
+            self.busqueda_cliente_var.set(cliente.nombre if cliente else f"ID {dialog.result}")
+
+    def quitar_cliente_busqueda(self):
+        self.busqueda_id_cliente = None
+        self.busqueda_cliente_var.set("Todos")
+
+    def ejecutar_busqueda_ventas(self):
+        filtros = {'id_cliente': self.busqueda_id_cliente}
+
+        texto_producto = self.busqueda_producto_var.get().strip()
+        if texto_producto:
+            producto = resolver_codigo_barras(texto_producto)
+            producto = producto[0] if producto else obtener_producto_por_nombre(texto_producto)
+            if not producto:
+                messagebox.showwarning("Producto no encontrado", f"No hay un producto con nombre o código '{texto_producto}'.")
+                return
+            filtros['id_producto'] = producto.id_producto
+
+        try:
+            for clave, variable in (('monto_minimo', self.busqueda_monto_desde_var), ('monto_maximo', self.busqueda_monto_hasta_var)):
+                valor = variable.get().strip().replace(',', '.')
+                filtros[clave] = float(valor) if valor else None
+        except ValueError:
+            messagebox.showerror("Error", "Los montos deben ser números.")
+            return
+
+        forma_pago = self.busqueda_forma_pago_var.get()
+        filtros['forma_pago'] = None if forma_pago == "Todas" else forma_pago
+        filtros['texto'] = self.busqueda_texto_var.get().strip() or None
+
+        self.busqueda_filtros = filtros
+        self.busqueda_inicios = [None]
+        self.cargar_pagina_busqueda()
+
+    def cargar_pagina_busqueda(self):
+        ventas = buscar_ventas(**self.busqueda_filtros, despues_de=self.busqueda_inicios[-1], limite=TAMANO_PAGINA_BUSQUEDA_VENTAS + 1)
+        hay_siguiente = len(ventas) > TAMANO_PAGINA_BUSQUEDA_VENTAS
+        ventas = ventas[:TAMANO_PAGINA_BUSQUEDA_VENTAS]
+
+        self.tree_busqueda.delete(*self.tree_busqueda.get_children())
+        for venta in ventas:
+            self.tree_busqueda.insert("", "end", iid=venta['id_venta'], values=(
+                venta['id_venta'], formatear_fecha(venta['fecha_venta']) + venta['fecha_venta'][10:16], venta['nombre_cliente'],
+                f"${venta['total']:.2f}", venta['forma_pago'], venta['observaciones'] or ""
+            ))
+
+        self.busqueda_ultima = (ventas[-1]['fecha_venta'], ventas[-1]['id_venta']) if ventas else None
+        self.busqueda_pagina_var.set(f"Página {len(self.busqueda_inicios)}" if ventas else "Sin resultados")
+        self.busqueda_anterior_btn.config(state="normal" if len(self.busqueda_inicios) > 1 else "disabled")
+        self.busqueda_siguiente_btn.config(state="normal" if hay_siguiente else "disabled")
+
+    def pagina_siguiente_busqueda(self):
+        if self.busqueda_ultima:
+            self.busqueda_inicios.append(self.busqueda_ultima)
+            self.cargar_pagina_busqueda()
+
+    def pagina_anterior_busqueda(self):
+        if len(self.busqueda_inicios) > 1:
+            self.busqueda_inicios.pop()
+            self.cargar_pagina_busqueda()
+
+    def mostrar_detalle_busqueda(self, event=None):
+        selection = self.tree_busqueda.selection()
+        if not selection: return
+        venta = obtener_venta_por_id(int(selection[0]))
+        if venta:
+            SaleDetailWindow(self, venta)
+
+
 class SaleDetailWindow(tk.Toplevel):
     def __init__(self, parent, venta: Venta):
         super().__init__(parent)